@@ -31,12 +31,22 @@ class AgendaConfig(AppConfig):
             keys_to_delete.append(f'eagenda:exporters:{sender.pk}:{schedule.version}')
             cache.delete_many(keys_to_delete)
 
+            from eventyay.agenda.views.utils import mark_schedule_changed
+
+            mark_schedule_changed(sender)
+
             try:
                 from eventyay.agenda.tasks import warm_schedule_caches
                 warm_schedule_caches.apply_async(kwargs={'schedule_pk': schedule.pk}, countdown=3)
             except Exception:
                 LOGGER.exception('Failed to enqueue warm_schedule_caches for schedule pk=%s', schedule.pk)
 
+            try:
+                from eventyay.agenda.tasks import build_schedule_exports
+                build_schedule_exports.apply_async(kwargs={'schedule_pk': schedule.pk}, countdown=3)
+            except Exception:
+                LOGGER.exception('Failed to enqueue build_schedule_exports for schedule pk=%s', schedule.pk)
+
         schedule_release.connect(on_schedule_release, dispatch_uid='agenda.on_schedule_release', weak=False)
 
         from eventyay.base.models import SubmissionStates
@@ -2,7 +2,8 @@ import logging
 
 from django.conf import settings
 from django.core.cache import cache
-from django.utils.translation import activate
+from django.utils.timezone import override as override_timezone
+from django.utils.translation import activate, override
 from django_scopes import scope, scopes_disabled
 
 from eventyay.base.models import Event
@@ -120,3 +121,58 @@ def warm_schedule_caches(*, schedule_pk: int):
             LOGGER.exception('Failed to warm exporters cache for schedule %s', schedule.pk)
 
     LOGGER.info('Pre-warmed schedule caches for schedule pk=%s version=%s', schedule.pk, schedule.version)
+
+
+@app.task(name='eventyay.agenda.build_schedule_exports', bind=True)
+def build_schedule_exports(self, *, schedule_pk: int):
+    """Render the full public exports of a released schedule in all event languages.
+
+    The schedule data is loaded once per language and shared by all exporters, and
+    talks that did not change since an earlier release reuse their cached parts, so
+    only new and changed talks are rendered. Progress is reported as a percentage.
+    """
+    from eventyay.agenda.views.utils import CACHE_TTL, get_schedule_export_cache_key
+    from eventyay.base.models import Schedule
+    from eventyay.schedule.exporters import CACHED_SCHEDULE_EXPORTERS, ScheduleData
+
+    def set_progress(value):
+        if not self.request.called_directly:
+            self.update_state(state='PROGRESS', meta={'value': value})
+
+    with scopes_disabled():
+        schedule = (
+            Schedule.objects.select_related('event', 'event__organizer')
+            .filter(pk=schedule_pk, version__isnull=False)
+            .first()
+        )
+    if not schedule:
+        return
+
+    event = schedule.event
+    steps = len(event.locales) * len(CACHED_SCHEDULE_EXPORTERS)
+    done = 0
+    with scope(event=event), override_timezone(event.tz):
+        for locale in event.locales:
+            with override(locale):
+                data = None
+                for exporter_class in CACHED_SCHEDULE_EXPORTERS:
+                    done += 1
+                    exporter = exporter_class(event, schedule=schedule)
+                    exporter.featured_only = False
+                    # The key has to be taken before rendering, so that a change during the
+                    # rendering can't be stored as current.
+                    cache_key = get_schedule_export_cache_key(event, schedule, exporter.identifier)
+                    if not cache_key:
+                        continue
+                    if isinstance(exporter, ScheduleData):
+                        if data is None:
+                            data = exporter.data
+                        else:
+                            exporter.data = data
+                    try:
+                        cache.set(cache_key, exporter.render(), CACHE_TTL)
+                    except Exception:
+                        LOGGER.exception('Failed to build %s for schedule %s', exporter.identifier, schedule.pk)
+                    set_progress(round(done / steps * 100))
+
+    LOGGER.info('Built schedule exports for schedule pk=%s version=%s', schedule.pk, schedule.version)
@@ -1,9 +1,13 @@
+import hashlib
 import urllib.parse
 
 from django.contrib.syndication.views import Feed
 from django.http import Http404
 from django.utils import feedgenerator
+from django.utils.http import quote_etag
+from django.utils.translation import get_language
 
+from eventyay.agenda.views.utils import get_schedule_not_modified
 from eventyay.common.utils.language import localize_event_text
 
 XML_REPLACE = str.maketrans(
@@ -25,6 +29,20 @@ class ScheduleFeed(Feed):
     feed_type = feedgenerator.Atom1Feed
     description_template = 'agenda/feed/description.html'
 
+    def __call__(self, request, *args, **kwargs):
+        # The feed only changes with a new release, so we can answer conditional
+        # requests from feed readers without building it.
+        schedule = self.get_object(request, *args, **kwargs).current_schedule
+        etag = None
+        if schedule and schedule.published:
+            etag = quote_etag(hashlib.sha1(f'{schedule.pk}:{schedule.version}:{get_language()}'.encode()).hexdigest())
+            if response := get_schedule_not_modified(request, (etag, int(schedule.published.timestamp()))):
+                return response
+        response = super().__call__(request, *args, **kwargs)
+        if etag:
+            response['ETag'] = etag
+        return response
+
     def get_object(self, request, *args, **kwargs):
         if not request.user.has_perm('base.list_schedule', request.event):
             raise Http404()
@@ -3,6 +3,7 @@ import json
 import logging
 import random
 import string
+import time
 from collections.abc import Iterable, Sequence
 from datetime import UTC, datetime
 from urllib.parse import urlencode
@@ -15,8 +16,10 @@ from django.core.cache import cache
 from django.http import HttpRequest, HttpResponse, HttpResponseNotModified, HttpResponseRedirect
 from django.urls import NoReverseMatch, reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.utils.encoding import force_str
 from django.utils.html import strip_tags
+from django.utils.http import http_date, quote_etag
 from django.utils.translation import activate, get_language, gettext_lazy as _
 from django_context_decorator import context
 from django_scopes import scope
@@ -28,8 +31,13 @@ from eventyay.common.exporter import BaseExporter
 from eventyay.common.signals import register_data_exporters, register_my_data_exporters
 from eventyay.common.social_links import serialize_social_link
 from eventyay.common.text.path import safe_filename
+from eventyay.common.views.cache import get_requested_etag
 from eventyay.common.views.helpers import build_login_url_with_next
-from eventyay.schedule.exporters import FavedICalExporter, filter_featured_public_talk_slots
+from eventyay.schedule.exporters import (
+    CACHED_SCHEDULE_EXPORTERS,
+    FavedICalExporter,
+    filter_featured_public_talk_slots,
+)
 from eventyay.talk_rules.agenda import (
     can_list_released_schedule_speakers,
     can_view_public_schedule_sessions,
@@ -1239,6 +1247,87 @@ def clear_featured_speakers_without_active_submissions(event, speakers):
     ).update(is_featured=False)
 
 
+def get_schedule_changed(event) -> int:
+    """Return the time of the last change to the schedule data of the event, as a unix timestamp.
+
+    The time is set whenever the schedule caches are cleared or a schedule is released.
+    If it is unknown (e.g. after a cache flush), it is the current time from now on.
+    Returns ``None`` if the cache can't keep it, as with the dummy cache.
+    """
+    cache_key = f'eagenda:changed:{event.pk}'
+    changed = cache.get(cache_key)
+    if changed is None:
+        cache.add(cache_key, int(time.time()), None)
+        changed = cache.get(cache_key)
+    return changed
+
+
+def mark_schedule_changed(event):
+    # Every change gets its own second, so that If-Modified-Since can't miss a change
+    # made within the same second as the previous one.
+    cache_key = f'eagenda:changed:{event.pk}'
+    cache.set(cache_key, max(int(time.time()), (cache.get(cache_key) or 0) + 1), None)
+
+
+def get_schedule_validators(event, schedule, *parts):
+    """Return an ETag and a Last-Modified timestamp for public data of a released schedule.
+
+    Both can be computed without rendering the data. They change with every release and
+    every change that clears the schedule caches, and with the language, the featured
+    settings and any ``parts`` the data depends on (like the exporter).  WIP schedules
+    change without clearing any caches, so they return ``(None, None)``, as does
+    everything if the time of the last change can't be kept.
+    """
+    if not schedule or not schedule.version:
+        return None, None
+    if (changed := get_schedule_changed(event)) is None:
+        return None, None
+    changed = max(changed, int(schedule.published.timestamp()) if schedule.published else 0)
+    key = ':'.join(
+        str(part)
+        for part in (
+            schedule.pk,
+            schedule.version,
+            changed,
+            get_language(),
+            schedule_widget_featured_cache_key_part(event),
+            *parts,
+        )
+    )
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest()), changed
+
+
+def get_schedule_export_cache_key(event, schedule, identifier, featured_only=False):
+    """Return the cache key of a full public export of a released schedule, or ``None``
+    if it can't be cached.  The key changes whenever the validators of the export change."""
+    if not schedule or not schedule.version:
+        return None
+    if (changed := get_schedule_changed(event)) is None:
+        return None
+    return (
+        f'eagenda:export:{schedule.pk}:{identifier}:{int(featured_only)}:{changed}:'
+        f'{get_language()}:{timezone.get_current_timezone_name()}'
+    )
+
+
+def get_schedule_not_modified(request, validators):
+    """Return a 304 response if the client's copy matches ``validators``, else None."""
+    etag, last_modified = validators
+    if not etag:
+        return None
+    if requested_etag := get_requested_etag(request):
+        return HttpResponseNotModified() if requested_etag == etag.strip('"') else None
+    return get_conditional_response(request, last_modified=last_modified)
+
+
+def set_schedule_validators(response, validators):
+    etag, last_modified = validators
+    if etag and response.status_code == 200:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
 def clear_schedule_caches(event, submission=None, speaker=None):
     """Clear all eagenda schedule caches for the event's schedules."""
     with scope(event=event):
@@ -1265,6 +1354,8 @@ def clear_schedule_caches(event, submission=None, speaker=None):
                 )
 
     cache.delete_many(keys)
+    # After the caches are gone, so that no response with the new validators is built from old data
+    mark_schedule_changed(event)
 
 
 def get_schedule_exporters(request, public=False):
@@ -1409,20 +1500,41 @@ def get_schedule_exporter_content(request, exporter_name, schedule, token=None):
         )
         if talk_ids:
             exporter.talk_ids = talk_ids
-    try:
-        file_name, file_type, data = exporter.render(request=request)
-        etag = hashlib.sha1(str(data).encode()).hexdigest()
-    except Exception:
-        logger.exception(f'Failed to use {exporter.identifier} for {request.event.slug}')
-        return
-    if request.headers.get('If-None-Match') == etag:
+    if '-my' in exporter.identifier:
+        validators = None, None
+    else:
+        # Public exports are the same for everyone, so we can tell whether the client's copy
+        # is still current without rendering it.
+        validators = get_schedule_validators(
+            request.event, schedule, exporter.identifier, int(is_organizer), int(exporter.featured_only)
+        )
+    if response := get_schedule_not_modified(request, validators):
+        if exporter.cors:
+            response['Access-Control-Allow-Origin'] = exporter.cors
+        return response
+    cache_key = None
+    if type(exporter) in CACHED_SCHEDULE_EXPORTERS:
+        # Usually built in the background on release, see build_schedule_exports
+        cache_key = get_schedule_export_cache_key(request.event, schedule, exporter.identifier, exporter.featured_only)
+    if cache_key and (cached := cache.get(cache_key)):
+        file_name, file_type, data = cached
+    else:
+        try:
+            file_name, file_type, data = exporter.render(request=request)
+        except Exception:
+            logger.exception(f'Failed to use {exporter.identifier} for {request.event.slug}')
+            return
+        if cache_key:
+            cache.set(cache_key, (file_name, file_type, data), CACHE_TTL)
+    etag = hashlib.sha1(str(data).encode()).hexdigest()
+    if request.headers.get('If-None-Match', '').strip('"') == etag:
         return HttpResponseNotModified()
     headers = {'ETag': f'"{etag}"'}
     if file_type not in ('application/json', 'text/xml'):
         headers['Content-Disposition'] = f'attachment; filename="{safe_filename(file_name)}"'
     if exporter.cors:
         headers['Access-Control-Allow-Origin'] = exporter.cors
-    return HttpResponse(data, content_type=file_type, headers=headers)
+    return set_schedule_validators(HttpResponse(data, content_type=file_type, headers=headers), validators)
 
 
 class WipAgendaPreviewPageMixin:
@@ -1,5 +1,6 @@
 import hashlib
 import os
+from functools import wraps
 from urllib.parse import unquote
 
 from csp.decorators import csp_exempt
@@ -26,7 +27,13 @@ from eventyay.talk_rules.agenda import (
     is_widget_visible,
     wip_preview_build_data,
 )
-from eventyay.agenda.views.utils import build_unavailable_widget_schedule_data
+from eventyay.agenda.views.utils import (
+    build_unavailable_widget_schedule_data,
+    get_schedule_changed,
+    get_schedule_not_modified,
+    get_schedule_validators,
+    set_schedule_validators,
+)
 from eventyay.talk_rules.submission import (
     are_featured_speakers_visible,
     schedule_widget_featured_cache_key_part,
@@ -87,8 +94,8 @@ def is_public_and_versioned(request, organizer=None, event=None, version=None, *
 
 
 def version_prefix(request, organizer=None, event=None, version=None, **kwargs):
-    """On non-versioned pages, invalidate cache on schedule release and featured-setting changes."""
-    featured_part = schedule_widget_featured_cache_key_part(request.event)
+    """On non-versioned pages, invalidate cache on schedule release, featured-setting and talk changes."""
+    featured_part = f'{schedule_widget_featured_cache_key_part(request.event)}-{get_schedule_changed(request.event)}'
     if not version and request.event.current_schedule:
         return f'{request.event.current_schedule.version}-{featured_part}'
     if version:
@@ -96,10 +103,46 @@ def version_prefix(request, organizer=None, event=None, version=None, **kwargs):
     return f'nov-{featured_part}'
 
 
+def widget_data_conditional(func):
+    """Answer conditional requests for public widget data without rendering it.
+
+    The ETag only depends on the schedule version, the time of the last change to the
+    schedule data, and the settings the data depends on, so polling clients that are
+    up to date get a 304 without the data being rendered or even loaded from the cache.
+    """
+
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or not is_public_and_versioned(request, *args, **kwargs):
+            return func(request, *args, **kwargs)
+        event = request.event
+        version = kwargs.get('version') or unquote(request.GET.get('v') or '')
+        if version == 'wip' or not can_access_schedule_widget(request.user, event):
+            return func(request, *args, **kwargs)
+        schedule = (event.schedules.filter(version__iexact=version).first() if version else None) or (
+            event.current_schedule
+        )
+        validators = get_schedule_validators(
+            event,
+            schedule,
+            'widget',
+            request.GET.get('enrich') in {'1', 'true', 'True'},
+            request.GET.get('qrcodes') in {'1', 'true', 'True'},
+        )
+        if response := get_schedule_not_modified(request, validators):
+            response['Access-Control-Allow-Headers'] = 'authorization,content-type'
+            response['Access-Control-Allow-Origin'] = '*'
+            return response
+        return set_schedule_validators(func(request, *args, **kwargs), validators)
+
+    return wrapper
+
+
 def qrcodes_prefix(request, organizer=None, event=None, version=None, kind=None, code=None, **kwargs):
     return f'{version_prefix(request, organizer=organizer, event=event, version=version)}-qrcodes-{kind}-{code}'
 
 
+@widget_data_conditional
 @gzip_page
 @conditional_cache_page(
     60,
@@ -107,6 +107,8 @@ _CHECKIN_STAFF_EXTRA_ALLOWLIST = (
     # Offline sync: incremental orders + revocation list (Badge Station / NoSync stays excluded).
     ('GET', 'api-v1:order-list'),
     ('GET', 'api-v1:revokedsecrets-list'),
+    ('GET', 'api-v1:checkinlistpos-sync'),
+    ('POST', 'api-v1:checkin.redeem-batch'),
     # Offline badge print: layout JSON synced separately from per-attendee pdf_data.
     ('GET', 'api-v1:badgelayout-list'),
     ('GET', 'api-v1:badgelayout-detail'),
@@ -0,0 +1,80 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.core import signing
+
+from eventyay.base.services import checkinstatus
+
+
+STATUS_STREAM_SALT = 'eventyay.api.checkinstatus'
+# Dashboards need to fetch the status once in a while to get a fresh stream URL, in case their access was revoked
+STATUS_STREAM_TIMEOUT = 3600
+# Check-ins come in bursts at doors opening, dashboards don't need to hear about every single one
+STATUS_PUSH_INTERVAL = 1
+
+
+def status_stream_token(clist):
+    """
+    Returns the token that allows to subscribe to the changes of a check-in list without any further authentication.
+    Handed out by the check-in list status API, which checks the permissions of the caller.
+    """
+    return signing.dumps({'event': clist.event_id, 'list': clist.pk}, salt=STATUS_STREAM_SALT)
+
+
+class CheckinStatusConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes ``{"list": …, "version": …}`` to dashboards whenever the check-in counters of a list change, once right
+    after connecting and then at most every :py:data:`STATUS_PUSH_INTERVAL` seconds. The version is the first part
+    of the ``ETag`` of the status API, or ``null`` while the counters are being rebuilt. Dashboards fetch the status
+    again whenever they are told about a new version.
+    """
+
+    list_id = None
+    sent = None
+    version = None
+    pusher = None
+
+    async def connect(self):
+        try:
+            stream = signing.loads(
+                self.scope['url_route']['kwargs']['token'],
+                salt=STATUS_STREAM_SALT,
+                max_age=STATUS_STREAM_TIMEOUT,
+            )
+        except signing.BadSignature:
+            await self.close()
+            return
+
+        self.list_id = stream['list']
+        await self.channel_layer.group_add(
+            checkinstatus.GROUP_STATUS.format(list_id=self.list_id),
+            self.channel_name,
+        )
+        await self.accept()
+        self.sent = await sync_to_async(checkinstatus.list_version)(stream['event'], self.list_id)
+        await self.send_json({'list': self.list_id, 'version': self.sent})
+
+    async def disconnect(self, close_code):
+        if self.pusher:
+            self.pusher.cancel()
+        if self.list_id is not None:
+            await self.channel_layer.group_discard(
+                checkinstatus.GROUP_STATUS.format(list_id=self.list_id),
+                self.channel_name,
+            )
+
+    async def receive_json(self, content, **kwargs):
+        # Nothing to say for the dashboards
+        pass
+
+    async def checkinstatus_changed(self, message):
+        self.version = message['version']
+        if self.pusher is None or self.pusher.done():
+            self.pusher = asyncio.get_running_loop().create_task(self._push())
+
+    async def _push(self):
+        await asyncio.sleep(STATUS_PUSH_INTERVAL)
+        if self.version != self.sent:
+            self.sent = self.version
+            await self.send_json({'list': self.list_id, 'version': self.sent})
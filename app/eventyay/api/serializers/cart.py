@@ -16,6 +16,7 @@ from eventyay.api.serializers.order import (
 from eventyay.base.settings import GlobalSettingsObject
 from eventyay.base.models import Quota, Seat
 from eventyay.base.models.orders import CartPosition
+from eventyay.base.services import quotacounters
 
 
 class CartPositionSerializer(I18nAwareModelSerializer):
@@ -134,7 +135,9 @@ class CartPositionCreateSerializer(I18nAwareModelSerializer):
                 raise ValidationError('The specified product requires to choose a seat.')
 
             validated_data.pop('sales_channel')
+            counter_snapshot = quotacounters.cart_snapshot(self.context['event'], validated_data['cart_id'])
             cp = CartPosition.objects.create(event=self.context['event'], **validated_data)
+            quotacounters.sync_cart(self.context['event'], validated_data['cart_id'], counter_snapshot)
 
         for answ_data in answers_data:
             options = answ_data.pop('options')
@@ -111,6 +111,34 @@ class CheckinRedeemInputSerializer(serializers.Serializer):
         ).select_related('event')
 
 
+class CheckinBatchRedeemItemSerializer(serializers.Serializer):
+    secret = serializers.CharField(required=True, allow_null=False)
+    list = serializers.IntegerField(required=True)
+    type = serializers.ChoiceField(choices=Checkin.CHECKIN_TYPES, default=Checkin.TYPE_ENTRY)
+    nonce = serializers.CharField(required=False, allow_null=True)
+    datetime = serializers.DateTimeField(required=False, allow_null=True)
+
+
+class CheckinBatchRedeemInputSerializer(serializers.Serializer):
+    scans = CheckinBatchRedeemItemSerializer(many=True, allow_empty=False, max_length=1000)
+    force = serializers.BooleanField(default=False, required=False)
+    ignore_unpaid = serializers.BooleanField(default=False, required=False)
+
+    def validate_scans(self, scans):
+        # Resolve all lists with one query instead of one per scan
+        lists = {
+            cl.pk: cl
+            for cl in CheckinList.objects.filter(
+                event__in=self.context['events'], pk__in={scan['list'] for scan in scans}
+            ).select_related('event', 'event__organizer')
+        }
+        for scan in scans:
+            if scan['list'] not in lists:
+                raise ValidationError(_('Invalid check-in list ID "{id}".').format(id=scan['list']))
+            scan['list'] = lists[scan['list']]
+        return scans
+
+
 class MiniCheckinListSerializer(I18nAwareModelSerializer):
     event = serializers.SlugRelatedField(slug_field='slug', read_only=True)
     subevent = serializers.PrimaryKeyRelatedField(read_only=True)
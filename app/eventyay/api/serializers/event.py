@@ -700,11 +700,14 @@ class EventSettingsSerializer(SettingsSerializer):
         'waiting_list_phones_asked',
         'waiting_list_phones_required',
         'waiting_list_phones_explanation_text',
+        'waiting_room_enabled',
+        'waiting_room_rate',
         'contact_form_enabled',
         'contact_mail',
         'show_variations_expanded',
         'hide_sold_out',
         'meta_noindex',
+        'high_demand_mode',
         'redirect_to_checkout_directly',
         'frontpage_subevent_ordering',
         'event_list_type',
@@ -744,6 +747,7 @@ class EventSettingsSerializer(SettingsSerializer):
         'ticket_download_nonadm',
         'ticket_download_pending',
         'ticket_download_require_validated_email',
+        'checkin_secret_index',
         'require_registered_account_for_tickets',
         'mail_prefix',
         'mail_from',
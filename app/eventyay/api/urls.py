@@ -202,6 +202,11 @@ urlpatterns = [
         checkin.CheckinRedeemView.as_view(),
         name='checkin.redeem',
     ),
+    path(
+        'organizers/<orgslug:organizer>/checkin/redeem-batch/',
+        checkin.CheckinBatchRedeemView.as_view(),
+        name='checkin.redeem-batch',
+    ),
     path(
         'organizers/<orgslug:organizer>/events/<slug:event>/orders/<int:order>/',
         include(order_router.urls),
@@ -1,12 +1,16 @@
+import hashlib
+import json
 import operator
+from datetime import UTC, datetime, timedelta
 from functools import reduce
 
 import django_filters
+import msgspec
 from django.conf import settings
+from django.core import signing
 from django.core.exceptions import ValidationError as BaseValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import (
-    Count,
-    Exists,
     F,
     Max,
     OrderBy,
@@ -17,21 +21,27 @@ from django.db.models import (
     prefetch_related_objects,
 )
 from django.db.models.functions import Coalesce
-from django.http import Http404
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 from django.utils.functional import cached_property
+from django.utils.http import parse_etags, quote_etag
+from django.utils.text import compress_string
 from django.utils.timezone import now
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet
 from django_scopes import scopes_disabled
 from rest_framework import views, viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.fields import DateTimeField
 from rest_framework.generics import ListAPIView
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 
+from eventyay.api.consumers import status_stream_token
 from eventyay.api.serializers.checkin import (
+    CheckinBatchRedeemInputSerializer,
     CheckinListSerializer,
     CheckinRedeemInputSerializer,
     MiniCheckinListSerializer,
@@ -53,13 +63,15 @@ from eventyay.base.models import (
     RevokedTicketSecret,
     TeamAPIToken,
 )
+from eventyay.base.services import checkinstatus, secretindex
 from eventyay.base.services.checkin import (
     CheckInError,
     RequiredQuestionsError,
-    SQLLogic,
     checkin_error_response_data,
     checkin_reason_explanation,
+    get_rules_query,
     perform_checkin,
+    perform_checkins,
     resolve_checkin_api_error,
 )
 from eventyay.consts import SizeKey
@@ -86,6 +98,10 @@ with scopes_disabled():
             return queryset.filter(expr)
 
 
+# Status snapshots are keyed by the counter version, so they only need to live as long as a version does
+STATUS_SNAPSHOT_TIMEOUT = 300
+
+
 class CheckinListViewSet(viewsets.ModelViewSet):
     serializer_class = CheckinListSerializer
     queryset = CheckinList.objects.none()
@@ -144,69 +160,83 @@ class CheckinListViewSet(viewsets.ModelViewSet):
         )
         super().perform_destroy(instance)
 
-    @action(detail=True, methods=['GET'])
-    def status(self, *args, **kwargs):
-        with language(self.request.event.settings.locale):
-            clist = self.get_object()
-            cqs = clist.positions.annotate(
-                checkedin=Exists(
-                    Checkin.objects.filter(
-                        list_id=clist.pk,
-                        position=OuterRef('pk'),
-                        type=Checkin.TYPE_ENTRY,
-                    )
-                )
-            ).filter(
-                checkedin=True,
-            )
-            pqs = clist.positions
+    def _status(self, clist):
+        counts = checkinstatus.get_counts(clist)
+        ev = clist.subevent or clist.event
+        response = {
+            'event': {
+                'name': str(ev.name),
+            },
+            'checkin_count': counts.checkin_count,
+            'position_count': counts.position_count,
+            'inside_count': counts.inside_count,
+        }
 
-            ev = clist.subevent or clist.event
-            response = {
-                'event': {
-                    'name': str(ev.name),
-                },
-                'checkin_count': cqs.count(),
-                'position_count': pqs.count(),
-                'inside_count': clist.inside_count,
+        if not clist.all_products:
+            products = clist.limit_products
+        else:
+            products = clist.event.products
+
+        response['products'] = []
+        for product in products.order_by('category__position', 'position', 'pk').prefetch_related('variations'):
+            i = {
+                'id': product.pk,
+                'name': str(product),
+                'admission': product.admission,
+                'checkin_count': counts.checkins_by_product.get(product.pk, 0),
+                'position_count': counts.positions_by_product.get(product.pk, 0),
+                'variations': [],
             }
+            for var in product.variations.all():
+                i['variations'].append(
+                    {
+                        'id': var.pk,
+                        'value': str(var),
+                        'checkin_count': counts.checkins_by_variation.get(var.pk, 0),
+                        'position_count': counts.positions_by_variation.get(var.pk, 0),
+                    }
+                )
+            response['products'].append(i)
 
-            op_by_product = {p['product']: p['cnt'] for p in pqs.order_by().values('product').annotate(cnt=Count('id'))}
-            op_by_variation = {
-                p['variation']: p['cnt'] for p in pqs.order_by().values('variation').annotate(cnt=Count('id'))
-            }
-            c_by_product = {p['product']: p['cnt'] for p in cqs.order_by().values('product').annotate(cnt=Count('id'))}
-            c_by_variation = {
-                p['variation']: p['cnt'] for p in cqs.order_by().values('variation').annotate(cnt=Count('id'))
+        response['gates'] = [
+            {
+                'id': gate.pk,
+                'name': gate.name,
+                'checkin_count': counts.checkins_by_gate[gate.pk],
             }
+            for gate in self.request.organizer.gates.filter(pk__in=counts.checkins_by_gate.keys())
+        ]
+        return response
 
-            if not clist.all_products:
-                products = clist.limit_products
-            else:
-                products = clist.event.products
-
-            response['products'] = []
-            for product in products.order_by('category__position', 'position', 'pk').prefetch_related('variations'):
-                i = {
-                    'id': product.pk,
-                    'name': str(product),
-                    'admission': product.admission,
-                    'checkin_count': c_by_product.get(product.pk, 0),
-                    'position_count': op_by_product.get(product.pk, 0),
-                    'variations': [],
-                }
-                for var in product.variations.all():
-                    i['variations'].append(
-                        {
-                            'id': var.pk,
-                            'value': str(var),
-                            'checkin_count': c_by_variation.get(var.pk, 0),
-                            'position_count': op_by_variation.get(var.pk, 0),
-                        }
-                    )
-                response['products'].append(i)
+    def _status_snapshot(self, clist, version):
+        locale = self.request.event.settings.locale
+        with language(locale):
+            data = self._status(clist)
+        etag = hashlib.sha1(json.dumps(data, cls=DjangoJSONEncoder).encode()).hexdigest()
+        return quote_etag(f'{version}-{etag}'), data
 
-            return Response(response)
+    @action(detail=True, methods=['GET'])
+    def status(self, *args, **kwargs):
+        clist = self.get_object()
+        version = checkinstatus.version(clist) if checkinstatus.counters_enabled() else None
+        if version is None:
+            with language(self.request.event.settings.locale):
+                return Response(self._status(clist))
+
+        # Dashboards that can't keep a websocket open poll this endpoint. As long as the counters did not change, they
+        # get a 304 from the snapshot in the event cache. Changes to the list bump the version, changes to products
+        # clear the cache.
+        etag, data = self.request.event.cache.get_or_set(
+            f'checkin_status:{clist.pk}:{version}:{self.request.event.settings.locale}',
+            lambda: self._status_snapshot(clist, version),
+            timeout=STATUS_SNAPSHOT_TIMEOUT,
+        )
+        # All others are told about new versions through the websocket, see CheckinStatusConsumer
+        stream = self.request.build_absolute_uri(f'/ws/checkinstatus/{status_stream_token(clist)}/')
+        headers = {'ETag': etag, 'X-Status-Stream': 'ws' + stream.removeprefix('http')}
+        if etag in parse_etags(self.request.headers.get('If-None-Match', '')):
+            return Response(status=304, headers=headers)
+        return Response(data, headers=headers)
 
 
 with scopes_disabled():
@@ -225,7 +255,7 @@ with scopes_disabled():
         def check_rules_qs(self, queryset, name, value):
             if not self.checkinlist.rules:
                 return queryset
-            return queryset.filter(SQLLogic(self.checkinlist).apply(self.checkinlist.rules))
+            return queryset.filter(get_rules_query(self.checkinlist))
 
 
 def _checkin_list_position_queryset(
@@ -615,10 +645,22 @@ def _redeem_process(
     ).order_by(F('addon_to').asc(nulls_first=True))
 
     q = _build_search_query(raw_barcode, untrusted_input, legacy_url_support)
-    op_candidates = list(queryset.filter(q))
+    indexed = None
+    if not (raw_barcode.isnumeric() and not untrusted_input and legacy_url_support):
+        indexed = secretindex.lookup([cl.event for cl in list_by_event.values()], raw_barcode)
+    if indexed is None:
+        op_candidates = list(queryset.filter(q))
+    elif indexed:
+        op_candidates = list(queryset.filter(q, pk__in=indexed))
+    else:
+        # The secret index knows the barcode is neither a ticket nor a revoked ticket of ours
+        op_candidates = []
 
     if not op_candidates:
-        revoked = list(RevokedTicketSecret.objects.filter(event_id__in=list_by_event.keys(), secret=raw_barcode))
+        if indexed is None:
+            revoked = list(RevokedTicketSecret.objects.filter(event_id__in=list_by_event.keys(), secret=raw_barcode))
+        else:
+            revoked = []
         if len(revoked) == 0:
             return _handle_no_candidates(
                 checkinlists,
@@ -740,6 +782,120 @@ def _redeem_process(
             )
 
 
+class MsgpackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return msgspec.msgpack.encode(data)
+
+
+SYNC_CURSOR_SALT = 'eventyay.api.checkin.sync'
+# Orders are picked up by their last_modified timestamp, which is set before the transaction that changed them is
+# committed. Every delta therefore overlaps with the previous one by this many seconds, devices apply it idempotently.
+SYNC_OVERLAP = 60
+
+_SYNC_POSITION_FIELDS = (
+    'id',
+    'order__code',
+    'positionid',
+    'secret',
+    'product_id',
+    'variation_id',
+    'subevent_id',
+    'addon_to_id',
+    'seat__seat_guid',
+    'attendee_name_cached',
+    'addon_to__attendee_name_cached',
+    'order__status',
+    'order__checkin_attention',
+    'product__checkin_attention',
+    'admission_valid_from',
+    'admission_valid_until',
+    'canceled',
+)
+
+
+def _sync_list_fingerprint(checkinlist):
+    # A delta is only meaningful as long as the list selects the same positions, otherwise we start over
+    products = sorted(checkinlist.limit_products.values_list('id', flat=True)) if not checkinlist.all_products else []
+    config = (checkinlist.pk, checkinlist.subevent_id, checkinlist.include_pending, checkinlist.all_products, products)
+    return hashlib.sha1(repr(config).encode()).hexdigest()[:16]
+
+
+def _sync_data(checkinlist, since=None):
+    """
+    Builds the compact representation of all positions and revoked secrets relevant to a check-in list. If
+    ``since`` is given, only the changes since then are included. Canceled positions and positions that are no
+    longer valid for the list are then reported by their ID in ``removed``.
+    """
+    event = checkinlist.event
+    statuses = [Order.STATUS_PAID, Order.STATUS_PENDING] if checkinlist.include_pending else [Order.STATUS_PAID]
+    products = None if checkinlist.all_products else set(checkinlist.limit_products.values_list('id', flat=True))
+    dt = DateTimeField().to_representation
+
+    positions = OrderPosition.all.filter(order__event=event)
+    checkins = Checkin.objects.filter(list=checkinlist)
+    revoked = RevokedTicketSecret.objects.filter(event=event)
+    if since:
+        positions = positions.filter(order__last_modified__gte=since)
+        checkins = checkins.filter(position__order__last_modified__gte=since)
+        revoked = revoked.filter(created__gte=since)
+    else:
+        positions = positions.filter(canceled=False, order__status__in=statuses)
+        if checkinlist.subevent_id:
+            positions = positions.filter(subevent_id=checkinlist.subevent_id)
+        if products is not None:
+            positions = positions.filter(product_id__in=products)
+
+    checkins_by_position = {}
+    for c in checkins.order_by('pk').values('id', 'position_id', 'type', 'datetime', 'gate_id').iterator():
+        checkins_by_position.setdefault(c['position_id'], []).append(
+            {'id': c['id'], 'type': c['type'], 'datetime': dt(c['datetime']), 'gate': c['gate_id']}
+        )
+
+    result = []
+    removed = []
+    for p in positions.order_by('pk').values(*_SYNC_POSITION_FIELDS).iterator(chunk_size=2000):
+        valid = (
+            not p['canceled']
+            and p['order__status'] in statuses
+            and (not checkinlist.subevent_id or p['subevent_id'] == checkinlist.subevent_id)
+            and (products is None or p['product_id'] in products)
+        )
+        if not valid:
+            removed.append(p['id'])
+            continue
+        result.append(
+            {
+                'id': p['id'],
+                'order': p['order__code'],
+                'positionid': p['positionid'],
+                'secret': p['secret'],
+                'product': p['product_id'],
+                'variation': p['variation_id'],
+                'subevent': p['subevent_id'],
+                'addon_to': p['addon_to_id'],
+                'seat': p['seat__seat_guid'],
+                'attendee_name': p['attendee_name_cached'] or p['addon_to__attendee_name_cached'],
+                'order__status': p['order__status'],
+                'require_attention': bool(p['order__checkin_attention'] or p['product__checkin_attention']),
+                'admission_valid_from': dt(p['admission_valid_from']),
+                'admission_valid_until': dt(p['admission_valid_until']),
+                'checkins': checkins_by_position.get(p['id'], []),
+            }
+        )
+
+    return {
+        'full': not since,
+        'positions': result,
+        'removed': removed,
+        'revoked_secrets': list(revoked.order_by('pk').values_list('secret', flat=True)),
+    }
+
+
 class ExtendedBackend(DjangoFilterBackend):
     def get_filterset_kwargs(self, request, queryset, view):
         kwargs = super().get_filterset_kwargs(request, queryset, view)
@@ -913,6 +1069,35 @@ class CheckinListPositionViewSet(viewsets.ReadOnlyModelViewSet):
 
         return qs
 
+    @action(detail=False, methods=['GET'], url_name='sync', renderer_classes=[JSONRenderer, MsgpackRenderer])
+    def sync(self, request, *args, **kwargs):
+        if 'can_view_orders' not in request.eventpermset:
+            raise PermissionDenied('You do not have permission to synchronize the full list.')
+
+        generated = now()
+        fingerprint = _sync_list_fingerprint(self.checkinlist)
+        since = None
+        if request.query_params.get('cursor'):
+            try:
+                cursor = signing.loads(request.query_params['cursor'], salt=SYNC_CURSOR_SALT)
+            except signing.BadSignature:
+                raise ValidationError({'cursor': ['This cursor is invalid. Please start over with a full sync.']})
+            if cursor.get('list') == fingerprint:
+                since = datetime.fromtimestamp(cursor['ts'], tz=UTC) - timedelta(seconds=SYNC_OVERLAP)
+
+        data = _sync_data(self.checkinlist, since=since)
+        data['cursor'] = signing.dumps({'list': fingerprint, 'ts': generated.timestamp()}, salt=SYNC_CURSOR_SALT)
+
+        renderer = request.accepted_renderer
+        content = renderer.render(data, request.accepted_media_type, self.get_renderer_context())
+        response = HttpResponse(content, content_type=renderer.media_type)
+        response['X-Page-Generated'] = DateTimeField().to_representation(generated)
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        if len(content) > 200 and 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response.content = compress_string(content)
+            response['Content-Encoding'] = 'gzip'
+        return response
+
     @action(detail=False, methods=['POST'], url_name='redeem', url_path='(?P<pk>.*)/redeem')
     def redeem(self, *args, **kwargs):
         force = bool(self.request.data.get('force', False))
@@ -1101,6 +1286,51 @@ class CheckinRedeemView(views.APIView):
         )
 
 
+class CheckinBatchRedeemView(views.APIView):
+    def post(self, request, *args, **kwargs):
+        auth = self.request.auth
+        user = self.request.user
+
+        if isinstance(auth, (TeamAPIToken, Device)):
+            events = auth.get_events_with_permission(('can_change_orders', 'can_checkin_orders'))
+        elif user.is_authenticated:
+            events = user.get_events_with_permission(('can_change_orders', 'can_checkin_orders'), request).filter(
+                organizer=self.request.organizer
+            )
+        else:
+            raise ValueError('Unknown authentication method')
+        serializer = CheckinBatchRedeemInputSerializer(data=request.data, context={'events': events})
+        serializer.is_valid(raise_exception=True)
+
+        results = perform_checkins(
+            serializer.validated_data['scans'],
+            force=serializer.validated_data['force'],
+            ignore_unpaid=serializer.validated_data['ignore_unpaid'],
+            canceled_supported=True,
+            user=user,
+            auth=auth,
+        )
+
+        response = []
+        for r in results:
+            op = r['position']
+            if r['status'] == 'ok':
+                response.append({'status': 'ok', 'position': op.pk, 'require_attention': op.require_checkin_attention})
+                continue
+            status, reason, http_status = resolve_checkin_api_error(r['error'])
+            response.append(
+                {
+                    'status': status,
+                    'reason': reason,
+                    'reason_explanation': checkin_reason_explanation(r['error'], op, op.order.event) if op else None,
+                    'position': op.pk if op else None,
+                    'require_attention': op.require_checkin_attention if op else False,
+                    **checkin_error_response_data(r['error']),
+                }
+            )
+        return Response({'results': response})
+
+
 class CheckinSearchView(ListAPIView):
     serializer_class = CheckinListOrderPositionSerializer
     queryset = OrderPosition.all.none()
@@ -47,10 +47,12 @@ from eventyay.api.views import ConditionalListView
 from eventyay.base.models import Device, Organizer, SubEvent, TaxRule, TeamAPIToken, User
 from eventyay.base.models.event import Event
 from eventyay.base.payment import ManualPayment
+from eventyay.base.services import secretindex
 from eventyay.base.services.event import notify_event_change
 from eventyay.base.settings import SETTINGS_AFFECTING_CSS
 from eventyay.eventyay_common.video.permissions import VIDEO_TRAIT_ROLE_MAP
 from eventyay.helpers.dicts import merge_dicts
+from eventyay.presale import waitingroom
 from eventyay.presale.style import regenerate_css
 from eventyay.presale.views.organizer import filter_qs_by_attr
 
@@ -497,6 +499,10 @@ class EventSettingsView(views.APIView):
             )
         if any(p in s.changed_data for p in SETTINGS_AFFECTING_CSS):
             transaction.on_commit(lambda: regenerate_css.apply_async(args=(request.event.pk,)))
+        if any(p in s.changed_data for p in waitingroom.SETTINGS_AFFECTING_WAITING_ROOM):
+            transaction.on_commit(lambda: waitingroom.configure(request.organizer, request.event))
+        if 'checkin_secret_index' in s.changed_data:
+            transaction.on_commit(lambda: secretindex.drop(request.event))
         s = EventSettingsSerializer(
             instance=request.event.settings,
             event=request.event,
@@ -81,7 +81,7 @@ from eventyay.base.models import (
 from eventyay.base.models.orders import QuestionAnswer, RevokedTicketSecret
 from eventyay.base.payment import PaymentException
 from eventyay.base.pdf import get_images
-from eventyay.base.secrets import assign_ticket_secret
+from eventyay.base.secrets import assign_ticket_secrets
 from eventyay.base.services import tickets
 from eventyay.base.services.invoices import (
     generate_cancellation,
@@ -770,8 +770,11 @@ class OrderViewSet(viewsets.ModelViewSet):
     def regenerate_secrets(self, request, **kwargs):
         order = self.get_object()
         order.secret = generate_secret()
-        for op in order.all_positions.all():
-            assign_ticket_secret(request.event, op, force_invalidate=True, save=True)
+        assign_ticket_secrets(
+            request.event,
+            list(order.all_positions.select_related('product', 'variation', 'subevent')),
+            force_invalidate=True,
+        )
         order.save(update_fields=['secret'])
         CachedTicket.objects.filter(order_position__order=order).delete()
         CachedCombinedTicket.objects.filter(order=order).delete()
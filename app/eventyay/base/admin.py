@@ -84,6 +84,7 @@ admin.site.register(seating.SeatCategoryMapping)
 admin.site.register(Room)
 admin.site.register(room.RoomView)
 admin.site.register(room.Reaction)
+admin.site.register(room.ReactionRollup)
 
 # Polls and Questions
 admin.site.register(Poll)
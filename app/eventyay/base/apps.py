@@ -12,6 +12,16 @@ class EventyayBaseConfig(AppConfig):
         from . import invoice  # NOQA
         from . import notifications  # NOQA
         from . import email  # NOQA
+        from .services import chatbuffer  # NOQA
+        from .services import checkinstatus  # NOQA
+        from .services import connections  # NOQA
+        from .services import eventsnapshot  # NOQA
+        from .services import poll  # NOQA
+        from .services import question  # NOQA
+        from .services import quotacounters  # NOQA
+        from .services import reactions  # NOQA
+        from .services import reservationtokens  # NOQA
+        from .services import secretindex  # NOQA
         from django.conf import settings
 
         try:
@@ -1,4 +1,5 @@
 import hashlib
+import random
 import time
 from collections.abc import Callable
 from typing import Any, Dict, List, TypeVar, cast
@@ -75,6 +76,49 @@ class NamespacedCache:
 
         return cast(T, current)
 
+    def get_or_refresh(
+        self,
+        key: str,
+        compute: Callable[[], T],
+        timeout: int = 5,
+        stale_timeout: int = 30,
+        lock_timeout: int = 10,
+        wait: float = 2.0,
+    ) -> T:
+        """
+        Like ``get_or_set``, but protected against stampedes: only one caller at a time computes the value.
+
+        Values are kept for another ``stale_timeout`` seconds after they expired, and while one caller computes the
+        new value, everyone else gets the stale one. If there is no value at all, other callers wait up to ``wait``
+        seconds for it before computing it themselves. ``timeout`` is jittered by 10% so that values computed at
+        the same time do not all expire at the same time.
+        """
+        prefixed_key = self._prefix_key(key)
+        lock_key = prefixed_key + ':lock'
+        entry = self.cache.get(prefixed_key)
+        if entry is not None and entry[0] > time.time():
+            return cast(T, entry[1])
+
+        locked = self.cache.add(lock_key, 1, timeout=lock_timeout)
+        if not locked:
+            if entry is not None:
+                return cast(T, entry[1])
+            deadline = time.time() + wait
+            while time.time() < deadline:
+                time.sleep(0.05)
+                entry = self.cache.get(prefixed_key)
+                if entry is not None:
+                    return cast(T, entry[1])
+
+        try:
+            value = compute()
+            fresh = timeout * random.uniform(0.9, 1.1)
+            self.cache.set(prefixed_key, (time.time() + fresh, value), timeout=int(fresh + stale_timeout))
+        finally:
+            if locked:
+                self.cache.delete(lock_key)
+        return value
+
     def get_many(self, keys: List[str]) -> Dict[str, str]:
         values = self.cache.get_many([self._prefix_key(key) for key in keys])
         newvalues = {}
@@ -517,6 +517,44 @@ DEFAULT_SETTINGS = {
             help_text=_("The number of minutes the items in a user's cart are reserved for this user."),
         ),
     },
+    'waiting_room_enabled': {
+        'default': 'False',
+        'type': bool,
+        'serializer_class': serializers.BooleanField,
+        'form_class': forms.BooleanField,
+        'form_kwargs': dict(
+            label=_('Enable waiting room'),
+            help_text=_(
+                'Visitors of your shop are placed in a queue and let in one after another, in the order they '
+                'arrived. Use this if you expect more visitors at the start of your sale than your shop can handle.'
+            ),
+        ),
+    },
+    'waiting_room_rate': {
+        'default': '50',
+        'type': int,
+        'serializer_class': serializers.IntegerField,
+        'serializer_kwargs': dict(min_value=1),
+        'form_class': forms.IntegerField,
+        'form_kwargs': dict(
+            min_value=1,
+            label=_('Waiting room admission rate'),
+            help_text=_('The number of visitors let into the shop per second while the waiting room is enabled.'),
+        ),
+    },
+    'high_demand_mode': {
+        'default': 'False',
+        'type': bool,
+        'serializer_class': serializers.BooleanField,
+        'form_class': forms.BooleanField,
+        'form_kwargs': dict(
+            label=_('High-demand mode'),
+            help_text=_(
+                'Use this for on-sales where many people try to buy tickets at the same moment. Requests for '
+                'tickets that are already sold out are then rejected right away, which keeps the shop responsive.'
+            ),
+        ),
+    },
     'redirect_to_checkout_directly': {
         'default': 'True',
         'type': bool,
@@ -1238,6 +1276,19 @@ DEFAULT_SETTINGS = {
             ),
         ),
     },
+    'checkin_secret_index': {
+        'default': 'False',
+        'type': bool,
+        'serializer_class': serializers.BooleanField,
+        'form_class': forms.BooleanField,
+        'form_kwargs': dict(
+            label=_('Speed up check-in for large events'),
+            help_text=_(
+                'Keeps an index of all ticket codes in memory, so scans at the entrance can be validated faster. '
+                'Unknown codes are rejected without looking at the database at all.'
+            ),
+        ),
+    },
     'require_registered_account_for_tickets': {
         'default': 'True',
         'type': bool,
@@ -301,3 +301,15 @@ eventyay_task_runs_total = Counter('eventyay_task_runs_total', 'Total calls to a
 eventyay_task_duration_seconds = Histogram(
     'eventyay_task_duration_seconds', 'Call time of a celery task', ['task_name']
 )
+eventyay_lock_wait_seconds = Histogram(
+    'eventyay_lock_wait_seconds', 'Time spent waiting for an event or resource lock', ['resource']
+)
+eventyay_waitingroom_queued_total = Counter(
+    'eventyay_waitingroom_queued_total', 'Visitors that entered the waiting room of an event', ['event']
+)
+eventyay_waitingroom_admitted_total = Counter(
+    'eventyay_waitingroom_admitted_total', 'Visitors let through the waiting room of an event', ['event']
+)
+eventyay_lock_timeouts_total = Counter(
+    'eventyay_lock_timeouts_total', 'Event or resource locks given up after waiting', ['resource']
+)
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+def backfill_cached_score(apps, schema_editor):
+    RoomQuestion = apps.get_model('base', 'RoomQuestion')
+    for question in RoomQuestion.objects.annotate(_score=models.Count('votes')).filter(_score__gt=0).iterator():
+        RoomQuestion.objects.filter(pk=question.pk).update(cached_score=question._score)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0060_remove_video_poster_models'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roomquestion',
+            name='cached_score',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_cached_score, reverse_code=migrations.RunPython.noop),
+    ]
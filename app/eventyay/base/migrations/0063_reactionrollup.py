@@ -0,0 +1,54 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncMinute
+
+
+def rollup_reactions(apps, schema_editor):
+    Reaction = apps.get_model('base', 'Reaction')
+    ReactionRollup = apps.get_model('base', 'ReactionRollup')
+    rows = (
+        Reaction.objects.annotate(minute=TruncMinute('datetime'))
+        .order_by()
+        .values('room_id', 'minute', 'reaction')
+        .annotate(total=models.Sum('amount'))
+    )
+    batch = []
+    for row in rows.iterator():
+        batch.append(
+            ReactionRollup(room_id=row['room_id'], minute=row['minute'], reaction=row['reaction'], amount=row['total'])
+        )
+        if len(batch) >= 1000:
+            ReactionRollup.objects.bulk_create(batch)
+            batch = []
+    ReactionRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0062_alter_chatevent_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReactionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField()),
+                ('reaction', models.CharField(max_length=100)),
+                ('amount', models.IntegerField()),
+                (
+                    'room',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='reaction_rollups',
+                        to='base.room',
+                    ),
+                ),
+            ],
+            options={
+                'unique_together': {('room', 'minute', 'reaction')},
+            },
+        ),
+        migrations.RunPython(rollup_reactions, reverse_code=migrations.RunPython.noop),
+    ]
@@ -91,7 +91,7 @@ from .question import (
 )
 from .resource import Resource, ResourceKind
 from .review import Review, ReviewPhase, ReviewScore, ReviewScoreCategory
-from .room import Reaction, Room, RoomView
+from .room import Reaction, ReactionRollup, Room, RoomView
 from .roomquestion import QuestionVote, RoomQuestion
 from .roulette import RoulettePairing, RouletteRequest
 from .schedule import Schedule
@@ -196,6 +196,7 @@ __all__ = [
     'QueuedMail',
     'Quota',
     'Reaction',
+    'ReactionRollup',
     'RequiredAction',
     'Resource',
     'Review',
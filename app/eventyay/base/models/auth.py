@@ -1188,7 +1188,7 @@ the eventyay team"""
 
         roles = self._grant_cache["event"]
         if room:
-            roles |= self._grant_cache.get(room.id, set())
+            roles = roles | self._grant_cache.get(room.id, set())
         return roles
 
     async def get_role_grants_async(self, room=None):
@@ -1197,7 +1197,7 @@ the eventyay team"""
 
         roles = self._grant_cache["event"]
         if room:
-            roles |= self._grant_cache.get(room.id, set())
+            roles = roles | self._grant_cache.get(room.id, set())
         return roles
 
     def _update_membership_cache(self):
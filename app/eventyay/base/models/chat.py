@@ -3,6 +3,7 @@ from collections import defaultdict
 
 from django.db import models
 from django.db.models import JSONField
+from django.utils.timezone import now
 
 
 class Channel(models.Model):
@@ -40,7 +41,8 @@ class ChatEvent(models.Model):
         related_name="chat_events",
         on_delete=models.CASCADE,
     )
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Not using auto_now_add since buffered events are written after the fact with their original timestamp
+    timestamp = models.DateTimeField(default=now)
     edited = models.DateTimeField(null=True)
     event_type = models.CharField(max_length=200)
     replaces = models.ForeignKey(
@@ -113,6 +113,7 @@ FEATURE_FLAGS = [
     'polls',
     'conftool',
     'cross-origin-isolation',
+    'chat-write-behind',
 ]
 
 
@@ -1014,12 +1015,22 @@ class Event(
 
         return ObjectRelatedCache(self)
 
-    def lock(self, blocking=False, blocking_timeout=None):
+    def lock(self, blocking=False, blocking_timeout=None, quotas=None, seats=(), vouchers=()):
         """
         Returns a contextmanager that can be used to lock an event for bookings.
+
+        If *quotas* is given and fine-grained locking is enabled, only the given quotas, seats
+        and vouchers are locked instead of the whole event.
         """
         from eventyay.base.services import locking
 
+        if quotas is not None and settings.FINE_GRAINED_LOCKING:
+            return locking.ResourceLockManager(
+                self,
+                locking.lock_resources_for(quotas, seats, vouchers),
+                blocking=blocking,
+                blocking_timeout=blocking_timeout,
+            )
         return locking.LockManager(self, blocking=blocking, blocking_timeout=blocking_timeout)
 
     def __getstate__(self):
@@ -1634,17 +1645,21 @@ class Event(
             Membership,
             Poll,
             Reaction,
+            ReactionRollup,
             RoomView,
         )
         from eventyay.base.models.storage_model import StoredFile
+        from eventyay.base.services import chathistory
 
         self.audit_logs.all().delete()
         self.event_grants.all().delete()
         self.room_grants.all().delete()
         self.bbb_calls.all().delete()
         ChatEvent.objects.filter(channel__event=self).delete()
+        chathistory.drop(self.channels.values_list('pk', flat=True))
         Membership.objects.filter(channel__event=self).delete()
         Reaction.objects.filter(room__event=self).delete()
+        ReactionRollup.objects.filter(room__event=self).delete()
         RoomView.objects.filter(room__event=self).delete()
         EventView.objects.filter(event=self).delete()
         RoomQuestion.objects.filter(room__event=self).delete()
@@ -477,6 +477,21 @@ class Order(LockModel, LoggedModel):
         if not self.expires:
             self.set_expires()
         super().save(**kwargs)
+        if 'update_fields' not in kwargs or 'status' in kwargs['update_fields']:
+            previous_status = getattr(self, '_status_in_db', None)
+            if previous_status is not None and previous_status != self.status:
+                from eventyay.base.services import checkinstatus, quotacounters
+
+                quotacounters.order_status_changed(self, previous_status, self.status)
+                checkinstatus.order_status_changed(self, previous_status, self.status)
+            self._status_in_db = self.status
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the status the quota and check-in counters know about, see eventyay.base.services.quotacounters
+        instance._status_in_db = instance.__dict__.get('status')
+        return instance
 
     def touch(self):
         self.save(update_fields=['last_modified'])
@@ -2469,6 +2484,8 @@ class OrderPosition(AbstractPosition):
 
     @classmethod
     def transform_cart_positions(cls, cp: List, order) -> list:
+        from eventyay.base.services.quotacounters import cart_positions_removed
+
         from . import Voucher
 
         ops = []
@@ -2493,6 +2510,7 @@ class OrderPosition(AbstractPosition):
                 Voucher.objects.filter(pk=cartpos.voucher.pk).update(redeemed=F('redeemed') + 1)
                 cartpos.voucher.log_action('eventyay.voucher.redeemed', {'order_code': order.code})
 
+        cart_positions_removed(order.event_id, cp)
         # Delete afterwards. Deleting in between might cause deletion of things related to add-ons
         # due to the deletion cascade.
         for cartpos in cp:
@@ -2562,7 +2580,32 @@ class OrderPosition(AbstractPosition):
         if not self.pk:
             assign_issued_admission_bounds(self)
 
-        return super().save(*args, **kwargs)
+        adding = self._state.adding
+        previous = getattr(self, '_quota_key_in_db', None)
+        ret = super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'product', 'variation', 'subevent', 'canceled'} & set(update_fields):
+            from eventyay.base.services import checkinstatus, quotacounters
+
+            if adding or previous is not None:
+                quotacounters.order_position_saved(self, None if adding else previous)
+                checkinstatus.order_position_saved(self, None if adding else previous)
+            self._quota_key_in_db = (self.product_id, self.variation_id, self.subevent_id, self.canceled)
+        return ret
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the quota and check-in counters know about this position, see
+        # eventyay.base.services.quotacounters
+        if {'product_id', 'variation_id', 'subevent_id', 'canceled'} <= instance.__dict__.keys():
+            instance._quota_key_in_db = (
+                instance.product_id,
+                instance.variation_id,
+                instance.subevent_id,
+                instance.canceled,
+            )
+        return instance
 
     @scopes_disabled()
     def assign_pseudonymization_id(self):
@@ -429,6 +429,20 @@ class Reaction(models.Model):
     amount = models.IntegerField()
 
 
+class ReactionRollup(models.Model):
+    """
+    Number of reactions in a room per minute, written in batches by eventyay.base.services.reactions.
+    """
+
+    room = models.ForeignKey("Room", related_name="reaction_rollups", on_delete=models.CASCADE)
+    minute = models.DateTimeField()
+    reaction = models.CharField(max_length=100)
+    amount = models.IntegerField()
+
+    class Meta:
+        unique_together = (("room", "minute", "reaction"),)
+
+
 class RoomView(models.Model):
     room = models.ForeignKey(to="Room", related_name="views", on_delete=models.CASCADE)
     start = models.DateTimeField(
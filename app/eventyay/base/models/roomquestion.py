@@ -23,6 +23,8 @@ class RoomQuestion(models.Model):
     answered = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
     is_pinned = models.BooleanField(default=False)
+    # Number of votes, written in batches by the vote pipeline in eventyay.base.services.question
+    cached_score = models.PositiveIntegerField(default=0)
 
     room = models.ForeignKey(
         to="Room",
@@ -49,11 +51,12 @@ class RoomQuestion(models.Model):
     @cached_property
     def score(self):
         # When the question is retrieved with the with_score manager method,
-        # we can just use the available score. We'll count manually otherwise.
+        # we can just use the available score. Otherwise, we use the score that
+        # has been written with the last batch of votes.
         aggregated_score = getattr(self, "_score", None)
         if aggregated_score is not None:
             return aggregated_score
-        return self.votes.all().count()
+        return self.cached_score
 
     def serialize_public(self, voted_state=False):
         data = {
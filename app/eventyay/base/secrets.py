@@ -17,11 +17,20 @@ from cryptography.hazmat.primitives.serialization import (
 from django.conf import settings
 from django.dispatch import receiver
 from django.utils.crypto import get_random_string
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from google.protobuf.message import DecodeError
 
-from eventyay.base.models import Product, ProductVariation, SubEvent
+from eventyay.base.models import (
+    Order,
+    OrderPosition,
+    Product,
+    ProductVariation,
+    RevokedTicketSecret,
+    SubEvent,
+)
 from eventyay.base.secretgenerators import pretix_sig1_pb2
+from eventyay.base.services import secretindex
 from eventyay.base.signals import register_ticket_secret_generators
 
 logger = logging.getLogger(__name__)
@@ -95,6 +104,32 @@ class BaseTicketSecretGenerator:
         """
         raise NotImplementedError()
 
+    def generate_secrets(self, positions, force_invalidate=False) -> list:
+        """
+        Generate secrets for many order positions at once, e.g. when all tickets of an event are reissued. Returns a
+        list of secrets in the same order as ``positions``. For every position, the same rules apply as for
+        :py:meth:`generate_secret` called with the position's ``product``, ``variation``, ``subevent``,
+        ``attendee_name`` and ``secret``.
+
+        The default implementation calls :py:meth:`generate_secret` for every position. You can override it if your
+        method has a setup cost that can be shared between positions.
+        """
+        pass_name = 'attendee_name' in inspect.signature(self.generate_secret).parameters
+        secrets = []
+        for p in positions:
+            kwargs = {'attendee_name': p.attendee_name} if pass_name else {}
+            secrets.append(
+                self.generate_secret(
+                    product=p.product,
+                    variation=p.variation,
+                    subevent=p.subevent,
+                    current_secret=p.secret,
+                    force_invalidate=force_invalidate,
+                    **kwargs,
+                )
+            )
+        return secrets
+
 
 class RandomTicketSecretGenerator(BaseTicketSecretGenerator):
     verbose_name = _('Random (default, works with all apps in the ecosystem)')
@@ -152,17 +187,38 @@ class Sig1TicketSecretGenerator(BaseTicketSecretGenerator):
             pubkey.public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo)
         ).decode()
 
-    def _sign_payload(self, payload):
+    def __init__(self, event):
+        super().__init__(event)
+        self._keys = {}
+
+    def _load_key(self, value, loader):
+        # Loading a PEM key costs more than signing or verifying with it, so we keep the key objects for as long as
+        # the event settings do not change
+        key = self._keys.get(value)
+        if key is None:
+            key = self._keys[value] = loader(base64.b64decode(value))
+        return key
+
+    def _private_key(self):
         if not self.event.settings.ticket_secrets_pretix_sig1_privkey:
             self._generate_keys()
-        privkey = load_pem_private_key(
-            base64.b64decode(self.event.settings.ticket_secrets_pretix_sig1_privkey),
-            None,
+        return self._load_key(
+            self.event.settings.ticket_secrets_pretix_sig1_privkey,
+            lambda data: load_pem_private_key(data, None),
         )
-        signature = privkey.sign(payload)
+
+    def _public_key(self):
+        return self._load_key(self.event.settings.ticket_secrets_pretix_sig1_pubkey, load_pem_public_key)
+
+    def _sign_payload(self, payload):
+        signature = self._private_key().sign(payload)
         return bytes([0x01]) + struct.pack('>H', len(payload)) + struct.pack('>H', len(signature)) + payload + signature
 
-    def _parse(self, secret):
+    def _parse(self, secret, ticket=None):
+        """
+        Verifies a secret and returns the decoded ticket, or ``None`` if the secret is invalid. If ``ticket`` is given,
+        the message is decoded into it instead of a new message.
+        """
         try:
             rawbytes = base64.b64decode(secret[::-1])
             if len(rawbytes) < 5:
@@ -174,17 +230,33 @@ class Sig1TicketSecretGenerator(BaseTicketSecretGenerator):
             sig_len = struct.unpack('>H', rawbytes[3:5])[0]
             payload = rawbytes[5 : 5 + payload_len]
             signature = rawbytes[5 + payload_len : 5 + payload_len + sig_len]
-            pubkey = load_pem_public_key(
-                base64.b64decode(self.event.settings.ticket_secrets_pretix_sig1_pubkey),
-            )
-            pubkey.verify(signature, payload)
-            t = pretix_sig1_pb2.Ticket()
+            self._public_key().verify(signature, payload)
+            t = ticket if ticket is not None else pretix_sig1_pb2.Ticket()
             t.ParseFromString(payload)
             return t
         except (binascii.Error, struct.error, ValueError, TypeError, InvalidSignature, DecodeError) as e:
             logger.debug('Failed to parse ticket secret: %s', e)
             return None
 
+    def _generate(self, ticket, product, variation, subevent, current_secret, force_invalidate):
+        if current_secret and not force_invalidate:
+            if self._parse(current_secret, ticket):
+                unchanged = (
+                    ticket.item == product.pk
+                    and ticket.variation == (variation.pk if variation else 0)
+                    and ticket.subevent == (subevent.pk if subevent else 0)
+                )
+                if unchanged:
+                    return current_secret
+
+        ticket.Clear()
+        ticket.seed = get_random_string(9)
+        ticket.item = product.pk
+        ticket.variation = variation.pk if variation else 0
+        ticket.subevent = subevent.pk if subevent else 0
+        payload = ticket.SerializeToString()
+        return base64.b64encode(self._sign_payload(payload)).decode()[::-1]
+
     def generate_secret(
         self,
         product: Product,
@@ -194,25 +266,14 @@ class Sig1TicketSecretGenerator(BaseTicketSecretGenerator):
         current_secret: str = None,
         force_invalidate=False,
     ):
-        if current_secret and not force_invalidate:
-            ticket = self._parse(current_secret)
-            if ticket:
-                unchanged = (
-                    ticket.item == product.pk
-                    and ticket.variation == (variation.pk if variation else 0)
-                    and ticket.subevent == (subevent.pk if subevent else 0)
-                )
-                if unchanged:
-                    return current_secret
+        return self._generate(pretix_sig1_pb2.Ticket(), product, variation, subevent, current_secret, force_invalidate)
 
-        t = pretix_sig1_pb2.Ticket()
-        t.seed = get_random_string(9)
-        t.item = product.pk
-        t.variation = variation.pk if variation else 0
-        t.subevent = subevent.pk if subevent else 0
-        payload = t.SerializeToString()
-        result = base64.b64encode(self._sign_payload(payload)).decode()[::-1]
-        return result
+    def generate_secrets(self, positions, force_invalidate=False):
+        # One message instance is enough to verify the current secrets and encode the new ones
+        ticket = pretix_sig1_pb2.Ticket()
+        return [
+            self._generate(ticket, p.product, p.variation, p.subevent, p.secret, force_invalidate) for p in positions
+        ]
 
 
 @receiver(register_ticket_secret_generators, dispatch_uid='ticket_generator_default')
@@ -248,3 +309,35 @@ def assign_ticket_secret(
     position.secret = secret
     if save and changed:
         position.save()
+
+
+def assign_ticket_secrets(event, positions, force_invalidate_if_revokation_list_used=False, force_invalidate=False):
+    """
+    Batch version of :py:func:`assign_ticket_secret` for many positions of the same event. Changed secrets are
+    written with bulk queries, so no ``save()`` or ``post_save`` handlers run for the positions. Instead, we touch the
+    orders and update the secret index ourselves. Returns the list of positions whose secret changed.
+    """
+    gen = event.ticket_secret_generator
+    if gen.use_revocation_list and force_invalidate_if_revokation_list_used:
+        force_invalidate = True
+
+    secrets = gen.generate_secrets(positions, force_invalidate=force_invalidate)
+    changed = []
+    revoked = []
+    previous = {}
+    for position, secret in zip(positions, secrets):
+        if position.secret == secret:
+            continue
+        previous[position.pk] = position.secret
+        if position.secret and gen.use_revocation_list:
+            revoked.append(RevokedTicketSecret(event=event, position=position, secret=position.secret))
+        position.secret = secret
+        changed.append(position)
+
+    if changed:
+        OrderPosition.all.bulk_update(changed, ['secret'])
+        Order.objects.filter(pk__in={p.order_id for p in changed}).update(last_modified=now())
+    if revoked:
+        RevokedTicketSecret.objects.bulk_create(revoked)
+    secretindex.secrets_changed(event, changed, revoked, previous)
+    return changed
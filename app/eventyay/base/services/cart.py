@@ -1,6 +1,7 @@
 from collections import Counter, defaultdict, namedtuple
 from datetime import datetime, time, timedelta
 from decimal import Decimal
+from functools import partial
 from typing import List, Optional
 
 from celery.exceptions import MaxRetriesExceededError
@@ -34,6 +35,7 @@ from eventyay.base.models.orders import OrderFee, OrderPosition
 from eventyay.base.models.product import ProductMetaValue
 from eventyay.base.models.tax import TAXED_ZERO, TaxedPrice, TaxRule
 from eventyay.base.reldate import RelativeDateWrapper
+from eventyay.base.services import quotacounters, reservationtokens
 from eventyay.base.services.checkin import _save_answers
 from eventyay.base.services.locking import LockTimeoutException, NoLockManager
 from eventyay.base.services.pricing import get_price
@@ -1176,6 +1178,8 @@ class CartManager:
     def _perform_operations(self):
         vouchers_ok = self._get_voucher_availability()
         quotas_ok = self._get_quota_availability()
+        self._quotas_reserved = dict(quotas_ok)
+        self._quotas_left = quotas_ok
         err = None
         warning = None
         new_cart_positions = []
@@ -1411,23 +1415,55 @@ class CartManager:
         self._check_max_cart_size()
         self._calculate_expiry()
 
+        counter_snapshot = quotacounters.cart_snapshot(self.event, self.cart_id)
         err = self._delete_out_of_timeframe()
         err = self.extend_expired_positions() or err
 
+        tokens = None
+        if reservationtokens.high_demand_mode(self.event):
+            # Fail fast if the quotas are sold out, before we spend any time waiting for locks
+            tokens = {q: n for q, n in self._quota_diff.items() if n > 0}
+            taken = reservationtokens.take(self.event, tokens)
+            if taken is False:
+                raise CartError(error_messages['unavailable'])
+            elif taken is None:
+                tokens = {}
+
         lockfn = NoLockManager
         if self._require_locking():
-            lockfn = self.event.lock
-
-        with lockfn() as now_dt:
-            with transaction.atomic():
-                self.now_dt = now_dt
-                self._extend_expiry_of_valid_existing_positions()
-                err, warning = self._perform_operations()
-            if err:
-                raise CartError(err)
-            # Store warning for later retrieval if needed
-            if warning:
-                self._last_warning = warning
+            lockfn = partial(
+                self.event.lock,
+                quotas=list(self._quota_diff),
+                seats={o.seat for o in self._operations if getattr(o, 'seat', None)},
+                vouchers=list(self._voucher_use_diff),
+            )
+
+        committed = False
+        try:
+            with lockfn() as now_dt:
+                with transaction.atomic():
+                    self.now_dt = now_dt
+                    self._extend_expiry_of_valid_existing_positions()
+                    err, warning = self._perform_operations()
+                    quotacounters.sync_cart(self.event, self.cart_id, counter_snapshot)
+                committed = True
+                if err:
+                    raise CartError(err)
+                # Store warning for later retrieval if needed
+                if warning:
+                    self._last_warning = warning
+        finally:
+            if tokens is not None:
+                reservationtokens.give_back(self.event, self._unused_tokens(tokens, committed))
+
+    def _unused_tokens(self, tokens, committed):
+        if not committed:
+            return tokens
+        # Everything we took but did not reserve, plus what was freed by removed positions
+        return {
+            q: tokens.get(q, 0) - self._quotas_reserved.get(q, 0) + self._quotas_left.get(q, 0)
+            for q in set(tokens) | set(self._quotas_left)
+        }
 
 
 def update_tax_rates(event: Event, cart_id: str, invoice_address: InvoiceAddress):
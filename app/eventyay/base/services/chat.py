@@ -30,6 +30,7 @@ from eventyay.base.models import (
 from eventyay.base.models.chat import ChatEventNotification
 from eventyay.core.permissions import Permission
 from eventyay.core.utils.redis import aredis
+from eventyay.base.services import chatbuffer, chathistory
 from eventyay.base.services.bbb import choose_server
 from eventyay.base.services.user import get_public_users, user_broadcast
 
@@ -234,8 +235,7 @@ class ChatService:
             m.save(update_fields=["hidden"])
         return u
 
-    @database_sync_to_async
-    def get_events(
+    async def get_events(
         self,
         channel,
         before_id,
@@ -244,39 +244,116 @@ class ChatService:
         users_known_to_client=None,
         include_admin_info=False,
         trait_badges_map=None,
+        use_history=False,
     ):
-        events = ChatEvent.objects
-        if skip_membership:
-            events = events.exclude(event_type="channel.member")
-        events = list(
-            events.filter(
-                id__lt=before_id,
-                channel=channel,
+        events = None
+        if use_history:
+            events = await self._get_events_from_history(
+                channel, before_id, count, skip_membership
+            )
+        if events is None:
+            events = await self._get_events(
+                channel,
+                before_id,
+                count,
+                skip_membership,
+                buffered_events=await self._get_buffered_events(channel, before_id),
             )
-            .prefetch_related("reactions")
-            .order_by("-id")[: min(count, 1000)]
-        )
-        user_ids = set()
 
+        user_ids = set()
         for e in events:
-            user_ids.add(str(e.sender.pk))
+            user_ids.add(e["sender"])
 
-            for r in e.reactions.all():
-                user_ids.add(str(r.sender.pk))
+            for senders in e["reactions"].values():
+                user_ids |= set(senders)
 
-            if e.content.get("type") == "text":
-                user_ids |= extract_mentioned_user_ids(e.content.get("body", ""))
+            if e["content"].get("type") == "text":
+                user_ids |= extract_mentioned_user_ids(e["content"].get("body", ""))
+        user_ids.discard(None)
 
         if users_known_to_client:
             user_ids = user_ids - set(users_known_to_client)
-        users = {
-            str(u.pk): u.serialize_public(
-                include_admin_info=include_admin_info,
-                trait_badges_map=trait_badges_map,
+        if include_admin_info:
+            # Admin info is not cached
+            users = await self._get_users(user_ids, include_admin_info, trait_badges_map)
+            users = {pk: user for pk, (version, user) in users.items()}
+        else:
+            users = await chathistory.get_users(user_ids)
+            loaded = await self._get_users(
+                user_ids - users.keys(), include_admin_info, trait_badges_map
+            )
+            await chathistory.store_users(loaded)
+            users.update({pk: user for pk, (version, user) in loaded.items()})
+        return events, users
+
+    async def _get_events_from_history(self, channel, before_id, count, skip_membership):
+        events, loaded = await chathistory.get_events(
+            channel, before_id, count, skip_membership
+        )
+        if not loaded and await chathistory.start_load(channel):
+            latest = await self._get_events(
+                channel,
+                None,
+                chathistory.HISTORY_SIZE + 1,
+                buffered_events=await self._get_buffered_events(channel, None),
+            )
+            await chathistory.load(
+                channel,
+                list(reversed(latest)),
+                complete=len(latest) <= chathistory.HISTORY_SIZE,
+            )
+            events, loaded = await chathistory.get_events(
+                channel, before_id, count, skip_membership
+            )
+        return events
+
+    async def _get_buffered_events(self, channel, before_id):
+        if "chat-write-behind" in self.event.feature_flags:
+            return await chatbuffer.pending_events(channel, before_id)
+        return ()
+
+    @database_sync_to_async
+    def _get_events(
+        self,
+        channel,
+        before_id,
+        count,
+        skip_membership=False,
+        buffered_events=(),
+    ):
+        events = ChatEvent.objects.filter(channel=channel)
+        if skip_membership:
+            events = events.exclude(event_type="channel.member")
+        if before_id is not None:
+            events = events.filter(id__lt=before_id)
+        events = list(
+            events.prefetch_related("reactions").order_by("-id")[: min(count, 1000)]
+        )
+        events = [e.serialize_public() for e in events]
+        if skip_membership:
+            buffered_events = [e for e in buffered_events if e["event_type"] != "channel.member"]
+        if buffered_events:
+            # Events that have not been written to the database yet, see chatbuffer
+            known = {e["event_id"] for e in events}
+            events = sorted(
+                events + [e for e in buffered_events if e["event_id"] not in known],
+                key=lambda e: e["event_id"],
+                reverse=True,
+            )[: min(count, 1000)]
+        return list(reversed(events))
+
+    @database_sync_to_async
+    def _get_users(self, user_ids, include_admin_info, trait_badges_map):
+        return {
+            str(u.pk): (
+                u.version,
+                u.serialize_public(
+                    include_admin_info=include_admin_info,
+                    trait_badges_map=trait_badges_map,
+                ),
             )
             for u in User.objects.filter(event=self.event, id__in=user_ids)
         }
-        return [e.serialize_public() for e in reversed(events)], users
 
     @database_sync_to_async
     def _store_event(self, channel, id, event_type, content, sender, replaces=None):
@@ -328,6 +405,12 @@ class ChatService:
                 return int(rval.decode())
             return await self._get_highest_id()
 
+    def buffers_events(self, channel):
+        """
+        Returns whether new events in the channel are broadcast before they are written to the database.
+        """
+        return chatbuffer.buffer_enabled(self.event, channel)
+
     async def create_event(
         self, channel, event_type, content, sender, replaces=None, _retry=False
     ):
@@ -337,6 +420,22 @@ class ChatService:
             current_max = await self._get_highest_id()
             async with aredis() as redis:
                 await redis.set("chat.event_id", current_max + 1)
+        if self.buffers_events(channel):
+            event = {
+                "event_id": event_id,
+                "channel": str(channel.pk),
+                "sender": str(sender.pk) if sender else None,
+                "type": "chat.event",
+                "timestamp": now().isoformat(),
+                "event_type": event_type,
+                "content": content,
+                "edited": None,
+                "replaces": replaces,
+                "reactions": {},
+            }
+            await chatbuffer.append_event(event)
+            await chathistory.event_changed(event, new=True)
+            return event
         event = await self._store_event(
             channel=channel,
             id=event_id,
@@ -346,6 +445,7 @@ class ChatService:
             replaces=replaces,
         )
         if event:
+            await chathistory.event_changed(event, new=True)
             return event
         elif not _retry:
             # Ooops! Probably our redis cleared out / failed over. Let's try to self-heal
@@ -357,15 +457,25 @@ class ChatService:
             )
         raise ValueError("unable to recover in store_event")  # pragma: no cover
 
+    async def remove_reaction(self, event, reaction, user):
+        event = await self._remove_reaction(event, reaction, user)
+        await chathistory.event_changed(event)
+        return event
+
     @database_sync_to_async
-    def remove_reaction(self, event, reaction, user):
+    def _remove_reaction(self, event, reaction, user):
         ChatEventReaction.objects.filter(
             chat_event=event, reaction=reaction, sender=user
         ).delete()
         return self._get_event(pk=event.pk).serialize_public()
 
+    async def add_reaction(self, event, reaction, user):
+        event = await self._add_reaction(event, reaction, user)
+        await chathistory.event_changed(event)
+        return event
+
     @database_sync_to_async
-    def add_reaction(self, event, reaction, user):
+    def _add_reaction(self, event, reaction, user):
         ChatEventReaction.objects.update_or_create(
             chat_event=event, reaction=reaction, sender=user
         )
@@ -389,24 +499,6 @@ class ChatService:
             str(n["chat_event__channel_id"]): n["count"] for n in notification_counts
         }
 
-    @database_sync_to_async
-    def store_notification(self, event_id: int, user_ids: list):
-        """
-        Stores notifications for a given event for multiple users.
-
-        Args:
-            event_id (int): The ID of the chat event.
-            user_ids (list): List of user IDs to receive the notification.
-
-        Returns:
-            None
-        """
-        notifications = [
-            ChatEventNotification(chat_event_id=event_id, recipient_id=user_id)
-            for user_id in user_ids
-        ]
-        ChatEventNotification.objects.bulk_create(notifications)
-
     @database_sync_to_async
     def remove_notifications(self, user_id: int, channel_id: int, max_id: int) -> bool:
         """
@@ -498,9 +590,14 @@ class ChatService:
     def get_event(self, **kwargs):
         return self._get_event(**kwargs)
 
+    async def update_event(self, event, new_content, by_user):
+        await chathistory.event_changed(
+            await self._update_event(event, new_content, by_user)
+        )
+
     @database_sync_to_async
     @transaction.atomic
-    def update_event(self, event, new_content, by_user):
+    def _update_event(self, event, new_content, by_user):
         old = event.serialize_public()
         event.content = new_content
         event.edited = now()
@@ -517,6 +614,7 @@ class ChatService:
                 "new": new,
             },
         )
+        return new
 
     @database_sync_to_async
     def get_channels_to_join_forced(self, user):
@@ -0,0 +1,269 @@
+import asyncio
+import json
+import logging
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, transaction
+from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
+
+from eventyay.base.models import ChatEvent
+from eventyay.base.models.chat import ChatEventNotification
+from eventyay.base.signals import periodic_task
+from eventyay.core.utils.redis import aredis
+
+
+logger = logging.getLogger(__name__)
+
+# In events with the "chat-write-behind" feature flag, messages in room channels are broadcast before they are written
+# to the database (see ChatService.create_event). They get their ID from the chat.event_id counter as usual and are
+# appended to a redis stream, from which a flusher running in the background of the server process writes them to the
+# database in batches. Notifications about new messages go through the same stream in all events (see chatfanout).
+#
+# chat:buffer           stream of events and notifications that have not been written to the database yet. Entries
+#                       are only removed once the transaction writing them has been committed, and writing an entry
+#                       twice does no harm, so nothing is lost if a process dies in between.
+# chat:buffer:flusher   lock held by the one flusher that currently writes the stream. A single writer keeps the
+#                       events in order, which matters since edits reference the message they replace.
+# chat:buffer:dead      stream of the entries that can't be read or written, e.g. because their channel or sender has
+#                       been deleted in the meantime, with the reason in the additional field "error". They are moved
+#                       here instead of being retried forever, and can be inspected or replayed by hand.
+#
+# Whatever is left in the stream after a crash or restart is written by the next flusher, which is started by the next
+# buffered message or by the periodic task, whichever comes first.
+KEY_STREAM = "chat:buffer"
+KEY_FLUSHER = "chat:buffer:flusher"
+KEY_DEAD = "chat:buffer:dead"
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.5  # seconds
+FLUSHER_TTL = 10  # seconds, the lock of a flusher that died is free again after this time
+FLUSHER_IDLE_ROUNDS = 20  # a flusher stops after the stream has been empty for this many intervals
+PENDING_LOOKUP = 1000  # number of the most recent buffered entries that are merged into the chat history
+DEAD_MAXLEN = 10000  # the oldest entries that can't be written are dropped for good beyond this length
+
+# Errors that won't go away by trying again, as opposed to e.g. the database being unavailable
+WRITE_ERRORS = (IntegrityError, DataError, ValidationError, TypeError, ValueError)
+
+ACQUIRE = """
+local holder = redis.call('get', KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+redis.call('set', KEYS[1], ARGV[1], 'ex', ARGV[2])
+return 1
+"""
+
+RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_tasks = {}  # background tasks of this process, by name
+
+
+def buffer_enabled(event, channel):
+    return bool(channel.room_id) and "chat-write-behind" in event.feature_flags
+
+
+async def append_event(event):
+    """
+    Buffers a serialized chat event until it is written to the database.
+    """
+    await _append({"event": json.dumps(event)})
+
+
+async def append_notifications(event_id, user_ids):
+    """
+    Buffers the notifications for a chat event. For buffered events, they are written after the event itself.
+    """
+    await _append({"notifications": json.dumps({"event_id": event_id, "users": list(user_ids)})})
+
+
+async def _append(fields):
+    async with aredis(KEY_STREAM) as redis:
+        await redis.xadd(KEY_STREAM, fields)
+    start_flusher()
+
+
+async def pending_events(channel_id, before_id):
+    """
+    Returns the buffered events of a channel that are older than ``before_id`` (if given), newest first. Some of them
+    might already be in the database.
+    """
+    async with aredis(KEY_STREAM) as redis:
+        entries = await redis.xrevrange(KEY_STREAM, count=PENDING_LOOKUP)
+    events = []
+    for entry_id, fields in entries:
+        if b"event" in fields:
+            event = json.loads(fields[b"event"])
+            if event["channel"] == str(channel_id) and (before_id is None or event["event_id"] < before_id):
+                events.append(event)
+    return events
+
+
+def start_flusher():
+    task = _tasks.get("flusher")
+    if task is None or task.done():
+        _tasks["flusher"] = asyncio.get_running_loop().create_task(_run_flusher())
+
+
+def _deserialize(entries):
+    """
+    Returns the events and notifications of the given stream entries as lists of ``(entry ID, object)`` pairs, and
+    the entries that can't be read as a dict mapping their ID to the reason.
+    """
+    events, notifications, dead = [], [], {}
+    for entry_id, fields in entries:
+        try:
+            if b"event" in fields:
+                event = json.loads(fields[b"event"])
+                events.append(
+                    (
+                        entry_id,
+                        ChatEvent(
+                            id=event["event_id"],
+                            channel_id=event["channel"],
+                            timestamp=parse_datetime(event["timestamp"]),
+                            event_type=event["event_type"],
+                            content=event["content"],
+                            sender_id=event["sender"],
+                            replaces_id=event["replaces"],
+                        ),
+                    )
+                )
+            else:
+                data = json.loads(fields[b"notifications"])
+                notifications += [(entry_id, (int(data["event_id"]), str(user_id))) for user_id in data["users"]]
+        except (KeyError, TypeError, ValueError) as e:
+            dead[entry_id] = repr(e)
+    return events, notifications, dead
+
+
+def _new_notifications(notifications):
+    # Notifications have no unique constraint, so we skip those that have been written before, but not removed from
+    # the stream
+    pairs = {pair: entry_id for entry_id, pair in notifications}
+    if not pairs:
+        return []
+    existing = {
+        (event_id, str(user_id))
+        for event_id, user_id in ChatEventNotification.objects.filter(
+            chat_event_id__in={event_id for event_id, user_id in pairs}
+        ).values_list("chat_event_id", "recipient_id")
+    }
+    return [
+        (entry_id, ChatEventNotification(chat_event_id=event_id, recipient_id=user_id))
+        for (event_id, user_id), entry_id in pairs.items()
+        if (event_id, user_id) not in existing
+    ]
+
+
+@database_sync_to_async
+def _store(entries):
+    """
+    Writes the given stream entries to the database. Returns the entries that can't be written, as a dict mapping
+    their ID to the reason.
+    """
+    events, notifications, dead = _deserialize(entries)
+    try:
+        with transaction.atomic():
+            # Conflicts are events that have been written before, but not removed from the stream
+            ChatEvent.objects.bulk_create([obj for entry_id, obj in events], ignore_conflicts=True)
+            ChatEventNotification.objects.bulk_create([obj for entry_id, obj in _new_notifications(notifications)])
+        return dead
+    except WRITE_ERRORS:
+        # Usually a channel or user that has been deleted in the meantime. We do not want to lose the whole batch
+        # because of it, so we try again one by one.
+        logger.warning("Could not write buffered chat events in bulk, retrying one by one.")
+
+    for entry_id, obj in events:
+        error = _store_one(obj)
+        if error:
+            dead[entry_id] = error
+    for entry_id, obj in _new_notifications(notifications):
+        error = _store_one(obj)
+        if error:
+            dead[entry_id] = error
+    return dead
+
+
+def _store_one(obj):
+    """
+    Writes a single object and returns ``None``, or the reason if it can't be written.
+    """
+    try:
+        with transaction.atomic():
+            type(obj).objects.bulk_create([obj], ignore_conflicts=True)
+    except WRITE_ERRORS as e:
+        logger.info(f"Buffered {obj._meta.model_name} can't be written: {e!r}")
+        return repr(e)
+
+
+async def flush(redis):
+    """
+    Writes the oldest batch of buffered entries to the database and removes them from the stream. Entries that can't
+    be written are moved to the dead letter stream. Must only be called while holding the flusher lock. Returns the
+    number of entries processed.
+    """
+    entries = await redis.xrange(KEY_STREAM, count=BATCH_SIZE)
+    if entries:
+        dead = await _store(entries)
+        tr = redis.pipeline(transaction=True)
+        for entry_id, fields in entries:
+            if entry_id in dead:
+                tr.xadd(KEY_DEAD, {**fields, b"error": dead[entry_id]}, maxlen=DEAD_MAXLEN, approximate=True)
+        tr.xdel(KEY_STREAM, *[entry_id for entry_id, fields in entries])
+        await tr.execute()
+        if dead:
+            logger.warning(f"Moved {len(dead)} buffered chat entries that can't be written to {KEY_DEAD}.")
+    return len(entries)
+
+
+async def _run_flusher():
+    token = str(uuid.uuid4())
+    idle = 0
+    async with aredis(KEY_STREAM) as redis:
+        try:
+            # Even if another process holds the lock, we keep going until the stream is empty, so that our entries
+            # are not left behind if the other flusher stops right after we appended them.
+            while idle < FLUSHER_IDLE_ROUNDS:
+                written = 0
+                if await redis.eval(ACQUIRE, 1, KEY_FLUSHER, token, FLUSHER_TTL):
+                    try:
+                        written = await flush(redis)
+                    except Exception:
+                        logger.exception("Could not write buffered chat events.")
+                if written == BATCH_SIZE:
+                    continue
+                idle = idle + 1 if not await redis.xlen(KEY_STREAM) else 0
+                await asyncio.sleep(FLUSH_INTERVAL)
+        finally:
+            await redis.eval(RELEASE, 1, KEY_FLUSHER, token)
+
+
+async def flush_buffer():
+    """
+    Writes all buffered entries to the database, unless a flusher is already running.
+    """
+    token = str(uuid.uuid4())
+    written = 0
+    async with aredis(KEY_STREAM) as redis:
+        try:
+            while await redis.xlen(KEY_STREAM) and await redis.eval(ACQUIRE, 1, KEY_FLUSHER, token, FLUSHER_TTL):
+                written += await flush(redis)
+        finally:
+            await redis.eval(RELEASE, 1, KEY_FLUSHER, token)
+    return written
+
+
+@receiver(signal=periodic_task, dispatch_uid="chatbuffer_flush")
+def flush_chat_buffer(sender, **kwargs):
+    written = async_to_sync(flush_buffer)()
+    if written:
+        logger.info(f"Wrote {written} chat events and notifications left behind in the buffer.")
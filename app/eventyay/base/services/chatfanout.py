@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from channels.layers import get_channel_layer
+
+from eventyay.base.services import chatbuffer
+from eventyay.core.utils.redis import aredis
+from eventyay.features.live.channels import GROUP_USER
+
+
+logger = logging.getLogger(__name__)
+
+# Unread pointers and notifications for new chat messages are not sent by the socket that sent the message, but queued
+# here and fanned out by a worker task in the background of the server process once per tick. Within a tick, all new
+# messages in a channel result in one unread pointer per user, and all pointers for a user are sent in one message.
+# Notifications are persisted through the chat buffer before they are queued, so only the websocket messages are lost
+# if the process dies before the next tick.
+#
+# The users to send unread pointers to in room channels are popped from chat:unread.notify:{channel} by the worker,
+# since they do not need to be notified again until they sent a new read pointer (see ChatModule.mark_read).
+FANOUT_TICK = 0.5  # seconds
+SEND_CONCURRENCY = 100
+POP_LIMIT = 100_000
+
+_pointers = {}  # channel ID -> (ID of the newest event, ID of its sender)
+_dm_pointers = defaultdict(dict)  # user ID -> {channel ID: ID of the newest event}
+_notifications = []  # (serialized event, serialized sender, list of user IDs)
+_tasks = {}  # background tasks of this process, by name
+
+
+def queue_unread_pointers(channel_id, event_id, sender_id, user_ids=None):
+    """
+    Queues new unread pointers for a channel. If ``user_ids`` is not given, the users are taken from the set of
+    users to notify of the channel.
+    """
+    channel_id = str(channel_id)
+    if user_ids is None:
+        if channel_id not in _pointers or _pointers[channel_id][0] < event_id:
+            _pointers[channel_id] = (event_id, sender_id)
+    else:
+        for user_id in user_ids:
+            if user_id != sender_id:
+                _dm_pointers[user_id][channel_id] = max(_dm_pointers[user_id].get(channel_id, 0), event_id)
+    _start_worker()
+
+
+async def queue_notifications(event, sender, user_ids):
+    """
+    Stores notifications of the given users about a chat event and queues sending them.
+    """
+    if user_ids:
+        user_ids = list(user_ids)
+        # The buffer writes them to the database in batches, after the event itself if that is buffered as well
+        await chatbuffer.append_notifications(event["event_id"], user_ids)
+        _notifications.append((event, sender, user_ids))
+        _start_worker()
+
+
+def _start_worker():
+    task = _tasks.get("worker")
+    if task is None or task.done():
+        _tasks["worker"] = asyncio.get_running_loop().create_task(_run_worker())
+
+
+async def _run_worker():
+    while _pointers or _dm_pointers or _notifications:
+        await asyncio.sleep(FANOUT_TICK)
+        pointers, dm_pointers, notifications = dict(_pointers), dict(_dm_pointers), list(_notifications)
+        _pointers.clear()
+        _dm_pointers.clear()
+        _notifications.clear()
+        try:
+            await fan_out(pointers, dm_pointers, notifications)
+        except Exception:
+            logger.exception("Could not fan out chat notifications.")
+
+
+async def fan_out(pointers, dm_pointers, notifications):
+    channel_layer = get_channel_layer()
+    semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+
+    async def _send(user_id, message):
+        async with semaphore:
+            await channel_layer.group_send(GROUP_USER.format(id=user_id), message)
+
+    await asyncio.gather(
+        *(
+            _send(user_id, {"type": "chat.notification", "data": {"event": event, "sender": sender}})
+            for event, sender, user_ids in notifications
+            for user_id in user_ids
+        )
+    )
+
+    by_user = defaultdict(dict, {user_id: dict(p) for user_id, p in dm_pointers.items()})
+    if pointers:
+        async with aredis() as redis:
+            pipe = redis.pipeline(transaction=False)
+            for channel_id in pointers:
+                pipe.spop(f"chat:unread.notify:{channel_id}", POP_LIMIT)
+            results = await pipe.execute()
+        for (channel_id, (event_id, sender_id)), user_ids in zip(pointers.items(), results):
+            for user_id in {u.decode() for u in user_ids or []} - {sender_id}:
+                by_user[user_id][channel_id] = max(by_user[user_id].get(channel_id, 0), event_id)
+    await asyncio.gather(
+        *(_send(user_id, {"type": "chat.unread_pointers", "data": data}) for user_id, data in by_user.items())
+    )
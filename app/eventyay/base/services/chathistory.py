@@ -0,0 +1,214 @@
+import json
+
+from eventyay.base.models import User
+from eventyay.core.utils.redis import aredis, sredis
+
+
+# The most recent events of every room channel are kept in redis, so that the clients entering a busy room, which all
+# fetch the tail of the chat at the same moment, do not all query the database (see ChatService.get_events). Older
+# pages and direct messages are still read from the database.
+#
+# chat:history:{channel}           sorted set of the most recent serialized events, scored by event ID
+# chat:history:{channel}:meta      hash with "complete" once the sorted set has been loaded from the database, and
+#                                  "all" as long as the sorted set holds every event of the channel
+# chat:history:{channel}:loading   lock held while the sorted set is loaded from the database. Changes that happen in
+#                                  the meantime are recorded in the sorted set and take precedence over the database.
+# chat:user:{user}                 public profile of a user in chat, along with the version of the user model it was
+#                                  serialized from
+KEY_HISTORY = "chat:history:{channel}"
+KEY_META = "chat:history:{channel}:meta"
+KEY_LOADING = "chat:history:{channel}:loading"
+KEY_USER = "chat:user:{user}"
+
+HISTORY_SIZE = 200
+HISTORY_TTL = 24 * 3600  # seconds, refreshed with every change
+LOAD_TIMEOUT = 10  # seconds
+USER_TTL = 300  # seconds
+
+CHANGE = """
+local complete = redis.call('hget', KEYS[2], 'complete') == '1'
+if not complete and redis.call('exists', KEYS[3]) == 0 then
+    return 0
+end
+if complete and ARGV[5] ~= '1' and #redis.call('zrangebyscore', KEYS[1], ARGV[1], ARGV[1]) == 0 then
+    -- Edits and reactions of events older than the tail we keep
+    return 0
+end
+redis.call('zremrangebyscore', KEYS[1], ARGV[1], ARGV[1])
+redis.call('zadd', KEYS[1], ARGV[1], ARGV[2])
+if complete then
+    local excess = redis.call('zcard', KEYS[1]) - tonumber(ARGV[3])
+    if excess > 0 then
+        redis.call('zremrangebyrank', KEYS[1], 0, excess - 1)
+        redis.call('hset', KEYS[2], 'all', '0')
+    end
+end
+redis.call('expire', KEYS[1], ARGV[4])
+redis.call('expire', KEYS[2], ARGV[4])
+return 1
+"""
+
+START_LOAD = """
+if not redis.call('set', KEYS[3], '1', 'nx', 'ex', ARGV[1]) then
+    return 0
+end
+redis.call('del', KEYS[1], KEYS[2])
+return 1
+"""
+
+LOAD = """
+for i = 4, #ARGV, 2 do
+    if #redis.call('zrangebyscore', KEYS[1], ARGV[i], ARGV[i]) == 0 then
+        redis.call('zadd', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+local all = ARGV[3]
+local excess = redis.call('zcard', KEYS[1]) - tonumber(ARGV[1])
+if excess > 0 then
+    redis.call('zremrangebyrank', KEYS[1], 0, excess - 1)
+    all = '0'
+end
+redis.call('hset', KEYS[2], 'complete', '1', 'all', all)
+redis.call('expire', KEYS[1], ARGV[2])
+redis.call('expire', KEYS[2], ARGV[2])
+redis.call('del', KEYS[3])
+return 1
+"""
+
+
+def _keys(channel_id):
+    return (
+        KEY_HISTORY.format(channel=channel_id),
+        KEY_META.format(channel=channel_id),
+        KEY_LOADING.format(channel=channel_id),
+    )
+
+
+async def get_events(channel_id, before_id, count, skip_membership=False):
+    """
+    Returns the ``count`` most recent events of the channel older than ``before_id`` in chronological order, along
+    with whether the history of the channel has been loaded at all. The events are ``None`` if the request can't be
+    answered from redis.
+    """
+    key, key_meta, key_loading = _keys(channel_id)
+    async with aredis(key) as redis:
+        pipe = redis.pipeline(transaction=False)
+        pipe.hgetall(key_meta)
+        pipe.zrevrangebyscore(key, f"({before_id}", "-inf", start=0, num=HISTORY_SIZE)
+        meta, entries = await pipe.execute()
+    if meta.get(b"complete") != b"1":
+        return None, False
+
+    events = [json.loads(e) for e in entries]
+    if skip_membership:
+        events = [e for e in events if e["event_type"] != "channel.member"]
+    if len(events) < count and meta.get(b"all") != b"1":
+        return None, True
+    return list(reversed(events[:count])), True
+
+
+async def start_load(channel_id):
+    """
+    Prepares loading the history of a channel from the database. Returns ``False`` if somebody else is already doing
+    so.
+    """
+    key, key_meta, key_loading = _keys(channel_id)
+    async with aredis(key) as redis:
+        return bool(await redis.eval(START_LOAD, 3, key, key_meta, key_loading, LOAD_TIMEOUT))
+
+
+async def load(channel_id, events, complete):
+    """
+    Stores the most recent events of a channel, as read from the database after :py:func:`start_load`. ``complete``
+    tells whether these are all events of the channel.
+    """
+    args = []
+    for e in events[:HISTORY_SIZE]:
+        args += [e["event_id"], json.dumps(e)]
+    key, key_meta, key_loading = _keys(channel_id)
+    async with aredis(key) as redis:
+        await redis.eval(
+            LOAD,
+            3,
+            key,
+            key_meta,
+            key_loading,
+            HISTORY_SIZE,
+            HISTORY_TTL,
+            "1" if complete else "0",
+            *args,
+        )
+
+
+async def event_changed(event, new=False):
+    """
+    Updates the history with a new or changed serialized event.
+    """
+    key, key_meta, key_loading = _keys(event["channel"])
+    async with aredis(key) as redis:
+        await redis.eval(
+            CHANGE,
+            3,
+            key,
+            key_meta,
+            key_loading,
+            event["event_id"],
+            json.dumps(event),
+            HISTORY_SIZE,
+            HISTORY_TTL,
+            "1" if new else "0",
+        )
+
+
+def drop(channel_ids):
+    """
+    Removes the history of the given channels, e.g. after their events have been deleted.
+    """
+    keys = []
+    for channel_id in channel_ids:
+        keys += _keys(channel_id)
+    if keys:
+        with sredis() as redis:
+            redis.delete(*keys)
+
+
+def _user_version_key(user_id):
+    # Maintained by VersionedModel whenever a user is saved
+    return f"modelcache:{User._meta.label}:{user_id}:version"
+
+
+async def get_users(user_ids):
+    """
+    Returns the cached public profiles of the given users, as far as they are cached and up to date.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    keys = []
+    for user_id in user_ids:
+        keys += [KEY_USER.format(user=user_id), _user_version_key(user_id)]
+    async with aredis() as redis:
+        values = await redis.mget(keys)
+
+    users = {}
+    for user_id, cached, version in zip(user_ids, values[::2], values[1::2]):
+        if cached is None:
+            continue
+        data = json.loads(cached)
+        if version is None or version.decode() == str(data["version"]):
+            users[user_id] = data["user"]
+    return users
+
+
+async def store_users(users):
+    """
+    Caches public profiles, given as a dictionary mapping user IDs to tuples of the version of the user model and the
+    serialized profile.
+    """
+    if not users:
+        return
+    async with aredis() as redis:
+        pipe = redis.pipeline(transaction=False)
+        for user_id, (version, user) in users.items():
+            pipe.setex(KEY_USER.format(user=user_id), USER_TTL, json.dumps({"version": version, "user": user}))
+        await pipe.execute()
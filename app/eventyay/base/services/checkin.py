@@ -1,3 +1,4 @@
+import json
 from datetime import timedelta
 from functools import partial, reduce
 
@@ -15,6 +16,7 @@ from django.db.models import (
     Q,
     Subquery,
     Value,
+    prefetch_related_objects,
 )
 from django.db.models.functions import Coalesce, TruncDate
 from django.dispatch import receiver
@@ -35,6 +37,7 @@ from eventyay.base.models import (
     OrderPosition,
     QuestionOption,
 )
+from eventyay.base.services import checkinstatus
 from eventyay.base.signals import checkin_created, order_placed, periodic_task
 from eventyay.helpers.jsonlogic import Logic
 from eventyay.helpers.jsonlogic_query import (
@@ -80,6 +83,52 @@ def get_logic_environment(ev):
     return logic
 
 
+# Compiled rules and SQL expressions, per process. The cache keys contain the rules and everything else the
+# compiled result depends on, so a change to a check-in list or event is picked up on its next use in every process.
+_compiled_rules = {}
+_compiled_rule_queries = {}
+COMPILED_RULES_MAX_SIZE = 1000
+
+
+def _cache_get_or_compute(cache, key, compute):
+    try:
+        return cache[key]
+    except KeyError:
+        if len(cache) >= COMPILED_RULES_MAX_SIZE:
+            cache.clear()
+        cache[key] = result = compute()
+        return result
+
+
+def get_compiled_rules(clist, ev):
+    """
+    Returns the rules of the check-in list compiled into a function that takes the rule variables and returns
+    whether entry is permitted. ``ev`` is the subevent or event of the position that is checked in.
+    """
+    key = (
+        clist.pk,
+        json.dumps(clist.rules, sort_keys=True),
+        type(ev),
+        ev.pk,
+        ev.date_from,
+        ev.date_to,
+        ev.date_admission,
+    )
+    return _cache_get_or_compute(_compiled_rules, key, lambda: get_logic_environment(ev).compile(clist.rules))
+
+
+def get_rules_query(clist):
+    """
+    Returns the rules of the check-in list as a Q object that selects all positions currently allowed to enter.
+    """
+    rules = json.dumps(clist.rules, sort_keys=True)
+    if '"now"' in rules or '"entries_today"' in rules:
+        # The expression contains the current time, so we cannot keep it around
+        return SQLLogic(clist).apply(clist.rules)
+    key = (clist.pk, rules, str(clist.event.tz))
+    return _cache_get_or_compute(_compiled_rule_queries, key, lambda: SQLLogic(clist).apply(clist.rules))
+
+
 class LazyRuleVars:
     def __init__(self, position, clist, dt):
         self._position = position
@@ -491,6 +540,70 @@ def _admission_validity_violated(op, dt):
     raise CheckInError(_('This ticket is no longer valid.'), 'invalid_time')
 
 
+def _check_order_status(op, canceled_supported):
+    if op.canceled:
+        raise CheckInError(
+            _('This ticket has been canceled and cannot be used for check-in.'),
+            'canceled' if canceled_supported else 'unpaid',
+        )
+    if op.order.status not in (Order.STATUS_PAID, Order.STATUS_PENDING):
+        if op.order.status == Order.STATUS_CANCELED:
+            msg = _('This order was canceled. Check-in is not allowed.')
+        else:
+            msg = _('This order cannot be checked in.')
+        raise CheckInError(
+            msg,
+            'canceled' if canceled_supported else 'unpaid',
+        )
+
+
+def _check_position(op, clist, type, force, ignore_unpaid):
+    if type == Checkin.TYPE_ENTRY and not force and not op.product.admission:
+        raise CheckInError(
+            _('This product does not grant admission.'),
+            'product',
+        )
+
+    if not clist.all_products and op.product_id not in [i.pk for i in clist.limit_products.all()]:
+        raise CheckInError(
+            _('This ticket type is not accepted at this check-in list.'),
+            'product',
+        )
+    elif clist.subevent_id and op.subevent_id != clist.subevent_id:
+        raise CheckInError(
+            _('This order position has an invalid date for this check-in list.'),
+            'subevent',
+        )
+    elif (
+        op.order.status != Order.STATUS_PAID
+        and not force
+        and not (ignore_unpaid and clist.include_pending and op.order.status == Order.STATUS_PENDING)
+    ):
+        raise CheckInError(_('This order is not marked as paid.'), 'unpaid')
+
+
+def _check_entry_rules(op, clist, dt, type, force):
+    if type == Checkin.TYPE_ENTRY and not force:
+        _admission_validity_violated(op, dt)
+
+    if type == Checkin.TYPE_ENTRY and clist.rules and not force:
+        rule_data = LazyRuleVars(op, clist, dt)
+        if not get_compiled_rules(clist, op.subevent or clist.event)(rule_data):
+            raise CheckInError(_('This entry is not permitted due to custom rules.'), 'rules')
+
+
+def _entry_allowed(op, clist, last_ci, dt, type, force, gate):
+    entry_allowed = (
+        type == Checkin.TYPE_EXIT
+        or clist.allow_multiple_entries
+        or last_ci is None
+        or (clist.allow_entry_after_exit and last_ci.type == Checkin.TYPE_EXIT)
+    )
+    if type == Checkin.TYPE_ENTRY and entry_allowed and not force and _entry_limit_violated(op, clist, dt, gate):
+        entry_allowed = False
+    return entry_allowed
+
+
 def perform_checkin(
     op: OrderPosition,
     clist: CheckinList,
@@ -521,20 +634,7 @@ def perform_checkin(
     """
     dt = datetime or now()
 
-    if op.canceled:
-        raise CheckInError(
-            _('This ticket has been canceled and cannot be used for check-in.'),
-            'canceled' if canceled_supported else 'unpaid',
-        )
-    if op.order.status not in (Order.STATUS_PAID, Order.STATUS_PENDING):
-        if op.order.status == Order.STATUS_CANCELED:
-            msg = _('This order was canceled. Check-in is not allowed.')
-        else:
-            msg = _('This order cannot be checked in.')
-        raise CheckInError(
-            msg,
-            'canceled' if canceled_supported else 'unpaid',
-        )
+    _check_order_status(op, canceled_supported)
 
     # Do this outside of transaction so it is saved even if the checkin fails for some other reason
     checkin_questions = list(clist.event.questions.filter(ask_during_checkin=True, products__in=[op.product_id]))
@@ -551,62 +651,21 @@ def perform_checkin(
         # Lock order positions
         op = OrderPosition.all.select_for_update().select_related('product').get(pk=op.pk)
 
-        if type == Checkin.TYPE_ENTRY and not force and not op.product.admission:
-            raise CheckInError(
-                _('This product does not grant admission.'),
-                'product',
-            )
-
-        if not clist.all_products and op.product_id not in [i.pk for i in clist.limit_products.all()]:
-            raise CheckInError(
-                _('This ticket type is not accepted at this check-in list.'),
-                'product',
-            )
-        elif clist.subevent_id and op.subevent_id != clist.subevent_id:
-            raise CheckInError(
-                _('This order position has an invalid date for this check-in list.'),
-                'subevent',
-            )
-        elif (
-            op.order.status != Order.STATUS_PAID
-            and not force
-            and not (ignore_unpaid and clist.include_pending and op.order.status == Order.STATUS_PENDING)
-        ):
-            raise CheckInError(_('This order is not marked as paid.'), 'unpaid')
-        elif require_answers and not force and questions_supported:
+        _check_position(op, clist, type, force, ignore_unpaid)
+        if require_answers and not force and questions_supported:
             raise RequiredQuestionsError(
                 _('You need to answer questions to complete this check-in.'),
                 'incomplete',
                 require_answers,
             )
-
-        if type == Checkin.TYPE_ENTRY and not force:
-            _admission_validity_violated(op, dt)
-
-        if type == Checkin.TYPE_ENTRY and clist.rules and not force:
-            rule_data = LazyRuleVars(op, clist, dt)
-            logic = get_logic_environment(op.subevent or clist.event)
-            if not logic.apply(clist.rules, rule_data):
-                raise CheckInError(_('This entry is not permitted due to custom rules.'), 'rules')
+        _check_entry_rules(op, clist, dt, type, force)
 
         device = None
         if isinstance(auth, Device):
             device = auth
 
         last_ci = op.checkins.order_by('-datetime').filter(list=clist).only('type', 'nonce').first()
-        entry_allowed = (
-            type == Checkin.TYPE_EXIT
-            or clist.allow_multiple_entries
-            or last_ci is None
-            or (clist.allow_entry_after_exit and last_ci.type == Checkin.TYPE_EXIT)
-        )
-        if (
-            type == Checkin.TYPE_ENTRY
-            and entry_allowed
-            and not force
-            and _entry_limit_violated(op, clist, dt, device.gate if device else None)
-        ):
-            entry_allowed = False
+        entry_allowed = _entry_allowed(op, clist, last_ci, dt, type, force, device.gate if device else None)
 
         if nonce and (
             (last_ci and last_ci.nonce == nonce)
@@ -644,6 +703,196 @@ def perform_checkin(
             _raise_checkin_denied(op, clist, type, device.gate if device else None)
 
 
+def _batch_candidate(candidates, clist):
+    # Prefer the position that is actually valid on the list if a secret is used twice, e.g. by an add-on
+    products = {i.pk for i in clist.limit_products.all()}
+    matching = [op for op in candidates if clist.all_products or op.product_id in products]
+    return (matching or candidates)[0]
+
+
+def perform_checkins(items, force=False, ignore_unpaid=False, canceled_supported=False, user=None, auth=None):
+    """
+    Processes many check-ins at once, e.g. the scans a device collected while it was offline. Every item is a
+    dictionary with the keys ``secret``, ``list``, ``datetime``, ``nonce`` and ``type``. All secrets are resolved
+    with a single query and all resulting check-ins are created in bulk within a single transaction, but every item is
+    validated just like in :py:func:`perform_checkin`. Items that carry the nonce of a check-in that already exists
+    are treated as successful, so uploading the same batch again is safe. Check-in questions are not asked.
+
+    Returns a list with one dictionary for every item, in the same order, containing the ``status`` (``ok`` or
+    ``error``), the ``position`` and, in case of an error, the ``error`` that occurred.
+    """
+    from eventyay.base.models import LogEntry, RevokedTicketSecret
+
+    device = auth if isinstance(auth, Device) else None
+    gate = device.gate if device else None
+    lists = {item['list'].pk: item['list'] for item in items}
+    prefetch_related_objects([cl for cl in lists.values() if not cl.all_products], 'limit_products')
+    event_ids = {cl.event_id for cl in lists.values()}
+    now_dt = now()
+    for item in items:
+        item['datetime'] = item.get('datetime') or now_dt
+        item['type'] = item.get('type') or Checkin.TYPE_ENTRY
+
+    results = [None] * len(items)
+    logs = []
+    created = []
+    pending = []
+    pending_keys = set()
+
+    def flush():
+        Checkin.objects.bulk_create(pending)
+        created.extend(pending)
+        pending.clear()
+        pending_keys.clear()
+
+    with transaction.atomic():
+        candidates = {}
+        positions = (
+            OrderPosition.all.select_for_update()
+            .filter(order__event_id__in=event_ids, secret__in={item['secret'] for item in items})
+            .select_related('order', 'order__event', 'product')
+            .order_by(F('addon_to').asc(nulls_first=True), 'pk')
+        )
+        for op in positions:
+            candidates.setdefault((op.order.event_id, op.secret), []).append(op)
+
+        revoked = set(
+            RevokedTicketSecret.objects.filter(
+                event_id__in=event_ids,
+                secret__in={item['secret'] for item in items} - {secret for event_id, secret in candidates},
+            ).values_list('event_id', 'secret')
+        )
+
+        last_checkins = {}
+        nonces = set()
+        existing = Checkin.objects.filter(
+            position__in=[op for ops in candidates.values() for op in ops], list_id__in=lists.keys()
+        ).only('position_id', 'list_id', 'type', 'nonce', 'device_id', 'datetime')
+        for ci in existing.order_by('datetime', 'pk'):
+            last_checkins[ci.position_id, ci.list_id] = ci
+            if ci.nonce:
+                nonces.add((ci.position_id, ci.list_id, ci.type, ci.device_id, ci.nonce))
+
+        # Process the scans in the order they happened, so entries and exits of the same ticket make sense
+        for i in sorted(range(len(items)), key=lambda i: items[i]['datetime']):
+            item = items[i]
+            clist = item['list']
+            dt = item['datetime']
+            type = item['type']
+            nonce = item.get('nonce')
+
+            ops = candidates.get((clist.event_id, item['secret']))
+            if not ops:
+                code = 'revoked' if (clist.event_id, item['secret']) in revoked else 'invalid'
+                logs.append(
+                    clist.event.log_action(
+                        'eventyay.event.checkin.{}'.format('revoked' if code == 'revoked' else 'unknown'),
+                        data={'datetime': dt, 'type': type, 'list': clist.pk, 'barcode': item['secret']},
+                        user=user,
+                        auth=auth,
+                        save=False,
+                    )
+                )
+                if code == 'revoked':
+                    error = CheckInError(_('This ticket has been revoked.'), code)
+                else:
+                    error = CheckInError(_('This ticket is not known.'), code)
+                results[i] = {'status': 'error', 'position': None, 'error': error}
+                continue
+
+            op = _batch_candidate(ops, clist)
+            key = (op.pk, clist.pk)
+            last_ci = last_checkins.get(key)
+            nonce_key = (op.pk, clist.pk, type, device.pk if device else None, nonce)
+            if nonce and ((last_ci and last_ci.nonce == nonce) or nonce_key in nonces):
+                results[i] = {'status': 'ok', 'position': op}
+                continue
+
+            if key in pending_keys:
+                # Rules and entry limits look at the check-ins stored in the database
+                flush()
+
+            try:
+                _check_order_status(op, canceled_supported)
+                _check_position(op, clist, type, force, ignore_unpaid)
+                _check_entry_rules(op, clist, dt, type, force)
+                entry_allowed = _entry_allowed(op, clist, last_ci, dt, type, force, gate)
+                if not entry_allowed and not force:
+                    _raise_checkin_denied(op, clist, type, gate)
+            except CheckInError as e:
+                logs.append(
+                    op.order.log_action(
+                        'eventyay.event.checkin.denied',
+                        data={
+                            'position': op.id,
+                            'positionid': op.positionid,
+                            'errorcode': e.code,
+                            'reason_explanation': checkin_reason_explanation(e, op, clist.event),
+                            'force': force,
+                            'datetime': dt,
+                            'type': type,
+                            'list': clist.pk,
+                        },
+                        user=user,
+                        auth=auth,
+                        save=False,
+                    )
+                )
+                results[i] = {'status': 'error', 'position': op, 'error': e}
+                continue
+
+            ci = Checkin(
+                position=op,
+                type=type,
+                list=clist,
+                datetime=dt,
+                device=device,
+                gate=gate,
+                nonce=nonce,
+                forced=force and not entry_allowed,
+            )
+            pending.append(ci)
+            pending_keys.add(key)
+            if not last_ci or last_ci.datetime <= dt:
+                last_checkins[key] = ci
+            if nonce:
+                nonces.add(nonce_key)
+            logs.append(
+                op.order.log_action(
+                    'pretix.event.checkin',
+                    data={
+                        'position': op.id,
+                        'positionid': op.positionid,
+                        'first': True,
+                        'forced': force or op.order.status != Order.STATUS_PAID,
+                        'datetime': dt,
+                        'type': type,
+                        'list': clist.pk,
+                    },
+                    user=user,
+                    auth=auth,
+                    save=False,
+                )
+            )
+            results[i] = {'status': 'ok', 'position': op}
+
+        flush()
+        LogEntry.objects.bulk_create(logs, batch_size=500)
+
+        # bulk_create() bypasses Checkin.save(), so we need to take care of its side effects
+        if created:
+            Order.objects.filter(pk__in={ci.position.order_id for ci in created}).update(last_modified=now())
+        for clist in {ci.list for ci in created}:
+            clist.event.cache.delete('checkin_count')
+            clist.touch()
+        checkinstatus.checkins_created(created)
+
+    LogEntry.bulk_postprocess(logs)
+    for ci in created:
+        checkin_created.send(ci.list.event, checkin=ci)
+    return results
+
+
 @receiver(order_placed, dispatch_uid='autocheckin_order_placed')
 def order_placed(sender, **kwargs):
     order = kwargs['order']
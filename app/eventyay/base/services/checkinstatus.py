@@ -0,0 +1,712 @@
+"""
+Incrementally maintained check-in status counters.
+
+If ``CHECKIN_STATUS_COUNTERS`` is enabled (and redis is available), the numbers shown by the check-in list status
+API (positions, checked-in positions and positions currently inside, per list, product, variation and gate) are
+kept in redis and updated whenever a check-in is created or an order changes. Reading them then takes constant
+time instead of several aggregate queries, which matters when many dashboards refresh at doors opening.
+
+We store the following structures in redis:
+
+* ``checkinstatus:{event_id}:lists`` is a hash with an entry for every check-in list of the event whose counters
+  are maintained. The value is ``1`` while the counters can be trusted, ``p`` while they are being reconciled and
+  ``r`` while they are being rebuilt after they have been invalidated.
+
+* ``checkinstatus:list:{list_id}:positions`` is a hash mapping the ID of every position on the list to its state,
+  ``{product},{variation},{last entry},{last exit},{gates}``, where the times are timestamps in microseconds and
+  ``gates`` is a ``|``-separated list of the gates the position entered through.
+
+* ``checkinstatus:list:{list_id}:counters`` is a hash with the counters derived from these states, i.e. the
+  fields ``positions``, ``checkins`` and ``inside`` as well as ``positions:p:{product}``, ``positions:v:{variation}``,
+  ``checkins:p:{product}``, ``checkins:v:{variation}`` and ``checkins:g:{gate}``. The field ``version`` is
+  incremented with every change.
+
+* ``checkinstatus:list:{list_id}:journal`` collects all changes that happen while the list is being reconciled.
+
+* ``checkinstatus:events`` is a sorted set of the events that recently read their counters, scored by the timestamp
+  of the last read. Only these events are reconciled periodically.
+
+Every change to the counters of a list is also sent to the channel group ``checkinstatus.{list_id}``, so dashboards
+can subscribe to their lists through :py:class:`eventyay.api.consumers.CheckinStatusConsumer` instead of polling the
+status API.
+
+All changes are expressed as operations on the state of a single position (``add``, ``remove`` and ``scan``), which
+are idempotent. :py:func:`reconcile` therefore does not need to stop the world: it recomputes all states from the
+database and replays everything that happened in the meantime on top. Changes that can't be expressed this way,
+e.g. deleted check-ins or changes to the list configuration, invalidate the counters of the affected lists, which
+makes the status API fall back to counting in the database until they have been rebuilt.
+"""
+
+import logging
+import time
+from collections import Counter, defaultdict, namedtuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef, Subquery
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+from django_scopes import scopes_disabled
+
+from eventyay.base.models import Checkin, CheckinList, Event, Order, OrderPosition
+from eventyay.base.services.tasks import EventTask
+from eventyay.base.signals import periodic_task
+from eventyay.celery_app import app
+
+
+logger = logging.getLogger(__name__)
+
+KEY_LISTS = 'checkinstatus:{event_id}:lists'
+KEY_COUNTERS = 'checkinstatus:list:{list_id}:counters'
+KEY_POSITIONS = 'checkinstatus:list:{list_id}:positions'
+KEY_JOURNAL = 'checkinstatus:list:{list_id}:journal'
+KEY_RECONCILING = 'checkinstatus:list:{list_id}:reconciling'
+KEY_EVENTS = 'checkinstatus:events'
+KEY_RECONCILE_REQUESTED = 'checkinstatus:{event_id}:reconcile'
+
+GROUP_STATUS = 'checkinstatus.{list_id}'
+
+# Counters expire if nobody touches them for a week, just to keep old events from filling up redis
+COUNTER_TTL = 3600 * 24 * 7
+# Events that did not read their counters for this long are no longer maintained
+ACTIVE_TIMEOUT = 3600
+# A reconciliation that did not finish within this time is considered to have crashed
+RECONCILE_TIMEOUT = 300
+RECONCILE_CHUNK_SIZE = 5000
+
+CheckinStatusCounts = namedtuple(
+    'CheckinStatusCounts',
+    (
+        'position_count',
+        'checkin_count',
+        'inside_count',
+        'positions_by_product',
+        'positions_by_variation',
+        'checkins_by_product',
+        'checkins_by_variation',
+        'checkins_by_gate',
+    ),
+)
+
+# Shared by all scripts that modify the state of positions
+LUA_APPLY = """
+local function parse(state)
+    return string.match(state, '^([^,]*),([^,]*),([^,]*),([^,]*),([^,]*)$')
+end
+
+local function is_inside(entry, exit)
+    return entry ~= '' and (exit == '' or tonumber(exit) < tonumber(entry))
+end
+
+local function count(counters, prefix, product, variation, amount)
+    redis.call('HINCRBY', counters, prefix, amount)
+    redis.call('HINCRBY', counters, prefix .. ':p:' .. product, amount)
+    if variation ~= '' then
+        redis.call('HINCRBY', counters, prefix .. ':v:' .. variation, amount)
+    end
+end
+
+local function apply(counters, positions, op, pos, product, variation, kind, ts, gate)
+    local state = redis.call('HGET', positions, pos)
+    local entry, exit, gates = '', '', ''
+    if state then
+        product, variation, entry, exit, gates = parse(state)
+    end
+
+    if op == 'remove' then
+        if state then
+            count(counters, 'positions', product, variation, -1)
+            if entry ~= '' then
+                count(counters, 'checkins', product, variation, -1)
+                for g in string.gmatch(gates, '[^|]+') do
+                    redis.call('HINCRBY', counters, 'checkins:g:' .. g, -1)
+                end
+            end
+            if is_inside(entry, exit) then
+                redis.call('HINCRBY', counters, 'inside', -1)
+            end
+            redis.call('HDEL', positions, pos)
+        end
+        return
+    end
+
+    if not state then
+        count(counters, 'positions', product, variation, 1)
+    end
+    if op == 'scan' then
+        local was_inside = is_inside(entry, exit)
+        if kind == 'entry' then
+            if entry == '' then
+                count(counters, 'checkins', product, variation, 1)
+            end
+            if entry == '' or tonumber(ts) > tonumber(entry) then
+                entry = ts
+            end
+            if gate ~= '' and not string.find('|' .. gates .. '|', '|' .. gate .. '|', 1, true) then
+                redis.call('HINCRBY', counters, 'checkins:g:' .. gate, 1)
+                gates = (gates == '' and gate) or (gates .. '|' .. gate)
+            end
+        elseif exit == '' or tonumber(ts) > tonumber(exit) then
+            exit = ts
+        end
+        if was_inside ~= is_inside(entry, exit) then
+            redis.call('HINCRBY', counters, 'inside', is_inside(entry, exit) and 1 or -1)
+        end
+    end
+    redis.call('HSET', positions, pos, table.concat({product, variation, entry, exit, gates}, ','))
+end
+"""
+
+# Applies operations (ARGV[3:], in groups of seven) to the list ARGV[1], or journals them if the list is being
+# reconciled. Returns 0 if the counters of the list are not maintained.
+APPLY = (
+    LUA_APPLY
+    + """
+local state = redis.call('HGET', KEYS[1], ARGV[1])
+if not state then
+    return 0
+end
+if state ~= '1' then
+    for i = 3, #ARGV do
+        redis.call('RPUSH', KEYS[4], ARGV[i])
+    end
+    redis.call('EXPIRE', KEYS[4], ARGV[2])
+    return 1
+end
+for i = 3, #ARGV, 7 do
+    apply(KEYS[2], KEYS[3], ARGV[i], ARGV[i + 1], ARGV[i + 2], ARGV[i + 3], ARGV[i + 4], ARGV[i + 5], ARGV[i + 6])
+end
+redis.call('HINCRBY', KEYS[2], 'version', 1)
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+return 1
+"""
+)
+
+# Starts journaling changes to the list ARGV[1]. Returns 0 if another reconciliation is already running.
+START = """
+if not redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[2]) then
+    return 0
+end
+local state = redis.call('HGET', KEYS[1], ARGV[1])
+if state == '1' or state == 'p' then
+    redis.call('HSET', KEYS[1], ARGV[1], 'p')
+else
+    redis.call('HSET', KEYS[1], ARGV[1], 'r')
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('DEL', KEYS[3])
+return 1
+"""
+
+# Replaces the counters of the list ARGV[1] with the recomputed ones and replays the journal. Returns 0 if the
+# counters have been invalidated in the meantime.
+FINISH = (
+    LUA_APPLY
+    + """
+local state = redis.call('HGET', KEYS[1], ARGV[1])
+if state ~= 'p' and state ~= 'r' then
+    redis.call('DEL', KEYS[4], KEYS[5], KEYS[6], KEYS[7])
+    return 0
+end
+local version = tonumber(redis.call('HGET', KEYS[2], 'version') or '0')
+redis.call('DEL', KEYS[2], KEYS[3])
+redis.call('RENAME', KEYS[5], KEYS[2])
+if redis.call('EXISTS', KEYS[6]) == 1 then
+    redis.call('RENAME', KEYS[6], KEYS[3])
+end
+local journal = redis.call('LRANGE', KEYS[4], 0, -1)
+for i = 1, #journal, 7 do
+    apply(
+        KEYS[2], KEYS[3], journal[i], journal[i + 1], journal[i + 2], journal[i + 3], journal[i + 4],
+        journal[i + 5], journal[i + 6]
+    )
+end
+redis.call('HSET', KEYS[2], 'version', version + 1)
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+redis.call('HSET', KEYS[1], ARGV[1], '1')
+redis.call('DEL', KEYS[4], KEYS[7])
+return 1
+"""
+)
+
+
+def counters_enabled():
+    return settings.HAS_REDIS and settings.CHECKIN_STATUS_COUNTERS
+
+
+def _ts(dt):
+    return int(dt.timestamp()) * 1000000 + dt.microsecond
+
+
+def _counts_position(clist, product_id, subevent_id, status):
+    """
+    Mirrors ``CheckinList.positions`` for a single, non-canceled position.
+    """
+    if status not in ((Order.STATUS_PAID, Order.STATUS_PENDING) if clist.include_pending else (Order.STATUS_PAID,)):
+        return False
+    if clist.subevent_id and clist.subevent_id != subevent_id:
+        return False
+    return clist.all_products or product_id in {p.pk for p in clist.limit_products.all()}
+
+
+async def _group_send(channel_layer, versions):
+    for list_id, v in versions.items():
+        await channel_layer.group_send(
+            GROUP_STATUS.format(list_id=list_id),
+            {'type': 'checkinstatus.changed', 'list': list_id, 'version': v},
+        )
+
+
+def _notify(versions):
+    """
+    Tells the dashboards subscribed to the given check-in lists that their counters changed.
+
+    :param versions: dict mapping check-in list IDs to their new counter version, or to ``None`` if the counters
+                     can't be trusted right now
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not versions:
+        return
+    try:
+        async_to_sync(_group_send)(channel_layer, versions)
+    except Exception:
+        # Dashboards fall back to polling, that's no reason to fail a check-in
+        logger.exception('Could not notify check-in status subscribers.')
+
+
+def _op(op, position_id, product_id='', variation_id='', type='', ts='', gate_id=''):
+    return [op, position_id, product_id, variation_id or '', type, ts, gate_id or '']
+
+
+def _apply(event_id, ops):
+    """
+    Applies operations to the position states of the check-in lists of an event once the current transaction has
+    been committed.
+
+    :param ops: dict mapping check-in list IDs to a list of operations built with ``_op``
+    """
+    ops = {list_id: o for list_id, o in ops.items() if o}
+    if not ops:
+        return
+
+    def _write():
+        rc = get_redis_connection('redis')
+        pipe = rc.pipeline(transaction=False)
+        for list_id, list_ops in ops.items():
+            pipe.eval(
+                APPLY,
+                4,
+                KEY_LISTS.format(event_id=event_id),
+                KEY_COUNTERS.format(list_id=list_id),
+                KEY_POSITIONS.format(list_id=list_id),
+                KEY_JOURNAL.format(list_id=list_id),
+                list_id,
+                COUNTER_TTL,
+                *[arg for op in list_ops for arg in op],
+            )
+            pipe.hget(KEY_COUNTERS.format(list_id=list_id), 'version')
+        results = pipe.execute()
+        _notify({list_id: int(v or 0) for list_id, v in zip(ops, results[1::2])})
+
+    transaction.on_commit(_write)
+
+
+def _maintained_lists(event_id):
+    """
+    Returns the check-in lists of an event whose counters are currently maintained.
+    """
+    list_ids = get_redis_connection('redis').hkeys(KEY_LISTS.format(event_id=event_id))
+    if not list_ids:
+        return []
+    return list(CheckinList.objects.filter(pk__in=[int(i) for i in list_ids]).prefetch_related('limit_products'))
+
+
+def invalidate(event_id, list_ids=None):
+    """
+    Marks the counters of the given check-in lists (or of all lists of the event) as untrustworthy and schedules
+    them to be rebuilt.
+    """
+    if not counters_enabled():
+        return
+
+    def _write():
+        rc = get_redis_connection('redis')
+        key = KEY_LISTS.format(event_id=event_id)
+        ids = list_ids if list_ids is not None else rc.hkeys(key)
+        if ids:
+            rc.hdel(key, *ids)
+            request_reconcile(event_id)
+            _notify({int(i): None for i in ids})
+
+    transaction.on_commit(_write)
+
+
+def checkins_created(checkins):
+    """
+    Counts new check-ins. Called for every check-in saved through ``Checkin.save()`` and explicitly for check-ins
+    that are created in bulk.
+    """
+    if not counters_enabled():
+        return
+    by_event = defaultdict(list)
+    for ci in checkins:
+        by_event[ci.list.event_id].append(ci)
+
+    for event_id, event_checkins in by_event.items():
+        maintained = {
+            int(i) for i in get_redis_connection('redis').hkeys(KEY_LISTS.format(event_id=event_id))
+        }
+        ops = defaultdict(list)
+        for ci in event_checkins:
+            op = ci.position
+            if ci.list_id not in maintained or op.canceled:
+                continue
+            if not _counts_position(ci.list, op.product_id, op.subevent_id, op.order.status):
+                continue
+            ops[ci.list_id].append(
+                _op('scan', op.pk, op.product_id, op.variation_id, ci.type, _ts(ci.datetime), ci.gate_id)
+            )
+        _apply(event_id, ops)
+
+
+def order_status_changed(order, old_status, new_status):
+    """
+    Called by ``Order.save()`` whenever the status of an order changed.
+    """
+    if not counters_enabled():
+        return
+    lists = _maintained_lists(order.event_id)
+    if not lists:
+        return
+    positions = list(OrderPosition.objects.filter(order=order).only('pk', 'product_id', 'variation_id', 'subevent_id'))
+    checked_in = None
+    ops = defaultdict(list)
+    invalid = set()
+    for clist in lists:
+        before = [p for p in positions if _counts_position(clist, p.product_id, p.subevent_id, old_status)]
+        after = [p for p in positions if _counts_position(clist, p.product_id, p.subevent_id, new_status)]
+        if before and not after:
+            ops[clist.pk] += [_op('remove', p.pk) for p in before]
+        elif after and not before:
+            if checked_in is None:
+                checked_in = set(Checkin.objects.filter(position__order=order).values_list('list_id', flat=True))
+            if clist.pk in checked_in:
+                # The positions come with their check-ins, which we can't reproduce here
+                invalid.add(clist.pk)
+            else:
+                ops[clist.pk] += [_op('add', p.pk, p.product_id, p.variation_id) for p in after]
+    _apply(order.event_id, ops)
+    if invalid:
+        invalidate(order.event_id, invalid)
+
+
+def order_position_saved(position, previous):
+    """
+    Called by ``OrderPosition.save()``. ``previous`` is the tuple ``(product_id, variation_id, subevent_id,
+    canceled)`` as loaded from the database, or ``None`` for new positions.
+    """
+    if not counters_enabled():
+        return
+    current = (position.product_id, position.variation_id, position.subevent_id, position.canceled)
+    if current == previous:
+        return
+    order = position.order
+    lists = _maintained_lists(order.event_id)
+    ops = defaultdict(list)
+    invalid = set()
+    for clist in lists:
+        was = (
+            previous is not None
+            and not previous[3]
+            and _counts_position(clist, previous[0], previous[2], order.status)
+        )
+        counted = not position.canceled and _counts_position(
+            clist, position.product_id, position.subevent_id, order.status
+        )
+        if was and counted:
+            if previous[:2] != current[:2]:
+                # The check-ins of the position move to a different product, which we can't reproduce here
+                invalid.add(clist.pk)
+        elif was:
+            ops[clist.pk].append(_op('remove', position.pk))
+        elif counted:
+            if previous is not None and Checkin.objects.filter(position=position, list=clist).exists():
+                invalid.add(clist.pk)
+            else:
+                ops[clist.pk].append(_op('add', position.pk, position.product_id, position.variation_id))
+    _apply(order.event_id, ops)
+    if invalid:
+        invalidate(order.event_id, invalid)
+
+
+def read(clist):
+    """
+    Returns the counters of a check-in list as a dictionary, or ``None`` if they can't be trusted right now, in
+    which case they are scheduled to be rebuilt.
+    """
+    rc = get_redis_connection('redis')
+    pipe = rc.pipeline(transaction=False)
+    pipe.hget(KEY_LISTS.format(event_id=clist.event_id), clist.pk)
+    pipe.hgetall(KEY_COUNTERS.format(list_id=clist.pk))
+    pipe.zadd(KEY_EVENTS, {str(clist.event_id): time.time()})
+    state, counters, _ = pipe.execute()
+    if state not in (b'1', b'p'):
+        # Counters that are being reconciled are still good, they just miss the last few changes
+        request_reconcile(clist.event_id)
+        return None
+    return {k.decode(): int(v) for k, v in counters.items()}
+
+
+def version(clist):
+    """
+    Returns a value that changes whenever the counters of a check-in list change, or ``None`` if they can't be
+    trusted right now.
+    """
+    return list_version(clist.event_id, clist.pk)
+
+
+def list_version(event_id, list_id):
+    """
+    Like :py:func:`version`, for callers that only know the IDs of the list and its event.
+    """
+    rc = get_redis_connection('redis')
+    pipe = rc.pipeline(transaction=False)
+    pipe.hget(KEY_LISTS.format(event_id=event_id), list_id)
+    pipe.hget(KEY_COUNTERS.format(list_id=list_id), 'version')
+    state, v = pipe.execute()
+    if state not in (b'1', b'p'):
+        return None
+    return int(v or 0)
+
+
+def _by_id(counters, prefix):
+    return {int(k[len(prefix) :]): v for k, v in counters.items() if k.startswith(prefix)}
+
+
+def _count_in_database(clist):
+    cqs = clist.positions.annotate(
+        checkedin=Exists(
+            Checkin.objects.filter(
+                list_id=clist.pk,
+                position=OuterRef('pk'),
+                type=Checkin.TYPE_ENTRY,
+            )
+        )
+    ).filter(
+        checkedin=True,
+    )
+    pqs = clist.positions
+    return CheckinStatusCounts(
+        position_count=pqs.count(),
+        checkin_count=cqs.count(),
+        inside_count=clist.inside_count,
+        positions_by_product={
+            p['product']: p['cnt'] for p in pqs.order_by().values('product').annotate(cnt=Count('id'))
+        },
+        positions_by_variation={
+            p['variation']: p['cnt'] for p in pqs.order_by().values('variation').annotate(cnt=Count('id'))
+        },
+        checkins_by_product={
+            p['product']: p['cnt'] for p in cqs.order_by().values('product').annotate(cnt=Count('id'))
+        },
+        checkins_by_variation={
+            p['variation']: p['cnt'] for p in cqs.order_by().values('variation').annotate(cnt=Count('id'))
+        },
+        checkins_by_gate={
+            c['gate']: c['cnt']
+            for c in Checkin.objects.filter(
+                list_id=clist.pk, type=Checkin.TYPE_ENTRY, gate__isnull=False, position__in=pqs
+            )
+            .order_by()
+            .values('gate')
+            .annotate(cnt=Count('position_id', distinct=True))
+        },
+    )
+
+
+def get_counts(clist):
+    """
+    Returns the ``CheckinStatusCounts`` of a check-in list, from the counters if possible.
+    """
+    counters = read(clist) if counters_enabled() else None
+    if counters is None:
+        return _count_in_database(clist)
+    return CheckinStatusCounts(
+        position_count=counters.get('positions', 0),
+        checkin_count=counters.get('checkins', 0),
+        inside_count=counters.get('inside', 0),
+        positions_by_product=_by_id(counters, 'positions:p:'),
+        positions_by_variation=_by_id(counters, 'positions:v:'),
+        checkins_by_product=_by_id(counters, 'checkins:p:'),
+        checkins_by_variation=_by_id(counters, 'checkins:v:'),
+        checkins_by_gate={k: v for k, v in _by_id(counters, 'checkins:g:').items() if v},
+    )
+
+
+def request_reconcile(event_id):
+    """
+    Schedules a reconciliation of the counters of an event, unless one has been scheduled very recently.
+    """
+    rc = get_redis_connection('redis')
+    if rc.set(KEY_RECONCILE_REQUESTED.format(event_id=event_id), '1', nx=True, ex=10):
+        reconcile_checkin_status.apply_async(args=(event_id,))
+
+
+def _position_states(clist):
+    def last(type):
+        return Subquery(
+            Checkin.objects.filter(position_id=OuterRef('pk'), list_id=clist.pk, type=type)
+            .order_by()
+            .values('position_id')
+            .annotate(m=Max('datetime'))
+            .values('m')
+        )
+
+    gates = defaultdict(list)
+    for position_id, gate_id in (
+        Checkin.objects.filter(list_id=clist.pk, type=Checkin.TYPE_ENTRY, gate__isnull=False)
+        .order_by()
+        .values_list('position_id', 'gate_id')
+        .distinct()
+    ):
+        gates[position_id].append(str(gate_id))
+
+    counters = Counter(positions=0, checkins=0, inside=0)
+    states = {}
+    positions = clist.positions.annotate(
+        last_entry=last(Checkin.TYPE_ENTRY),
+        last_exit=last(Checkin.TYPE_EXIT),
+    ).values_list('pk', 'product_id', 'variation_id', 'last_entry', 'last_exit')
+    for pk, product_id, variation_id, last_entry, last_exit in positions.iterator(chunk_size=RECONCILE_CHUNK_SIZE):
+        keys = ['', f':p:{product_id}'] + ([f':v:{variation_id}'] if variation_id else [])
+        for k in keys:
+            counters['positions' + k] += 1
+        if last_entry:
+            for k in keys:
+                counters['checkins' + k] += 1
+            for gate_id in gates[pk]:
+                counters[f'checkins:g:{gate_id}'] += 1
+            if not last_exit or last_exit < last_entry:
+                counters['inside'] += 1
+        states[pk] = ','.join(
+            [
+                str(product_id),
+                str(variation_id or ''),
+                str(_ts(last_entry)) if last_entry else '',
+                str(_ts(last_exit)) if last_exit else '',
+                '|'.join(gates[pk]) if last_entry else '',
+            ]
+        )
+    return counters, states
+
+
+def reconcile_list(clist):
+    """
+    Recomputes the counters of a check-in list from the database. Changes that happen in the meantime are
+    journaled and applied on top once we are done. Returns ``False`` if the counters have been invalidated while we
+    were working, or another reconciliation is still running.
+    """
+    rc = get_redis_connection('redis')
+    key_lists = KEY_LISTS.format(event_id=clist.event_id)
+    key_reconciling = KEY_RECONCILING.format(list_id=clist.pk)
+    key_journal = KEY_JOURNAL.format(list_id=clist.pk)
+    if not rc.eval(START, 3, key_lists, key_reconciling, key_journal, clist.pk, RECONCILE_TIMEOUT, COUNTER_TTL):
+        return False
+
+    counters, states = _position_states(clist)
+    tmp_counters = KEY_COUNTERS.format(list_id=clist.pk) + ':tmp'
+    tmp_positions = KEY_POSITIONS.format(list_id=clist.pk) + ':tmp'
+    pipe = rc.pipeline(transaction=False)
+    pipe.delete(tmp_counters, tmp_positions)
+    pipe.hset(tmp_counters, mapping=counters)
+    states = list(states.items())
+    for i in range(0, len(states), RECONCILE_CHUNK_SIZE):
+        pipe.hset(tmp_positions, mapping=dict(states[i : i + RECONCILE_CHUNK_SIZE]))
+    pipe.execute()
+
+    finished = rc.eval(
+        FINISH,
+        7,
+        key_lists,
+        KEY_COUNTERS.format(list_id=clist.pk),
+        KEY_POSITIONS.format(list_id=clist.pk),
+        key_journal,
+        tmp_counters,
+        tmp_positions,
+        key_reconciling,
+        clist.pk,
+        COUNTER_TTL,
+    )
+    if finished:
+        _notify({clist.pk: version(clist)})
+    return bool(finished)
+
+
+def reconcile(event):
+    """
+    Recomputes the counters of all check-in lists of an event. Returns the IDs of the lists that could not be
+    reconciled.
+    """
+    return [
+        clist.pk for clist in event.checkin_lists.prefetch_related('limit_products') if not reconcile_list(clist)
+    ]
+
+
+@app.task(base=EventTask)
+def reconcile_checkin_status(event: Event):
+    if not counters_enabled():
+        return []
+    return reconcile(event)
+
+
+@receiver(signal=periodic_task, dispatch_uid='checkinstatus_reconcile')
+@scopes_disabled()
+def reconcile_active_events(sender, **kwargs):
+    if not counters_enabled():
+        return
+    rc = get_redis_connection('redis')
+    threshold = time.time() - ACTIVE_TIMEOUT
+    for event_id in rc.zrangebyscore(KEY_EVENTS, '-inf', threshold):
+        # Nobody looked at these counters for a while, so we stop maintaining them. They will be rebuilt from
+        # scratch once they are needed again.
+        rc.delete(KEY_LISTS.format(event_id=event_id.decode()))
+    rc.zremrangebyscore(KEY_EVENTS, '-inf', threshold)
+    for event_id in rc.zrange(KEY_EVENTS, 0, -1):
+        reconcile_checkin_status.apply_async(args=(int(event_id),))
+
+
+@receiver(post_save, sender=Checkin, dispatch_uid='checkinstatus_checkin_saved')
+def _checkin_saved(sender, instance, created, **kwargs):
+    if created:
+        checkins_created([instance])
+    else:
+        invalidate(instance.list.event_id, [instance.list_id])
+
+
+@receiver(post_delete, sender=Checkin, dispatch_uid='checkinstatus_checkin_deleted')
+def _checkin_deleted(sender, instance, **kwargs):
+    invalidate(instance.list.event_id, [instance.list_id])
+
+
+@receiver(post_delete, sender=OrderPosition, dispatch_uid='checkinstatus_orderposition_deleted')
+def _orderposition_deleted(sender, instance, **kwargs):
+    if counters_enabled():
+        event_id = instance.order.event_id
+        _apply(event_id, {clist.pk: [_op('remove', instance.pk)] for clist in _maintained_lists(event_id)})
+
+
+@receiver(post_save, sender=CheckinList, dispatch_uid='checkinstatus_checkinlist_saved')
+def _checkinlist_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'include_pending', 'subevent', 'all_products'} & set(update_fields):
+        invalidate(instance.event_id, [instance.pk])
+
+
+@receiver(m2m_changed, sender=CheckinList.limit_products.through, dispatch_uid='checkinstatus_checkinlist_products')
+def _checkinlist_products_changed(sender, instance, action, **kwargs):
+    if isinstance(instance, CheckinList) and action.startswith('post_'):
+        invalidate(instance.event_id, [instance.pk])
@@ -1,37 +1,161 @@
-
+import asyncio
 import logging
+import os
+import socket
 import time
+from collections import Counter
 
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 from django.conf import settings
+from django.dispatch import receiver
 
+from eventyay.base.services.roompresence import KEY_USERS as KEY_ROOM_USERS
+from eventyay.base.signals import periodic_task
 from eventyay.core.utils.redis import aredis
 
+
 logger = logging.getLogger(__name__)
 
+# Every server process is a node of its own. Connections are counted per node and per event, so the number of
+# connections of an event, of a node, or of an event on a node can be looked up without scanning any lists of channels.
+# Nodes send a heartbeat while they have connections, and the counts of nodes that stopped sending one (because they
+# crashed or were killed) are removed by the periodic compaction.
+#
+# connections:nodes                   sorted set of node IDs, scored by the time of their last heartbeat
+# connections:node:{node}             hash of the node with its "label" ("{commit}.{environment}"), its "total"
+#                                     number of connections, the number of connections per event in "event:{event}",
+#                                     and the number of seconds to spread closing its connections over in "draining"
+# connections:node:{node}:channels    set of the channel names of the connections of the node
+# connections:event:{event}           hash of node IDs to the number of connections of the event on that node
+# connections.list.user:{user}        list of the channel names of the connections of a user
+KEY_NODES = "connections:nodes"
+KEY_NODE = "connections:node:{node}"
+KEY_NODE_CHANNELS = "connections:node:{node}:channels"
+KEY_EVENT = "connections:event:{event}"
 
-async def register_connection():
-    async with aredis() as redis:
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}"
+HEARTBEAT = 20  # seconds
+NODE_TTL = 60  # seconds without a heartbeat after which a node is considered dead
+
+_channels = {}  # channel name -> event ID, for all connections of this node
+_tasks = {}  # background tasks of this process, by name
+
+
+def _label():
+    return f"{settings.EVENTYAY_COMMIT}.{settings.EVENTYAY_ENVIRONMENT}"
+
+
+def _alive_since():
+    return time.time() - NODE_TTL
+
+
+async def register_connection(channel_name, event_id):
+    _channels[channel_name] = str(event_id)
+    async with aredis(KEY_EVENT.format(event=event_id)) as redis:
         tr = redis.pipeline(transaction=False)
-        tr.hincrby(
-            "connections",
-            f"{settings.EVENTYAY_COMMIT}.{settings.EVENTYAY_ENVIRONMENT}",
-            1,
-        )
-        tr.setex(
-            f"connections:{settings.EVENTYAY_COMMIT}.{settings.EVENTYAY_ENVIRONMENT}",
-            60,
-            "exists",
-        )
+        tr.sadd(KEY_NODE_CHANNELS.format(node=NODE_ID), channel_name)
+        tr.hincrby(KEY_NODE.format(node=NODE_ID), "total", 1)
+        tr.hincrby(KEY_NODE.format(node=NODE_ID), f"event:{event_id}", 1)
+        tr.hincrby(KEY_EVENT.format(event=event_id), NODE_ID, 1)
+        await tr.execute()
+    _start_heartbeat()
+
+
+async def unregister_connection(channel_name, event_id):
+    if _channels.pop(channel_name, None) is None:
+        return
+    async with aredis(KEY_EVENT.format(event=event_id)) as redis:
+        tr = redis.pipeline(transaction=False)
+        tr.srem(KEY_NODE_CHANNELS.format(node=NODE_ID), channel_name)
+        tr.hincrby(KEY_NODE.format(node=NODE_ID), "total", -1)
+        tr.hincrby(KEY_NODE.format(node=NODE_ID), f"event:{event_id}", -1)
+        tr.hincrby(KEY_EVENT.format(event=event_id), NODE_ID, -1)
         await tr.execute()
 
 
-async def unregister_connection():
+def _start_heartbeat():
+    task = _tasks.get("heartbeat")
+    if task is None or task.done():
+        _tasks["heartbeat"] = asyncio.get_running_loop().create_task(_run_heartbeat())
+
+
+async def _run_heartbeat():
+    while _channels:
+        try:
+            await heartbeat()
+        except Exception:
+            logger.exception("Could not send connection heartbeat.")
+        await asyncio.sleep(HEARTBEAT)
+
+
+async def heartbeat():
     async with aredis() as redis:
-        await redis.hincrby(
-            "connections",
-            f"{settings.EVENTYAY_COMMIT}.{settings.EVENTYAY_ENVIRONMENT}",
-            -1,
-        )
+        tr = redis.pipeline(transaction=False)
+        tr.zadd(KEY_NODES, {NODE_ID: time.time()})
+        tr.hset(KEY_NODE.format(node=NODE_ID), "label", _label())
+        tr.hget(KEY_NODE.format(node=NODE_ID), "draining")
+        added, _, draining = await tr.execute()
+        if added:
+            # The node is new, or it has been compacted away while it did not send a heartbeat in time (e.g. because
+            # its event loop was blocked), so its counts need to be written again from what we know locally.
+            await _write_state(redis)
+    if draining is not None:
+        _start_drainer(float(draining))
+
+
+async def _write_state(redis):
+    by_event = Counter(_channels.values())
+    tr = redis.pipeline(transaction=True)
+    tr.delete(KEY_NODE.format(node=NODE_ID), KEY_NODE_CHANNELS.format(node=NODE_ID))
+    tr.hset(
+        KEY_NODE.format(node=NODE_ID),
+        mapping={
+            "label": _label(),
+            "total": len(_channels),
+            **{f"event:{event_id}": count for event_id, count in by_event.items()},
+        },
+    )
+    if _channels:
+        tr.sadd(KEY_NODE_CHANNELS.format(node=NODE_ID), *_channels)
+    for event_id, count in by_event.items():
+        tr.hset(KEY_EVENT.format(event=event_id), NODE_ID, count)
+    await tr.execute()
+
+
+def _start_drainer(duration):
+    task = _tasks.get("drainer")
+    if task is None or task.done():
+        _tasks["drainer"] = asyncio.get_running_loop().create_task(_drain(duration))
+
+
+async def _drain(duration):
+    """
+    Asks all clients connected to this node to reconnect, spread over ``duration`` seconds so that the other nodes
+    are not hit by all of them at once.
+    """
+    channel_names = list(_channels)
+    logger.info("Draining %s connections of node %s over %s seconds.", len(channel_names), NODE_ID, duration)
+    channel_layer = get_channel_layer()
+    interval = duration / len(channel_names) if channel_names else 0
+    for channel_name in channel_names:
+        if channel_name in _channels:
+            await channel_layer.send(channel_name, {"type": "connection.reload"})
+        await asyncio.sleep(interval)
+    async with aredis() as redis:
+        await redis.hdel(KEY_NODE.format(node=NODE_ID), "draining")
+
+
+async def drain_node(node, duration=60):
+    """
+    Makes a node close its connections with its next heartbeat, e.g. before it is shut down during a deployment.
+    Returns ``False`` if the node is unknown.
+    """
+    async with aredis() as redis:
+        if await redis.zscore(KEY_NODES, node) is None:
+            return False
+        await redis.hset(KEY_NODE.format(node=node), "draining", duration)
+    return True
 
 
 async def register_user_connection(user_id, channel_name):
@@ -68,29 +192,101 @@ async def ping_connection(last_ping, user=None):
     n = time.time()
     if n - last_ping < 50:
         return last_ping
-    async with aredis() as redis:
-        tr = redis.pipeline(transaction=False)
-        if user:
-            tr.expire(
+    # The node itself is kept alive by its heartbeat, only the user's list of connections needs to be refreshed
+    if user:
+        async with aredis() as redis:
+            await redis.expire(
                 f"connections.list.user:{user.id}",
                 90,
             )
-        tr.setex(
-            f"connections:{settings.EVENTYAY_COMMIT}.{settings.EVENTYAY_ENVIRONMENT}",
-            60,
-            "exists",
-        )
-        await tr.execute()
     return n
 
 
+async def get_nodes():
+    """
+    Returns the nodes that are alive, with their label, number of connections and whether they are draining.
+    """
+    async with aredis() as redis:
+        nodes = [n.decode() for n in await redis.zrangebyscore(KEY_NODES, _alive_since(), "+inf")]
+        tr = redis.pipeline(transaction=False)
+        for node in nodes:
+            tr.hmget(KEY_NODE.format(node=node), "label", "total", "draining")
+        result = await tr.execute()
+    return {
+        node: {
+            "label": label.decode() if label else None,
+            "connections": int(total or 0),
+            "draining": draining is not None,
+        }
+        for node, (label, total, draining) in zip(nodes, result)
+    }
+
+
 async def get_connections():
+    """
+    Returns the number of connections per label of the nodes that are alive.
+    """
+    ret = Counter()
+    for node in (await get_nodes()).values():
+        if node["label"]:
+            ret[node["label"]] += node["connections"]
+    return dict(ret)
+
+
+async def get_node_channels(nodes):
+    async with aredis() as redis:
+        tr = redis.pipeline(transaction=False)
+        for node in nodes:
+            tr.smembers(KEY_NODE_CHANNELS.format(node=node))
+        return [c.decode() for channels in await tr.execute() for c in channels]
+
+
+async def get_event_connections(event_id, room_ids):
+    """
+    Returns the number of connections of an event, in total and per node, and the number of users in each of the
+    given rooms.
+    """
+    room_ids = [str(r) for r in room_ids]
+    async with aredis(KEY_EVENT.format(event=event_id)) as redis:
+        tr = redis.pipeline(transaction=False)
+        tr.zrangebyscore(KEY_NODES, _alive_since(), "+inf")
+        tr.hgetall(KEY_EVENT.format(event=event_id))
+        for room_id in room_ids:
+            tr.hlen(KEY_ROOM_USERS.format(room=room_id))
+        alive, per_node, *per_room = await tr.execute()
+    alive = set(alive)
+    nodes = {node.decode(): int(count) for node, count in per_node.items() if node in alive and int(count) > 0}
+    return {
+        "total": sum(nodes.values()),
+        "nodes": nodes,
+        "rooms": dict(zip(room_ids, per_room)),
+    }
+
+
+async def compact():
+    """
+    Removes the counts and channels of nodes that stopped sending heartbeats. Returns the IDs of the removed nodes.
+    """
     async with aredis() as redis:
-        conns = await redis.hgetall("connections")
-        ret = {}
-        for k, v in conns.items():
-            if v == 0 or await redis.get(f"connections:{k.decode()}") != b"exists":
-                await redis.hdel("connections", k)
-            else:
-                ret[k.decode()] = int(v.decode())
-        return ret
+        dead = [n.decode() for n in await redis.zrangebyscore(KEY_NODES, "-inf", f"({_alive_since()}")]
+        for node in dead:
+            events = [
+                k.decode().removeprefix("event:")
+                for k in await redis.hkeys(KEY_NODE.format(node=node))
+                if k.startswith(b"event:")
+            ]
+            tr = redis.pipeline(transaction=True)
+            # The node might have come back in the meantime, in which case it rewrites its state anyway
+            tr.zrem(KEY_NODES, node)
+            tr.delete(KEY_NODE.format(node=node), KEY_NODE_CHANNELS.format(node=node))
+            for event_id in events:
+                tr.hdel(KEY_EVENT.format(event=event_id), node)
+            await tr.execute()
+    return dead
+
+
+@receiver(signal=periodic_task, dispatch_uid="connections_compact")
+def compact_connections(sender, **kwargs):
+    dead = async_to_sync(compact)()
+    if dead:
+        logger.info(f"Removed connections of dead nodes {', '.join(dead)}.")
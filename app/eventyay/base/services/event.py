@@ -9,14 +9,15 @@ from channels.layers import get_channel_layer
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import Count, Max, OuterRef, Q, Subquery
+from django.db.models import Max, Q
 from eventyay.timezones import common_timezones
 from rest_framework import serializers
 
 from eventyay.base.models.audit import AuditLog
 from eventyay.base.models.chat import Channel
 from eventyay.base.models.event import Event
-from eventyay.base.models.room import Room, RoomConfigSerializer, RoomView
+from eventyay.base.models.room import Room, RoomConfigSerializer
+from eventyay.base.services import eventsnapshot, roompresence
 from eventyay.base.services.jitsi import user_can_create_jitsi_room_during_development
 from eventyay.base.services.video_theme import build_video_theme_for_event
 from eventyay.core.permissions import Permission
@@ -98,22 +99,14 @@ def get_rooms(event, user):
             .with_has_linked_sessions()
             .order_by('sorting_priority', 'id')
             .prefetch_related("channel")
-            .annotate(
-                current_roomviews=Subquery(
-                    RoomView.objects.filter(room_id=OuterRef("pk"), end__isnull=True)
-                    .values("room_id")
-                    .order_by()
-                    .annotate(
-                        # Count('user_id', distinct=True) would be more accurate, but might be slow, and we don't need accurate
-                        c=Count("user_id")
-                    )
-                    .values("c")
-                )
-            )
         )
         if user:
             qs = qs.with_permission(event=event, user=user)
-        return list(qs)
+        rooms = list(qs)
+    counts = roompresence.get_counts([room.pk for room in rooms])
+    for room in rooms:
+        room.current_roomviews = counts[room.pk]
+    return rooms
 
 
 @database_sync_to_async
@@ -142,19 +135,23 @@ def get_permissions_for_traits(rules, traits, prefixes):
 
 
 async def notify_event_change(event_id):
+    version = await eventsnapshot.increase_version(event_id)
     await get_channel_layer().group_send(
         f"event.{event_id}",
         {
             "type": "event.update",
+            "version": version,
         },
     )
 
 
 async def notify_schedule_change(event_id):
+    version = await eventsnapshot.increase_version(event_id)
     await get_channel_layer().group_send(
         f"event.{event_id}",
         {
             "type": "event.schedule.update",
+            "version": version,
         },
     )
 
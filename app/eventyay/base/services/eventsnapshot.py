@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from eventyay.base.models.event import Event
+from eventyay.base.models.room import Room
+from eventyay.core.utils.redis import aredis, sredis
+
+
+# All consumers of an event in a server process share one snapshot of the event and its rooms, so commands neither
+# need to look them up in the database nor check on their own whether they are outdated. The version of the snapshot
+# is increased whenever the event or one of its rooms is changed. Server processes check the version at most every
+# CHECK_INTERVAL seconds, and learn about new versions right away from the event.update message that is sent to all
+# consumers of the event (see notify_event_change).
+#
+# eventsnapshot:{event}:version   version of the snapshot of the event
+KEY_VERSION = "eventsnapshot:{event}:version"
+CHECK_INTERVAL = 5  # seconds
+MISS_CHECK_INTERVAL = 1  # seconds, for rooms that are not in the snapshot (yet)
+
+
+class EventSnapshot:
+    def __init__(self, event_id):
+        self.event_id = event_id
+        self.version = None
+        self.event = None
+        self.rooms = {}  # room ID as string -> Room
+        self.checked = 0
+        self.lock = asyncio.Lock()
+
+    def is_current(self, version=None, max_age=CHECK_INTERVAL):
+        if self.version is None:
+            return False
+        if version is not None:
+            return self.version >= version
+        # Like VersionedModel, we always check during unit testing to not need any sleep() calls in tests
+        return time.time() - self.checked < max_age and "PYTEST_CURRENT_TEST" not in os.environ
+
+    async def refresh(self, version=None, max_age=CHECK_INTERVAL):
+        if self.is_current(version, max_age):
+            return
+        async with self.lock:
+            # Another consumer might have refreshed the snapshot while we were waiting for the lock
+            if self.is_current(version, max_age):
+                return
+            async with aredis(KEY_VERSION.format(event=self.event_id)) as redis:
+                current = int(await redis.get(KEY_VERSION.format(event=self.event_id)) or 0)
+            if current != self.version:
+                await database_sync_to_async(self._load)()
+                self.version = current
+            self.checked = time.time()
+
+    def _load(self):
+        # The event is updated in place, since consumers and their modules keep references to it. Rooms are looked up
+        # in the snapshot for every command instead.
+        if self.event is None:
+            self.event = Event.objects.filter(pk=self.event_id).first()
+        else:
+            try:
+                self.event.refresh_from_db()
+            except Event.DoesNotExist:
+                self.event = None
+        if self.event is None:
+            self.rooms = {}
+            return
+
+        rooms = {}
+        for room in Room.objects.filter(event=self.event, deleted=False).prefetch_related("channel"):
+            room.event = self.event
+            rooms[str(room.pk)] = room
+        self.rooms = rooms
+
+
+_snapshots = {}  # event ID -> EventSnapshot
+_event_ids = {}  # slug or ID of the event as used in URLs -> event ID
+
+
+@database_sync_to_async
+def _get_event_id(event_id):
+    """Retrieve the ID of an Event by primary key or slug."""
+    if isinstance(event_id, str) and event_id.isdigit():
+        return Event.objects.filter(Q(slug=event_id) | Q(id=int(event_id))).values_list("id", flat=True).first()
+    return Event.objects.filter(slug=event_id).values_list("id", flat=True).first()
+
+
+async def get_event(event_id, version=None):
+    """
+    Returns the event from the snapshot of this process, or ``None`` if it does not exist. ``event_id`` can be the
+    primary key or the slug of the event. If ``version`` is given, the snapshot is refreshed unless it is at least that
+    recent.
+    """
+    if event_id not in _event_ids:
+        pk = await _get_event_id(event_id)
+        if pk is None:
+            return None
+        _event_ids[event_id] = pk
+    pk = _event_ids[event_id]
+    if pk not in _snapshots:
+        _snapshots[pk] = EventSnapshot(pk)
+    await _snapshots[pk].refresh(version)
+    return _snapshots[pk].event
+
+
+async def get_room(event, room_id):
+    """
+    Returns a room of the event from the snapshot of this process, or ``None`` if it does not exist or was deleted.
+    """
+    snapshot = _snapshots.get(event.pk)
+    if snapshot is None:
+        await get_event(event.pk)
+        snapshot = _snapshots[event.pk]
+    room = snapshot.rooms.get(str(room_id))
+    if room is None:
+        # The room might have been created since the snapshot was taken
+        await snapshot.refresh(max_age=MISS_CHECK_INTERVAL)
+        room = snapshot.rooms.get(str(room_id))
+    return room
+
+
+async def refresh_channel_room(event, channel):
+    """
+    Replaces the room of a cached channel with the room from the snapshot, which is kept up to date.
+    """
+    if channel and channel.room_id:
+        room = await get_room(event, channel.room_id)
+        if room:
+            channel.room = room
+
+
+async def increase_version(event_id):
+    async with aredis(KEY_VERSION.format(event=event_id)) as redis:
+        return await redis.incr(KEY_VERSION.format(event=event_id))
+
+
+def _increase_version_sync(event_id):
+    with sredis(KEY_VERSION.format(event=event_id)) as redis:
+        redis.incr(KEY_VERSION.format(event=event_id))
+
+
+@receiver(post_save, sender=Event, dispatch_uid="eventsnapshot_event_saved")
+@receiver(post_delete, sender=Event, dispatch_uid="eventsnapshot_event_deleted")
+def event_changed(sender, instance, **kwargs):
+    # Events are saved all over the ticket shop, which also runs without redis (e.g. in its tests)
+    if settings.HAS_REDIS:
+        transaction.on_commit(lambda: _increase_version_sync(instance.pk))
+
+
+@receiver(post_save, sender=Room, dispatch_uid="eventsnapshot_room_saved")
+@receiver(post_delete, sender=Room, dispatch_uid="eventsnapshot_room_deleted")
+def room_changed(sender, instance, **kwargs):
+    if settings.HAS_REDIS:
+        transaction.on_commit(lambda: _increase_version_sync(instance.event_id))
@@ -9,8 +9,11 @@ from django.utils.timezone import now
 
 from eventyay.base.models import EventLock
 
+
 logger = logging.getLogger('pretix.base.locking')
 LOCK_TIMEOUT = 120
+# How long an event-wide lock waits for fine-grained locks of the same event to be released
+DRAIN_TIMEOUT = 10
 
 
 class NoLockManager:
@@ -41,6 +44,27 @@ class LockManager:
             return False
 
 
+class ResourceLockManager:
+    def __init__(self, event, resources, blocking=False, blocking_timeout=None):
+        self.event = event
+        self.resources = resources
+        self.blocking = blocking
+        self.blocking_timeout = blocking_timeout
+        self.acquired = False
+
+    def __enter__(self):
+        self.acquired = lock_resources(
+            self.event, self.resources, blocking=self.blocking, blocking_timeout=self.blocking_timeout
+        )
+        return now()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.acquired:
+            release_resources(self.event)
+        if exc_type is not None:
+            return False
+
+
 class LockTimeoutException(Exception):  # NOQA: N818
     pass
 
@@ -61,10 +85,25 @@ def lock_event(event, blocking=False, blocking_timeout=None):
     if hasattr(event, '_lock') and event._lock:
         return True
 
-    if settings.HAS_REDIS:
-        return lock_event_redis(event, blocking=blocking, blocking_timeout=blocking_timeout)
-    else:
-        return lock_event_db(event, blocking=blocking, blocking_timeout=blocking_timeout)
+    t0 = time.monotonic()
+    try:
+        if settings.HAS_REDIS:
+            lock_event_redis(event, blocking=blocking, blocking_timeout=blocking_timeout)
+        else:
+            lock_event_db(event, blocking=blocking, blocking_timeout=blocking_timeout)
+    except LockTimeoutException:
+        _observe_timeout(f'event:{event.id}')
+        raise
+
+    if settings.FINE_GRAINED_LOCKING:
+        try:
+            _wait_for_resource_locks(event, blocking_timeout or DRAIN_TIMEOUT)
+        except LockTimeoutException:
+            release_event(event)
+            _observe_timeout(f'event:{event.id}')
+            raise
+    _observe_wait(f'event:{event.id}', time.monotonic() - t0)
+    return True
 
 
 def release_event(event):
@@ -83,31 +122,45 @@ def release_event(event):
         return release_event_db(event)
 
 
-def lock_event_db(event, blocking=False, blocking_timeout=None):
+def _retry(attempt, blocking=False, blocking_timeout=None):
+    """
+    Calls *attempt* until it returns a truthy value. Gives up after 5 tries with exponential
+    backoff, or after *blocking_timeout* seconds if *blocking* is enabled.
+    """
     deadline = time.monotonic() + blocking_timeout if blocking and blocking_timeout else None
     while True:
         retries = 5
         for i in range(retries):
-            with transaction.atomic():
-                dt = now()
-                l, created = EventLock.objects.get_or_create(event=event.id)
-                if created:
-                    event._lock = l
-                    return True
-                elif l.date < now() - timedelta(seconds=LOCK_TIMEOUT):
-                    newtoken = str(uuid.uuid4())
-                    updated = EventLock.objects.filter(event=event.id, token=l.token).update(
-                        date=dt, token=newtoken
-                    )
-                    if updated:
-                        l.token = newtoken
-                        event._lock = l
-                        return True
+            result = attempt()
+            if result:
+                return result
             time.sleep(2**i / 100)
         if not blocking or deadline is None or time.monotonic() >= deadline:
-            break
+            return None
         time.sleep(0.05)
-    raise LockTimeoutException()
+
+
+def _acquire_db(key):
+    with transaction.atomic():
+        dt = now()
+        l, created = EventLock.objects.get_or_create(event=key)
+        if created:
+            return l
+        elif l.date < now() - timedelta(seconds=LOCK_TIMEOUT):
+            newtoken = str(uuid.uuid4())
+            updated = EventLock.objects.filter(event=key, token=l.token).update(date=dt, token=newtoken)
+            if updated:
+                l.token = newtoken
+                return l
+    return None
+
+
+def lock_event_db(event, blocking=False, blocking_timeout=None):
+    l = _retry(lambda: _acquire_db(event.id), blocking=blocking, blocking_timeout=blocking_timeout)
+    if not l:
+        raise LockTimeoutException()
+    event._lock = l
+    return True
 
 
 @transaction.atomic
@@ -128,7 +181,7 @@ def redis_lock_from_event(event):
 
     if not hasattr(event, '_lock') or not event._lock:
         rc = get_redis_connection('redis')
-        event._lock = Lock(redis=rc, name='pretix_event_%s' % event.id, timeout=LOCK_TIMEOUT)
+        event._lock = Lock(redis=rc, name=f'pretix_event_{event.id}', timeout=LOCK_TIMEOUT)
     return event._lock
 
 
@@ -167,3 +220,206 @@ def release_event_redis(event):
         logger.exception('Error releasing an event lock')
         raise LockTimeoutException()
     event._lock = None
+
+
+def lock_resources(event, resources, blocking=False, blocking_timeout=None):
+    """
+    Issue locks on single resources of this event, e.g. ``quota:12``, ``seat:3`` or ``voucher:7``,
+    instead of the whole event, so that bookings touching different resources can run in parallel.
+    Resources are always acquired in sorted order, so two callers can never wait for each other.
+
+    The event itself is only marked as being in use: A call to :py:func:`lock_event` waits until
+    all resource locks of the event are released, and no new resource locks are handed out while
+    the event is locked as a whole.
+
+    :returns: ``False`` if this event is already locked by us and nothing needed to be acquired
+    :raises LockTimeoutException: if one of the resources stays locked every time we try to
+                                  obtain the lock
+    """
+    if getattr(event, '_lock', None) or getattr(event, '_resource_locks', None):
+        return False
+
+    if settings.HAS_REDIS:
+        enter, acquire = _enter_event_redis, _acquire_resource_redis
+    else:
+        enter, acquire = _enter_event_db, _acquire_resource_db
+
+    token = uuid.uuid4().hex[:16]
+    event._resource_locks = (token, [])
+    try:
+        if not _retry(lambda: enter(event, token), blocking=blocking, blocking_timeout=blocking_timeout):
+            _observe_timeout(f'event:{event.id}')
+            raise LockTimeoutException()
+        for resource in sorted(set(resources)):
+            t0 = time.monotonic()
+            l = _retry(lambda: acquire(event, resource), blocking=blocking, blocking_timeout=blocking_timeout)
+            if not l:
+                _observe_timeout(resource)
+                raise LockTimeoutException()
+            _observe_wait(resource, time.monotonic() - t0)
+            event._resource_locks[1].append(l)
+    except BaseException:
+        release_resources(event)
+        raise
+    return True
+
+
+def release_resources(event):
+    """
+    Release all locks placed by :py:func:`lock_resources`.
+
+    :raises LockReleaseException: if we do not own any resource locks
+    """
+    if not getattr(event, '_resource_locks', None):
+        raise LockReleaseException('Lock is not owned by this thread')
+    token, locks = event._resource_locks
+    try:
+        if settings.HAS_REDIS:
+            release_resources_redis(event, token, locks)
+        else:
+            release_resources_db(event, token, locks)
+    finally:
+        event._resource_locks = None
+
+
+def lock_resources_for(quotas=(), seats=(), vouchers=()):
+    """
+    Returns the names of the resources to pass to :py:func:`lock_resources` when the given quotas,
+    seats and vouchers are about to be used. Unlimited quotas do not need to be locked.
+    """
+    resources = {f'quota:{q.pk}' for q in quotas if q.size is not None}
+    resources |= {f'seat:{s.pk}' for s in seats}
+    resources |= {f'voucher:{v.pk}' for v in vouchers}
+    return sorted(resources)
+
+
+def _wait_for_resource_locks(event, timeout):
+    own = event._resource_locks[0] if getattr(event, '_resource_locks', None) else None
+    if settings.HAS_REDIS:
+        check = _resource_locks_held_redis
+    else:
+        check = _resource_locks_held_db
+
+    deadline = time.monotonic() + timeout
+    while check(event, own):
+        if time.monotonic() >= deadline:
+            raise LockTimeoutException()
+        time.sleep(0.05)
+
+
+def _shared_key_db(event, token):
+    return f'{event.id}:shared:{token}'
+
+
+def _enter_event_db(event, token):
+    # Announce ourselves first and only then check for an event-wide lock. lock_event() does the
+    # opposite, so at least one of the two sides always notices the other.
+    EventLock.objects.create(event=_shared_key_db(event, token))
+    if not EventLock.objects.filter(
+        event=event.id, date__gte=now() - timedelta(seconds=LOCK_TIMEOUT)
+    ).exists():
+        return True
+    EventLock.objects.filter(event=_shared_key_db(event, token)).delete()
+    return False
+
+
+def _acquire_resource_db(event, resource):
+    return _acquire_db(f'{event.id}:{resource}')
+
+
+def _resource_locks_held_db(event, own):
+    return (
+        EventLock.objects.filter(
+            event__startswith=_shared_key_db(event, ''),
+            date__gte=now() - timedelta(seconds=LOCK_TIMEOUT),
+        )
+        .exclude(event=_shared_key_db(event, own))
+        .exists()
+    )
+
+
+def release_resources_db(event, token, locks):
+    for l in reversed(locks):
+        EventLock.objects.filter(event=l.event, token=l.token).delete()
+    EventLock.objects.filter(event=_shared_key_db(event, token)).delete()
+
+
+def _enter_event_redis(event, token):
+    from django_redis import get_redis_connection
+    from redis.exceptions import RedisError
+
+    rc = get_redis_connection('redis')
+    key = f'pretix_event_{event.id}_shared'
+    try:
+        # See _enter_event_db() on why the order of these operations matters
+        pipe = rc.pipeline()
+        pipe.zadd(key, {token: time.time() + LOCK_TIMEOUT})
+        pipe.expire(key, LOCK_TIMEOUT)
+        pipe.exists(f'pretix_event_{event.id}')
+        if not pipe.execute()[-1]:
+            return True
+        rc.zrem(key, token)
+    except RedisError:
+        logger.exception('Error locking an event')
+        raise LockTimeoutException()
+    return False
+
+
+def _acquire_resource_redis(event, resource):
+    from django_redis import get_redis_connection
+    from redis.exceptions import RedisError
+    from redis.lock import Lock
+
+    rc = get_redis_connection('redis')
+    lock = Lock(redis=rc, name=f'pretix_event_{event.id}_{resource}', timeout=LOCK_TIMEOUT)
+    try:
+        if lock.acquire(blocking=False):
+            return lock
+    except RedisError:
+        logger.exception('Error locking an event resource')
+        raise LockTimeoutException()
+    return None
+
+
+def _resource_locks_held_redis(event, own):
+    from django_redis import get_redis_connection
+    from redis.exceptions import RedisError
+
+    rc = get_redis_connection('redis')
+    key = f'pretix_event_{event.id}_shared'
+    try:
+        pipe = rc.pipeline()
+        pipe.zremrangebyscore(key, '-inf', time.time())
+        pipe.zrange(key, 0, -1)
+        holders = {t.decode() for t in pipe.execute()[-1]}
+    except RedisError:
+        logger.exception('Error locking an event')
+        raise LockTimeoutException()
+    return bool(holders - {own})
+
+
+def release_resources_redis(event, token, locks):
+    from django_redis import get_redis_connection
+    from redis import RedisError
+
+    try:
+        for l in reversed(locks):
+            l.release()
+        get_redis_connection('redis').zrem(f'pretix_event_{event.id}_shared', token)
+    except RedisError:
+        logger.exception('Error releasing event resource locks')
+        raise LockReleaseException()
+
+
+def _observe_wait(resource, seconds):
+    if settings.METRICS_ENABLED:
+        from eventyay.base import metrics
+
+        metrics.eventyay_lock_wait_seconds.observe(seconds, resource=resource)
+
+
+def _observe_timeout(resource):
+    if settings.METRICS_ENABLED:
+        from eventyay.base import metrics
+
+        metrics.eventyay_lock_timeouts_total.inc(1, resource=resource)
@@ -3,6 +3,7 @@ import logging
 from collections import Counter, namedtuple
 from datetime import datetime, time, timedelta
 from decimal import Decimal
+from functools import partial
 
 from celery.exceptions import MaxRetriesExceededError
 from django.conf import settings
@@ -1129,6 +1130,27 @@ def _order_placed_email_attendee(event: Event, order: Order, position: OrderPosi
         logger.exception('Order received email could not be sent to attendee')
 
 
+def _lock_resources(positions):
+    """
+    Returns the quotas, seats and vouchers that need to be locked to turn the given cart
+    positions into an order.
+    """
+    rows = list(positions.values_list('product_id', 'variation_id', 'subevent_id', 'seat_id', 'voucher_id'))
+    quota_filter = Q(pk__in=[])
+    for product_id, variation_id, subevent_id, seat_id, voucher_id in rows:
+        if variation_id:
+            quota_filter |= Q(variations=variation_id, subevent=subevent_id)
+        else:
+            quota_filter |= Q(products=product_id, subevent=subevent_id)
+    seat_ids = {r[3] for r in rows if r[3]}
+    voucher_ids = {r[4] for r in rows if r[4]}
+    return {
+        'quotas': list(Quota.objects.filter(quota_filter).distinct().only('pk', 'size')),
+        'seats': list(Seat.objects.filter(pk__in=seat_ids).only('pk')) if seat_ids else [],
+        'vouchers': list(Voucher.objects.filter(pk__in=voucher_ids).only('pk')) if voucher_ids else [],
+    }
+
+
 def _perform_order(
     event: Event,
     payment_provider: str,
@@ -1208,7 +1230,10 @@ def _perform_order(
 
     # Always lock the event during checkout to prevent race conditions (overselling).
     # We deliberately skip the previous performance optimization here to ensure data integrity.
+    # With fine-grained locking, only the quotas, seats and vouchers of these positions are locked.
     lockfn = event.lock
+    if settings.FINE_GRAINED_LOCKING:
+        lockfn = partial(event.lock, **_lock_resources(positions))
 
     with lockfn() as now_dt:
         positions = list(
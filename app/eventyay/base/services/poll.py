@@ -1,7 +1,70 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
 from channels.db import database_sync_to_async
+from django.db import transaction
 from django.db.models import Q
+from django.dispatch import receiver
+from redis.exceptions import WatchError
 
 from eventyay.base.models.poll import Poll, PollOption, PollVote
+from eventyay.base.signals import periodic_task
+from eventyay.core.utils.redis import aredis
+
+
+logger = logging.getLogger(__name__)
+
+# Votes on open polls are counted in redis. The database is only updated in batches, once per tick, by whoever
+# broadcasts the results of the tick (see PollModule.vote). Votes left behind, e.g. because that process died in
+# between, are written by the periodic task.
+#
+# polls:{poll}:meta     hash with the public poll data, its room and its option IDs. Votes are only accepted while
+#                       this key exists, it is loaded from the database on the first vote.
+# polls:{poll}:tally    hash mapping option IDs to the number of votes
+# polls:{poll}:votes    hash mapping user IDs to the comma-separated option IDs they voted for
+# polls:{poll}:dirty    set of user IDs whose vote has not been written to the database yet
+# polls:dirty           set of the IDs of all polls with a polls:{poll}:dirty set
+# polls:{poll}:tick     exists while a result broadcast for the poll is scheduled
+# polls:{poll}:persist  lock held while votes are written to the database
+KEY_META = "polls:{poll}:meta"
+KEY_TALLY = "polls:{poll}:tally"
+KEY_VOTES = "polls:{poll}:votes"
+KEY_DIRTY = "polls:{poll}:dirty"
+KEY_DIRTY_POLLS = "polls:dirty"
+KEY_TICK = "polls:{poll}:tick"
+KEY_PERSIST = "polls:{poll}:persist"
+
+POLL_TICK = 1  # seconds
+POLL_STATE_TTL = 6 * 3600  # seconds, refreshed with every vote
+
+VOTE = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return false
+end
+local old = redis.call('hget', KEYS[3], ARGV[1])
+if old then
+    for option in string.gmatch(old, '[^,]+') do
+        redis.call('hincrby', KEYS[2], option, -1)
+    end
+end
+if ARGV[2] == '' then
+    redis.call('hdel', KEYS[3], ARGV[1])
+else
+    for option in string.gmatch(ARGV[2], '[^,]+') do
+        redis.call('hincrby', KEYS[2], option, 1)
+    end
+    redis.call('hset', KEYS[3], ARGV[1], ARGV[2])
+end
+redis.call('sadd', KEYS[4], ARGV[1])
+redis.call('sadd', KEYS[5], ARGV[4])
+for i=1,4 do
+    redis.call('expire', KEYS[i], ARGV[3])
+end
+return redis.call('hgetall', KEYS[2])
+"""
 
 
 @database_sync_to_async
@@ -96,16 +159,226 @@ def delete_poll(**kwargs):
     return True
 
 
+def _decode_results(results):
+    if isinstance(results, dict):
+        results = results.items()
+    else:  # flat list as returned by HGETALL inside a script
+        results = zip(results[::2], results[1::2])
+    return {k.decode(): int(v) for k, v in results}
+
+
 @database_sync_to_async
-def vote_on_poll(pk, room, user, options):
-    poll = Poll.objects.get(pk=pk, room=room, state=Poll.States.OPEN)
-    PollVote.objects.filter(sender=user, option__poll=poll).delete()
-    validated_options = PollOption.objects.filter(
-        poll=poll, id__in=options
-    ).values_list("id", flat=True)
+def _load_poll(pk, room):
+    poll = Poll.objects.with_results().get(pk=pk, room=room, state=Poll.States.OPEN)
+    votes = defaultdict(list)
+    for sender, option in PollVote.objects.filter(option__poll=poll).values_list(
+        "sender_id", "option_id"
+    ):
+        votes[str(sender)].append(str(option))
+    return (
+        poll.serialize_public(),
+        poll.results,
+        {sender: ",".join(options) for sender, options in votes.items()},
+    )
+
+
+async def _load_poll_state(redis, pk, room):
+    poll, results, votes = await _load_poll(pk, room)
+    key_meta = KEY_META.format(poll=pk)
+    keys = (key_meta, KEY_TALLY.format(poll=pk), KEY_VOTES.format(poll=pk))
+    async with redis.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(key_meta)
+            if await pipe.exists(key_meta):
+                return
+            pipe.multi()
+            pipe.delete(keys[1], keys[2])
+            if results:
+                pipe.hset(keys[1], mapping=results)
+            if votes:
+                pipe.hset(keys[2], mapping=votes)
+            pipe.hset(
+                key_meta,
+                mapping={
+                    "poll": json.dumps(poll),
+                    "room": poll["room_id"],
+                    "options": ",".join(o["id"] for o in poll["options"]),
+                },
+            )
+            for key in keys:
+                pipe.expire(key, POLL_STATE_TTL)
+            await pipe.execute()
+        except WatchError:
+            pass  # Somebody else loaded the poll at the same time
+
+
+async def vote_on_poll(pk, room, user, options):
+    """
+    Replaces the vote of ``user`` and returns the poll with its current results. The vote is counted in redis right
+    away and written to the database later by :py:func:`persist_votes`.
+    """
+    key_meta = KEY_META.format(poll=pk)
+    keys = (key_meta, KEY_TALLY.format(poll=pk), KEY_VOTES.format(poll=pk), KEY_DIRTY.format(poll=pk))
+    async with aredis(key_meta) as redis:
+        for attempt in range(3):
+            meta = await redis.hgetall(key_meta)
+            if not meta:
+                # Raises Poll.DoesNotExist if the poll is not open
+                await _load_poll_state(redis, pk, room)
+                continue
+            if meta[b"room"].decode() != str(room):
+                raise Poll.DoesNotExist("Poll matching query does not exist.")
+
+            choice = ",".join(
+                o for o in meta[b"options"].decode().split(",") if o and o in options
+            )
+            results = await redis.eval(
+                VOTE, len(keys) + 1, *keys, KEY_DIRTY_POLLS, user.pk, choice, POLL_STATE_TTL, pk
+            )
+            if results is None:
+                continue  # The poll has been changed in the meantime
+            poll = json.loads(meta[b"poll"])
+            # Do not send answers, as this object will be sent to everybody with access
+            poll["results"] = _decode_results(results)
+            return poll
+    raise Poll.DoesNotExist("Poll is not open for voting.")
+
+
+async def add_live_results(polls, user):
+    """
+    Replaces the results and answers of open polls serialized from the database with the not yet persisted state in
+    redis.
+    """
+    polls = [p for p in polls if p["state"] == Poll.States.OPEN]
+    if not polls:
+        return
+    async with aredis() as redis:
+        pipe = redis.pipeline(transaction=False)
+        for p in polls:
+            pipe.hgetall(KEY_TALLY.format(poll=p["id"]))
+            pipe.hget(KEY_VOTES.format(poll=p["id"]), str(user.pk))
+        values = await pipe.execute()
+    for p, results, answers in zip(polls, values[::2], values[1::2]):
+        if not results:
+            continue
+        if answers:
+            p["answers"] = answers.decode().split(",")
+        if "results" in p or answers:
+            p["results"] = _decode_results(results)
+
+
+async def poll_results_tick(pk):
+    """
+    Returns the current results of a poll if the caller is the one to broadcast them, or ``None`` otherwise. We only
+    want to send one update per poll and tick, no matter how many people vote, so the first voter of a tick waits for
+    the length of the tick and then gets the results of all votes cast in the meantime.
+    """
+    key_tick = KEY_TICK.format(poll=pk)
+    async with aredis(key_tick) as redis:
+        if not await redis.set(key_tick, "1", ex=POLL_TICK * 5, nx=True):
+            return None
+        await asyncio.sleep(POLL_TICK)
+        tr = redis.pipeline(transaction=True)
+        tr.delete(key_tick)
+        tr.hgetall(KEY_TALLY.format(poll=pk))
+        _, results = await tr.execute()
+    return _decode_results(results)
+
+
+@database_sync_to_async
+@transaction.atomic
+def _store_votes(pk, votes):
+    PollVote.objects.filter(option__poll_id=pk, sender_id__in=votes.keys()).delete()
     PollVote.objects.bulk_create(
-        [PollVote(sender=user, option_id=option) for option in validated_options]
+        [
+            PollVote(sender_id=sender, option_id=option)
+            for sender, options in votes.items()
+            for option in options
+        ]
     )
-    return Poll.objects.get(pk=pk).serialize_public(
-        force_results=True, answers=None
-    )  # Do not send answers, as this object will be sent to everybody with access
+
+
+async def persist_votes(pk):
+    """
+    Writes all votes that have been cast since the last call to the database. Returns the number of users whose
+    votes have been written.
+    """
+    key_persist = KEY_PERSIST.format(poll=pk)
+    key_dirty = KEY_DIRTY.format(poll=pk)
+    async with aredis(key_persist) as redis:
+        # Only one process writes the votes of a poll at a time. Everyone writes the latest vote of the users, so it
+        # does not matter in which order the turns are taken.
+        for attempt in range(50):
+            if await redis.set(key_persist, "1", ex=30, nx=True):
+                break
+            await asyncio.sleep(0.1)
+        else:
+            logger.warning("Could not persist votes of poll %s, lock is held", pk)
+            return 0
+
+        try:
+            tr = redis.pipeline(transaction=True)
+            tr.smembers(key_dirty)
+            tr.delete(key_dirty)
+            tr.srem(KEY_DIRTY_POLLS, pk)
+            senders, _, _ = await tr.execute()
+            if not senders:
+                return 0
+            senders = [s.decode() for s in senders]
+            choices = await redis.hmget(KEY_VOTES.format(poll=pk), senders)
+            try:
+                await _store_votes(
+                    pk,
+                    {
+                        sender: choice.decode().split(",") if choice else []
+                        for sender, choice in zip(senders, choices)
+                    },
+                )
+            except Exception:
+                tr = redis.pipeline(transaction=True)
+                tr.sadd(key_dirty, *senders)
+                tr.sadd(KEY_DIRTY_POLLS, pk)
+                await tr.execute()
+                raise
+            return len(senders)
+        finally:
+            await redis.delete(key_persist)
+
+
+async def persist_dirty_polls():
+    """
+    Writes the outstanding votes of all polls. Returns the number of users whose votes have been written.
+    """
+    async with aredis(KEY_DIRTY_POLLS) as redis:
+        polls = await redis.smembers(KEY_DIRTY_POLLS)
+    written = 0
+    for pk in polls:
+        try:
+            written += await persist_votes(pk.decode())
+        except Exception:
+            logger.exception("Could not persist votes of poll %s", pk.decode())
+    return written
+
+
+async def drop_poll_votes(pk, persist=True):
+    """
+    Removes the redis state of a poll after it has been changed, since the state also contains the poll itself. Unless
+    ``persist`` is ``False``, outstanding votes are written to the database first.
+    """
+    if persist:
+        await persist_votes(pk)
+    async with aredis() as redis:
+        await redis.delete(
+            KEY_META.format(poll=pk),
+            KEY_TALLY.format(poll=pk),
+            KEY_VOTES.format(poll=pk),
+            KEY_DIRTY.format(poll=pk),
+        )
+        await redis.srem(KEY_DIRTY_POLLS, pk)
+
+
+@receiver(signal=periodic_task, dispatch_uid="poll_persist_votes")
+def persist_poll_votes(sender, **kwargs):
+    written = async_to_sync(persist_dirty_polls)()
+    if written:
+        logger.info(f"Wrote poll votes of {written} users left behind.")
@@ -1,7 +1,89 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
 from channels.db import database_sync_to_async
-from django.db.models import Exists, OuterRef, Q
+from django.db import transaction
+from django.dispatch import receiver
+from redis.exceptions import WatchError
+
+from eventyay.base.models.roomquestion import QuestionVote, RoomQuestion
+from eventyay.base.signals import periodic_task
+from eventyay.core.utils.redis import aredis
+
+
+logger = logging.getLogger(__name__)
+
+# Votes on questions are counted in redis and written to the database in batches, once per tick, by whoever
+# broadcasts the changed scores of the tick (see QuestionModule.vote). Votes left behind, e.g. because that process
+# died in between, are written by the periodic task. Question lists are served from redis as well.
+#
+# questions:{room}:loaded   exists while the state of the room is in redis, it is loaded from the database on first use
+# questions:{room}:data     hash mapping question IDs to the public question data (without the score) and the sender
+# questions:{room}:scores   sorted set of question IDs by score
+# questions:{room}:votes    hash with a field "{question}:{user}" for every vote
+# questions:{room}:dirty    set of "{question}:{user}" votes that have not been written to the database yet
+# questions:dirty           set of the IDs of all rooms with a questions:{room}:dirty set
+# questions:{room}:changed  set of question IDs whose score changed since the last broadcast
+# questions:{room}:tick     exists while a score broadcast for the room is scheduled
+# questions:{room}:persist  lock held while votes are written to the database
+KEY_LOADED = "questions:{room}:loaded"
+KEY_DATA = "questions:{room}:data"
+KEY_SCORES = "questions:{room}:scores"
+KEY_VOTES = "questions:{room}:votes"
+KEY_DIRTY = "questions:{room}:dirty"
+KEY_DIRTY_ROOMS = "questions:dirty"
+KEY_CHANGED = "questions:{room}:changed"
+KEY_TICK = "questions:{room}:tick"
+KEY_PERSIST = "questions:{room}:persist"
+
+QUESTION_TICK = 1  # seconds
+QUESTION_STATE_TTL = 6 * 3600  # seconds, refreshed with every vote
 
-from eventyay.base.models.roomquestion import RoomQuestion, QuestionVote
+VOTE = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return false
+end
+local data = redis.call('hget', KEYS[2], ARGV[1])
+if not data then
+    return {-1}
+end
+local field = ARGV[1] .. ':' .. ARGV[2]
+local changed
+if ARGV[3] == '1' then
+    changed = redis.call('hsetnx', KEYS[4], field, '1')
+else
+    changed = redis.call('hdel', KEYS[4], field)
+end
+local score
+if changed == 1 then
+    score = redis.call('zincrby', KEYS[3], ARGV[3] == '1' and 1 or -1, ARGV[1])
+    redis.call('sadd', KEYS[5], field)
+    redis.call('sadd', KEYS[6], ARGV[1])
+    redis.call('sadd', KEYS[7], ARGV[5])
+else
+    score = redis.call('zscore', KEYS[3], ARGV[1])
+end
+for i=1,6 do
+    redis.call('expire', KEYS[i], ARGV[4])
+end
+return {tonumber(score), data}
+"""
+
+
+def _keys(room_id):
+    return tuple(
+        key.format(room=room_id)
+        for key in (KEY_LOADED, KEY_DATA, KEY_SCORES, KEY_VOTES, KEY_DIRTY, KEY_CHANGED)
+    )
+
+
+def _question_data(question, sender_id):
+    data = {k: v for k, v in question.items() if k not in ("score", "voted")}
+    data["sender"] = str(sender_id) if sender_id else None
+    return json.dumps(data)
 
 
 @database_sync_to_async
@@ -27,23 +109,6 @@ def pin_question(pk, room):
     room.questions.filter(pk=pk).update(is_pinned=True)
 
 
-@database_sync_to_async
-def get_questions(room, add_by_user=None, for_user=None, **kwargs):
-    questions = RoomQuestion.objects.filter(room=room)
-    if add_by_user:
-        questions = questions.filter(Q(**kwargs) | Q(sender=add_by_user))
-    elif kwargs:
-        questions = questions.filter(**kwargs)
-    if for_user:
-        subquery = QuestionVote.objects.filter(
-            question_id=OuterRef("pk"), sender=for_user
-        )
-        questions = questions.annotate(_voted=Exists(subquery))
-    return [
-        question.serialize_public(voted_state=bool(for_user)) for question in questions
-    ]
-
-
 @database_sync_to_async
 def update_question(**kwargs):
     question = RoomQuestion.objects.get(pk=kwargs["id"], room=kwargs["room"])
@@ -60,11 +125,273 @@ def delete_question(**kwargs):
 
 
 @database_sync_to_async
-def vote_on_question(pk, room, user, vote):
-    if vote is True:  # upvote
-        QuestionVote.objects.update_or_create(question_id=pk, sender_id=user.id)
-    else:
-        QuestionVote.objects.filter(question_id=pk, sender_id=user.id).delete()
+def _load_questions(room_id):
+    questions = {}
+    scores = {}
+    for question in RoomQuestion.objects.with_score().filter(room_id=room_id):
+        questions[str(question.pk)] = _question_data(question.serialize_public(), question.sender_id)
+        scores[str(question.pk)] = question.score
+    votes = QuestionVote.objects.filter(question__room_id=room_id).values_list("question_id", "sender_id")
+    return questions, scores, {f"{question}:{sender}": "1" for question, sender in votes}
 
-    question = RoomQuestion.objects.with_score().get(pk=pk, room=room)
-    return question.serialize_public()
+
+async def _load_room_state(redis, room_id):
+    questions, scores, votes = await _load_questions(room_id)
+    key_loaded, key_data, key_scores, key_votes = _keys(room_id)[:4]
+    async with redis.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(key_loaded)
+            if await pipe.exists(key_loaded):
+                return
+            pipe.multi()
+            pipe.delete(key_data, key_scores, key_votes)
+            if questions:
+                pipe.hset(key_data, mapping=questions)
+                pipe.zadd(key_scores, scores)
+            if votes:
+                pipe.hset(key_votes, mapping=votes)
+            pipe.set(key_loaded, "1")
+            for key in (key_loaded, key_data, key_scores, key_votes):
+                pipe.expire(key, QUESTION_STATE_TTL)
+            await pipe.execute()
+        except WatchError:
+            pass  # Somebody else loaded the room at the same time
+
+
+async def vote_on_question(pk, room, user, vote):
+    """
+    Adds or removes the vote of ``user`` and returns the question with its current score. The vote is counted in redis
+    right away and written to the database later by :py:func:`persist_question_votes`.
+    """
+    keys = _keys(room)
+    async with aredis(keys[0]) as redis:
+        for attempt in range(3):
+            result = await redis.eval(
+                VOTE,
+                len(keys) + 1,
+                *keys,
+                KEY_DIRTY_ROOMS,
+                str(pk),
+                user.pk,
+                "1" if vote is True else "0",
+                QUESTION_STATE_TTL,
+                str(room),
+            )
+            if result is None:
+                await _load_room_state(redis, room)
+                continue
+            if result[0] == -1:
+                raise RoomQuestion.DoesNotExist("RoomQuestion matching query does not exist.")
+            question = json.loads(result[1])
+            question.pop("sender")
+            question["score"] = int(result[0])
+            return question
+    raise RoomQuestion.DoesNotExist("Questions of this room are not available.")
+
+
+async def list_questions(room, user, moderator=False):
+    """
+    Returns the questions of a room visible to ``user`` from redis, ordered by score. Unless ``moderator`` is set,
+    these are the visible questions and the user's own ones.
+    """
+    key_loaded, key_data, key_scores, key_votes = _keys(room)[:4]
+    async with aredis(key_loaded) as redis:
+        for attempt in range(3):
+            pipe = redis.pipeline(transaction=True)
+            pipe.exists(key_loaded)
+            pipe.zrevrange(key_scores, 0, -1, withscores=True)
+            pipe.hgetall(key_data)
+            loaded, scores, data = await pipe.execute()
+            if loaded:
+                break
+            await _load_room_state(redis, room)
+        else:
+            raise RoomQuestion.DoesNotExist("Questions of this room are not available.")
+
+        questions = []
+        for pk, score in scores:
+            question = data.get(pk)
+            if question is None:
+                continue
+            question = json.loads(question)
+            sender = question.pop("sender")
+            if not moderator and question["state"] != RoomQuestion.States.VISIBLE and sender != str(user.pk):
+                continue
+            question["score"] = int(score)
+            questions.append(question)
+        if questions:
+            voted = await redis.hmget(key_votes, [f"{q['id']}:{user.pk}" for q in questions])
+            for question, v in zip(questions, voted):
+                question["voted"] = v is not None
+    return questions
+
+
+async def question_changed(question, sender_id=None):
+    """
+    Updates a question in the redis state of its room after it has been created or changed in the database, and
+    returns its current score (or ``None`` if the state of the room is not in redis).
+    """
+    key_loaded, key_data, key_scores = _keys(question["room_id"])[:3]
+    async with aredis(key_loaded) as redis:
+        if not await redis.exists(key_loaded):
+            return None
+        if sender_id is None:
+            existing = await redis.hget(key_data, question["id"])
+            sender_id = json.loads(existing)["sender"] if existing else None
+        pipe = redis.pipeline(transaction=True)
+        pipe.hset(key_data, question["id"], _question_data(question, sender_id))
+        pipe.zadd(key_scores, {question["id"]: question.get("score", 0)}, nx=True)
+        pipe.zscore(key_scores, question["id"])
+        result = await pipe.execute()
+    return int(result[-1])
+
+
+async def question_scores_tick(room):
+    """
+    Returns the changed scores of the questions of a room, if the caller is the one to broadcast them, or ``None``
+    otherwise. The first voter of a tick waits for the length of the tick and then gets the scores of all questions
+    that have been voted on in the meantime, as a mapping of question IDs to ``(score, state)`` ordered by score.
+    """
+    key_tick = KEY_TICK.format(room=room)
+    key_changed = KEY_CHANGED.format(room=room)
+    async with aredis(key_tick) as redis:
+        if not await redis.set(key_tick, "1", ex=QUESTION_TICK * 5, nx=True):
+            return None
+        await asyncio.sleep(QUESTION_TICK)
+        tr = redis.pipeline(transaction=True)
+        tr.delete(key_tick)
+        tr.smembers(key_changed)
+        tr.delete(key_changed)
+        _, changed, _ = await tr.execute()
+        if not changed:
+            return {}
+        changed = [pk.decode() for pk in changed]
+        pipe = redis.pipeline(transaction=False)
+        pipe.zmscore(KEY_SCORES.format(room=room), changed)
+        pipe.hmget(KEY_DATA.format(room=room), changed)
+        scores, data = await pipe.execute()
+    result = [
+        (pk, int(score), json.loads(d)["state"])
+        for pk, score, d in zip(changed, scores, data)
+        if score is not None and d is not None
+    ]
+    result.sort(key=lambda r: -r[1])
+    return {pk: (score, state) for pk, score, state in result}
+
+
+@database_sync_to_async
+@transaction.atomic
+def _store_votes(room_id, votes, scores):
+    # Questions might have been deleted in the meantime
+    existing = {
+        str(pk)
+        for pk in RoomQuestion.objects.filter(room_id=room_id, pk__in=scores.keys()).values_list("pk", flat=True)
+    }
+    votes = {(question, sender): voted for (question, sender), voted in votes.items() if question in existing}
+    by_question = defaultdict(list)
+    for question, sender in votes:
+        by_question[question].append(sender)
+    for question, senders in by_question.items():
+        QuestionVote.objects.filter(question_id=question, sender_id__in=senders).delete()
+    QuestionVote.objects.bulk_create(
+        [
+            QuestionVote(question_id=question, sender_id=sender)
+            for (question, sender), voted in votes.items()
+            if voted
+        ]
+    )
+    for question in existing:
+        RoomQuestion.objects.filter(pk=question).update(cached_score=scores[question])
+
+
+async def persist_question_votes(room):
+    """
+    Writes all votes that have been cast in a room since the last call to the database, together with the new scores
+    of the questions. Returns the number of votes written.
+    """
+    key_persist = KEY_PERSIST.format(room=room)
+    key_dirty = KEY_DIRTY.format(room=room)
+    async with aredis(key_persist) as redis:
+        # Only one process writes the votes of a room at a time. Everyone writes the latest state of the votes, so it
+        # does not matter in which order the turns are taken.
+        for attempt in range(50):
+            if await redis.set(key_persist, "1", ex=30, nx=True):
+                break
+            await asyncio.sleep(0.1)
+        else:
+            logger.warning("Could not persist question votes of room %s, lock is held", room)
+            return 0
+
+        try:
+            tr = redis.pipeline(transaction=True)
+            tr.smembers(key_dirty)
+            tr.delete(key_dirty)
+            tr.srem(KEY_DIRTY_ROOMS, str(room))
+            fields, _, _ = await tr.execute()
+            if not fields:
+                return 0
+            fields = [f.decode() for f in fields]
+            questions = sorted({f.split(":")[0] for f in fields})
+            pipe = redis.pipeline(transaction=False)
+            pipe.hmget(KEY_VOTES.format(room=room), fields)
+            pipe.zmscore(KEY_SCORES.format(room=room), questions)
+            voted, scores = await pipe.execute()
+            try:
+                await _store_votes(
+                    room,
+                    {tuple(f.split(":")): v is not None for f, v in zip(fields, voted)},
+                    {q: int(s) for q, s in zip(questions, scores) if s is not None},
+                )
+            except Exception:
+                tr = redis.pipeline(transaction=True)
+                tr.sadd(key_dirty, *fields)
+                tr.sadd(KEY_DIRTY_ROOMS, str(room))
+                await tr.execute()
+                raise
+            return len(fields)
+        finally:
+            await redis.delete(key_persist)
+
+
+async def persist_dirty_rooms():
+    """
+    Writes the outstanding question votes of all rooms. Returns the number of votes written.
+    """
+    async with aredis(KEY_DIRTY_ROOMS) as redis:
+        rooms = await redis.smembers(KEY_DIRTY_ROOMS)
+    written = 0
+    for room in rooms:
+        try:
+            written += await persist_question_votes(room.decode())
+        except Exception:
+            logger.exception("Could not persist question votes of room %s", room.decode())
+    return written
+
+
+async def question_removed(question):
+    """
+    Removes a deleted question from the redis state of its room.
+    """
+    key_data, key_scores = _keys(question["room_id"])[1:3]
+    async with aredis(key_data) as redis:
+        pipe = redis.pipeline(transaction=True)
+        pipe.hdel(key_data, question["id"])
+        pipe.zrem(key_scores, question["id"])
+        await pipe.execute()
+
+
+async def drop_question_state(room):
+    """
+    Writes outstanding votes to the database and removes the redis state of a room, e.g. after changes that affect
+    many questions at once.
+    """
+    await persist_question_votes(room)
+    async with aredis() as redis:
+        await redis.delete(*_keys(room))
+
+
+@receiver(signal=periodic_task, dispatch_uid="question_persist_votes")
+def flush_question_votes(sender, **kwargs):
+    written = async_to_sync(persist_dirty_rooms)()
+    if written:
+        logger.info(f"Wrote {written} question votes left behind.")
@@ -0,0 +1,561 @@
+"""
+Incrementally maintained quota counters, also called "counter mode".
+
+If ``QUOTA_COUNTER_MODE`` is enabled (and redis is available), the number of paid and pending order positions,
+blocking vouchers, waiting list entries and cart positions of every quota is kept in redis and updated by the
+code paths that write these objects. :py:class:`eventyay.base.services.quotas.QuotaAvailability` then answers
+availability requests for those quotas from the counters, without any aggregate queries.
+
+We store the following structures in redis:
+
+* ``quotas:{event_id}:counters`` is a hash with the fields ``{quota_id}:paid``, ``{quota_id}:pending``,
+  ``{quota_id}:vouchers``, ``{quota_id}:vouchers_until`` and ``{quota_id}:waitinglist``. The field
+  ``{quota_id}:valid`` is only present as long as the counters of that quota can be trusted.
+
+* ``quotas:{event_id}:carts:{quota_id}`` is a sorted set of cart position IDs, scored by the expiry timestamp
+  of the cart position. This way, expired cart positions drop out of the count without any write.
+
+* ``quotas:counters:events`` is a sorted set of the events that recently used their counters, scored by the
+  timestamp of the last use. Only these events are reconciled periodically.
+
+Write paths that can cheaply compute their effect on the counters apply a delta (order status changes, new or
+canceled order positions, cart changes). All other changes invalidate the counters of the affected quotas, which
+makes ``QuotaAvailability`` fall back to a full recount for these quotas until :py:func:`reconcile` has
+recomputed them. ``reconcile`` also runs periodically for all active events and reports any drift it finds.
+Quotas without a size limit and quotas that release capacity after exit scans are never counted here.
+"""
+
+import logging
+import time
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+from django_redis import get_redis_connection
+from django_scopes import scopes_disabled
+from redis.exceptions import WatchError
+
+from eventyay.base.models import (
+    CartPosition,
+    Event,
+    Order,
+    OrderPosition,
+    Quota,
+    Voucher,
+    WaitingListEntry,
+)
+from eventyay.base.services.tasks import EventTask
+from eventyay.base.signals import periodic_task
+from eventyay.celery_app import app
+
+
+logger = logging.getLogger(__name__)
+
+KEY_COUNTERS = 'quotas:{event_id}:counters'
+KEY_CARTS = 'quotas:{event_id}:carts:{quota_id}'
+KEY_EVENTS = 'quotas:counters:events'
+KEY_RECONCILE_REQUESTED = 'quotas:{event_id}:counters:reconcile'
+
+FIELDS = ('valid', 'paid', 'pending', 'vouchers', 'vouchers_until', 'waitinglist')
+COUNTED_STATUS = {
+    Order.STATUS_PAID: 'paid',
+    Order.STATUS_PENDING: 'pending',
+}
+
+# Counters expire if nobody touches them for a week, just to keep old events from filling up redis
+COUNTER_TTL = 3600 * 24 * 7
+# Events that did not read their counters for this long are no longer reconciled
+ACTIVE_TIMEOUT = 3600
+
+QuotaCounts = namedtuple('QuotaCounts', ('paid', 'pending', 'vouchers', 'cart', 'waitinglist'))
+
+
+def counters_enabled():
+    return settings.HAS_REDIS and settings.QUOTA_COUNTER_MODE
+
+
+def _position_key(product_id, variation_id, subevent_id):
+    if variation_id:
+        return 'v', variation_id, subevent_id
+    return 'p', product_id, subevent_id
+
+
+def _quota_ids(event_id, keys):
+    """
+    Maps keys built with ``_position_key`` to the list of IDs of the counted quotas that apply to them.
+    """
+    keys = set(keys)
+    product_ids = {k[1] for k in keys if k[0] == 'p'}
+    variation_ids = {k[1] for k in keys if k[0] == 'v'}
+    counted = Q(quota__event_id=event_id, quota__size__isnull=False, quota__release_after_exit=False)
+
+    lookup = defaultdict(list)
+    if product_ids:
+        for row in Quota.products.through.objects.filter(counted, product_id__in=product_ids).values(
+            'quota_id', 'product_id', 'quota__subevent_id'
+        ):
+            lookup['p', row['product_id'], row['quota__subevent_id']].append(row['quota_id'])
+    if variation_ids:
+        for row in Quota.variations.through.objects.filter(counted, productvariation_id__in=variation_ids).values(
+            'quota_id', 'productvariation_id', 'quota__subevent_id'
+        ):
+            lookup['v', row['productvariation_id'], row['quota__subevent_id']].append(row['quota_id'])
+    return lookup
+
+
+def _voucher_quota_ids(voucher):
+    if voucher.variation_id or voucher.product_id:
+        key = _position_key(voucher.product_id, voucher.variation_id, voucher.subevent_id)
+        return _quota_ids(voucher.event_id, [key])[key]
+    if voucher.quota_id:
+        return [voucher.quota_id]
+    return []
+
+
+def _blocks_quota(voucher, now_dt):
+    return (
+        voucher is not None
+        and voucher.block_quota
+        and (voucher.valid_until is None or voucher.valid_until >= now_dt)
+    )
+
+
+def _apply(event_id, increments=None, carts_add=None, carts_remove=None, invalid=None):
+    """
+    Writes changes to the counters of an event once the current transaction has been committed.
+
+    :param increments: ``Counter`` mapping ``(quota_id, field)`` to the amount the field changes by
+    :param carts_add: dict mapping quota IDs to a dict of cart position IDs and their expiry timestamp
+    :param carts_remove: dict mapping quota IDs to a set of cart position IDs
+    :param invalid: set of quota IDs whose counters can no longer be trusted
+    """
+    increments = {k: v for k, v in (increments or {}).items() if v}
+    if not increments and not carts_add and not carts_remove and not invalid:
+        return
+
+    def _write():
+        rc = get_redis_connection('redis')
+        key = KEY_COUNTERS.format(event_id=event_id)
+        pipe = rc.pipeline(transaction=False)
+        for (quota_id, field), amount in increments.items():
+            pipe.hincrby(key, f'{quota_id}:{field}', amount)
+        if invalid:
+            pipe.hdel(key, *[f'{quota_id}:valid' for quota_id in invalid])
+        pipe.expire(key, COUNTER_TTL)
+        for quota_id, members in (carts_add or {}).items():
+            if members:
+                pipe.zadd(KEY_CARTS.format(event_id=event_id, quota_id=quota_id), members)
+                pipe.expire(KEY_CARTS.format(event_id=event_id, quota_id=quota_id), COUNTER_TTL)
+        for quota_id, members in (carts_remove or {}).items():
+            if members:
+                pipe.zrem(KEY_CARTS.format(event_id=event_id, quota_id=quota_id), *members)
+        pipe.execute()
+        if invalid:
+            request_reconcile(event_id)
+
+    transaction.on_commit(_write)
+
+
+def invalidate(event_id, quota_ids):
+    """
+    Marks the counters of the given quotas as untrustworthy and schedules them to be recomputed.
+    """
+    if counters_enabled() and quota_ids:
+        _apply(event_id, invalid=set(quota_ids))
+
+
+def invalidate_voucher(voucher):
+    """
+    Invalidates the counters of all quotas a voucher might block capacity in.
+    """
+    if counters_enabled():
+        invalidate(voucher.event_id, _voucher_quota_ids(voucher))
+
+
+def invalidate_positions(event_id, positions):
+    """
+    Invalidates the counters of all quotas that apply to any of the given positions (or waiting list entries).
+    """
+    if not counters_enabled():
+        return
+    keys = [_position_key(p.product_id, p.variation_id, p.subevent_id) for p in positions]
+    lookup = _quota_ids(event_id, keys)
+    invalidate(event_id, {qid for k in keys for qid in lookup[k]})
+
+
+def count_positions(event_id, positions, field, amount):
+    """
+    Adds ``amount`` to the counter ``field`` of every quota that applies to one of the given positions.
+    """
+    if not counters_enabled() or not amount:
+        return
+    keys = [_position_key(p.product_id, p.variation_id, p.subevent_id) for p in positions]
+    lookup = _quota_ids(event_id, keys)
+    increments = Counter()
+    for k in keys:
+        for quota_id in lookup[k]:
+            increments[quota_id, field] += amount
+    _apply(event_id, increments)
+
+
+def order_status_changed(order, old_status, new_status):
+    """
+    Called by ``Order.save()`` whenever the status of an order changed.
+    """
+    if not counters_enabled():
+        return
+    old_field, new_field = COUNTED_STATUS.get(old_status), COUNTED_STATUS.get(new_status)
+    if old_field == new_field:
+        return
+    positions = list(
+        OrderPosition.objects.filter(order=order).only('product_id', 'variation_id', 'subevent_id', 'voucher_id')
+    )
+    if not positions:
+        return
+    if (old_field is None or new_field is None) and any(p.voucher_id for p in positions):
+        # Canceling or reactivating an order changes the redemption count of the vouchers used
+        invalidate_positions(order.event_id, positions)
+        return
+    keys = [_position_key(p.product_id, p.variation_id, p.subevent_id) for p in positions]
+    lookup = _quota_ids(order.event_id, keys)
+    increments = Counter()
+    for k in keys:
+        for quota_id in lookup[k]:
+            if old_field:
+                increments[quota_id, old_field] -= 1
+            if new_field:
+                increments[quota_id, new_field] += 1
+    _apply(order.event_id, increments)
+
+
+def order_position_saved(position, previous):
+    """
+    Called by ``OrderPosition.save()``. ``previous`` is the tuple ``(product_id, variation_id, subevent_id,
+    canceled)`` as loaded from the database, or ``None`` for new positions.
+    """
+    if not counters_enabled():
+        return
+    current = (position.product_id, position.variation_id, position.subevent_id, position.canceled)
+    if current == previous:
+        return
+    order = position.order
+    field = COUNTED_STATUS.get(order.status)
+    if field is None:
+        return
+
+    if previous is None:
+        if position.canceled:
+            return
+        key = _position_key(*current[:3])
+        increments = Counter()
+        quota_ids = _quota_ids(order.event_id, [key])[key]
+        for quota_id in quota_ids:
+            increments[quota_id, field] += 1
+        voucher = position.voucher if position.voucher_id else None
+        if _blocks_quota(voucher, now()) and voucher.max_usages - voucher.redeemed > 0:
+            # The position takes over the capacity the voucher blocked so far
+            for quota_id in _voucher_quota_ids(voucher):
+                increments[quota_id, 'vouchers'] -= 1
+        _apply(order.event_id, increments)
+    elif position.voucher_id or previous[:3] != current[:3]:
+        invalidate(
+            order.event_id,
+            {
+                qid
+                for k, ids in _quota_ids(
+                    order.event_id, [_position_key(*previous[:3]), _position_key(*current[:3])]
+                ).items()
+                for qid in ids
+            },
+        )
+    else:
+        count_positions(order.event_id, [position], field, -1 if position.canceled else 1)
+
+
+def cart_snapshot(event, cart_id):
+    """
+    Returns the cart positions currently in a cart, to be passed to ``sync_cart`` after the cart has been modified.
+    """
+    if not counters_enabled():
+        return None
+    return {
+        cp['pk']: _position_key(cp['product_id'], cp['variation_id'], cp['subevent_id'])
+        for cp in CartPosition.objects.filter(event=event, cart_id=cart_id).values(
+            'pk', 'product_id', 'variation_id', 'subevent_id'
+        )
+    }
+
+
+def sync_cart(event, cart_id, snapshot):
+    """
+    Brings the cart counters in line with the current state of a cart, given a ``snapshot`` of the cart taken before
+    it was modified.
+    """
+    if snapshot is None or not counters_enabled():
+        return
+    now_dt = now()
+    current = list(
+        CartPosition.objects.filter(event=event, cart_id=cart_id).select_related('voucher')
+    )
+    keys = {cp.pk: _position_key(cp.product_id, cp.variation_id, cp.subevent_id) for cp in current}
+    lookup = _quota_ids(event.pk, list(keys.values()) + list(snapshot.values()))
+
+    carts_add = defaultdict(dict)
+    carts_remove = defaultdict(set)
+    for cp in current:
+        if _blocks_quota(cp.voucher, now_dt):
+            # Counted through the voucher, not through the cart
+            for quota_id in lookup[keys[cp.pk]]:
+                carts_remove[quota_id].add(cp.pk)
+            continue
+        for quota_id in lookup[keys[cp.pk]]:
+            carts_add[quota_id][cp.pk] = cp.expires.timestamp()
+    for pk, key in snapshot.items():
+        if pk not in keys:
+            for quota_id in lookup[key]:
+                carts_remove[quota_id].add(pk)
+    _apply(event.pk, carts_add=carts_add, carts_remove=carts_remove)
+
+
+def cart_positions_removed(event_id, positions):
+    """
+    Removes cart positions that are deleted e.g. because they have been converted into an order.
+    """
+    if not counters_enabled():
+        return
+    keys = {cp.pk: _position_key(cp.product_id, cp.variation_id, cp.subevent_id) for cp in positions if cp.pk}
+    lookup = _quota_ids(event_id, keys.values())
+    carts_remove = defaultdict(set)
+    for pk, key in keys.items():
+        for quota_id in lookup[key]:
+            carts_remove[quota_id].add(pk)
+    _apply(event_id, carts_remove=carts_remove)
+
+
+def read(event_id, quotas, now_dt):
+    """
+    Returns a dictionary mapping quota IDs to ``QuotaCounts`` for all given quotas that currently have trustworthy
+    counters. If counters are missing, a reconciliation is scheduled.
+    """
+    rc = get_redis_connection('redis')
+    ts = now_dt.timestamp()
+    eligible = [q for q in quotas if q.size is not None and not q.release_after_exit]
+    if not eligible:
+        return {}
+
+    pipe = rc.pipeline(transaction=False)
+    pipe.hmget(KEY_COUNTERS.format(event_id=event_id), [f'{q.pk}:{f}' for q in eligible for f in FIELDS])
+    for q in eligible:
+        pipe.zcount(KEY_CARTS.format(event_id=event_id, quota_id=q.pk), ts, '+inf')
+    pipe.zadd(KEY_EVENTS, {str(event_id): time.time()})
+    values, *carts = pipe.execute()
+    carts = carts[:-1]
+
+    result = {}
+    missing = False
+    for i, q in enumerate(eligible):
+        valid, paid, pending, vouchers, vouchers_until, waitinglist = values[i * len(FIELDS) : (i + 1) * len(FIELDS)]
+        if valid is None:
+            missing = True
+            continue
+        if vouchers_until is not None and float(vouchers_until) < ts:
+            # One of the counted vouchers expired in the meantime
+            missing = True
+            continue
+        result[q.pk] = QuotaCounts(
+            paid=int(paid or 0),
+            pending=int(pending or 0),
+            vouchers=int(vouchers or 0),
+            cart=int(carts[i]),
+            waitinglist=int(waitinglist or 0),
+        )
+    if missing:
+        request_reconcile(event_id)
+    return result
+
+
+def request_reconcile(event_id):
+    """
+    Schedules a reconciliation of the counters of an event, unless one has been scheduled very recently.
+    """
+    rc = get_redis_connection('redis')
+    if rc.set(KEY_RECONCILE_REQUESTED.format(event_id=event_id), '1', nx=True, ex=10):
+        reconcile_quota_counters.apply_async(args=(event_id,))
+
+
+def reconcile(event, now_dt=None):
+    """
+    Recomputes all counters of an event from the database and replaces the stored values. Returns a dictionary
+    mapping quota IDs to a dictionary of the differences between the stored and the recomputed counters, for
+    all quotas that were considered valid before.
+    """
+    from eventyay.base.services.quotas import QuotaAvailability
+
+    rc = get_redis_connection('redis')
+    key = KEY_COUNTERS.format(event_id=event.pk)
+    quotas = list(Quota.objects.filter(event=event, size__isnull=False, release_after_exit=False))
+    if not quotas:
+        return {}
+    cart_keys = [KEY_CARTS.format(event_id=event.pk, quota_id=q.pk) for q in quotas]
+
+    for attempt in range(3):
+        now_dt = now_dt or now()
+        with rc.pipeline() as pipe:
+            try:
+                # If any of the write paths touches the counters while we count, our results are useless
+                pipe.watch(key, *cart_keys)
+                stored = pipe.hmget(key, [f'{q.pk}:{f}' for q in quotas for f in FIELDS])
+                stored_carts = [pipe.zcount(k, now_dt.timestamp(), '+inf') for k in cart_keys]
+
+                qa = QuotaAvailability(full_results=True, early_out=False, ignore_closed=True, use_counters=False)
+                # We need the raw numbers without plugin overrides or caching, so we skip compute() on purpose.
+                qa._compute(quotas, now_dt)
+                carts, vouchers_until = _cart_and_voucher_state(event, quotas, now_dt)
+
+                drift = {}
+                for i, q in enumerate(quotas):
+                    recomputed = {
+                        'paid': qa.count_paid_orders[q],
+                        'pending': qa.count_pending_orders[q],
+                        'vouchers': qa.count_vouchers[q],
+                        'waitinglist': qa.count_waitinglist[q],
+                    }
+                    old = dict(zip(FIELDS, stored[i * len(FIELDS) : (i + 1) * len(FIELDS)]))
+                    if old['valid'] is not None:
+                        diff = {f: int(old[f] or 0) - v for f, v in recomputed.items() if int(old[f] or 0) != v}
+                        if stored_carts[i] != qa.count_cart[q]:
+                            diff['cart'] = stored_carts[i] - qa.count_cart[q]
+                        if diff:
+                            drift[q.pk] = diff
+
+                pipe.multi()
+                mapping = {}
+                for q in quotas:
+                    mapping[f'{q.pk}:valid'] = '1'
+                    mapping[f'{q.pk}:paid'] = qa.count_paid_orders[q]
+                    mapping[f'{q.pk}:pending'] = qa.count_pending_orders[q]
+                    mapping[f'{q.pk}:vouchers'] = qa.count_vouchers[q]
+                    mapping[f'{q.pk}:waitinglist'] = qa.count_waitinglist[q]
+                pipe.hset(key, mapping=mapping)
+                pipe.hdel(key, *[f'{q.pk}:vouchers_until' for q in quotas])
+                for q in quotas:
+                    if vouchers_until.get(q.pk):
+                        pipe.hset(key, f'{q.pk}:vouchers_until', vouchers_until[q.pk].timestamp())
+                pipe.expire(key, COUNTER_TTL)
+                for q, cart_key in zip(quotas, cart_keys):
+                    pipe.delete(cart_key)
+                    if carts[q.pk]:
+                        pipe.zadd(cart_key, carts[q.pk])
+                        pipe.expire(cart_key, COUNTER_TTL)
+                pipe.execute()
+            except WatchError:
+                now_dt = None
+                continue
+
+        if drift:
+            logger.warning('Quota counters of event %s drifted from the database: %r', event.pk, drift)
+        return drift
+
+    # We could not get a consistent view three times in a row, so we make sure nobody trusts the counters
+    # and try again later.
+    rc.hdel(key, *[f'{q.pk}:valid' for q in quotas])
+    logger.info('Could not reconcile quota counters of event %s due to concurrent writes.', event.pk)
+    return {}
+
+
+def _cart_and_voucher_state(event, quotas, now_dt):
+    quota_ids = {q.pk for q in quotas}
+    subevent_ids = {q.subevent_id for q in quotas}
+
+    cart_positions = CartPosition.objects.filter(
+        Q(event=event)
+        & Q(expires__gte=now_dt)
+        & Q(Q(voucher__isnull=True) | Q(voucher__block_quota=False) | Q(voucher__valid_until__lt=now_dt))
+    ).values('pk', 'product_id', 'variation_id', 'subevent_id', 'expires')
+    cart_positions = [cp for cp in cart_positions if cp['subevent_id'] in subevent_ids]
+    lookup = _quota_ids(
+        event.pk, [_position_key(cp['product_id'], cp['variation_id'], cp['subevent_id']) for cp in cart_positions]
+    )
+    carts = defaultdict(dict)
+    for cp in cart_positions:
+        for quota_id in lookup[_position_key(cp['product_id'], cp['variation_id'], cp['subevent_id'])]:
+            if quota_id in quota_ids:
+                carts[quota_id][cp['pk']] = cp['expires'].timestamp()
+
+    vouchers_until = {}
+    voucher_rows = (
+        Voucher.objects.filter(event=event, block_quota=True, valid_until__gte=now_dt)
+        .order_by()
+        .values('product_id', 'variation_id', 'subevent_id', 'quota_id')
+        .annotate(until=Min('valid_until'))
+    )
+    for row in voucher_rows:
+        if row['variation_id'] or row['product_id']:
+            key = _position_key(row['product_id'], row['variation_id'], row['subevent_id'])
+            affected = _quota_ids(event.pk, [key])[key]
+        else:
+            affected = [row['quota_id']]
+        for quota_id in affected:
+            if quota_id in quota_ids and (quota_id not in vouchers_until or row['until'] < vouchers_until[quota_id]):
+                vouchers_until[quota_id] = row['until']
+    return carts, vouchers_until
+
+
+@app.task(base=EventTask)
+def reconcile_quota_counters(event: Event):
+    if not counters_enabled():
+        return {}
+    return {str(k): v for k, v in reconcile(event).items()}
+
+
+@receiver(signal=periodic_task, dispatch_uid='quotacounters_reconcile')
+@scopes_disabled()
+def reconcile_active_events(sender, **kwargs):
+    if not counters_enabled():
+        return
+    rc = get_redis_connection('redis')
+    threshold = time.time() - ACTIVE_TIMEOUT
+    for event_id in rc.zrangebyscore(KEY_EVENTS, '-inf', threshold):
+        # Nobody looked at these counters for a while, so we stop maintaining their consistency. They will be
+        # rebuilt from scratch once they are needed again.
+        rc.delete(KEY_COUNTERS.format(event_id=event_id.decode()))
+    rc.zremrangebyscore(KEY_EVENTS, '-inf', threshold)
+    for event_id in rc.zrange(KEY_EVENTS, 0, -1):
+        reconcile_quota_counters.apply_async(args=(int(event_id),))
+
+
+@receiver(post_delete, sender=OrderPosition, dispatch_uid='quotacounters_orderposition_deleted')
+def _orderposition_deleted(sender, instance, **kwargs):
+    if counters_enabled():
+        invalidate_positions(instance.order.event_id, [instance])
+
+
+@receiver(post_save, sender=Voucher, dispatch_uid='quotacounters_voucher_saved')
+@receiver(post_delete, sender=Voucher, dispatch_uid='quotacounters_voucher_deleted')
+def _voucher_changed(sender, instance, **kwargs):
+    invalidate_voucher(instance)
+
+
+@receiver(post_save, sender=WaitingListEntry, dispatch_uid='quotacounters_waitinglist_saved')
+@receiver(post_delete, sender=WaitingListEntry, dispatch_uid='quotacounters_waitinglist_deleted')
+def _waitinglistentry_changed(sender, instance, **kwargs):
+    if counters_enabled():
+        invalidate_positions(instance.event_id, [instance])
+
+
+@receiver(post_save, sender=Quota, dispatch_uid='quotacounters_quota_saved')
+def _quota_saved(sender, instance, update_fields=None, **kwargs):
+    relevant = {'size', 'subevent', 'release_after_exit'}
+    if counters_enabled() and (update_fields is None or relevant & set(update_fields)):
+        invalidate(instance.event_id, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Quota.products.through, dispatch_uid='quotacounters_quota_products')
+@receiver(m2m_changed, sender=Quota.variations.through, dispatch_uid='quotacounters_quota_variations')
+def _quota_products_changed(sender, instance, action, **kwargs):
+    if counters_enabled() and isinstance(instance, Quota) and action.startswith('post_'):
+        invalidate(instance.event_id, [instance.pk])
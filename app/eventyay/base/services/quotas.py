@@ -32,6 +32,7 @@ from eventyay.base.models import (
 )
 
 from ..signals import quota_availability
+from . import quotacounters
 
 
 class QuotaAvailability:
@@ -63,6 +64,7 @@ class QuotaAvailability:
         ignore_closed=False,
         full_results=False,
         early_out=True,
+        use_counters=True,
     ):
         """
         Initialize a new quota availability calculator
@@ -85,6 +87,10 @@ class QuotaAvailability:
                           keep the database-level quota cache up to date so backend overviews render quickly. If you
                           do not care about keeping the cache up to date, you can set this to ``False`` for further
                           performance improvements.
+
+        :param use_counters: If the quota counter mode is enabled (see :py:mod:`eventyay.base.services.quotacounters`),
+                             quotas are counted from the incrementally maintained counters whenever they are
+                             available. Set this to ``False`` to always count in the database.
         """
         self._queue = []
         self._count_waitinglist = count_waitinglist
@@ -93,6 +99,7 @@ class QuotaAvailability:
         self._product_to_quotas = defaultdict(list)
         self._var_to_quotas = defaultdict(list)
         self._early_out = early_out
+        self._use_counters = use_counters
         self._quota_objects = {}
         self.results = {}
         self.count_paid_orders = defaultdict(int)
@@ -232,6 +239,11 @@ class QuotaAvailability:
                 if not quotas:
                     return
 
+        if self._use_counters and quotacounters.counters_enabled():
+            quotas = self._compute_from_counters(quotas, now_dt)
+            if not quotas:
+                return
+
         size_left = Counter({q: (sys.maxsize if s is None else s) for q, s in self.sizes.items()})
         for q in quotas:
             self.count_paid_orders[q] = 0
@@ -284,6 +296,50 @@ class QuotaAvailability:
                 else:
                     raise ValueError('inconclusive quota')
 
+    def _compute_from_counters(self, quotas, now_dt):
+        """
+        Takes the numbers for all quotas with trustworthy counters from redis instead of the database. Returns the
+        list of quotas that still need to be counted.
+        """
+        remaining = []
+        quotas_by_event = defaultdict(list)
+        for q in quotas:
+            quotas_by_event[q.event_id].append(q)
+
+        for eventid, evquotas in quotas_by_event.items():
+            counts = quotacounters.read(eventid, evquotas, now_dt)
+            for q in evquotas:
+                c = counts.get(q.pk)
+                if c is None:
+                    remaining.append(q)
+                    continue
+
+                self.count_paid_orders[q] = c.paid
+                self.count_pending_orders[q] = c.pending
+                self.count_vouchers[q] = c.vouchers
+                self.count_cart[q] = c.cart
+                self.count_waitinglist[q] = c.waitinglist if self._count_waitinglist else 0
+                q.cached_availability_paid_orders = c.paid
+                if q in self.results:
+                    continue
+
+                # Same order of precedence as in the database-backed computation below
+                size_left = self.sizes[q]
+                for count, state in (
+                    (c.paid, Quota.AVAILABILITY_GONE),
+                    (c.pending, Quota.AVAILABILITY_ORDERED),
+                    (c.vouchers, Quota.AVAILABILITY_ORDERED),
+                    (c.cart, Quota.AVAILABILITY_RESERVED),
+                    (self.count_waitinglist[q], Quota.AVAILABILITY_ORDERED),
+                ):
+                    size_left -= count
+                    if size_left <= 0:
+                        self.results[q] = state, 0
+                        break
+                else:
+                    self.results[q] = Quota.AVAILABILITY_OK, size_left
+        return remaining
+
     def _compute_orders(self, quotas, q_products, q_vars, size_left):
         events = {q.event_id for q in quotas}
         subevents = {q.subevent_id for q in quotas}
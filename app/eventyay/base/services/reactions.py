@@ -1,8 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import UTC, datetime
+
+from asgiref.sync import async_to_sync
 from channels.db import database_sync_to_async
+from django.dispatch import receiver
+
+from eventyay.base.models.room import ReactionRollup, Room
+from eventyay.base.signals import periodic_task
+from eventyay.core.utils.redis import aredis
+
+
+logger = logging.getLogger(__name__)
+
+# Reactions are counted per room and minute in redis and written to the database as one ReactionRollup row per room,
+# minute and reaction by a worker task in the background of the server process. Every write stores the full count of
+# the minute, so a minute that is written again (e.g. because a tick ended late) is not counted twice.
+#
+# reactions:rollup:{minute}    hash "{room}:{reaction}" -> number of reactions in the minute that starts at the unix
+#                              timestamp {minute}
+# reactions:rollup:pending     sorted set of the minutes that changed since they have last been written, scored by
+#                              their timestamp. Only the process that removes a minute from it writes the minute.
+KEY_ROLLUP = "reactions:rollup:{minute}"
+KEY_PENDING = "reactions:rollup:pending"
+
+WRITE_DELAY = 5  # seconds after the end of a minute before it is written
+WRITE_INTERVAL = 15  # seconds
+ROLLUP_TTL = 3600  # seconds, a minute can't be written again once its counters expired
+
+_tasks = {}  # background tasks of this process, by name
+
+
+async def store_reactions(room_id, reactions):
+    """
+    Counts the reactions of one tick towards the current minute. ``reactions`` maps reactions to their amount.
+    """
+    minute = int(time.time()) // 60 * 60
+    key = KEY_ROLLUP.format(minute=minute)
+    async with aredis(KEY_PENDING) as redis:
+        tr = redis.pipeline(transaction=True)
+        for reaction, amount in reactions.items():
+            tr.hincrby(key, f"{room_id}:{reaction}", amount)
+        tr.expire(key, ROLLUP_TTL)
+        tr.zadd(KEY_PENDING, {minute: minute})
+        await tr.execute()
+    _start_writer()
 
-from eventyay.base.models.room import Reaction
+
+def _start_writer():
+    task = _tasks.get("writer")
+    if task is None or task.done():
+        _tasks["writer"] = asyncio.get_running_loop().create_task(_run_writer())
+
+
+async def _run_writer():
+    while True:
+        await asyncio.sleep(WRITE_INTERVAL)
+        try:
+            await write_rollups()
+        except Exception:
+            logger.exception("Could not write reaction rollups.")
+        async with aredis(KEY_PENDING) as redis:
+            if not await redis.zcard(KEY_PENDING):
+                return
 
 
 @database_sync_to_async
-def store_reaction(room_id: str, reaction: str, amount: int):
-    Reaction.objects.create(room_id=room_id, reaction=reaction, amount=amount)
+def _write(minute, counts):
+    start = datetime.fromtimestamp(minute, tz=UTC)
+    rollups = []
+    for field, amount in counts.items():
+        room_id, reaction = field.decode().split(":", 1)
+        rollups.append(ReactionRollup(room_id=room_id, minute=start, reaction=reaction, amount=int(amount)))
+    # Rooms might have been deleted in the meantime
+    room_ids = {
+        str(pk) for pk in Room.objects.filter(pk__in={r.room_id for r in rollups}).values_list("pk", flat=True)
+    }
+    ReactionRollup.objects.bulk_create(
+        [r for r in rollups if r.room_id in room_ids],
+        update_conflicts=True,
+        unique_fields=["room", "minute", "reaction"],
+        update_fields=["amount"],
+    )
+
+
+async def write_rollups(until=None):
+    """
+    Writes the counts of all minutes that ended before ``until`` (a unix timestamp, by default a few seconds ago) and
+    changed since they have last been written. Returns the number of minutes written.
+    """
+    if until is None:
+        until = time.time() - WRITE_DELAY
+    written = 0
+    async with aredis(KEY_PENDING) as redis:
+        for pending in await redis.zrangebyscore(KEY_PENDING, "-inf", until - 60):
+            minute = int(pending)
+            tr = redis.pipeline(transaction=True)
+            tr.zrem(KEY_PENDING, minute)
+            tr.hgetall(KEY_ROLLUP.format(minute=minute))
+            removed, counts = await tr.execute()
+            if not removed:
+                # Another process got to it first
+                continue
+            try:
+                await _write(minute, counts)
+            except Exception:
+                await redis.zadd(KEY_PENDING, {minute: minute})
+                raise
+            written += 1
+    return written
+
+
+def get_reaction_counts(room, begin, end, bucket_minutes=1):
+    """
+    Returns the number of reactions in a room between ``begin`` and ``end`` as a Counter of (start of bucket,
+    reaction) -> amount. ``bucket_minutes`` must divide an hour. Reactions of the last minute or so are not included
+    before they have been written.
+    """
+    counts = Counter()
+    rollups = ReactionRollup.objects.filter(room=room, minute__gte=begin, minute__lte=end).values_list(
+        "minute", "reaction", "amount"
+    )
+    for minute, reaction, amount in rollups:
+        bucket = minute.replace(minute=minute.minute // bucket_minutes * bucket_minutes)
+        counts[bucket, reaction] += amount
+    return counts
+
+
+@receiver(signal=periodic_task, dispatch_uid="reactions_write_rollups")
+def write_reaction_rollups(sender, **kwargs):
+    written = async_to_sync(write_rollups)()
+    if written:
+        logger.info(f"Wrote reaction rollups for {written} minutes left behind.")
@@ -0,0 +1,172 @@
+"""
+Reservation tokens for high-demand on-sales.
+
+If the event setting ``high_demand_mode`` is enabled (and redis is available), every quota of the event gets a
+pool of reservation tokens in redis, one token per ticket that is currently available. Before a cart change
+touches the database, :py:class:`eventyay.base.services.cart.CartManager` atomically takes one token for every
+quota slot it wants to reserve. If a pool runs dry, the request fails right away with a "sold out" error,
+without waiting for the event lock or running the full quota check. Requests that got their tokens still go
+through the regular checks, so the pools only need to be roughly right and can never lead to overbooking.
+
+We store the following structures in redis:
+
+* ``quotas:{event_id}:tokens`` is a hash mapping quota IDs to the number of tokens left in their pool.
+
+* ``quotas:tokens:events`` is a sorted set of the events that recently used their pools, scored by the timestamp
+  of the last use. Only these events are refilled periodically.
+
+Tokens of cart positions that are removed from a cart are put back into the pool right away. Cart positions that
+expire free their quota at the time of expiry, not when they are cleaned up, so their tokens are returned by
+:py:func:`refill`, which recomputes all pools of an event from :py:class:`QuotaAvailability`. It runs
+periodically for all active events and on demand whenever a pool is missing or empty.
+"""
+
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+from django_scopes import scopes_disabled
+
+from eventyay.base.models import Event, Quota
+from eventyay.base.services.tasks import EventTask
+from eventyay.base.signals import periodic_task
+from eventyay.celery_app import app
+
+
+KEY_POOL = 'quotas:{event_id}:tokens'
+KEY_EVENTS = 'quotas:tokens:events'
+KEY_REFILL_REQUESTED = 'quotas:{event_id}:tokens:refill'
+
+# Pools expire if nobody touches them for a day, just to keep old events from filling up redis
+POOL_TTL = 3600 * 24
+# Events that did not use their pools for this long are no longer refilled
+ACTIVE_TIMEOUT = 3600
+
+# Takes ARGV[2i] tokens from the pool of quota ARGV[2i-1] for all given quotas, or none at all. Returns -1 if
+# one of the pools does not exist, 0 if one of them has not enough tokens left and 1 on success.
+TAKE = """
+for i = 1, #ARGV, 2 do
+    local left = redis.call('HGET', KEYS[1], ARGV[i])
+    if not left then
+        return -1
+    end
+    if tonumber(left) < tonumber(ARGV[i + 1]) then
+        return 0
+    end
+end
+for i = 1, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], -tonumber(ARGV[i + 1]))
+end
+return 1
+"""
+
+
+def high_demand_mode(event):
+    return settings.HAS_REDIS and event.settings.high_demand_mode
+
+
+def take(event, demand):
+    """
+    Takes tokens from the pools of the event. *demand* maps quotas to the number of tokens needed. Returns
+    ``True`` if all tokens were taken, ``False`` if at least one pool did not have enough tokens left (in which
+    case nothing is taken) and ``None`` if the pools are not available and the caller needs to fall back to the
+    regular checks.
+    """
+    demand = {q.pk: n for q, n in demand.items() if n > 0 and q.size is not None}
+    if not demand:
+        return True
+    rc = get_redis_connection('redis')
+    argv = []
+    for quota_id, n in demand.items():
+        argv += [quota_id, n]
+    result = rc.eval(TAKE, 1, KEY_POOL.format(event_id=event.pk), *argv)
+    rc.zadd(KEY_EVENTS, {event.pk: time.time()})
+    if result < 1:
+        # Either the pool is missing, or it ran dry and might not have seen some cart positions expire yet
+        request_refill(event.pk)
+    if result < 0:
+        return None
+    return bool(result)
+
+
+def give_back(event, tokens):
+    """
+    Returns tokens to the pools of the event. *tokens* maps quotas to the number of tokens to return.
+    """
+    tokens = {q.pk: n for q, n in tokens.items() if n > 0 and q.size is not None}
+    if not tokens:
+        return
+    rc = get_redis_connection('redis')
+    key = KEY_POOL.format(event_id=event.pk)
+    pipe = rc.pipeline()
+    for quota_id, n in tokens.items():
+        # Only return tokens into pools that still exist, a pool that was dropped in the meantime will be
+        # recomputed from scratch anyway.
+        pipe.hexists(key, quota_id)
+    exists = pipe.execute()
+    pipe = rc.pipeline()
+    for (quota_id, n), e in zip(tokens.items(), exists):
+        if e:
+            pipe.hincrby(key, quota_id, n)
+    pipe.execute()
+
+
+def refill(event, now_dt=None):
+    """
+    Recomputes the pools of all limited quotas of an event from the current availability.
+    """
+    from eventyay.base.services.quotas import QuotaAvailability
+
+    quotas = list(event.quotas.filter(size__isnull=False))
+    if not quotas:
+        return {}
+    qa = QuotaAvailability(early_out=False)
+    qa.queue(*quotas)
+    qa.compute(now_dt=now_dt)
+    pools = {q.pk: max(qa.results[q][1] or 0, 0) if qa.results[q][0] == Quota.AVAILABILITY_OK else 0 for q in quotas}
+
+    rc = get_redis_connection('redis')
+    key = KEY_POOL.format(event_id=event.pk)
+    pipe = rc.pipeline()
+    pipe.delete(key)
+    pipe.hset(key, mapping=pools)
+    pipe.expire(key, POOL_TTL)
+    pipe.execute()
+    return pools
+
+
+def request_refill(event_id):
+    """
+    Schedules a refill of the pools of an event, unless one has been scheduled very recently.
+    """
+    rc = get_redis_connection('redis')
+    if rc.set(KEY_REFILL_REQUESTED.format(event_id=event_id), '1', nx=True, ex=5):
+        refill_reservation_tokens.apply_async(args=(event_id,))
+
+
+@app.task(base=EventTask)
+def refill_reservation_tokens(event: Event):
+    if not high_demand_mode(event):
+        return {}
+    return {str(k): v for k, v in refill(event).items()}
+
+
+@receiver(signal=periodic_task, dispatch_uid='reservationtokens_refill')
+@scopes_disabled()
+def refill_active_events(sender, **kwargs):
+    if not settings.HAS_REDIS:
+        return
+    rc = get_redis_connection('redis')
+    threshold = time.time() - ACTIVE_TIMEOUT
+    rc.zremrangebyscore(KEY_EVENTS, '-inf', threshold)
+    for event_id in rc.zrange(KEY_EVENTS, 0, -1):
+        refill_reservation_tokens.apply_async(args=(int(event_id),))
+
+
+@receiver(post_save, sender=Quota, dispatch_uid='reservationtokens_quota_saved')
+def _quota_saved(sender, instance, **kwargs):
+    if settings.HAS_REDIS and instance.event.settings.high_demand_mode:
+        # The pool will be recomputed when it is needed next
+        get_redis_connection('redis').hdel(KEY_POOL.format(event_id=instance.event_id), instance.pk)
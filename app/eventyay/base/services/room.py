@@ -5,7 +5,6 @@ from channels.db import database_sync_to_async
 from channels.layers import get_channel_layer
 from django.db.transaction import atomic
 from django.dispatch import receiver
-from django.utils.timezone import now
 from django_scopes import scope, scopes_disabled
 
 from eventyay.base.models import AuditLog, Channel, User
@@ -17,13 +16,13 @@ from eventyay.base.models.room import (
     get_room_with_linked_sessions,
     partial_validated_update,
 )
+from eventyay.base.services import roompresence
 from eventyay.base.services.user import get_public_users
 from eventyay.base.signals import periodic_task
 from eventyay.features.live.channels import GROUP_ROOM
 
 
-@database_sync_to_async
-def start_view(room: Room, user: User, delete=False):
+async def start_view(room: Room, user: User, socket_id, delete=False):
     # The majority of RoomViews that go "abandoned" (i.e. ``end`` is never set) are likely caused by server
     # crashes or restarts, in which case ``end`` can't be set. However, after a server crash, the client
     # either reconnects automatically or the user will attempt a reconnect themselves through a page reload,
@@ -36,34 +35,21 @@ def start_view(room: Room, user: User, delete=False):
     # we only count unique users and the result "this user was present at the time" is still correct. Second,
     # the way ``end_view`` is implemented, the session from browser A will still be corrected with the accurate
     # time as soon as browser A leaves.
-    previous = RoomView.objects.filter(room=room, user=user, end__isnull=True)
-    if delete:
-        previous.delete()
-    else:
-        previous.update(end=now())
-    r = RoomView.objects.create(room=room, user=user)
-    c = RoomView.objects.filter(room=room, end__isnull=True).count()
-    return r, c
+    #
+    # Presence is tracked in redis per socket, though, so the viewer count and the viewer list are not affected.
+    view = roompresence.queue_view_start(room, user, delete=delete)
+    count, gone = await roompresence.enter(room.pk, user.pk, socket_id)
+    return view, count, gone
 
 
-@database_sync_to_async
-def end_view(view: RoomView, delete=False):
-    if delete:
-        if view.pk:
-            view.delete()
-    else:
-        view.end = now()
-        view.save()
-    c = RoomView.objects.filter(room_id=view.room_id, end__isnull=True).count()
-    is_last = RoomView.objects.filter(room_id=view.room_id, end__isnull=True, user=view.user).count() == 0
-    return c, is_last
+async def end_view(view: RoomView, socket_id, delete=False):
+    roompresence.queue_view_end(view, delete=delete)
+    return await roompresence.leave(view.room_id, view.user_id, socket_id)
 
 
 async def get_viewers(event: Event, room: Room, *, include_private=False):
     users = await get_public_users(
-        # We're doing an ORM query in an async method, but it's okay, since it is not going to be evaluated but
-        # lazily passed to get_public_users which will use it as a subquery :)
-        ids=RoomView.objects.filter(room=room, end__isnull=True).values_list('user_id', flat=True),
+        ids=await roompresence.get_viewer_ids(room.pk),
         event_id=event.pk,
         include_banned=False,
         trait_badges_map=event.config.get('trait_badges_map'),
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import time
+from functools import reduce
+from operator import or_
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from eventyay.base.models.room import RoomView
+from eventyay.core.utils.redis import aredis, sredis
+from eventyay.features.live.channels import GROUP_EVENT
+
+
+logger = logging.getLogger(__name__)
+
+# Who is currently in a room is tracked in redis, so entering and leaving a room does not need to count RoomView rows.
+# The RoomView rows themselves are still written for the analytics, but in batches by a worker task in the background
+# of the server process (see queue_view_start and queue_view_end).
+#
+# room:presence:{room}:sessions   sorted set of "{user}:{socket}" for every open view of the room, scored by the time
+#                                 the view expires unless it is refreshed by the heartbeat of the socket
+# room:presence:{room}:users      hash mapping the IDs of the users in the room to their number of open views
+# room:approxcount:known:{room}   viewer count that has last been broadcast to the event
+# room:approxcount:tick:{room}    exists while a broadcast of the viewer count of the room is scheduled
+KEY_SESSIONS = "room:presence:{room}:sessions"
+KEY_USERS = "room:presence:{room}:users"
+KEY_KNOWN_COUNT = "room:approxcount:known:{room}"
+KEY_COUNT_TICK = "room:approxcount:tick:{room}"
+
+SESSION_TTL = 120  # seconds, sockets refresh their views about every 50 seconds, see ping_connection
+COUNT_TICK = 1  # seconds
+VIEW_WRITE_TICK = 1  # seconds
+
+# Removes expired views, then enters (ARGV[4] == '1'), leaves (ARGV[4] == '0') or does neither. Returns the number of
+# users in the room, whether the user has no other view of the room left, and the IDs of users that left by expiry.
+UPDATE = """
+local expired = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[3])
+local gone = {}
+for _, session in ipairs(expired) do
+    redis.call('zrem', KEYS[1], session)
+    local user = string.match(session, '^([^:]+):')
+    if redis.call('hincrby', KEYS[2], user, -1) <= 0 then
+        redis.call('hdel', KEYS[2], user)
+        table.insert(gone, user)
+    end
+end
+local is_last = 0
+if ARGV[4] == '1' then
+    if redis.call('zadd', KEYS[1], ARGV[5], ARGV[1]) == 1 then
+        redis.call('hincrby', KEYS[2], ARGV[2], 1)
+    end
+elseif ARGV[4] == '0' then
+    if redis.call('zrem', KEYS[1], ARGV[1]) == 1 and redis.call('hincrby', KEYS[2], ARGV[2], -1) <= 0 then
+        redis.call('hdel', KEYS[2], ARGV[2])
+        is_last = 1
+    end
+end
+redis.call('expire', KEYS[1], ARGV[6])
+redis.call('expire', KEYS[2], ARGV[6])
+return {redis.call('hlen', KEYS[2]), is_last, gone}
+"""
+
+_view_starts = []  # (RoomView, whether previous views are deleted instead of ended)
+_view_ends = []  # (RoomView, whether it is deleted instead of ended)
+_tasks = {}  # background tasks of this process, by name
+_count_broadcasts = {}
+
+
+def _keys(room_id):
+    return KEY_SESSIONS.format(room=room_id), KEY_USERS.format(room=room_id)
+
+
+async def _update(room_id, user_id, socket_id, mode):
+    n = time.time()
+    async with aredis(KEY_USERS.format(room=room_id)) as redis:
+        count, is_last, gone = await redis.eval(
+            UPDATE,
+            2,
+            *_keys(room_id),
+            f"{user_id}:{socket_id}",
+            str(user_id),
+            n,
+            mode,
+            n + SESSION_TTL,
+            SESSION_TTL * 2,
+        )
+    return count, bool(is_last), [u.decode() for u in gone]
+
+
+async def enter(room_id, user_id, socket_id):
+    """
+    Records a view of a room. Returns the number of users in the room and the IDs of users whose views expired.
+    """
+    count, is_last, gone = await _update(room_id, user_id, socket_id, "1")
+    return count, gone
+
+
+async def leave(room_id, user_id, socket_id):
+    """
+    Ends a view of a room. Returns the number of users in the room, whether this was the last view of the user, and
+    the IDs of users whose views expired.
+    """
+    return await _update(room_id, user_id, socket_id, "0")
+
+
+async def refresh(room_ids, user_id, socket_id):
+    """
+    Extends the views of a socket, called with its heartbeat.
+    """
+    if not room_ids:
+        return
+    expires = time.time() + SESSION_TTL
+    async with aredis() as redis:
+        pipe = redis.pipeline(transaction=False)
+        for room_id in room_ids:
+            pipe.zadd(KEY_SESSIONS.format(room=room_id), {f"{user_id}:{socket_id}": expires}, xx=True)
+        await pipe.execute()
+
+
+async def get_viewer_ids(room_id):
+    await _update(room_id, "", "", "")
+    async with aredis(KEY_USERS.format(room=room_id)) as redis:
+        return [u.decode() for u in await redis.hkeys(KEY_USERS.format(room=room_id))]
+
+
+def get_counts(room_ids):
+    """
+    Returns the number of users in each of the given rooms, without removing expired views first.
+    """
+    room_ids = list(room_ids)
+    if not room_ids:
+        return {}
+    with sredis() as redis:
+        pipe = redis.pipeline(transaction=False)
+        for room_id in room_ids:
+            pipe.hlen(KEY_USERS.format(room=room_id))
+        return dict(zip(room_ids, pipe.execute()))
+
+
+def schedule_count_broadcast(event_id, room_id):
+    """
+    Broadcasts the viewer count of a room to the event after a short delay, so that a crowd entering a room at once
+    results in only one update per tick.
+    """
+    key = (event_id, room_id)
+    if key not in _count_broadcasts:
+        _count_broadcasts[key] = asyncio.get_running_loop().create_task(_broadcast_count(event_id, room_id))
+
+
+async def _broadcast_count(event_id, room_id):
+    try:
+        async with aredis(KEY_COUNT_TICK.format(room=room_id)) as redis:
+            if not await redis.set(KEY_COUNT_TICK.format(room=room_id), "1", nx=True, ex=COUNT_TICK * 5):
+                # Another process is already on it
+                return
+        await asyncio.sleep(COUNT_TICK)
+        async with aredis(KEY_USERS.format(room=room_id)) as redis:
+            tr = redis.pipeline(transaction=True)
+            tr.delete(KEY_COUNT_TICK.format(room=room_id))
+            tr.hlen(KEY_USERS.format(room=room_id))
+            tr.get(KEY_KNOWN_COUNT.format(room=room_id))
+            _, count, known = await tr.execute()
+            if known is not None and int(known) == count:
+                return
+            await redis.setex(KEY_KNOWN_COUNT.format(room=room_id), 900, count)
+        # broadcast actual viewer count instead of approximate text
+        await get_channel_layer().group_send(
+            GROUP_EVENT.format(id=event_id),
+            {
+                "type": "event.user_count_change",
+                "room": str(room_id),
+                "users": count,
+            },
+        )
+    finally:
+        _count_broadcasts.pop((event_id, room_id), None)
+
+
+def queue_view_start(room, user, delete=False):
+    """
+    Returns a new RoomView that is written to the database with the next batch. Any other open views of the user in
+    the room are ended (or deleted) at the same time, as we assume they have been abandoned.
+    """
+    view = RoomView(room=room, user=user)
+    _view_starts.append((view, delete))
+    _start_view_writer()
+    return view
+
+
+def queue_view_end(view, delete=False):
+    _view_ends.append((view, delete))
+    _start_view_writer()
+
+
+def _start_view_writer():
+    task = _tasks.get("view_writer")
+    if task is None or task.done():
+        _tasks["view_writer"] = asyncio.get_running_loop().create_task(_run_view_writer())
+
+
+async def _run_view_writer():
+    global _view_starts, _view_ends
+    while _view_starts or _view_ends:
+        await asyncio.sleep(VIEW_WRITE_TICK)
+        starts, ends = _view_starts, _view_ends
+        _view_starts, _view_ends = [], []
+        try:
+            await write_views(starts, ends)
+        except Exception:
+            logger.exception("Could not write room views.")
+
+
+@database_sync_to_async
+@transaction.atomic
+def write_views(starts, ends):
+    # Ends of views started in this batch can't be matched by ID before they are created
+    started = {id(view) for view, delete in starts}
+    ended_now = {id(view): delete for view, delete in ends if id(view) in started}
+
+    for delete in (False, True):
+        pairs = {(view.room_id, view.user_id) for view, d in starts if d == delete}
+        if pairs:
+            previous = RoomView.objects.filter(
+                reduce(or_, (Q(room_id=room_id, user_id=user_id) for room_id, user_id in pairs)),
+                end__isnull=True,
+            )
+            if delete:
+                previous.delete()
+            else:
+                previous.update(end=now())
+
+    RoomView.objects.bulk_create(
+        [view for view, delete in starts if not ended_now.get(id(view))]
+    )
+    for delete in (False, True):
+        pks = [view.pk for view, d in ends if d == delete and view.pk]
+        if not pks:
+            continue
+        if delete:
+            RoomView.objects.filter(pk__in=pks).delete()
+        else:
+            RoomView.objects.filter(pk__in=pks).update(end=now())
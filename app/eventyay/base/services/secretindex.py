@@ -0,0 +1,250 @@
+"""
+Index of ticket secrets for barcode lookups at the gate.
+
+If the event setting ``checkin_secret_index`` is enabled (and redis is available), we keep all ticket secrets of
+the event in redis. The redeem API then finds the order position belonging to a scanned barcode with a primary key
+lookup and rejects barcodes that are not ours without querying the database at all.
+
+We store the following structures in redis:
+
+* ``checkin:{event_id}:secrets`` is a hash mapping every ticket secret of the event to a comma-separated list of
+  the IDs of the order positions using it, plus ``revoked`` if the secret has been revoked. Secrets can be shared
+  between positions (e.g. by add-ons), so entries are only ever changed by adding or removing single members with
+  a Lua script.
+
+* ``checkin:{event_id}:secrets:complete`` exists once the hash has been fully built by :py:func:`build`. Until then
+  (and after both keys expired), the index is not used and lookups go to the database.
+
+The index is kept up to date by signal receivers on order positions and revoked secrets, which remove positions from
+their previous secret when the secret changes or the position is deleted. Changes that bypass these receivers may
+still leave positions behind under secrets they no longer carry, which is why the caller still needs to compare the
+secret in the database. A secret that is missing from a complete index, however, is definitely unknown.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+from django_redis import get_redis_connection
+
+from eventyay.base.models import Event, OrderPosition, RevokedTicketSecret
+from eventyay.base.services.tasks import EventTask
+from eventyay.celery_app import app
+
+
+KEY_SECRETS = 'checkin:{event_id}:secrets'
+KEY_COMPLETE = 'checkin:{event_id}:secrets:complete'
+KEY_BUILD_REQUESTED = 'checkin:{event_id}:secrets:build'
+
+REVOKED = 'revoked'
+
+# The index is rebuilt from scratch after a week, just to keep old events from filling up redis
+INDEX_TTL = 3600 * 24 * 7
+# Changes that happened this long before a rebuild started are applied again after the rebuild
+BUILD_OVERLAP = timedelta(seconds=60)
+BUILD_CHUNK_SIZE = 5000
+
+# Adds (``+``) or removes (``-``) members to or from the comma-separated lists of secrets, given as triples of
+# operation, secret and member after the TTL of the index.
+UPDATE = """
+for i = 2, #ARGV, 3 do
+    local op, secret, member = ARGV[i], ARGV[i + 1], ARGV[i + 2]
+    local members = {}
+    local found = false
+    local value = redis.call('HGET', KEYS[1], secret)
+    if value then
+        for m in string.gmatch(value, '[^,]+') do
+            if m == member then
+                found = true
+            else
+                table.insert(members, m)
+            end
+        end
+    end
+    if op == '+' then
+        table.insert(members, member)
+    end
+    if #members > 0 then
+        redis.call('HSET', KEYS[1], secret, table.concat(members, ','))
+    elseif found then
+        redis.call('HDEL', KEYS[1], secret)
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+"""
+
+
+def index_enabled(event):
+    return settings.HAS_REDIS and event.settings.checkin_secret_index
+
+
+def lookup(events, secret):
+    """
+    Looks up a scanned secret in the indexes of the given events. Returns the list of IDs of all order positions
+    that might use the secret (an empty list if the secret is definitely unknown), or ``None`` if the indexes can't
+    tell and the caller needs to fall back to the database. This is also the case for revoked secrets, which are
+    rare enough not to warrant a shortcut.
+    """
+    if not events or not all(index_enabled(e) for e in events):
+        return None
+    rc = get_redis_connection('redis')
+    pipe = rc.pipeline()
+    for e in events:
+        pipe.exists(KEY_COMPLETE.format(event_id=e.pk))
+        pipe.hget(KEY_SECRETS.format(event_id=e.pk), secret)
+    results = pipe.execute()
+
+    position_ids = []
+    for e, complete, value in zip(events, results[::2], results[1::2]):
+        if not complete:
+            request_build(e.pk)
+            return None
+        if value is None:
+            continue
+        members = value.decode().split(',')
+        if REVOKED in members:
+            return None
+        position_ids += [int(pk) for pk in members]
+    return position_ids
+
+
+def _write(rc, key, index):
+    index = list(index.items())
+    for i in range(0, len(index), BUILD_CHUNK_SIZE):
+        rc.hset(key, mapping=dict(index[i : i + BUILD_CHUNK_SIZE]))
+
+
+def _update(rc, event_id, ops):
+    """
+    Applies a list of ``(operation, secret, member)`` triples to the index of an event.
+    """
+    key = KEY_SECRETS.format(event_id=event_id)
+    for i in range(0, len(ops), BUILD_CHUNK_SIZE):
+        rc.eval(UPDATE, 1, key, INDEX_TTL, *[arg for op in ops[i : i + BUILD_CHUNK_SIZE] for arg in op])
+
+
+def build(event):
+    """
+    Rebuilds the index of an event from the database.
+    """
+    started = now()
+    index = defaultdict(list)
+    positions = OrderPosition.all.filter(order__event=event).values_list('secret', 'pk')
+    for secret, pk in positions.iterator(chunk_size=BUILD_CHUNK_SIZE):
+        index[secret].append(str(pk))
+    for secret in set(event.revoked_secrets.values_list('secret', flat=True)):
+        index[secret].append(REVOKED)
+    index = {secret: ','.join(members) for secret, members in index.items()}
+
+    rc = get_redis_connection('redis')
+    key = KEY_SECRETS.format(event_id=event.pk)
+    tmp_key = key + ':tmp'
+    rc.delete(tmp_key)
+    _write(rc, tmp_key, index)
+    rc.expire(tmp_key, INDEX_TTL)
+    if index:
+        rc.rename(tmp_key, key)
+    else:
+        rc.delete(key)
+
+    # Secrets that were written to the old index while we were building the new one are lost with the rename, so we
+    # look for them in the database again. Adding a member twice does no harm.
+    since = started - BUILD_OVERLAP
+    recent = [
+        ('+', secret, str(pk))
+        for secret, pk in OrderPosition.all.filter(order__event=event, order__last_modified__gte=since).values_list(
+            'secret', 'pk'
+        )
+    ]
+    recent += [
+        ('+', secret, REVOKED)
+        for secret in event.revoked_secrets.filter(created__gte=since).values_list('secret', flat=True)
+    ]
+    _update(rc, event.pk, recent)
+    rc.set(KEY_COMPLETE.format(event_id=event.pk), started.isoformat(), ex=INDEX_TTL)
+    return len(index)
+
+
+def drop(event):
+    """
+    Removes the index of an event, e.g. because it has been turned off. Once turned on again, it is rebuilt on
+    first use.
+    """
+    if not settings.HAS_REDIS:
+        return
+    get_redis_connection('redis').delete(
+        KEY_COMPLETE.format(event_id=event.pk),
+        KEY_SECRETS.format(event_id=event.pk),
+    )
+
+
+def request_build(event_id):
+    """
+    Schedules a rebuild of the index of an event, unless one has been scheduled recently.
+    """
+    rc = get_redis_connection('redis')
+    if rc.set(KEY_BUILD_REQUESTED.format(event_id=event_id), '1', nx=True, ex=60):
+        build_secret_index.apply_async(args=(event_id,))
+
+
+@app.task(base=EventTask)
+def build_secret_index(event: Event):
+    if not index_enabled(event):
+        return 0
+    return build(event)
+
+
+def secrets_changed(event, positions, revoked_secrets, previous=None):
+    """
+    Updates the index after secrets have been changed with bulk queries, which do not send ``post_save``.
+
+    :param previous: dict mapping the IDs of the given positions to the secrets they carried before
+    """
+    if not index_enabled(event) or not (positions or revoked_secrets):
+        return
+    previous = previous or {}
+    ops = [('-', previous[p.pk], str(p.pk)) for p in positions if previous.get(p.pk)]
+    ops += [('+', p.secret, str(p.pk)) for p in positions]
+    ops += [('+', rs.secret, REVOKED) for rs in revoked_secrets]
+    transaction.on_commit(lambda: _update(get_redis_connection('redis'), event.pk, ops))
+
+
+@receiver(pre_save, sender=OrderPosition, dispatch_uid='secretindex_position_pre_save')
+def _position_pre_save(sender, instance, update_fields=None, **kwargs):
+    if not instance.pk or (update_fields is not None and 'secret' not in update_fields):
+        return
+    if index_enabled(instance.order.event):
+        instance._secretindex_previous = (
+            OrderPosition.all.filter(pk=instance.pk).values_list('secret', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=OrderPosition, dispatch_uid='secretindex_position_saved')
+def _position_saved(sender, instance, **kwargs):
+    event = instance.order.event
+    if index_enabled(event):
+        pk = str(instance.pk)
+        ops = [('+', instance.secret, pk)]
+        previous = instance.__dict__.pop('_secretindex_previous', None)
+        if previous and previous != instance.secret:
+            ops.insert(0, ('-', previous, pk))
+        transaction.on_commit(lambda: _update(get_redis_connection('redis'), event.pk, ops))
+
+
+@receiver(post_delete, sender=OrderPosition, dispatch_uid='secretindex_position_deleted')
+def _position_deleted(sender, instance, **kwargs):
+    event = instance.order.event
+    if index_enabled(event):
+        ops = [('-', instance.secret, str(instance.pk))]
+        transaction.on_commit(lambda: _update(get_redis_connection('redis'), event.pk, ops))
+
+
+@receiver(post_save, sender=RevokedTicketSecret, dispatch_uid='secretindex_revoked_secret_saved')
+def _revoked_secret_saved(sender, instance, **kwargs):
+    if index_enabled(instance.event):
+        event_id, ops = instance.event_id, [('+', instance.secret, REVOKED)]
+        transaction.on_commit(lambda: _update(get_redis_connection('redis'), event_id, ops))
@@ -2,6 +2,7 @@ import logging
 import os
 
 from django.core.files.base import ContentFile
+from django.db import transaction
 from django.utils.timezone import now
 from django.utils.translation import gettext as _
 from django_scopes import scopes_disabled
@@ -14,8 +15,10 @@ from eventyay.base.models import (
     InvoiceAddress,
     Order,
     OrderPosition,
+    User,
 )
-from eventyay.base.services.tasks import EventTask, ProfiledTask
+from eventyay.base.secrets import assign_ticket_secrets
+from eventyay.base.services.tasks import EventTask, ProfiledEventTask, ProfiledTask
 from eventyay.base.settings import PERSON_NAME_SCHEMES
 from eventyay.base.signals import allow_ticket_download, register_ticket_outputs
 from eventyay.celery_app import app
@@ -26,6 +29,8 @@ logger = logging.getLogger(__name__)
 
 # Providers whose PDFs must always be regenerated from current layout data.
 _PROVIDERS_WITHOUT_TICKET_CACHE = frozenset({'badge'})
+# Number of positions that get new secrets in one transaction when regenerating all ticket codes of an event
+REGENERATE_SECRETS_CHUNK_SIZE = 1000
 
 
 def generate_orderposition(order_position: int, provider: str):
@@ -244,3 +249,34 @@ def invalidate_cache(event: Event, product: int = None, provider: str = None, or
         ct.delete()
     for ct in qsc:
         ct.delete()
+
+
+@app.task(base=ProfiledEventTask, bind=True)
+def regenerate_secrets(self, event: Event, user: int = None):
+    """
+    Replaces the ticket secrets of all order positions of an event, e.g. after the signing key has been rotated.
+    Positions are processed in chunks with one transaction each, so a failure does not undo the chunks that have
+    already been done.
+    """
+    if user:
+        user = User.objects.get(pk=user)
+    qs = OrderPosition.all.filter(order__event=event).select_related('product', 'variation', 'subevent')
+    ids = list(qs.order_by('pk').values_list('pk', flat=True))
+    total = len(ids)
+    changed = 0
+    if not self.request.called_directly:
+        self.update_state(state='PROGRESS', meta={'value': 0})
+
+    for i in range(0, total, REGENERATE_SECRETS_CHUNK_SIZE):
+        with transaction.atomic():
+            positions = list(qs.filter(pk__in=ids[i : i + REGENERATE_SECRETS_CHUNK_SIZE]))
+            changed += len(assign_ticket_secrets(event, positions, force_invalidate=True))
+        if not self.request.called_directly:
+            self.update_state(
+                state='PROGRESS',
+                meta={'value': round(min(i + REGENERATE_SECRETS_CHUNK_SIZE, total) / total * 100, 2)},
+            )
+
+    invalidate_cache.apply_async(kwargs={'event': event.pk})
+    event.log_action('eventyay.event.tickets.secrets.regenerated', user=user, data={'positions': changed})
+    return changed
@@ -8,12 +8,16 @@ registered with the Celery worker via autodiscover_tasks().
 from eventyay.base.services import (  # noqa: F401
     cancelevent,
     cart,
+    checkinstatus,
     export,
     invoices,
     mail,
     notifications,
     orderimport,
     orders,
+    quotacounters,
+    reservationtokens,
+    secretindex,
     shredder,
     talkimport,
     telemetry,
@@ -28,12 +28,15 @@ from channels.security.websocket import AllowedHostsOriginValidator
 from django.conf import settings
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 
+from eventyay.api import routing as api
 from eventyay.features.live import routing as live
 
 # Configure ASGI application with WebSocket and HTTP support
 application = ProtocolTypeRouter(
     {
-        'websocket': AllowedHostsOriginValidator(URLRouter(live.websocket_urlpatterns)),
+        'websocket': AllowedHostsOriginValidator(
+            URLRouter(live.websocket_urlpatterns + api.websocket_urlpatterns)
+        ),
         'http': django_asgi_app,
     }
 )
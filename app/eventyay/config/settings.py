@@ -160,6 +160,14 @@ class BaseSettings(_BaseSettings):
     # Set to 1 to enable Vite dev servers with HMR for live frontend development.
     npm_dev: bool = False
     fetch_ecb_rates: bool = True
+    # Serve quota availability from incrementally maintained counters in Redis.
+    quota_counter_mode: bool = False
+    # Serve check-in list status from incrementally maintained counters in Redis.
+    checkin_status_counters: bool = False
+    # Lock only the quotas, seats and vouchers touched by a checkout instead of the whole event.
+    fine_grained_locking: bool = False
+    # Put a queue in front of the presale checkout of events that have their waiting room turned on.
+    waiting_room: bool = False
 
     @classmethod
     def settings_customise_sources(
@@ -1107,6 +1115,22 @@ SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 # TODO: Remove. Redis is always required.
 HAS_REDIS = bool(REDIS_URL) and not DOCS_BUILD
 
+# Keep per-quota counters in Redis instead of counting orders and carts for every availability check.
+# See eventyay.base.services.quotacounters.
+QUOTA_COUNTER_MODE = conf.quota_counter_mode and HAS_REDIS
+
+# Keep per-list check-in counters in Redis instead of counting positions and check-ins for every status request.
+# See eventyay.base.services.checkinstatus.
+CHECKIN_STATUS_COUNTERS = conf.checkin_status_counters and HAS_REDIS
+
+# Let cart and order creation lock single quotas, seats and vouchers instead of the whole event.
+# See eventyay.base.services.locking.
+FINE_GRAINED_LOCKING = conf.fine_grained_locking
+
+# Let presale requests pass the waiting room of their event. Without it, the middleware does not talk to Redis at all.
+# See eventyay.presale.waitingroom.
+WAITING_ROOM = conf.waiting_room and HAS_REDIS
+
 # TODO: Remove. Always use Redis Pub/Sub for Channels.
 REDIS_USE_PUBSUB = not DOCS_BUILD
 
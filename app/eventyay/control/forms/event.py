@@ -609,8 +609,11 @@ class EventSettingsForm(SettingsForm):
         'waiting_list_phones_asked',
         'waiting_list_phones_required',
         'waiting_list_phones_explanation_text',
+        'waiting_room_enabled',
+        'waiting_room_rate',
         'show_variations_expanded',
         'hide_sold_out',
+        'high_demand_mode',
         'redirect_to_checkout_directly',
         'frontpage_subevent_ordering',
         'event_list_type',
@@ -774,8 +777,11 @@ class GeneralEventSettingsForm(EventSettingsForm):
         'waiting_list_phones_asked',
         'waiting_list_phones_required',
         'waiting_list_phones_explanation_text',
+        'waiting_room_enabled',
+        'waiting_room_rate',
         'show_variations_expanded',
         'hide_sold_out',
+        'high_demand_mode',
         'redirect_to_checkout_directly',
         'frontpage_subevent_ordering',
         'event_list_type',
@@ -1502,6 +1508,7 @@ class TicketSettingsForm(SettingsForm):
         'ticket_download_nonadm',
         'ticket_download_pending',
         'ticket_download_require_validated_email',
+        'checkin_secret_index',
     ]
     ticket_secret_generator = forms.ChoiceField(
         label=_('Ticket code generator'),
@@ -655,6 +655,7 @@ def eventyaycontrol_logentry_display(sender: Event, logentry: LogEntry, **kwargs
         'eventyay.event.taxrule.changed': _('The tax rule has been changed.'),
         'eventyay.event.settings': _('The event settings have been changed.'),
         'eventyay.event.tickets.settings': _('The ticket download settings have been changed.'),
+        'eventyay.event.tickets.secrets.regenerated': _('All ticket codes have been regenerated.'),
         'eventyay.event.plugins.enabled': _('A plugin has been enabled.'),
         'eventyay.event.plugins.disabled': _('A plugin has been disabled.'),
         'eventyay.event.live.activated': _('The event has been published.'),
@@ -210,6 +210,11 @@ urlpatterns = [
                 ),
                 url(r'^settings/payment$', event.PaymentSettings.as_view(), name='event.settings.payment'),
                 url(r'^settings/tickets$', event.TicketSettings.as_view(), name='event.settings.tickets'),
+                url(
+                    r'^settings/tickets/regenerate_secrets$',
+                    event.TicketSettingsRegenerateSecrets.as_view(),
+                    name='event.settings.tickets.regenerate_secrets',
+                ),
                 url(
                     r'^settings/tickets/preview/(?P<output>[^/]+)$',
                     event.TicketSettingsPreview.as_view(),
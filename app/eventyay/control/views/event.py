@@ -52,7 +52,7 @@ from eventyay.base.models import (
 from eventyay.base.models.event import EventMetaValue
 from eventyay.base.models.global_plugin_config import GlobalPluginConfig
 from eventyay.base.plugins import get_all_plugins
-from eventyay.base.services import tickets
+from eventyay.base.services import secretindex, tickets
 from eventyay.base.services.invoices import build_preview_invoice_pdf
 from eventyay.base.signals import register_ticket_outputs
 from eventyay.base.templatetags.rich_text import (
@@ -60,6 +60,7 @@ from eventyay.base.templatetags.rich_text import (
     is_placeholder_html_sample,
     markdown_compile_email,
 )
+from eventyay.base.views.tasks import AsyncAction
 from eventyay.control.forms.event import (
     CancelSettingsForm,
     CommentForm,
@@ -83,6 +84,7 @@ from eventyay.control.permissions import EventPermissionRequiredMixin
 from eventyay.control.views.user import RecentAuthenticationRequiredMixin
 from eventyay.helpers.database import rolledback_transaction
 from eventyay.multidomain.urlreverse import get_event_domain
+from eventyay.presale import waitingroom
 from eventyay.presale.style import regenerate_css
 
 from ...base.configurations.lazy_i18n_string_list_base import (
@@ -231,6 +233,8 @@ class EventUpdate(
             )
 
         tickets.invalidate_cache.apply_async(kwargs={'event': self.request.event.pk})
+        if any(p in self.sform.changed_data for p in waitingroom.SETTINGS_AFFECTING_WAITING_ROOM):
+            transaction.on_commit(lambda: waitingroom.configure(self.request.organizer, self.request.event))
         if change_css:
             transaction.on_commit(lambda: regenerate_css.apply_async(args=(self.request.event.pk,)))
             messages.success(
@@ -1025,6 +1029,29 @@ class TicketSettingsPreview(EventPermissionRequiredMixin, View):
         )
 
 
+class TicketSettingsRegenerateSecrets(EventPermissionRequiredMixin, AsyncAction, View):
+    task = tickets.regenerate_secrets
+    permission = 'can_change_event_settings'
+
+    def get_success_message(self, value):
+        return _('{num} ticket codes have been regenerated.').format(num=value)
+
+    def get_success_url(self, value):
+        return self.get_error_url()
+
+    def get_error_url(self):
+        return reverse(
+            'control:event.settings.tickets',
+            kwargs={
+                'organizer': self.request.event.organizer.slug,
+                'event': self.request.event.slug,
+            },
+        )
+
+    def post(self, request, *args, **kwargs):
+        return self.do(self.request.event.id, self.request.user.id)
+
+
 class TicketSettings(EventSettingsViewMixin, EventPermissionRequiredMixin, FormView):
     model = Event
     form_class = TicketSettingsForm
@@ -1106,6 +1133,8 @@ class TicketSettings(EventSettingsViewMixin, EventPermissionRequiredMixin, FormV
                     user=self.request.user,
                     data={k: form.cleaned_data.get(k) for k in form.changed_data},
                 )
+                if 'checkin_secret_index' in form.changed_data:
+                    transaction.on_commit(lambda: secretindex.drop(self.request.event))
 
             messages.success(self.request, _('Your changes have been saved.'))
             return redirect(self.get_success_url())
@@ -80,7 +80,7 @@ from eventyay.base.models.orders import (
 )
 from eventyay.base.models.tax import cc_to_vat_prefix, is_eu_country
 from eventyay.base.payment import PaymentException
-from eventyay.base.secrets import assign_ticket_secret
+from eventyay.base.secrets import assign_ticket_secrets
 from eventyay.base.services import tickets
 from eventyay.base.services.cancelevent import cancel_event
 from eventyay.base.services.export import export
@@ -2386,13 +2386,11 @@ class OrderContactChange(OrderView):
             if self.form.cleaned_data['regenerate_secrets']:
                 changed = True
                 self.order.secret = generate_secret()
-                for op in self.order.all_positions.all():
-                    assign_ticket_secret(
-                        self.request.event,
-                        position=op,
-                        force_invalidate=True,
-                        save=True,
-                    )
+                assign_ticket_secrets(
+                    self.request.event,
+                    list(self.order.all_positions.select_related('product', 'variation', 'subevent')),
+                    force_invalidate=True,
+                )
                 tickets.invalidate_cache.apply_async(kwargs={'event': self.request.event.pk, 'order': self.order.pk})
                 self.order.log_action('eventyay.event.order.secret.changed', user=self.request.user)
 
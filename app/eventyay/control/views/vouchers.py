@@ -30,6 +30,7 @@ from django.views.generic import (
 
 from eventyay.base.models import CartPosition, LogEntry, OrderPosition, Voucher
 from eventyay.base.models.vouchers import _generate_random_code
+from eventyay.base.services import quotacounters
 from eventyay.base.services.locking import NoLockManager
 from eventyay.base.services.vouchers import vouchers_send
 from eventyay.base.views.tasks import AsyncFormView
@@ -415,6 +416,9 @@ class VoucherBulkCreate(EventPermissionRequiredMixin, AsyncFormView):
                 )
             LogEntry.objects.bulk_create(log_entries)
             form.post_bulk_save(batch_vouchers)
+            if batch_vouchers and batch_vouchers[0].block_quota:
+                # bulk_create() bypasses the signals that keep quota counters up to date
+                quotacounters.invalidate_voucher(batch_vouchers[0])
             batch_vouchers.clear()
             set_progress(len(voucherids) / total_num * (50.0 if form.cleaned_data['send'] else 100.0))
 
@@ -9,9 +9,9 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from tqdm import tqdm
 
-from eventyay.base.services.connections import get_connections
-from eventyay.core.utils.redis import aredis, flush_aredis_pool
-from eventyay.base.live.channels import GROUP_VERSION
+from eventyay.base.services.connections import drain_node, get_connections, get_node_channels, get_nodes
+from eventyay.core.utils.redis import flush_aredis_pool
+from eventyay.features.live.channels import GROUP_VERSION
 
 
 class Command(BaseCommand):
@@ -23,6 +23,17 @@ class Command(BaseCommand):
         )
 
         subparsers.add_parser("list")
+        subparsers.add_parser("nodes")
+
+        c = subparsers.add_parser("drain")
+        c.add_argument("node", type=str, help='ID of the node as shown by "nodes", e.g. "web1:1234".')
+        c.add_argument(
+            "--duration",
+            dest="duration",
+            type=int,
+            default=60,
+            help="Number of seconds to spread the reconnects of the clients of the node over.",
+        )
 
         c = subparsers.add_parser("drop")
         c.add_argument(
@@ -61,6 +72,10 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         if options["subcommand"] == "list":
             self._list(*args, **options)
+        elif options["subcommand"] == "nodes":
+            self._nodes(*args, **options)
+        elif options["subcommand"] == "drain":
+            self._drain(*args, **options)
         elif options["subcommand"] == "drop":
             self._drop(*args, **options)
         elif options["subcommand"] == "force_reload":
@@ -74,6 +89,22 @@ class Command(BaseCommand):
             print(f"{k:60} {v}")
         await self._close()
 
+    @async_to_sync
+    async def _nodes(self, *args, **options):
+        nodes = await get_nodes()
+        print("{:40} {:40} {:12} {}".format("node", "label", "connections", "draining"))
+        for node, info in nodes.items():
+            print(f"{node:40} {info['label'] or '':40} {info['connections']:<12} {'yes' if info['draining'] else ''}")
+        await self._close()
+
+    @async_to_sync
+    async def _drain(self, *args, **options):
+        if await drain_node(options["node"], options["duration"]):
+            print(f"Node {options['node']} will ask its clients to reconnect within {options['duration']} seconds.")
+        else:
+            print(f"Node {options['node']} is unknown or not alive.")
+        await self._close()
+
     @async_to_sync
     async def _drop(self, *args, **options):
         rc = await get_connections()
@@ -142,23 +173,16 @@ class Command(BaseCommand):
         """
         cl = get_channel_layer()
         groups = [GROUP_VERSION.format(label=c) for c in conns]
-        if interval == 0:
+        if interval == 0 and not settings.REDIS_USE_PUBSUB:
             for group in groups:
                 await cl.group_send(group, message)
             return
 
         if settings.REDIS_USE_PUBSUB:
-            channel_names = []
-
-            async with aredis() as redis:
-                for v in conns:
-                    await redis.zremrangebyscore(
-                        f"version.{v}", min=0, max=int(time.time()) - 24 * 3600
-                    )
-                    channel_names += [
-                        x.decode("utf8")
-                        for x in await redis.zrange(f"version.{v}", 0, -1)
-                    ]
+            nodes = await get_nodes()
+            channel_names = await get_node_channels(
+                [node for node, info in nodes.items() if info["label"] in conns]
+            )
 
             for name in tqdm(channel_names):
                 await cl.send(name, message)
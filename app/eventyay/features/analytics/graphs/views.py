@@ -1,7 +1,7 @@
 import io
 import logging
 import re
-from collections import Counter, defaultdict
+from collections import defaultdict
 from datetime import timedelta
 from os.path import dirname
 from urllib.parse import urljoin
@@ -10,8 +10,7 @@ import dateutil.parser
 import datetime
 from zoneinfo import ZoneInfo
 from django.core.exceptions import PermissionDenied
-from django.db.models import Max, Min, Q, Sum
-from django.db.models.functions import TruncMinute
+from django.db.models import Max, Min, Q
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.functional import cached_property
@@ -22,6 +21,7 @@ from matplotlib.figure import Figure
 
 from eventyay.base.models import Room, User, Event
 from eventyay.base.models.room import RoomView
+from eventyay.base.services.reactions import get_reaction_counts
 from eventyay.core.permissions import Permission
 
 logger = logging.getLogger(__name__)
@@ -135,23 +135,7 @@ def build_room_view_fig(fig, room, begin, end, tz):
     ax.set_ylabel(f"Unique viewers ({len(all_users)} total, {peak} peak)")
 
     if isinstance(room, Room):
-        reactions = (
-            room.reactions.filter(
-                datetime__gte=begin,
-                datetime__lte=end,
-            )
-            .annotate(min=TruncMinute("datetime"))
-            .order_by()
-            .values("datetime", "reaction")
-            .annotate(amount=Sum("amount"))
-        )
-
-        reacts = Counter()
-        for r in reactions:
-            bucket = r["datetime"].replace(
-                second=0, microsecond=0, minute=r["datetime"].minute // 10 * 10
-            )
-            reacts[bucket, r["reaction"]] += 1
+        reacts = get_reaction_counts(room, begin, end, bucket_minutes=10)
 
         ax2 = ax.twinx()
         if reacts:
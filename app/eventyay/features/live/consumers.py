@@ -4,6 +4,7 @@ import random
 import time
 import uuid
 
+import msgspec
 import orjson
 from channels.exceptions import StopConsumer
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
@@ -17,12 +18,12 @@ from eventyay.base.services.connections import (
     register_connection,
     unregister_connection,
 )
-from eventyay.base.services.event import get_event
+from eventyay.base.services.eventsnapshot import get_event
 from eventyay.features.live.exceptions import ConsumerException
 
-from eventyay.core.utils.redis import aredis
 from eventyay.core.utils.statsd import statsd
 from .channels import GROUP_VERSION
+from .frames import FRAME_KEY, PROTOCOL_JSON, PROTOCOLS, encode_frame
 from .modules.announcement import AnnouncementModule
 from .modules.auth import AuthModule
 from .modules.bbb import BBBModule
@@ -46,11 +47,11 @@ class MainConsumer(AsyncJsonWebsocketConsumer):
         self.user = None
         self.socket_id = str(uuid.uuid4())
         self.event = None
-        self.room_cache = {}
         self.channel_cache = {}
         self.components = {}
         self.conn_time = 0
         self.last_conn_ping = 0
+        self.protocol = PROTOCOL_JSON
 
         # known_room_id_cache: contain IDs of rooms we know this user is allowed to see. updated after login and with
         # event update. used to quickly filter events.
@@ -72,27 +73,6 @@ class MainConsumer(AsyncJsonWebsocketConsumer):
         self.conn_time = time.time()
         event_id = self.scope["url_route"]["kwargs"]["event"]
         await self.accept()
-        if settings.REDIS_USE_PUBSUB:
-            async with aredis() as redis:
-                await redis.zadd(
-                    f"version.{settings.EVENTYAY_COMMIT}.{settings.EVENTYAY_ENVIRONMENT}",
-                    dict([(self.channel_name, int(time.time()))]),
-                )
-                await redis.expire(
-                    f"version.{settings.EVENTYAY_COMMIT}.{settings.EVENTYAY_ENVIRONMENT}",
-                    24 * 3600,
-                )
-        else:
-            await self.channel_layer.group_add(
-                GROUP_VERSION.format(
-                    label=settings.EVENTYAY_COMMIT
-                    + "."
-                    + settings.EVENTYAY_ENVIRONMENT
-                ),
-                self.channel_name,
-            )
-
-        await register_connection()
 
         try:
             self.event = await get_event(event_id)
@@ -106,6 +86,18 @@ class MainConsumer(AsyncJsonWebsocketConsumer):
             await self.send_error("event.unknown_event", close=True)
             return
 
+        # With REDIS_USE_PUBSUB, the channels of a server version are looked up through the connection registry
+        await register_connection(self.channel_name, self.event.pk)
+        if not settings.REDIS_USE_PUBSUB:
+            await self.channel_layer.group_add(
+                GROUP_VERSION.format(
+                    label=settings.EVENTYAY_COMMIT
+                    + "."
+                    + settings.EVENTYAY_ENVIRONMENT
+                ),
+                self.channel_name,
+            )
+
         if settings.SENTRY_DSN:
             with configure_scope() as scope:
                 scope.set_extra("event", self.event.id)
@@ -133,13 +125,9 @@ class MainConsumer(AsyncJsonWebsocketConsumer):
             if hasattr(c, "dispatch_disconnect"):
                 await c.dispatch_disconnect(close_code)
 
-        if settings.REDIS_USE_PUBSUB:
-            async with aredis() as redis:
-                await redis.zrem(
-                    f"version.{settings.EVENTYAY_COMMIT}.{settings.EVENTYAY_ENVIRONMENT}",
-                    self.channel_name,
-                )
-        else:
+        if not self.event:
+            return
+        if not settings.REDIS_USE_PUBSUB:
             await self.channel_layer.group_discard(
                 GROUP_VERSION.format(
                     label=settings.EVENTYAY_COMMIT
@@ -148,8 +136,7 @@ class MainConsumer(AsyncJsonWebsocketConsumer):
                 ),
                 self.channel_name,
             )
-
-        await unregister_connection()
+        await unregister_connection(self.channel_name, self.event.pk)
 
     # Receive message from WebSocket
     async def receive_json(self, content, **kargs):
@@ -157,16 +144,26 @@ class MainConsumer(AsyncJsonWebsocketConsumer):
 
         if content[0] == "ping":
             await self.send_json(["pong", content[1]])
+            last_conn_ping = self.last_conn_ping
             self.last_conn_ping = await ping_connection(self.last_conn_ping, self.user)
+            if self.last_conn_ping != last_conn_ping and self.user:
+                await self.components["room"].refresh_views()
             return
 
+        if self.event:
+            # The event is shared by all consumers of the event in this process and only refreshed when it changed
+            self.event = await get_event(self.event.pk)
         if not self.event:
             await self.send_error("event.unknown_event", close=True)
             return
 
         if not self.user:
             if content[0] == "authenticate":
-                await self._maybe_refresh(self.event, allowed_age=30)
+                protocol = isinstance(content[-1], dict) and content[-1].get("protocol") or PROTOCOL_JSON
+                if protocol not in PROTOCOLS:
+                    await self.send_error("protocol.unsupported")
+                    return
+                self.protocol = protocol
                 await self.components["user"].login(content[-1])
             else:
                 await self.send_error("protocol.unauthenticated")
@@ -179,7 +176,6 @@ class MainConsumer(AsyncJsonWebsocketConsumer):
         component = self.components.get(namespace)
         if component:
             try:
-                await self._maybe_refresh(self.event, allowed_age=900)
                 await self._maybe_refresh(self.user, allowed_age=30)
                 await component.dispatch_command(content)
             except ConsumerException as e:
@@ -271,14 +267,40 @@ class MainConsumer(AsyncJsonWebsocketConsumer):
     # Override send and receive methods to use orjson and less function calls
 
     async def send_json(self, content, close=False):
+        await self.send_frame(encode_frame(content, self.protocol), close=close)
+
+    async def send_broadcast(self, message, content=None):
+        """
+        Sends content that is the same for every receiver of a group message. If the sender already encoded the frame
+        (see ``broadcast_message``), ``content`` can be omitted and JSON clients get the frame as it is. Otherwise,
+        the frame is encoded by the first consumer of this process that handles the message, since the channel layer
+        hands the same message to all consumers of the group in a process.
+        """
+        frames = message.setdefault("_frames", {})
+        if FRAME_KEY in message:
+            frames.setdefault(PROTOCOL_JSON, message[FRAME_KEY])
+        if self.protocol not in frames:
+            if content is None:
+                content = orjson.loads(message[FRAME_KEY])
+            frames[self.protocol] = encode_frame(content, self.protocol)
+        await self.send_frame(frames[self.protocol])
+
+    async def send_frame(self, frame, close=False):
         try:
-            await super().send(
-                text_data=orjson.dumps(content, default=str).decode(), close=close
-            )
+            if isinstance(frame, str):
+                await super().send(text_data=frame, close=close)
+            else:
+                await super().send(bytes_data=frame, close=close)
         except (RuntimeError, ConnectionClosed):
             # socket has been closed in the meantime
             pass
 
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        if bytes_data is not None and self.protocol != PROTOCOL_JSON:
+            await self.receive_json(msgspec.msgpack.decode(bytes_data), **kwargs)
+        else:
+            await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
     @classmethod
     async def decode_json(cls, text_data):
         return orjson.loads(text_data)
@@ -2,7 +2,7 @@ import functools
 from typing import List, Union
 
 from eventyay.core.permissions import Permission
-from eventyay.base.services.event import get_room
+from eventyay.base.services.eventsnapshot import get_room, refresh_channel_room
 from eventyay.base.services.chat import get_channel
 from eventyay.features.live.exceptions import ConsumerException
 
@@ -61,14 +61,7 @@ def room_action(
         @functools.wraps(func)
         async def wrapped(self, body, *args):
             if "room" in body:
-                self.room = self.consumer.room_cache.get(body["room"])
-                if self.room:
-                    await self.room.refresh_from_db_if_outdated(allowed_age=30)
-                else:
-                    self.room = await get_room(
-                        event=self.consumer.event, id=body["room"]
-                    )
-                    self.consumer.room_cache[body["room"]] = self.room
+                self.room = await get_room(self.consumer.event, body["room"])
             elif "channel" in body:
                 channel = self.consumer.channel_cache.get(body["channel"])
                 if not channel:
@@ -76,8 +69,7 @@ def room_action(
                         event=self.consumer.event, pk=body["channel"]
                     )
                     self.consumer.channel_cache[body["channel"]] = channel
-                elif channel.room:
-                    await channel.room.refresh_from_db_if_outdated(allowed_age=30)
+                await refresh_channel_room(self.consumer.event, channel)
 
                 if channel and channel.room:
                     self.room = channel.room
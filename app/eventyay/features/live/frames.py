@@ -0,0 +1,42 @@
+import zlib
+
+import msgspec
+import orjson
+
+
+# Clients can opt into a binary protocol with the "protocol" key in the body of their "authenticate" command, after
+# which frames in both directions are msgpack instead of JSON. With "msgpack+deflate", every frame sent by the server
+# starts with one byte that tells whether the rest of it is compressed with raw deflate (1) or not (0), as frames below
+# COMPRESS_THRESHOLD are not worth compressing.
+PROTOCOL_JSON = "json"
+PROTOCOL_MSGPACK = "msgpack"
+PROTOCOL_MSGPACK_DEFLATE = "msgpack+deflate"
+PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_MSGPACK, PROTOCOL_MSGPACK_DEFLATE)
+COMPRESS_THRESHOLD = 1024  # bytes
+
+
+def encode_frame(content, protocol=PROTOCOL_JSON):
+    if protocol == PROTOCOL_JSON:
+        return orjson.dumps(content, default=str).decode()
+    # to_builtins turns dates and UUIDs into the same strings as in the JSON protocol
+    data = msgspec.msgpack.encode(msgspec.to_builtins(content, enc_hook=str))
+    if protocol == PROTOCOL_MSGPACK_DEFLATE:
+        if len(data) < COMPRESS_THRESHOLD:
+            return b"\x00" + data
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return b"\x01" + compressor.compress(data) + compressor.flush()
+    return data
+
+
+# Key of channel layer messages that carry the JSON frame to send to clients, see broadcast_message
+FRAME_KEY = "_frame"
+
+
+def broadcast_message(message_type, content, /, **fields):
+    """
+    Returns a channel layer message that carries ``content`` as an encoded JSON frame, so that the frame is encoded
+    once by the sender instead of once per receiving socket. Consumers forward it to their clients with
+    ``MainConsumer.send_broadcast``. Any ``fields`` are included as well, for handlers that can not always send the
+    same content to everyone. They may have any name, chat events e.g. have a ``content`` field of their own.
+    """
+    return {"type": message_type, **fields, FRAME_KEY: encode_frame(content)}
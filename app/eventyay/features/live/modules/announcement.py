@@ -74,7 +74,8 @@ class AnnouncementModule(BaseModule):
 
     @event("created_or_updated")
     async def push_announce(self, body):
-        await self.consumer.send_json(
+        await self.consumer.send_broadcast(
+            body,
             [
                 "announcement.created_or_updated",
                 body.get("announcement"),
@@ -9,11 +9,13 @@ from channels.db import database_sync_to_async
 from sentry_sdk import configure_scope
 
 from eventyay.core.permissions import Permission
+from eventyay.base.services import chatfanout
 from eventyay.base.services.chat import (
     ChatService,
     extract_mentioned_user_ids,
     get_channel,
 )
+from eventyay.base.services.eventsnapshot import refresh_channel_room
 from eventyay.base.services.user import get_public_users
 from eventyay.core.utils.redis import aredis
 from eventyay.features.live.channels import GROUP_CHAT, GROUP_USER
@@ -25,11 +27,13 @@ from eventyay.features.live.decorators import (
 )
 from eventyay.eventyay_common.utils import encode_email as _encode_email
 from eventyay.features.live.exceptions import ConsumerException
+from eventyay.features.live.frames import FRAME_KEY, broadcast_message
 from eventyay.features.live.modules.base import BaseModule
 from eventyay.features.live.tasks import send_chat_webhook
 from eventyay.storage.tasks import retrieve_preview_information
 
 _CENTRALAUTH_CACHE_TTL = 3600  # 1 hour — renames are rare
+PREVIEW_BUFFER_DELAY = 5  # seconds, time for the chat buffer to write a message
 
 
 def _get_centralauth_info(user):
@@ -99,6 +103,15 @@ def _parse_uid(uid) -> int | None:
 logger = logging.getLogger(__name__)
 
 
+def _event_message(event):
+    """
+    Returns the channel layer message for a new or changed chat event. Its frame is what ``publish_event`` sends to
+    clients that already know all users the event refers to.
+    """
+    data = {k: v for k, v in event.items() if k != "type"}
+    return broadcast_message(event["type"], [event["type"], {**data, "users": {}}], **data)
+
+
 def channel_action(
     room_permission_required: Permission = None,
     room_module_required=None,
@@ -121,8 +134,7 @@ def channel_action(
                         event=self.consumer.event, pk=body["channel"]
                     )
                     self.consumer.channel_cache[body["channel"]] = self.channel
-                elif self.channel.room:
-                    await self.channel.room.refresh_from_db_if_outdated(allowed_age=30)
+                await refresh_channel_room(self.consumer.event, self.channel)
             else:
                 raise ConsumerException("chat.unknown", "Unknown channel ID")
             if not self.channel:
@@ -334,7 +346,7 @@ class ChatModule(BaseModule):
                 )
                 await self.consumer.channel_layer.group_send(
                     GROUP_CHAT.format(channel=self.channel_id),
-                    event,
+                    _event_message(event),
                 )
             await self.service.broadcast_channel_list(
                 self.consumer.user, self.consumer.socket_id
@@ -350,21 +362,21 @@ class ChatModule(BaseModule):
     async def _leave(self, volatile=False):
         await self.service.remove_channel_user(self.channel_id, self.consumer.user.id)
         if not volatile:
+            event = await self.service.create_event(
+                channel=self.channel,
+                event_type="channel.member",
+                content={
+                    "membership": "leave",
+                    "user": self.consumer.user.serialize_public(
+                        trait_badges_map=self.consumer.event.config.get(
+                            "trait_badges_map"
+                        )
+                    ),
+                },
+                sender=self.consumer.user,
+            )
             await self.consumer.channel_layer.group_send(
-                GROUP_CHAT.format(channel=self.channel_id),
-                await self.service.create_event(
-                    channel=self.channel,
-                    event_type="channel.member",
-                    content={
-                        "membership": "leave",
-                        "user": self.consumer.user.serialize_public(
-                            trait_badges_map=self.consumer.event.config.get(
-                                "trait_badges_map"
-                            )
-                        ),
-                    },
-                    sender=self.consumer.user,
-                ),
+                GROUP_CHAT.format(channel=self.channel_id), _event_message(event)
             )
         await self.service.broadcast_channel_list(
             self.consumer.user, self.consumer.socket_id
@@ -423,6 +435,7 @@ class ChatModule(BaseModule):
                 permission=Permission.EVENT_USERS_MANAGE,
             ),
             trait_badges_map=self.consumer.event.config.get("trait_badges_map"),
+            use_history=bool(self.channel.room),
         )
         self.users_known_to_client |= set(users.keys())
         await self.consumer.send_success({"results": events, "users": users})
@@ -569,46 +582,25 @@ class ChatModule(BaseModule):
             {"event": {k: v for k, v in event.items() if k != "type"}}
         )
         await self.consumer.channel_layer.group_send(
-            GROUP_CHAT.format(channel=self.channel_id), event
+            GROUP_CHAT.format(channel=self.channel_id), _event_message(event)
         )
 
         # Dispatch external webhook if configured (only for text messages)
         await self._dispatch_chat_webhook(event, message_type=content.get("type", "text"))
 
-        # Unread notifications
+        # Unread notifications are fanned out in the background, see chatfanout
         async with aredis() as redis:
 
-            async def _publish_new_pointers(users):
-                for user in users:
-                    user_id = user.decode() if isinstance(user, bytes) else str(user)
-                    if user_id == str(self.consumer.user.id):
-                        continue
-                    await self.consumer.channel_layer.group_send(
-                        GROUP_USER.format(id=user_id),
-                        {
-                            "type": "chat.unread_pointers",
-                            "data": {self.channel_id: event["event_id"]},
-                        },
-                    )
-
             async def _notify_users(users):
-                users = [u for u in users if u != str(self.consumer.user.id)]
-                await self.service.store_notification(event["event_id"], users)
-                for user in users:
-                    await self.consumer.channel_layer.group_send(
-                        GROUP_USER.format(id=user),
-                        {
-                            "type": "chat.notification",
-                            "data": {
-                                "event": event,
-                                "sender": self.consumer.user.serialize_public(
-                                    trait_badges_map=self.consumer.event.config.get(
-                                        "trait_badges_map"
-                                    )
-                                ),
-                            },
-                        },
-                    )
+                await chatfanout.queue_notifications(
+                    event,
+                    self.consumer.user.serialize_public(
+                        trait_badges_map=self.consumer.event.config.get(
+                            "trait_badges_map"
+                        )
+                    ),
+                    [u for u in users if u != str(self.consumer.user.id)],
+                )
 
             mentioned_users = set()
             if not body.get("replaces"):  # no notifications for edits:
@@ -656,19 +648,12 @@ class ChatModule(BaseModule):
                     if mentioned_users:
                         await _notify_users(mentioned_users)
 
-                # For regular unread notifications, we pop user IDs from the list of users to notify, because once
-                # they've been notified they don't need a notification again until they sent a new read pointer.
-                # We pop user IDs from the list of users to notify, because once they've been notified they don't need a
-                # notification again until they sent a new read pointer.
-                batch_size = 100
-                while True:
-                    users = await redis.spop(
-                        f"chat:unread.notify:{self.channel_id}", 100
-                    )
-                    await _publish_new_pointers(users)
-
-                    if len(users) < batch_size:
-                        break
+                # For regular unread notifications, the users to notify are popped from the channel's set of users to
+                # notify, because once they've been notified they don't need a notification again until they sent a
+                # new read pointer.
+                chatfanout.queue_unread_pointers(
+                    self.channel_id, event["event_id"], str(self.consumer.user.id)
+                )
             else:
                 # DMs
                 # In DMs, notify everyone.
@@ -679,7 +664,12 @@ class ChatModule(BaseModule):
                             f"chat:unread.notify:{self.channel_id}"
                         )
                     }
-                    await _publish_new_pointers(users)
+                    chatfanout.queue_unread_pointers(
+                        self.channel_id,
+                        event["event_id"],
+                        str(self.consumer.user.id),
+                        user_ids=users,
+                    )
                     await _notify_users(users)
 
                     if mentioned_users - users:
@@ -713,7 +703,13 @@ class ChatModule(BaseModule):
                     kwargs={
                         "event": str(self.consumer.event.id),
                         "event_id": event["event_id"],
-                    }
+                    },
+                    # Buffered messages need to be written to the database first
+                    countdown=(
+                        PREVIEW_BUFFER_DELAY
+                        if self.service.buffers_events(self.channel)
+                        else None
+                    ),
                 )
 
     @command("react")
@@ -742,7 +738,7 @@ class ChatModule(BaseModule):
         event["type"] = "chat.event.reaction"
         await self.consumer.send_success(event)
         await self.consumer.channel_layer.group_send(
-            GROUP_CHAT.format(channel=self.channel_id), event
+            GROUP_CHAT.format(channel=self.channel_id), _event_message(event)
         )
 
         # Dispatch external webhook for reaction
@@ -756,12 +752,10 @@ class ChatModule(BaseModule):
     @event(["event", "event.reaction"], refresh_user=30)
     async def publish_event(self, body):
         channel = self.consumer.channel_cache.get(body["channel"])
-        if channel:
-            if channel.room:
-                await channel.room.refresh_from_db_if_outdated(allowed_age=30)
-        else:
+        if not channel:
             channel = await get_channel(event=self.consumer.event, id=body["channel"])
             self.consumer.channel_cache[body["channel"]] = channel
+        await refresh_channel_room(self.consumer.event, channel)
 
         if channel.room and not await self.consumer.event.has_permission_async(
             user=self.consumer.user,
@@ -770,7 +764,9 @@ class ChatModule(BaseModule):
         ):
             return
 
-        data = {k: v for k, v in body.items() if k != "type"}
+        data = {
+            k: v for k, v in body.items() if k != "type" and not k.startswith("_")
+        }
 
         user_profiles_required = {data["sender"]}
         for uids in data["reactions"].values():
@@ -782,6 +778,10 @@ class ChatModule(BaseModule):
             )
 
         user_profiles_required -= self.users_known_to_client
+        if not user_profiles_required and FRAME_KEY in body:
+            # Nothing needs to be added for this client, so it gets the frame the sender already encoded
+            await self.consumer.send_broadcast(body)
+            return
         data["users"] = {}
 
         if user_profiles_required:
@@ -841,7 +841,7 @@ class ChatModule(BaseModule):
                 )
                 await self.consumer.channel_layer.group_send(
                     GROUP_CHAT.format(channel=self.channel_id),
-                    event,
+                    _event_message(event),
                 )
 
                 if not hide or user == self.consumer.user:
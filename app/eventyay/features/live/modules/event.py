@@ -5,6 +5,8 @@ from celery.result import AsyncResult
 from channels.db import database_sync_to_async
 
 from eventyay.core.permissions import Permission
+from eventyay.base.services import eventsnapshot
+from eventyay.base.services.connections import get_event_connections
 from eventyay.base.services.event import (
     _config_serializer,
     generate_tokens,
@@ -37,9 +39,12 @@ class EventModule(BaseModule):
 
     @event("update", refresh_user=True)
     async def push_event_update(self, body):
-        self.consumer.room_cache.clear()
-        # Refresh event data from database to ensure we have the latest configuration
-        await database_sync_to_async(self.consumer.event.refresh_from_db)()
+        # Make sure the snapshot of the event is at least as recent as the change we are told about
+        self.consumer.event = await eventsnapshot.get_event(
+            self.consumer.event.pk, version=body.get("version")
+        )
+        if not self.consumer.event:
+            return await self.consumer.close()
         event_config = await database_sync_to_async(get_event_config_for_user)(
             self.consumer.event,
             self.consumer.user,
@@ -49,8 +54,11 @@ class EventModule(BaseModule):
 
     @event("schedule.update", refresh_user=True)
     async def push_schedule_update(self, body):
-        # Refresh event data from database to ensure we have the latest configuration
-        await database_sync_to_async(self.consumer.event.refresh_from_db)()
+        self.consumer.event = await eventsnapshot.get_event(
+            self.consumer.event.pk, version=body.get("version")
+        )
+        if not self.consumer.event:
+            return await self.consumer.close()
         await self.consumer.send_json(
             [
                 "event.schedule.updated",
@@ -251,6 +259,16 @@ class EventModule(BaseModule):
         )
         await self.consumer.send_success({"resultid": str(result.id)})
 
+    @command("connections.list")
+    @require_event_permission(Permission.EVENT_GRAPHS)
+    async def connections_list(self, body):
+        room_ids = await database_sync_to_async(list)(
+            self.consumer.event.rooms.filter(deleted=False).values_list("id", flat=True)
+        )
+        await self.consumer.send_success(
+            await get_event_connections(self.consumer.event.pk, room_ids)
+        )
+
     @sync_to_async
     def _get_task_result(self, taskid):
         r = AsyncResult(taskid)
@@ -4,11 +4,15 @@ from eventyay.base.models.poll import Poll
 from eventyay.core.permissions import Permission
 from eventyay.base.services.chat import ChatService, get_channel
 from eventyay.base.services.poll import (
+    add_live_results,
     create_poll,
     delete_poll,
+    drop_poll_votes,
     get_poll,
     get_polls,
+    persist_votes,
     pin_poll,
+    poll_results_tick,
     unpin_poll,
     update_poll,
     vote_on_poll,
@@ -21,6 +25,7 @@ from eventyay.features.live.channels import (
     GROUP_ROOM_POLL_RESULTS,
 )
 from eventyay.features.live.decorators import command, event, room_action
+from eventyay.features.live.frames import broadcast_message
 from eventyay.features.live.modules.base import BaseModule
 
 logger = logging.getLogger(__name__)
@@ -57,11 +62,11 @@ class PollModule(BaseModule):
         group = self.get_group_for_state(poll["state"])
         await self.consumer.channel_layer.group_send(
             group.format(id=self.room.pk),
-            {
-                "type": "poll.created_or_updated",
-                "room": str(self.room.pk),
-                "poll": poll,
-            },
+            broadcast_message(
+                "poll.created_or_updated",
+                ["poll.created_or_updated", {"poll": poll}],
+                room=str(self.room.pk),
+            ),
         )
 
     @command("update")
@@ -75,8 +80,12 @@ class PollModule(BaseModule):
             return
 
         old_poll = await get_poll(body.get("id"), self.room)  # make sure poll exists
+        # Votes counted in redis need to be in the database before the poll is changed, e.g. closed with its final
+        # results. Votes that come in while we update the poll are picked up afterwards.
+        await drop_poll_votes(old_poll["id"])
         body["room"] = self.room
         new_poll = await update_poll(**body)
+        await drop_poll_votes(old_poll["id"])
 
         await self.consumer.send_success({"poll": new_poll})
 
@@ -89,11 +98,11 @@ class PollModule(BaseModule):
 
         await self.consumer.channel_layer.group_send(
             group.format(id=self.room.pk),
-            {
-                "type": "poll.created_or_updated",
-                "room": str(self.room.pk),
-                "poll": new_poll,
-            },
+            broadcast_message(
+                "poll.created_or_updated",
+                ["poll.created_or_updated", {"poll": new_poll}],
+                room=str(self.room.pk),
+            ),
         )
 
         if (
@@ -126,6 +135,7 @@ class PollModule(BaseModule):
             return
         old_poll = await get_poll(body.get("id"), self.room)
         await delete_poll(id=old_poll["id"], room=self.room)
+        await drop_poll_votes(old_poll["id"], persist=False)
         await self.consumer.send_success({"poll": old_poll["id"]})
         group = self.get_group_for_state(old_poll["state"])
         await self.consumer.channel_layer.group_send(
@@ -162,30 +172,27 @@ class PollModule(BaseModule):
             poll_results, self.consumer.channel_name
         )
 
-        await self.consumer.channel_layer.group_send(
+        # We do not broadcast every single vote, but aggregate them over short time frames ("ticks"), just like
+        # reactions. If we are the first to vote in this tick, it's our job to send out the results once the tick
+        # is over, and to write the votes of the tick to the database.
+        results = await poll_results_tick(poll["id"])
+        if results is None:
+            return
+        for group in (
             GROUP_ROOM_POLL_MANAGE.format(id=self.room.pk),
-            {
-                "type": "poll.created_or_updated",
-                "room": str(self.room.pk),
-                "poll": poll,
-            },
-        )
-        await self.consumer.channel_layer.group_send(
             GROUP_ROOM_POLL_ALL_RESULTS.format(id=self.room.pk),
-            {
-                "type": "poll.created_or_updated",
-                "room": str(self.room.pk),
-                "poll": poll,
-            },
-        )
-        await self.consumer.channel_layer.group_send(
-            poll_results.format(id=self.room.pk, poll=poll["id"]),
-            {
-                "type": "poll.created_or_updated",
-                "room": str(self.room.pk),
-                "poll": poll,
-            },
-        )
+            poll_results,
+        ):
+            await self.consumer.channel_layer.group_send(
+                group,
+                {
+                    "type": "poll.results",
+                    "room": str(self.room.pk),
+                    "id": poll["id"],
+                    "results": results,
+                },
+            )
+        await persist_votes(poll["id"])
 
     @command("list")
     @room_action(permission_required=Permission.ROOM_POLL_READ, module_required="poll")
@@ -210,6 +217,7 @@ class PollModule(BaseModule):
             moderator=is_moderator,
             early_results=early_results,
         )
+        await add_live_results(polls, self.consumer.user)
         await self.consumer.send_success(polls)
 
     @command("pin")
@@ -244,13 +252,26 @@ class PollModule(BaseModule):
 
     @event("created_or_updated")
     async def push_poll(self, body):
-        await self.consumer.send_json(
-            ["poll.created_or_updated", {"poll": body.get("poll")}]
+        await self.consumer.send_broadcast(body)
+
+    @event("results")
+    async def push_results(self, body):
+        await self.consumer.send_broadcast(
+            body,
+            [
+                "poll.results",
+                {
+                    "room": body.get("room"),
+                    "id": body.get("id"),
+                    "results": body.get("results"),
+                },
+            ]
         )
 
     @event("deleted")
     async def push_delete(self, body):
-        await self.consumer.send_json(
+        await self.consumer.send_broadcast(
+            body,
             [
                 "poll.deleted",
                 {"room": body.get("room"), "id": body.get("id")},
@@ -259,7 +280,8 @@ class PollModule(BaseModule):
 
     @event("pinned")
     async def push_pin(self, body):
-        await self.consumer.send_json(
+        await self.consumer.send_broadcast(
+            body,
             [
                 "poll.pinned",
                 {"room": body.get("room"), "id": body.get("id")},
@@ -268,7 +290,8 @@ class PollModule(BaseModule):
 
     @event("unpinned")
     async def push_unpin(self, body):
-        await self.consumer.send_json(
+        await self.consumer.send_broadcast(
+            body,
             [
                 "poll.unpinned",
                 {"room": body.get("room")},
@@ -5,9 +5,14 @@ from eventyay.core.permissions import Permission
 from eventyay.base.services.question import (
     create_question,
     delete_question,
+    drop_question_state,
     get_question,
-    get_questions,
+    list_questions,
+    persist_question_votes,
     pin_question,
+    question_changed,
+    question_removed,
+    question_scores_tick,
     unpin_question,
     update_question,
     vote_on_question,
@@ -46,6 +51,7 @@ class QuestionModule(BaseModule):
                 else RoomQuestion.States.VISIBLE
             ),
         )
+        await question_changed(question, sender_id=self.consumer.user.pk)
 
         await self.consumer.send_success({"question": question})
         group = (
@@ -78,6 +84,9 @@ class QuestionModule(BaseModule):
             moderator=self.consumer.user,
             **body,
         )
+        score = await question_changed(new_question)
+        if score is not None:
+            new_question["score"] = score
 
         await self.consumer.send_success({"question": new_question})
 
@@ -107,6 +116,7 @@ class QuestionModule(BaseModule):
             return
         old_question = await get_question(body.get("id"), self.room)
         await delete_question(**body)
+        await question_removed(old_question)
         await self.consumer.send_success({"question": old_question["id"]})
         group = (
             GROUP_ROOM_QUESTION_MODERATE
@@ -134,7 +144,7 @@ class QuestionModule(BaseModule):
 
         try:
             question = await vote_on_question(
-                room=body.get("room"),
+                room=self.room.pk,
                 pk=body.get("id"),
                 user=self.consumer.user,
                 vote=body.get("vote", True),
@@ -145,39 +155,48 @@ class QuestionModule(BaseModule):
 
         await self.consumer.send_success({"question": question})
 
-        group = (
-            GROUP_ROOM_QUESTION_MODERATE
-            if question["state"] != RoomQuestion.States.VISIBLE
-            else GROUP_ROOM_QUESTION_READ
-        )
-        await self.consumer.channel_layer.group_send(
-            group.format(id=self.room.pk),
-            {
-                "type": "question.created_or_updated",
-                "room": str(self.room.pk),
-                "question": question,
-            },
-        )
+        # We do not broadcast every single vote, but aggregate them over short time frames ("ticks"), just like
+        # reactions. If we are the first to vote in this tick, it's our job to send out the changed scores once the
+        # tick is over, and to write the votes of the tick to the database.
+        scores = await question_scores_tick(self.room.pk)
+        if scores is None:
+            return
+        visible = {
+            pk: score
+            for pk, (score, state) in scores.items()
+            if state == RoomQuestion.States.VISIBLE
+        }
+        hidden = {
+            pk: score
+            for pk, (score, state) in scores.items()
+            if state != RoomQuestion.States.VISIBLE
+        }
+        for group, delta in (
+            (GROUP_ROOM_QUESTION_READ, visible),
+            (GROUP_ROOM_QUESTION_MODERATE, hidden),
+        ):
+            if delta:
+                await self.consumer.channel_layer.group_send(
+                    group.format(id=self.room.pk),
+                    {
+                        "type": "question.scores",
+                        "room": str(self.room.pk),
+                        "scores": delta,
+                    },
+                )
+        await persist_question_votes(self.room.pk)
 
     @command("list")
     @room_action(permission_required=Permission.ROOM_QUESTION_READ)
     async def list_questions(self, body):
-        questions = []
-        if await self.consumer.event.has_permission_async(
+        is_moderator = await self.consumer.event.has_permission_async(
             user=self.consumer.user,
             room=self.room,
             permission=Permission.ROOM_QUESTION_MODERATE,
-        ):
-            questions = await get_questions(
-                room=self.room.id, for_user=self.consumer.user
-            )
-        else:
-            questions = await get_questions(
-                room=self.room.id,
-                state=RoomQuestion.States.VISIBLE,
-                add_by_user=self.consumer.user,
-                for_user=self.consumer.user,
-            )
+        )
+        questions = await list_questions(
+            room=self.room.pk, user=self.consumer.user, moderator=is_moderator
+        )
         await self.consumer.send_success(questions)
 
     @command("pin")
@@ -185,6 +204,7 @@ class QuestionModule(BaseModule):
     async def pin_question(self, body):
         question = await get_question(body.get("id"), self.room)
         await pin_question(pk=question["id"], room=self.room)
+        await drop_question_state(self.room.pk)
         await self.consumer.send_success({"id": str(question["id"])})
         group = (
             GROUP_ROOM_QUESTION_MODERATE
@@ -204,6 +224,7 @@ class QuestionModule(BaseModule):
     @room_action(permission_required=Permission.ROOM_QUESTION_MODERATE)
     async def unpin_question(self, body):
         await unpin_question(room=self.room)
+        await drop_question_state(self.room.pk)
         await self.consumer.send_success()
         group = GROUP_ROOM_QUESTION_READ
         await self.consumer.channel_layer.group_send(
@@ -216,13 +237,25 @@ class QuestionModule(BaseModule):
 
     @event("created_or_updated")
     async def push_question(self, body):
-        await self.consumer.send_json(
+        await self.consumer.send_broadcast(
+            body,
             ["question.created_or_updated", {"question": body.get("question")}]
         )
 
+    @event("scores")
+    async def push_scores(self, body):
+        await self.consumer.send_broadcast(
+            body,
+            [
+                "question.scores",
+                {"room": body.get("room"), "scores": body.get("scores")},
+            ]
+        )
+
     @event("deleted")
     async def push_delete(self, body):
-        await self.consumer.send_json(
+        await self.consumer.send_broadcast(
+            body,
             [
                 "question.deleted",
                 {"room": body.get("room"), "id": body.get("id")},
@@ -231,7 +264,8 @@ class QuestionModule(BaseModule):
 
     @event("pinned")
     async def push_pin(self, body):
-        await self.consumer.send_json(
+        await self.consumer.send_broadcast(
+            body,
             [
                 "question.pinned",
                 {"room": body.get("room"), "id": body.get("id")},
@@ -240,7 +274,8 @@ class QuestionModule(BaseModule):
 
     @event("unpinned")
     async def push_unpin(self, body):
-        await self.consumer.send_json(
+        await self.consumer.send_broadcast(
+            body,
             [
                 "question.unpinned",
                 {"room": body.get("room")},
@@ -18,6 +18,7 @@ from requests import RequestException
 from sentry_sdk import add_breadcrumb, configure_scope
 
 from eventyay.base.models.room import AnonymousInvite, RoomConfigSerializer
+from eventyay.base.services import roompresence
 from eventyay.base.services.event import (
     create_room,
     get_room_config_for_user,
@@ -25,7 +26,7 @@ from eventyay.base.services.event import (
     notify_event_change,
 )
 from eventyay.base.services.poll import get_polls, get_voted_polls
-from eventyay.base.services.reactions import store_reaction
+from eventyay.base.services.reactions import store_reactions
 from eventyay.base.services.room import (
     delete_room,
     end_view,
@@ -39,7 +40,6 @@ from eventyay.base.services.room import (
 from eventyay.core.permissions import Permission
 from eventyay.core.utils.redis import aredis
 from eventyay.features.live.channels import (
-    GROUP_EVENT,
     GROUP_ROOM,
     GROUP_ROOM_POLL_ALL_RESULTS,
     GROUP_ROOM_POLL_MANAGE,
@@ -56,6 +56,7 @@ from eventyay.features.live.decorators import (
     room_action,
 )
 from eventyay.features.live.exceptions import ConsumerException
+from eventyay.features.live.frames import broadcast_message
 from eventyay.features.live.modules.base import BaseModule
 
 
@@ -239,12 +240,13 @@ class RoomModule(BaseModule):
                     self.consumer.channel_name,
                 )
 
-        self.current_views[self.room], actual_view_count = await start_view(
+        self.current_views[self.room], view_count, gone = await start_view(
             self.room,
             self.consumer.user,
+            self.consumer.socket_id,
             delete=not self.consumer.event.config.get("track_room_views", True),
         )
-        await self._update_view_count(self.room, actual_view_count)
+        await self._update_view_count(self.room, gone)
 
         await get_channel_layer().group_send(
             GROUP_ROOM_VIEWERS.format(id=self.room.pk),
@@ -310,12 +312,13 @@ class RoomModule(BaseModule):
                 self.consumer.channel_name,
             )
         if room in self.current_views:
-            actual_view_count, is_last = await end_view(
+            view_count, is_last, gone = await end_view(
                 self.current_views[room],
+                self.consumer.socket_id,
                 delete=not self.consumer.event.config.get("track_room_views", True),
             )
             del self.current_views[room]
-            await self._update_view_count(room, actual_view_count)
+            await self._update_view_count(room, gone)
             if is_last:
                 await get_channel_layer().group_send(
                     GROUP_ROOM_VIEWERS.format(id=room.pk),
@@ -327,22 +330,27 @@ class RoomModule(BaseModule):
                     },
                 )
 
-    async def _update_view_count(self, room, actual_view_count):
-        async with aredis(f"room:approxcount:known:{room.pk}") as redis:
-            prev_value = await redis.getset(
-                f"room:approxcount:known:{room.pk}", actual_view_count
+    async def _update_view_count(self, room, gone):
+        # The count is broadcast to the whole event, at most once per tick
+        roompresence.schedule_count_broadcast(self.consumer.event.pk, room.pk)
+        for user_id in gone:
+            # Users whose views expired because their socket went away without leaving the room
+            await get_channel_layer().group_send(
+                GROUP_ROOM_VIEWERS.format(id=room.pk),
+                {
+                    "type": "room.viewer.removed",
+                    "user_id": user_id,
+                    "_show_publicly": True,
+                    "_room": str(room.pk),
+                },
             )
-            if prev_value != actual_view_count:
-                await redis.expire(f"room:approxcount:known:{room.pk}", 900)
-                # broadcast actual viewer count instead of approximate text
-                await self.consumer.channel_layer.group_send(
-                    GROUP_EVENT.format(id=self.consumer.event.pk),
-                    {
-                        "type": "event.user_count_change",
-                        "room": str(room.pk),
-                        "users": actual_view_count,
-                    },
-                )
+
+    async def refresh_views(self):
+        await roompresence.refresh(
+            [room.pk for room in self.current_views],
+            self.consumer.user.id,
+            self.consumer.socket_id,
+        )
 
     @command("leave")
     @room_action()
@@ -407,21 +415,22 @@ class RoomModule(BaseModule):
                 val, _ = await tr.execute()
                 if not val:
                     return
+                reactions = {
+                    k.decode(): int(v.decode())
+                    for k, v in val.items()
+                    if k.decode() != "tick"
+                }
                 await self.consumer.channel_layer.group_send(
                     GROUP_ROOM.format(id=self.room.pk),
-                    {
-                        "type": "room.reaction",
-                        "reactions": {
-                            k.decode(): int(v.decode())
-                            for k, v in val.items()
-                            if k.decode() != "tick"
-                        },
-                        "room": str(body["room"]),
-                    },
+                    broadcast_message(
+                        "room.reaction",
+                        [
+                            "room.reaction",
+                            {"reactions": reactions, "room": str(body["room"])},
+                        ],
+                    ),
                 )
-                for k, v in val.items():
-                    if k.decode() != "tick":
-                        await store_reaction(body["room"], k.decode(), int(v.decode()))
+                await store_reactions(body["room"], reactions)
             # else: We're just contributing to the reaction counter that someone else started.
 
     @command("create")
@@ -446,12 +455,7 @@ class RoomModule(BaseModule):
 
     @event("reaction")
     async def push_reaction(self, body):
-        await self.consumer.send_json(
-            [
-                body["type"],
-                {k: v for k, v in body.items() if k != "type"},
-            ]
-        )
+        await self.consumer.send_broadcast(body)
 
     @event("viewer.added")
     async def push_viewer_added(self, body):
@@ -499,7 +503,8 @@ class RoomModule(BaseModule):
 
     @event("stream.change")
     async def push_stream_change(self, body):
-        await self.consumer.send_json(
+        await self.consumer.send_broadcast(
+            body,
             [
                 'room.stream.change',
                 {
@@ -511,7 +516,8 @@ class RoomModule(BaseModule):
 
     @event("stream.will_change")
     async def push_stream_will_change(self, body):
-        await self.consumer.send_json(
+        await self.consumer.send_broadcast(
+            body,
             [
                 'room.stream.will_change',
                 {
@@ -236,3 +236,122 @@ class Logic:
             return self._operations[operator](*values)
         else:
             raise ValueError('Unrecognized operation %s' % operator)
+
+    def compile(self, tests):
+        """
+        Compiles the json-logic into a Python function that takes the data and returns the same result as
+        :py:meth:`apply`, without walking the rule tree again on every call. Parts of the logic that do not depend
+        on the data are only evaluated once, so operations need to be free of side effects (except for ``log``).
+        ``and``, ``or``, ``if`` and ``?:`` only evaluate the arguments they need, which matters if looking up
+        variables is expensive.
+        """
+        return self._compile(tests)[0]
+
+    def _compile(self, tests):
+        # Returns the compiled function and whether it always returns the same value
+        # You've recursed to a primitive, it evaluates to itself
+        if tests is None or not isinstance(tests, dict):
+            return (lambda data=None: tests), True
+
+        operator = list(tests.keys())[0]
+        values = tests[operator]
+
+        # Easy syntax for unary operators, like {"var": "x"} instead of strict
+        # {"var": ["x"]}
+        if not isinstance(values, list) and not isinstance(values, tuple):
+            values = [values]
+
+        # Array-level operations
+        if operator in ('none', 'all', 'some', 'map', 'filter'):
+            elements, func = self.compile(values[0]), self.compile(values[1])
+            if operator == 'none':
+                return (lambda data=None: not any(func(i) for i in elements(data or {}))), False
+            if operator == 'all':
+                return (lambda data=None: bool(e := elements(data or {})) and all(func(i) for i in e)), False
+            if operator == 'some':
+                return (lambda data=None: any(func(i) for i in elements(data or {}))), False
+            if operator == 'map':
+                return (lambda data=None: [func(i) for i in (elements(data or {}) or [])]), False
+            return (lambda data=None: [i for i in elements(data or {}) if func(i)]), False
+        if operator == 'reduce':
+            elements, func, initial = self.compile(values[0]), self.compile(values[1]), self.compile(values[2])
+            return (
+                lambda data=None: reduce(
+                    lambda acc, el: func({'current': el, 'accumulator': acc}),
+                    elements(data or {}) or [],
+                    initial(data or {}),
+                )
+            ), False
+
+        compiled = [self._compile(val) for val in values]
+        args = [func for func, constant in compiled]
+
+        if operator == 'var':
+            return (lambda data=None: get_var(data or {}, *[a(data) for a in args])), False
+        if operator == 'missing':
+            return (lambda data=None: missing(data or {}, *[a(data) for a in args])), False
+        if operator == 'missing_some':
+            return (lambda data=None: missing_some(data or {}, *[a(data) for a in args])), False
+
+        if operator == 'and':
+
+            def and_(data=None):
+                result = True
+                for a in args:
+                    result = a(data)
+                    if not result:
+                        return result
+                return result
+
+            func = and_
+        elif operator == 'or':
+
+            def or_(data=None):
+                result = False
+                for a in args:
+                    result = a(data)
+                    if result:
+                        return result
+                return result
+
+            func = or_
+        elif operator == 'if' or (operator == '?:' and len(args) == 3):
+
+            def if_compiled(data=None):
+                for i in range(0, len(args) - 1, 2):
+                    if args[i](data):
+                        return args[i + 1](data)
+                if len(args) % 2:
+                    return args[-1](data)
+                return None
+
+            func = if_compiled
+        else:
+            if operator in operations:
+                op = operations[operator]
+            elif operator in self._operations:
+                op = self._operations[operator]
+            else:
+                raise ValueError(f'Unrecognized operation {operator}')
+
+            func = self._call(op, args)
+
+        if operator != 'log' and all(constant for func_, constant in compiled):
+            try:
+                value = func()
+            except Exception:
+                # Keep raising the error at evaluation time
+                return func, False
+            return (lambda data=None: value), True
+        return func, False
+
+    @staticmethod
+    def _call(op, args):
+        # Avoid building an argument list for the common cases
+        if len(args) == 1:
+            a = args[0]
+            return lambda data=None: op(a(data))
+        if len(args) == 2:
+            a, b = args
+            return lambda data=None: op(a(data), b(data))
+        return lambda data=None: op(*[a(data) for a in args])
@@ -5,6 +5,7 @@ from django_scopes import scope
 from eventyay.base.channels import WebshopSalesChannel
 from eventyay.presale.signals import process_response
 
+from . import waitingroom
 from .utils import _detect_event
 
 
@@ -29,6 +30,11 @@ class EventMiddleware:
         if url.namespace != 'presale':
             return self.get_response(request)
 
+        # The waiting room runs before we look up the event, so visitors in the queue never hit the database
+        queued = waitingroom.check(request, url)
+        if queued:
+            return queued
+
         if 'organizer' in url.kwargs or 'event' in url.kwargs or getattr(request, 'event_domain', False):
             redirect = _detect_event(request, require_live=url.url_name not in self.NO_REQUIRE_LIVE_URLS)
             if redirect:
@@ -44,4 +50,4 @@ class EventMiddleware:
             if isinstance(response, TemplateResponse):
                 response = response.render()
 
-        return response
+        return waitingroom.add_admission_cookie(request, response)
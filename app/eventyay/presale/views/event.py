@@ -1,8 +1,10 @@
 import calendar
 import datetime as dt
 import importlib.util
+import io
 import json
 import logging
+import pickle
 import sys
 from collections import defaultdict
 from datetime import date, datetime, timedelta
@@ -34,6 +36,7 @@ from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.utils.formats import get_format
 from django.utils.timezone import now
+from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import pgettext_lazy
 from django.views import View
@@ -474,6 +477,57 @@ def get_grouped_products(
     return products, display_add_to_cart
 
 
+class _GroupedProductsPickler(pickle.Pickler):
+    """
+    The products and quotas reference the event (and subevent) of the request, which can't be pickled with everything
+    attached to it. They are replaced with the event of the request that loads the cached products.
+    """
+
+    def __init__(self, file, event, subevent):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.event = event
+        self.subevent = subevent
+
+    def persistent_id(self, obj):
+        if obj is self.event:
+            return 'event'
+        if self.subevent is not None and obj is self.subevent:
+            return 'subevent'
+        return None
+
+
+class _GroupedProductsUnpickler(pickle.Unpickler):
+    def __init__(self, file, event, subevent):
+        super().__init__(file)
+        self.event = event
+        self.subevent = subevent
+
+    def persistent_load(self, pid):
+        return self.event if pid == 'event' else self.subevent
+
+
+def get_cached_grouped_products(event, subevent=None, voucher=None, channel='web'):
+    """
+    Returns the same as ``get_grouped_products``, but cached for a few seconds per event, subevent, sales channel,
+    voucher and language. During a rush, only one request at a time computes the product list while everyone else
+    gets the previous one, instead of all of them computing quota availabilities at the same time. The cache of the
+    event is cleared whenever products, categories or quotas change.
+    """
+    cache_key = (
+        f'grouped_products:{subevent.id if subevent else 0}:{channel}:{voucher.pk if voucher else 0}:{get_language()}'
+    )
+
+    def compute():
+        buf = io.BytesIO()
+        _GroupedProductsPickler(buf, event, subevent).dump(
+            get_grouped_products(event, subevent, voucher=voucher, channel=channel)
+        )
+        return buf.getvalue()
+
+    data = event.cache.get_or_refresh(cache_key, compute, timeout=5, stale_timeout=30)
+    return _GroupedProductsUnpickler(io.BytesIO(data), event, subevent).load()
+
+
 def event_has_redeemable_voucher_products(event, subevent=None, channel='web'):
     """
     Return whether at least one active voucher can still be used to purchase
@@ -778,13 +832,22 @@ class EventIndex(EventViewMixin, EventListMixin, CartMixin, TemplateView):
 
         if not self.request.event.has_subevents or self.subevent:
             # Fetch all products
-            products, display_add_to_cart = get_grouped_products(
-                self.request.event,
-                self.subevent,
-                filter_products=self.request.GET.getlist('product'),
-                filter_categories=self.request.GET.getlist('category'),
-                channel=self.request.sales_channel.identifier,
-            )
+            filter_products = self.request.GET.getlist('product')
+            filter_categories = self.request.GET.getlist('category')
+            if filter_products or filter_categories:
+                products, display_add_to_cart = get_grouped_products(
+                    self.request.event,
+                    self.subevent,
+                    filter_products=filter_products,
+                    filter_categories=filter_categories,
+                    channel=self.request.sales_channel.identifier,
+                )
+            else:
+                products, display_add_to_cart = get_cached_grouped_products(
+                    self.request.event,
+                    self.subevent,
+                    channel=self.request.sales_channel.identifier,
+                )
             context['productnum'] = len(products)
             context['allfree'] = all(
                 product.display_price.gross == Decimal('0.00') for product in products if not product.has_variations
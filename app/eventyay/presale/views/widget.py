@@ -5,7 +5,7 @@ import logging
 from collections import defaultdict
 from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
-from urllib.parse import urljoin
+from urllib.parse import urlencode, urljoin
 
 import isoweek
 import datetime
@@ -15,11 +15,13 @@ from django.contrib.staticfiles import finders
 from django.core.cache import cache
 from django.core.files.base import ContentFile, File
 from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import Q
-from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.template import Context, Engine
 from django.template.loader import get_template
 from django.utils.formats import date_format
+from django.utils.http import parse_etags, quote_etag
 from django.utils.timezone import now
 from django.utils.translation import get_language, gettext, pgettext
 from django.utils.translation.trans_real import DjangoTranslation
@@ -56,6 +58,16 @@ from eventyay.presale.views.organizer import (
 
 logger = logging.getLogger(__name__)
 
+# Widget requests without a voucher or filters are answered from JSON snapshots of the response, which are shared by
+# all visitors and carry an ETag for conditional requests. They live in the cache of the event (or organizer), so they
+# are dropped whenever products, quotas or dates change, and are rebuilt by only one request at a time (see
+# NamespacedCache.get_or_refresh), while everyone else still gets the previous snapshot.
+SNAPSHOT_PARAMS = {'lang', 'cart_id'}
+SNAPSHOT_LIST_PARAMS = SNAPSHOT_PARAMS | {'style', 'year', 'month', 'week'}
+SNAPSHOT_TIMEOUT = 10  # seconds, availabilities change without clearing the cache
+SNAPSHOT_LIST_TIMEOUT = 30  # seconds
+SNAPSHOT_STALE_TIMEOUT = 60  # seconds
+
 
 def indent(s):
     return s.replace('\n', '\n  ')
@@ -320,6 +332,20 @@ class WidgetAPIProductList(EventListMixin, View):
         resp['Access-Control-Allow-Origin'] = '*'
         return resp
 
+    def snapshot(self, data):
+        self.post_process(data)
+        body = json.dumps(data, cls=DjangoJSONEncoder).encode()
+        return hashlib.sha1(body).hexdigest(), body
+
+    def snapshot_response(self, etag, body):
+        if quote_etag(etag) in parse_etags(self.request.headers.get('If-None-Match', '')):
+            resp = HttpResponseNotModified()
+        else:
+            resp = HttpResponse(body, content_type='application/json')
+        resp['ETag'] = quote_etag(etag)
+        resp['Access-Control-Allow-Origin'] = '*'
+        return resp
+
     def get(self, request, *args, **kwargs):
         if not hasattr(request, 'event'):
             return self._get_event_list(request, **kwargs)
@@ -452,6 +478,38 @@ class WidgetAPIProductList(EventListMixin, View):
         return events
 
     def _get_event_list(self, request, **kwargs):
+        o = getattr(request, 'event', request.organizer)
+        if set(request.GET) <= SNAPSHOT_LIST_PARAMS:
+            query = urlencode(sorted((k, v) for k, v in request.GET.items() if k not in SNAPSHOT_PARAMS))
+            etag, body = o.cache.get_or_refresh(
+                ':'.join(['widget_snapshot', 'eventlist', request.sales_channel.identifier, get_language(), query]),
+                lambda: self.snapshot(self._get_event_list_data(request, **kwargs)),
+                timeout=SNAPSHOT_LIST_TIMEOUT,
+                stale_timeout=SNAPSHOT_STALE_TIMEOUT,
+            )
+            return self.snapshot_response(etag, body)
+
+        cache_key = ':'.join(
+            [
+                'widget.py',
+                'eventlist',
+                request.organizer.slug,
+                request.event.slug if hasattr(request, 'event') else '-',
+                request.GET.urlencode(),
+                get_language(),
+            ]
+        )
+        cached_data = cache.get(cache_key)
+        if cached_data:
+            return self.response(cached_data)
+
+        data = self._get_event_list_data(request, **kwargs)
+        cache.set(cache_key, data, 30)
+        # These pages are cached for a really short duration – this should make them pretty accurate, while still
+        # providing some protection against burst traffic.
+        return self.response(data)
+
+    def _get_event_list_data(self, request, **kwargs):
         data = {}
         o = getattr(request, 'event', request.organizer)
         list_type = self.request.GET.get('style', o.settings.event_list_type)
@@ -473,21 +531,6 @@ class WidgetAPIProductList(EventListMixin, View):
             data['name'] = str(request.event.name)
             data['frontpage_text'] = str(rich_text(request.event.settings.frontpage_text))
 
-        cache_key = ':'.join(
-            [
-                'widget.py',
-                'eventlist',
-                request.organizer.slug,
-                request.event.slug if hasattr(request, 'event') else '-',
-                list_type,
-                request.GET.urlencode(),
-                get_language(),
-            ]
-        )
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return self.response(cached_data)
-
         if list_type == 'calendar':
             self._set_month_year()
             _, ndays = calendar.monthrange(self.year, self.month)
@@ -686,12 +729,31 @@ class WidgetAPIProductList(EventListMixin, View):
                         }
                     )
 
-        cache.set(cache_key, data, 30)
-        # These pages are cached for a really short duration – this should make them pretty accurate, while still
-        # providing some protection against burst traffic.
-        return self.response(data)
+        return data
 
     def _get_event_view(self, request, **kwargs):
+        if set(request.GET) <= SNAPSHOT_PARAMS:
+            etag, body = request.event.cache.get_or_refresh(
+                ':'.join(
+                    [
+                        'widget_snapshot',
+                        'event',
+                        str(self.subevent.pk) if self.subevent else '',
+                        request.sales_channel.identifier,
+                        get_language(),
+                    ]
+                ),
+                lambda: self.snapshot(self._get_event_data(request)),
+                timeout=SNAPSHOT_TIMEOUT,
+                stale_timeout=SNAPSHOT_STALE_TIMEOUT,
+            )
+            if self._cart_exists(request):
+                # The snapshot is the same for everyone, carts are not
+                data = json.loads(body)
+                data['cart_exists'] = True
+                return self.response(data)
+            return self.snapshot_response(etag, body)
+
         cache_key = ':'.join(
             [
                 'widget.py',
@@ -709,6 +771,21 @@ class WidgetAPIProductList(EventListMixin, View):
             if cached_data:
                 return self.response(cached_data)
 
+        data = self._get_event_data(request)
+        data['cart_exists'] = self._cart_exists(request)
+        if 'cart_id' not in request.GET:
+            cache.set(cache_key, data, 10)
+            # These pages are cached for a really short duration – this should make them pretty accurate with
+            # regards to availability display, while still providing some protection against burst traffic.
+        return self.response(data)
+
+    def _cart_exists(self, request):
+        return (
+            'cart_id' in request.GET
+            and CartPosition.objects.filter(event=request.event, cart_id=request.GET.get('cart_id')).exists()
+        )
+
+    def _get_event_data(self, request):
         data = {
             'currency': request.event.currency,
             'display_net_prices': request.event.settings.display_net_prices,
@@ -719,12 +796,6 @@ class WidgetAPIProductList(EventListMixin, View):
             'cart_exists': False,
         }
 
-        if (
-            'cart_id' in request.GET
-            and CartPosition.objects.filter(event=request.event, cart_id=request.GET.get('cart_id')).exists()
-        ):
-            data['cart_exists'] = True
-
         ev = self.subevent or request.event
         data['name'] = str(ev.name)
         if self.subevent:
@@ -801,8 +872,4 @@ class WidgetAPIProductList(EventListMixin, View):
             channel=request.sales_channel.identifier,
         )
 
-        if 'cart_id' not in request.GET:
-            cache.set(cache_key, data, 10)
-            # These pages are cached for a really short duration – this should make them pretty accurate with
-            # regards to availability display, while still providing some protection against burst traffic.
-        return self.response(data)
+        return data
@@ -0,0 +1,203 @@
+"""
+Virtual waiting room in front of the presale checkout.
+
+If the ``waiting_room`` option is set in the configuration file and the event setting ``waiting_room_enabled`` is
+active, visitors of the shop's front page, cart and checkout first need to pass a queue that admits
+``waiting_room_rate`` visitors per second, in the order they arrived. Everything needed to do so lives in redis, so a
+visitor waiting in the queue never causes any database queries. Without the ``waiting_room`` option, presale requests
+do not talk to redis at all:
+
+* ``waitingroom:{organizer}/{event}`` is a hash holding the configured ``rate``, a random ``generation`` that
+  changes every time the waiting room is turned on, the number of queue positions ``issued`` so far, and the
+  position up to which visitors have been ``served`` at time ``ts``. It only exists while the waiting room is
+  active and is written by :py:func:`configure` whenever the event settings change.
+
+Visitors carry their queue position in a signed cookie. The ``served`` position advances lazily on every request,
+by ``rate`` positions per second. It may run ahead of the queue by up to one second worth of visitors, so people
+are let through without waiting at all as long as the shop is not busy. Once admitted, a visitor gets a signed
+admission cookie that lets them through all checkout steps for :py:data:`ADMISSION_TIMEOUT` seconds.
+"""
+
+import time
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django_redis import get_redis_connection
+
+
+KEY_ROOM = 'waitingroom:{room}'
+
+# Event settings that need to be published to redis with configure() whenever they change
+SETTINGS_AFFECTING_WAITING_ROOM = ('waiting_room_enabled', 'waiting_room_rate')
+
+# Visitors are let into the checkout for this long after they left the queue
+ADMISSION_TIMEOUT = 3600
+# Queue positions are forgotten if the visitor does not come back for this long
+QUEUE_TIMEOUT = 3600 * 24
+
+GATED_URLS = {
+    'event.index',
+    'event.cart.add',
+    'event.cart.voucher',
+    'event.checkout.start',
+    'event.checkout',
+    'event.redeem',
+    'event.seatingplan',
+}
+
+# Returns {position, number of visitors ahead, generation, rate}, or {-1} if the waiting room is not active.
+# ARGV[2] is the position of the visitor, or 0 if they do not have one of the current generation ARGV[3] yet.
+ADMIT = """
+local room = redis.call('HMGET', KEYS[1], 'rate', 'generation', 'issued', 'served', 'ts')
+local rate = tonumber(room[1])
+if not rate then
+    return {-1}
+end
+local now = tonumber(ARGV[1])
+local issued = tonumber(room[3] or '0')
+local served = tonumber(room[4] or '0')
+local ts = tonumber(room[5])
+if ts then
+    served = math.min(served + math.max(now - ts, 0) * rate, issued + rate)
+else
+    served = issued + rate
+end
+
+local position = tonumber(ARGV[2])
+if position == 0 or ARGV[3] ~= room[2] then
+    issued = issued + 1
+    position = issued
+    redis.call('HSET', KEYS[1], 'issued', issued)
+end
+redis.call('HSET', KEYS[1], 'served', tostring(served), 'ts', ARGV[1])
+return {position, math.ceil(position - served), room[2], math.floor(rate)}
+"""
+
+
+def room_name(organizer, event):
+    return f'{organizer.slug}/{event.slug}'
+
+
+def configure(organizer, event):
+    """
+    Publishes the waiting room settings of an event to redis, where the presale middleware picks them up.
+    """
+    if not settings.HAS_REDIS:
+        return
+    rc = get_redis_connection('redis')
+    key = KEY_ROOM.format(room=room_name(organizer, event))
+    if event.settings.waiting_room_enabled:
+        pipe = rc.pipeline()
+        pipe.hset(key, 'rate', max(int(event.settings.waiting_room_rate), 1))
+        pipe.hsetnx(key, 'generation', uuid.uuid4().hex)
+        pipe.execute()
+    else:
+        rc.delete(key)
+
+
+def _room_from_request(request, url):
+    if getattr(request, 'event_domain', False):
+        return room_name(request.organizer, request.event)
+    if getattr(request, 'organizer_domain', False):
+        organizer = request.organizer.slug
+    else:
+        organizer = url.kwargs.get('organizer')
+    if organizer and url.kwargs.get('event'):
+        return f"{organizer}/{url.kwargs['event']}"
+
+
+def _cookie_name(room):
+    return f"eventyay_waitingroom_{room.replace('/', '_')}"
+
+
+def _observe(metric, room):
+    if settings.METRICS_ENABLED:
+        from eventyay.base import metrics
+
+        getattr(metrics, metric).inc(1, event=room)
+
+
+def check(request, url):
+    """
+    Decides whether a presale request may pass the waiting room. Returns ``None`` if it may, or the response
+    showing the visitor's queue position otherwise.
+    """
+    if not settings.WAITING_ROOM or url.url_name not in GATED_URLS:
+        return
+    room = _room_from_request(request, url)
+    if not room:
+        return
+
+    cookie_name = _cookie_name(room)
+    salt = f'eventyay.presale.waitingroom:{room}'
+    try:
+        ticket = signing.loads(request.COOKIES.get(cookie_name, ''), salt=salt, max_age=QUEUE_TIMEOUT)
+    except signing.BadSignature:
+        ticket = {}
+    if ticket.get('admitted_until', 0) > time.time():
+        return
+
+    rc = get_redis_connection('redis')
+    result = rc.eval(
+        ADMIT,
+        1,
+        KEY_ROOM.format(room=room),
+        time.time(),
+        ticket.get('position', 0),
+        ticket.get('generation', ''),
+    )
+    if result[0] < 0:
+        return
+    position, ahead, generation, rate = result
+    generation = generation.decode() if isinstance(generation, bytes) else generation
+    if ticket.get('generation') != generation or ticket.get('position') != position:
+        _observe('eventyay_waitingroom_queued_total', room)
+
+    if ahead <= 0:
+        _observe('eventyay_waitingroom_admitted_total', room)
+        request._waitingroom_admission = (
+            cookie_name,
+            signing.dumps({'admitted_until': time.time() + ADMISSION_TIMEOUT}, salt=salt),
+        )
+        return
+
+    wait = ahead // max(rate, 1) + 1
+    refresh = min(max(wait, 3), 30)
+    response = HttpResponse(
+        render_to_string(
+            'pretixpresale/waitingroom.html',
+            {'ahead': ahead, 'wait_minutes': wait // 60 + 1, 'refresh': refresh},
+        ),
+        status=200,
+    )
+    response['Refresh'] = str(refresh)
+    response['Cache-Control'] = 'no-store'
+    response.set_cookie(
+        cookie_name,
+        signing.dumps({'position': position, 'generation': generation}, salt=salt),
+        max_age=QUEUE_TIMEOUT,
+        httponly=True,
+        samesite=settings.SESSION_COOKIE_SAMESITE,
+        secure=settings.SESSION_COOKIE_SECURE,
+    )
+    return response
+
+
+def add_admission_cookie(request, response):
+    """
+    Hands out the admission cookie to visitors that just left the queue.
+    """
+    admission = getattr(request, '_waitingroom_admission', None)
+    if admission:
+        response.set_cookie(
+            admission[0],
+            admission[1],
+            max_age=ADMISSION_TIMEOUT,
+            httponly=True,
+            samesite=settings.SESSION_COOKIE_SAMESITE,
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
+    return response
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import datetime as dt
+import hashlib
 import json
 import xml.etree.ElementTree as ElementTree
 from typing import TYPE_CHECKING, TypedDict
@@ -9,9 +10,12 @@ from zoneinfo import ZoneInfo
 
 import vobject
 from django.conf import settings
+from django.core.cache import cache
 from django.template.loader import get_template
 from django.utils.functional import cached_property
-from django.utils.safestring import SafeString
+from django.utils.safestring import SafeString, mark_safe
+from django.utils.timezone import get_current_timezone_name
+from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
 from i18nfield.utils import I18nJSONEncoder
 
@@ -55,7 +59,68 @@ class PreparedData(TypedDict):
     rooms: dict[str, RoomData]
 
 
-class ScheduleData(BaseExporter):
+class TalkFragmentMixin:
+    """Caches the part of an export that belongs to a single talk.
+
+    Fragments are keyed by everything they are built from rather than by
+    the schedule, so unchanged talks are not rendered again for the next
+    release: the slot's time and room, the last change to the submission,
+    its type and track, and the version of each speaker and, if the export
+    shows it, their profile.
+    """
+
+    fragment_kind = None
+    fragment_timeout = 7 * 24 * 60 * 60
+
+    def get_fragment_parts(self, talk, profile_versions) -> list:
+        submission = talk.submission
+        return [
+            self.fragment_kind,
+            get_language(),
+            get_current_timezone_name(),
+            get_base_url(self.event),
+            self.event.slug,
+            self.event.get_feature_flag('use_feedback'),
+            submission.code,
+            talk.id_suffix,
+            talk.start,
+            talk.end,
+            talk.room_id,
+            talk.room.updated if talk.room else None,
+            submission.updated,
+            submission.submission_type.updated,
+            submission.track.updated if submission.track else None,
+            *(
+                (speaker.pk, speaker.version, profile_versions.get(speaker.pk))
+                for speaker in submission.speakers.all()
+            ),
+        ]
+
+    def get_profile_versions(self) -> dict:
+        """Return the last change of the speaker profiles used by the export,
+        by user pk."""
+        return {}
+
+    def get_talk_fragments(self, talks, build) -> dict:
+        """Return a dict of talk pk to fragment, calling ``build(talk)`` only
+        for talks that have no fragment in the cache yet."""
+        profile_versions = self.get_profile_versions() if talks else {}
+        keys = {
+            talk.pk: 'eagenda:fragment:'
+            + hashlib.sha1(':'.join(map(str, self.get_fragment_parts(talk, profile_versions))).encode()).hexdigest()
+            for talk in talks
+        }
+        fragments = cache.get_many(set(keys.values())) if keys else {}
+        missing = {}
+        for talk in talks:
+            if keys[talk.pk] not in fragments:
+                fragments[keys[talk.pk]] = missing[keys[talk.pk]] = build(talk)
+        if missing:
+            cache.set_many(missing, self.fragment_timeout)
+        return {pk: fragments[key] for pk, key in keys.items()}
+
+
+class ScheduleData(TalkFragmentMixin, BaseExporter):
     def __init__(self, event, schedule: Schedule | None = None, with_accepted=False, with_breaks=False):
         super().__init__(event)
         self.schedule = schedule
@@ -150,6 +215,14 @@ class ScheduleData(BaseExporter):
             )
         return tuple(data.values())
 
+    def get_fragment_parts(self, talk, profile_versions) -> list:
+        resources = talk.submission.resources.all()
+        return [
+            *super().get_fragment_parts(talk, profile_versions),
+            len(resources),
+            max((resource.updated for resource in resources), default=None),
+        ]
+
 
 class FrabXmlExporter(ScheduleData):
     identifier = 'schedule.xml'
@@ -160,10 +233,27 @@ class FrabXmlExporter(ScheduleData):
     talk_ids = frozenset()
     icon = 'fa-code'
     cors = '*'
+    fragment_kind = 'xml'
 
     def render(self, **kwargs):
+        template = get_template('agenda/schedule_talk.xml')
+        rooms = {talk: room for day in self.data for room in day['rooms'] for talk in room['talks']}
+        fragments = self.get_talk_fragments(
+            list(rooms),
+            lambda talk: template.render(context={'talk': talk, 'room': rooms[talk], 'event': self.event}).strip(),
+        )
+        data = [
+            {
+                **day,
+                'rooms': [
+                    {**room, 'events': [mark_safe(fragments[talk.pk]) for talk in room['talks']]}
+                    for room in day['rooms']
+                ],
+            }
+            for day in self.data
+        ]
         context = {
-            'data': self.data,
+            'data': data,
             'metadata': self.metadata,
             'schedule': self.schedule,
             'event': self.event,
@@ -231,6 +321,7 @@ class FrabJsonExporter(ScheduleData):
     talk_ids = frozenset()
     icon = 'fa-code'
     cors = '*'
+    fragment_kind = 'json'
 
     def speaker_ids(self) -> set[int]:
         # Must match the exact talk set that is actually exported via ``self.data``.
@@ -274,6 +365,9 @@ class FrabJsonExporter(ScheduleData):
             )
         }
 
+    def get_profile_versions(self):
+        return {user_id: profile.updated for user_id, profile in self.speaker_profiles.items()}
+
     def get_speaker_profile(self, person):
         """Look up a prefetched speaker profile, falling back to event_profile()."""
         profile = self.speaker_profiles.get(person.pk)
@@ -283,6 +377,18 @@ class FrabJsonExporter(ScheduleData):
 
     def get_data(self, **kwargs):
         schedule = self.schedule
+        rooms = {
+            talk: room
+            for day in self.data
+            for room in day['rooms']
+            for talk in room['talks']
+            if not self.favs_retrieve or talk.submission.code in self.talk_ids
+        }
+        # Fragments are stored as plain JSON data, so that they don't hold on to any model instances
+        talks = self.get_talk_fragments(
+            list(rooms),
+            lambda talk: json.loads(json.dumps(self.serialize_talk(talk, rooms[talk]), cls=I18nJSONEncoder)),
+        )
         return {
             'url': self.metadata['url'],
             'version': schedule.version,
@@ -322,12 +428,7 @@ class FrabJsonExporter(ScheduleData):
                         'day_start': day['start'].astimezone(self.event.tz).isoformat(),
                         'day_end': day['end'].astimezone(self.event.tz).isoformat(),
                         'rooms': {
-                            str(room['name']): [
-                                self.serialize_talk(talk, room)
-                                for talk in room['talks']
-                                if (self.favs_retrieve is True and talk.submission.code in self.talk_ids)
-                                or not self.favs_retrieve
-                            ]
+                            str(room['name']): [talks[talk.pk] for talk in room['talks'] if talk.pk in talks]
                             for room in day['rooms']
                         },
                     }
@@ -400,7 +501,26 @@ class MyFrabJsonExporter(FrabJsonExporter):
     favs_retrieve = True
 
 
-class ICalExporter(BaseExporter):
+def split_ical(content):
+    """Split a serialized calendar into its VTIMEZONE and its VEVENT blocks."""
+    timezones, events = [], []
+    block = None
+    for line in content.splitlines(keepends=True):
+        if block is None:
+            if line.startswith(('BEGIN:VTIMEZONE', 'BEGIN:VEVENT')):
+                block = [line]
+            continue
+        block.append(line)
+        if line.startswith('END:VTIMEZONE'):
+            timezones.append(''.join(block))
+            block = None
+        elif line.startswith('END:VEVENT'):
+            events.append(''.join(block))
+            block = None
+    return timezones, events
+
+
+class ICalExporter(TalkFragmentMixin, BaseExporter):
     identifier = 'schedule.ics'
     verbose_name = _('iCal (full event)')
     public = True
@@ -410,6 +530,7 @@ class ICalExporter(BaseExporter):
     talk_ids = frozenset()
     icon = 'fa-calendar'
     cors = '*'
+    fragment_kind = 'ics'
 
     def __init__(self, event, schedule=None):
         super().__init__(event)
@@ -421,20 +542,36 @@ class ICalExporter(BaseExporter):
         cal.add('prodid').value = f'-//pretalx//{netloc}//'
         creation_time = dt.datetime.now(ZoneInfo('UTC'))
 
+        def build(talk):
+            talk_cal = vobject.iCalendar()
+            talk.build_ical(talk_cal, creation_time=creation_time, netloc=netloc)
+            return split_ical(talk_cal.serialize())
+
         talks = (
             self.schedule.talks.filter(is_visible=True)
             .prefetch_related('submission__speakers')
-            .select_related('submission', 'room', 'submission__event')
+            .select_related(
+                'submission', 'room', 'submission__event', 'submission__submission_type', 'submission__track'
+            )
             .order_by('start')
         )
         if getattr(self, 'featured_only', False):
             talks = filter_featured_public_talk_slots(talks)
-        for talk in talks:
-            if self.favs_retrieve and talk.submission and talk.submission.code not in self.talk_ids:
-                continue
-            talk.build_ical(cal, creation_time=creation_time, netloc=netloc)
-
-        return f'{self.event.slug}.ics', 'text/calendar', cal.serialize()
+        talks = [
+            talk
+            for talk in talks
+            # build_ical skips talks without a submission, start or room
+            if talk.submission and talk.start and talk.room
+            if not self.favs_retrieve or talk.submission.code in self.talk_ids
+        ]
+        fragments = self.get_talk_fragments(talks, build)
+
+        # The events of all talks share the time zone of the event
+        timezones = dict.fromkeys(tz for talk in talks for tz in fragments[talk.pk][0])
+        events = [event for talk in talks for event in fragments[talk.pk][1]]
+        head, end, tail = cal.serialize().rpartition('END:VCALENDAR')
+        content = head + ''.join(timezones) + ''.join(events) + end + tail
+        return f'{self.event.slug}.ics', 'text/calendar', content
 
 
 class MyICalExporter(ICalExporter):
@@ -513,3 +650,7 @@ class MyWebcalExporter(BaseCalendarExporter):
     identifier = 'my-webcal'
     verbose_name = 'Subscribe to My ⭐ Sessions in Other Calendar'
     ical_exporter_cls = MyICalExporter
+
+
+# Full public exports of a released schedule, which are the same for every visitor
+CACHED_SCHEDULE_EXPORTERS = (FrabXmlExporter, FrabXCalExporter, FrabJsonExporter, ICalExporter)
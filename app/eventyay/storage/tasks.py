@@ -6,6 +6,7 @@ import channels
 
 from eventyay.celery_app import app
 from eventyay.base.models import ChatEvent
+from eventyay.base.services import chathistory
 from eventyay.base.services.chat import ChatService
 from eventyay.core.tasks import EventTask
 from eventyay.features.live.channels import GROUP_CHAT
@@ -33,8 +34,11 @@ def retrieve_preview_information(event=None, event_id=None):
     if preview_card:
         event.content["preview_card"] = preview_card
         event.save()
+        asgiref.sync.async_to_sync(chathistory.event_changed)(event.serialize_public())
 
-        event_data = asgiref.sync.async_to_sync(ChatService(event).create_event)(
+        event_data = asgiref.sync.async_to_sync(
+            ChatService(event.channel.event).create_event
+        )(
             channel=event.channel,
             event_type=event.event_type,
             content=event.content,
@@ -88,6 +88,13 @@ export default {
 				state.polls.push(poll)
 			}
 		},
+		'api::poll.results'({state}, {id, results}) {
+			// results are broadcast at most once per second, without the rest of the poll
+			const poll = state.polls?.find(q => q.id === id)
+			if (poll) {
+				poll.results = results
+			}
+		},
 		'api::poll.deleted'({state}, {id}) {
 			const pollIndex = state.polls.findIndex(q => q.id === id)
 			if (pollIndex > -1) {
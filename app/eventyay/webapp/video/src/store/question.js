@@ -73,6 +73,14 @@ export default {
 				state.questions.push(question)
 			}
 		},
+		'api::question.scores'({state}, {scores}) {
+			// scores are broadcast at most once per second, only for questions that have been voted on
+			for (const question of state.questions || []) {
+				if (question.id in scores) {
+					question.score = scores[question.id]
+				}
+			}
+		},
 		'api::question.deleted'({state}, {id}) {
 			const questionIndex = state.questions.findIndex(q => q.id === id)
 			if (questionIndex > -1) {
@@ -0,0 +1,107 @@
+"""
+Benchmark of group broadcasts to a large group, with per-socket encoding vs. frames encoded by the sender.
+
+Run from the ``app`` directory with::
+
+    python -m tests.benchmarks.bench_broadcast [members]
+
+All members are consumers in this process with the JSON protocol, and they all get the same message object, like
+with the channel layer. "per socket" encodes the content for every member, like before. "pre-encoded" sends a message
+built with ``broadcast_message`` that is forwarded as it is. The sockets only count the bytes.
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import UTC, datetime
+
+import django
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.tickets.settings')
+django.setup()
+
+import msgspec  # noqa: E402
+
+from eventyay.features.live.consumers import MainConsumer  # noqa: E402
+from eventyay.features.live.frames import broadcast_message  # noqa: E402
+
+
+ROOM = str(uuid.uuid4())
+USER = str(uuid.uuid4())
+OPTIONS = [str(uuid.uuid4()) for i in range(4)]
+
+CHAT_EVENT = {
+    'event_id': 12345,
+    'channel': str(uuid.uuid4()),
+    'sender': USER,
+    'timestamp': datetime(2030, 1, 1, 10, 0, tzinfo=UTC).isoformat(),
+    'event_type': 'channel.message',
+    'content': {'type': 'text', 'body': 'Great talk, thanks! Where can I find the slides?'},
+    'edited': None,
+    'replaces': None,
+    'reactions': {},
+}
+POLL = {
+    'id': str(uuid.uuid4()),
+    'content': 'Which session did you like best?',
+    'state': 'open',
+    'room_id': ROOM,
+    'is_pinned': False,
+    'options': [{'id': o, 'content': f'Session {i}', 'order': i} for i, o in enumerate(OPTIONS)],
+}
+
+BROADCASTS = {
+    'room.reaction': ['room.reaction', {'reactions': {'👏': 54, '❤️': 12}, 'room': ROOM}],
+    'chat.event': ['chat.event', {**CHAT_EVENT, 'users': {}}],
+    'poll.created_or_updated': ['poll.created_or_updated', {'poll': POLL}],
+}
+
+
+def make_consumers(count):
+    received = [0]
+
+    async def base_send(message):
+        received[0] += len(message['text'])
+
+    consumers = []
+    for i in range(count):
+        consumer = MainConsumer()
+        consumer.base_send = base_send
+        consumers.append(consumer)
+    return consumers, received
+
+
+async def per_socket(consumers, message_type, content):
+    for consumer in consumers:
+        await consumer.send_json(content)
+
+
+async def pre_encoded(consumers, message_type, content):
+    # Encoding the frame is part of sending the broadcast
+    message = broadcast_message(message_type, content)
+    for consumer in consumers:
+        await consumer.send_broadcast(message)
+
+
+async def main(members):
+    consumers, received = make_consumers(members)
+    print(f'{"message":24} {"layer bytes":>12} {"frame bytes":>12} {"per socket":>12} {"pre-encoded":>12}')
+    for message_type, content in BROADCASTS.items():
+        timings = []
+        for method in (per_socket, pre_encoded):
+            received[0] = 0
+            start = time.process_time()
+            await method(consumers, message_type, content)
+            timings.append(time.process_time() - start)
+        layer_size = len(msgspec.msgpack.encode(broadcast_message(message_type, content)))
+        print(
+            f'{message_type:24} {layer_size:>12} {received[0] // members:>12} '
+            f'{timings[0] * 1000:>10.1f}ms {timings[1] * 1000:>10.1f}ms'
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
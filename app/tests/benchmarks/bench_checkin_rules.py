@@ -0,0 +1,92 @@
+"""
+Micro-benchmark of check-in rule evaluation, interpreted vs. compiled.
+
+Run from the ``app`` directory with::
+
+    python -m tests.benchmarks.bench_checkin_rules
+
+The rule variables are plain values here, so this measures the overhead of the evaluation itself and not the
+database queries behind variables like ``entries_number``.
+"""
+
+import os
+import timeit
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import django
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.tickets.settings')
+django.setup()
+
+from eventyay.base.services.checkin import get_logic_environment  # noqa: E402
+
+
+NOW = datetime(2030, 1, 1, 10, 0, tzinfo=UTC)
+EVENT = SimpleNamespace(date_from=NOW, date_to=NOW + timedelta(hours=8), date_admission=NOW - timedelta(hours=1))
+DATA = {
+    'now': NOW,
+    'product': 3,
+    'variation': None,
+    'entries_number': 1,
+    'entries_today': 1,
+    'entries_days': 1,
+}
+
+# Rules as created by the graphical rule editor
+RULES = {
+    'product': {
+        'inList': [
+            {'var': 'product'},
+            {'objectList': [{'lookup': ['product', '1', 'A']}, {'lookup': ['product', '3', 'B']}]},
+        ]
+    },
+    'admission window': {
+        'and': [
+            {'isAfter': [{'var': 'now'}, {'buildTime': ['date_admission']}, 15]},
+            {'isBefore': [{'var': 'now'}, {'buildTime': ['date_to']}, None]},
+        ]
+    },
+    'entry limits': {
+        'or': [
+            {'<': [{'var': 'entries_number'}, 3]},
+            {'and': [{'<': [{'var': 'entries_today'}, 2]}, {'<': [{'var': 'entries_days'}, 2]}]},
+        ]
+    },
+    'combined': {
+        'or': [
+            {
+                'and': [
+                    {'inList': [{'var': 'product'}, {'objectList': [{'lookup': ['product', '3', 'B']}]}]},
+                    {'isAfter': [{'var': 'now'}, {'buildTime': ['custom', '2029-12-31T00:00:00Z']}, None]},
+                    {'<': [{'var': 'entries_today'}, 2]},
+                ]
+            },
+            {
+                'and': [
+                    {'inList': [{'var': 'variation'}, {'objectList': [{'lookup': ['variation', '7', 'VIP']}]}]},
+                    {'isBefore': [{'var': 'now'}, {'buildTime': ['date_from']}, 30]},
+                ]
+            },
+        ]
+    },
+}
+
+
+def main(number=20000):
+    logic = get_logic_environment(EVENT)
+    print(f'{"rule set":<20} {"interpreted":>14} {"compiled":>14} {"speedup":>8}')
+    for name, rules in RULES.items():
+        compiled = logic.compile(rules)
+        assert compiled(DATA) == logic.apply(rules, DATA)
+        interpreted_time = timeit.timeit(lambda: logic.apply(rules, DATA), number=number) / number
+        compiled_time = timeit.timeit(lambda: compiled(DATA), number=number) / number
+        print(
+            f'{name:<20} {interpreted_time * 1e6:>11.2f} µs {compiled_time * 1e6:>11.2f} µs '
+            f'{interpreted_time / compiled_time:>7.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Load test of poll voting: thousands of concurrent voters against the in-memory channel layer.
+
+Run from the ``app`` directory with::
+
+    python -m tests.benchmarks.bench_poll_votes [voters] [seconds]
+
+Redis is replaced by fakeredis (with lupa for the Lua scripts) and the database by a dictionary, so this measures the
+vote handling and the number of broadcasts, not the latency of redis or the database.
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import django
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.tickets.settings')
+django.setup()
+
+import fakeredis  # noqa: E402
+from channels.layers import InMemoryChannelLayer  # noqa: E402
+
+from eventyay.base.services import poll as poll_service  # noqa: E402
+from eventyay.features.live.channels import GROUP_ROOM_POLL_MANAGE  # noqa: E402
+from eventyay.features.live.modules.poll import PollModule  # noqa: E402
+
+
+ROOM = uuid.uuid4()
+POLL = str(uuid.uuid4())
+OPTIONS = [str(uuid.uuid4()) for i in range(4)]
+
+
+class CountingChannelLayer(InMemoryChannelLayer):
+    def __init__(self, **kwargs):
+        super().__init__(capacity=1000, **kwargs)
+        self.group_sends = Counter()
+
+    async def group_send(self, group, message):
+        self.group_sends[message['type']] += 1
+        await super().group_send(group, message)
+
+
+class Consumer:
+    def __init__(self, channel_layer, channel_name, user):
+        self.channel_layer = channel_layer
+        self.channel_name = channel_name
+        self.user = user
+        self.errors = []
+
+    async def send_success(self, data=None):
+        pass
+
+    async def send_error(self, code, message=None):
+        self.errors.append((code, message))
+
+
+def patch_backends():
+    redis = fakeredis.FakeAsyncRedis()
+    database = {}
+
+    @asynccontextmanager
+    async def aredis(shard_key=None):
+        yield redis
+
+    async def load_poll(pk, room):
+        poll = {
+            'id': POLL,
+            'content': 'Which session did you like best?',
+            'state': 'open',
+            'room_id': str(ROOM),
+            'is_pinned': False,
+            'options': [{'id': o, 'content': o, 'order': i} for i, o in enumerate(OPTIONS)],
+        }
+        return poll, dict.fromkeys(OPTIONS, 0), {}
+
+    async def store_votes(pk, votes):
+        await asyncio.sleep(0.005)  # one round trip to the database per batch
+        database.update(votes)
+
+    poll_service.aredis = aredis
+    poll_service._load_poll = load_poll
+    poll_service._store_votes = store_votes
+    return database
+
+
+async def vote(channel_layer, user_id, delay):
+    await asyncio.sleep(delay)
+    consumer = Consumer(channel_layer, await channel_layer.new_channel(), SimpleNamespace(pk=user_id))
+    module = PollModule(consumer)
+    module.room = SimpleNamespace(pk=ROOM)
+    module.module_config = {'active': True}
+    body = {'room': str(ROOM), 'id': POLL, 'options': [OPTIONS[user_id % len(OPTIONS)]]}
+    # Skip the room and permission lookups of the command decorators
+    await PollModule.vote.__wrapped__.__wrapped__(module, body)
+    return consumer.errors
+
+
+async def main(voters, seconds):
+    database = patch_backends()
+    channel_layer = CountingChannelLayer()
+    moderator = await channel_layer.new_channel()
+    await channel_layer.group_add(GROUP_ROOM_POLL_MANAGE.format(id=ROOM), moderator)
+
+    start = time.perf_counter()
+    errors = await asyncio.gather(*(vote(channel_layer, i, seconds * i / voters) for i in range(voters)))
+    duration = time.perf_counter() - start
+
+    updates = []
+    while True:
+        try:
+            updates.append(await asyncio.wait_for(channel_layer.receive(moderator), 0.1))
+        except TimeoutError:
+            break
+    final = updates[-1]['results'] if updates else {}
+    expected = Counter(OPTIONS[i % len(OPTIONS)] for i in range(voters))
+
+    print(f'{voters} voters over {seconds}s, finished after {duration:.2f}s')
+    print(f'errors: {sum(len(e) for e in errors)}')
+    print(f'group sends: {sum(channel_layer.group_sends.values())} (one per vote and group before: {voters * 3})')
+    print(f'result updates received by a moderator: {len(updates)}')
+    print(f'final results correct: {final == expected}')
+    print(f'votes persisted: {len(database)}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000, float(sys.argv[2]) if len(sys.argv) > 2 else 3))
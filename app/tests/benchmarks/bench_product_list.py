@@ -0,0 +1,97 @@
+"""
+Benchmark of front page requests per second of an event with many products, with and without the cached product list.
+
+Run from the ``app`` directory with::
+
+    python -m tests.benchmarks.bench_product_list [products] [seconds]
+
+This creates a test database like the test suite does and needs the same services (database, redis). The requests
+are made one after another by the test client, so this measures how much work a single request takes. During a rush,
+the uncached product list is additionally computed by every worker at the same time.
+"""
+
+import datetime
+import os
+import sys
+import time
+from decimal import Decimal
+from unittest import mock
+
+import django
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.tickets.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils.timezone import now  # noqa: E402
+from django_scopes import scopes_disabled  # noqa: E402
+
+from eventyay.base.models import Event, Organizer, Product, ProductCategory, Quota  # noqa: E402
+from eventyay.presale.views import event as event_views  # noqa: E402
+
+
+@scopes_disabled()
+def create_event(products):
+    organizer = Organizer.objects.create(name='Benchmark', slug='bench')
+    event = Event.objects.create(
+        organizer=organizer,
+        name='Benchmark',
+        slug='bench',
+        date_from=now() + datetime.timedelta(days=30),
+        live=True,
+    )
+    categories = [ProductCategory.objects.create(event=event, name=f'Category {i}', position=i) for i in range(10)]
+    for i in range(products):
+        product = Product.objects.create(
+            event=event,
+            category=categories[i % len(categories)],
+            name=f'Ticket {i}',
+            default_price=Decimal('23.00') + i,
+            position=i,
+        )
+        quota = Quota.objects.create(event=event, name=f'Quota {i}', size=100)
+        quota.products.add(product)
+    return event
+
+
+def requests_per_second(url, seconds):
+    client = Client()
+    client.get(url)
+    count = 0
+    start = time.monotonic()
+    while time.monotonic() - start < seconds:
+        response = client.get(url)
+        assert response.status_code == 200
+        count += 1
+    return count / (time.monotonic() - start)
+
+
+def main(products, seconds):
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        event = create_event(products)
+        url = f'/{event.organizer.slug}/{event.slug}/'
+
+        def uncached(event, subevent=None, voucher=None, channel='web'):
+            return event_views.get_grouped_products(event, subevent, voucher=voucher, channel=channel)
+
+        with mock.patch.object(event_views, 'get_cached_grouped_products', uncached):
+            before = requests_per_second(url, seconds)
+        after = requests_per_second(url, seconds)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print(f'{products} products')
+    print(f'{"uncached":12} {before:>8.1f} requests/s')
+    print(f'{"cached":12} {after:>8.1f} requests/s')
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 10,
+    )
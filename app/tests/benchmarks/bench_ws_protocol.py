@@ -0,0 +1,121 @@
+"""
+Benchmark of the websocket protocols of the live consumer: bytes per frame and CPU time per broadcast.
+
+Run from the ``app`` directory with::
+
+    python -m tests.benchmarks.bench_ws_protocol [sockets]
+
+Every broadcast is handed to all consumers as the same message, like the channel layer does for the consumers of a
+group within one server process. "per socket" encodes the frame for every consumer, like before, "shared" uses
+``send_broadcast``. The sockets themselves are replaced by a function that only counts the bytes.
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import UTC, datetime
+
+import django
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.tickets.settings')
+django.setup()
+
+from eventyay.features.live.consumers import MainConsumer  # noqa: E402
+from eventyay.features.live.frames import PROTOCOLS  # noqa: E402
+
+
+NOW = datetime(2030, 1, 1, 10, 0, tzinfo=UTC)
+CHANNEL = uuid.uuid4()
+
+MESSAGES = {
+    'room.reaction': ['room.reaction', {'room': str(uuid.uuid4()), 'reactions': {'👏': 12, '❤️': 4, '😂': 1}}],
+    'poll.results': [
+        'poll.results',
+        {'room': str(uuid.uuid4()), 'id': str(uuid.uuid4()), 'results': {str(uuid.uuid4()): i * 17 for i in range(6)}},
+    ],
+    'chat page (50 events)': ['success', {
+        'results': [
+            {
+                'event_id': 1000 + i,
+                'channel': CHANNEL,
+                'sender': uuid.uuid4(),
+                'type': 'chat.event',
+                'timestamp': NOW,
+                'event_type': 'channel.message',
+                'content': {'type': 'text', 'body': f'Message number {i}, with a bit of text to make it realistic.'},
+                'edited': None,
+                'replaces': None,
+                'reactions': {'👍': [str(uuid.uuid4())]} if i % 5 == 0 else {},
+            }
+            for i in range(50)
+        ],
+        'users': {
+            str(uuid.uuid4()): {'id': str(uuid.uuid4()), 'profile': {'display_name': f'Attendee {i}'}, 'badges': []}
+            for i in range(30)
+        },
+    }],
+    'room list (40 rooms)': ['event.updated', {
+        'rooms': [
+            {
+                'id': str(uuid.uuid4()),
+                'name': f'Room {i}',
+                'description': 'A room for talks, discussions and everything in between.',
+                'picture': None,
+                'permissions': ['room:view', 'room:chat.read', 'room:chat.join', 'room:question.ask'],
+                'force_join': False,
+                'modules': [{'type': 'chat.native', 'config': {'volatile': True}}, {'type': 'livestream.native'}],
+                'schedule_data': None,
+                'users': 100 + i,
+            }
+            for i in range(40)
+        ],
+    }],
+}
+
+
+def make_consumers(count, protocol):
+    received = [0]
+
+    async def base_send(message):
+        received[0] += len(message.get('text') or message.get('bytes'))
+
+    consumers = []
+    for i in range(count):
+        consumer = MainConsumer()
+        consumer.base_send = base_send
+        consumer.protocol = protocol
+        consumers.append(consumer)
+    return consumers, received
+
+
+async def broadcast(consumers, content, shared):
+    message = {'type': 'benchmark'}
+    for consumer in consumers:
+        if shared:
+            await consumer.send_broadcast(message, content)
+        else:
+            await consumer.send_json(content)
+
+
+async def main(sockets):
+    print(f'{"message":24} {"protocol":16} {"bytes/frame":>12} {"per socket":>12} {"shared":>12}')
+    for name, content in MESSAGES.items():
+        for protocol in PROTOCOLS:
+            consumers, received = make_consumers(sockets, protocol)
+            timings = {}
+            for shared in (False, True):
+                received[0] = 0
+                start = time.process_time()
+                for i in range(5):
+                    await broadcast(consumers, content, shared)
+                timings[shared] = (time.process_time() - start) / 5
+            size = received[0] / 5 / sockets
+            per_socket_ms, shared_ms = timings[False] * 1000, timings[True] * 1000
+            print(f'{name:24} {protocol:16} {size:>12.0f} {per_socket_ms:>10.1f}ms {shared_ms:>10.1f}ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
@@ -0,0 +1,57 @@
+import sys
+from contextlib import asynccontextmanager
+
+import django_redis
+import fakeredis
+import pytest
+from django_redis import get_redis_connection
+
+
+@pytest.fixture
+def fake_redis(monkeypatch, settings):
+    """
+    Returns a function that makes the given modules use one in-memory redis through ``get_redis_connection`` and
+    returns it. Since ``HAS_REDIS`` is turned on, all modules that already imported ``get_redis_connection`` use it
+    as well.
+    """
+    settings.HAS_REDIS = True
+    fake = fakeredis.FakeStrictRedis()
+    for name, module in list(sys.modules.items()):
+        if name.startswith('eventyay') and getattr(module, 'get_redis_connection', None) is get_redis_connection:
+            monkeypatch.setattr(module, 'get_redis_connection', lambda name: fake)
+    monkeypatch.setattr(django_redis, 'get_redis_connection', lambda name: fake)
+
+    def use_in(*modules):
+        for module in modules:
+            monkeypatch.setattr(module, 'get_redis_connection', lambda name: fake)
+        return fake
+
+    return use_in
+
+
+@pytest.fixture
+def fake_aredis(monkeypatch):
+    """
+    Returns a function that makes the given modules use one in-memory redis through ``aredis`` and returns it.
+    """
+    fake = fakeredis.FakeAsyncRedis()
+
+    @asynccontextmanager
+    async def aredis(shard_key=None):
+        yield fake
+
+    def use_in(*modules):
+        for module in modules:
+            monkeypatch.setattr(module, 'aredis', aredis)
+        return fake
+
+    return use_in
+
+
+@pytest.fixture
+def async_db(monkeypatch):
+    """
+    Lets code wrapped in ``database_sync_to_async`` use the transaction of a regular ``django_db`` test. Called
+    through ``async_to_sync`` from the test, it runs in the thread of the test anyway, but would close the connection.
+    """
+    monkeypatch.setattr('channels.db.close_old_connections', lambda: None)
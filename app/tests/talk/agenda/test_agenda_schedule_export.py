@@ -17,10 +17,12 @@ from lxml import etree
 from django.utils import timezone
 
 from eventyay.base.models.submission import SubmissionFavourite
-from eventyay.agenda.tasks import export_schedule_html
+from eventyay.agenda.tasks import build_schedule_exports, export_schedule_html
+from eventyay.agenda.views.utils import clear_schedule_caches
 from eventyay.base.models import Event
 from eventyay.base.models import Resource
 from eventyay.common.views.helpers import build_login_url_with_next
+from eventyay.schedule.exporters import FrabJsonExporter
 
 
 @pytest.mark.skipif(
@@ -103,6 +105,51 @@ def test_schedule_frab_xml_export(
     assert response.status_code == 304
 
 
+@pytest.mark.django_db
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+def test_schedule_export_not_modified_until_changed(slot, client):
+    url = reverse(
+        "agenda:export.schedule.xml", kwargs={"event": slot.submission.event.slug}
+    )
+    response = client.get(url, follow=True)
+    etag = response["ETag"]
+    last_modified = response["Last-Modified"]
+    assert response.status_code == 200
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag, follow=True)
+    assert response.status_code == 304
+    response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified, follow=True)
+    assert response.status_code == 304
+
+    clear_schedule_caches(slot.submission.event)
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag, follow=True)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+def test_schedule_export_served_from_built_exports(slot, client, monkeypatch):
+    event = slot.submission.event
+    build_schedule_exports.apply(kwargs={"schedule_pk": slot.schedule.pk})
+
+    def broken_render(self, **kwargs):
+        raise Exception("The export should have been served from the cache")
+
+    monkeypatch.setattr(FrabJsonExporter, "render", broken_render)
+    response = client.get(
+        reverse("agenda:export.schedule.json", kwargs={"event": event.slug})
+        + f"?lang={event.locale}",
+        follow=True,
+    )
+    assert response.status_code == 200
+    assert slot.submission.title in response.text
+
+
 @pytest.mark.django_db
 def test_schedule_frab_xml_export_control_char(
     slot, client, django_assert_max_num_queries
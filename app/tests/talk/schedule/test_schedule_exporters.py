@@ -1,9 +1,16 @@
 import datetime as dt
+from urllib.parse import urlparse
 
 import pytest
+import vobject
+from django.test import override_settings
 from django_scopes import scope
 
-from eventyay.schedule.exporters import ScheduleData
+from eventyay.common.urls import get_base_url
+from eventyay.schedule.exporters import FrabJsonExporter, ICalExporter, ScheduleData
+
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
 
 
 def test_schedule_data_empty_methods():
@@ -36,3 +43,45 @@ def test_schedule_data_out_of_order_slots(event, slot, other_slot):
         slot.save()
         other_slot.save()
         assert ScheduleData(event=event, schedule=slot.schedule).data
+
+
+@pytest.mark.django_db
+@override_settings(CACHES=LOCMEM_CACHES)
+def test_talk_fragments_reused_until_talk_changes(event, slot, other_slot, monkeypatch):
+    serialized = []
+    serialize_talk = FrabJsonExporter.serialize_talk
+
+    def counting_serialize_talk(self, talk, room):
+        serialized.append(talk.submission.code)
+        return serialize_talk(self, talk, room)
+
+    monkeypatch.setattr(FrabJsonExporter, "serialize_talk", counting_serialize_talk)
+    with scope(event=event):
+        content = FrabJsonExporter(event, schedule=slot.schedule).render()
+        assert FrabJsonExporter(event, schedule=slot.schedule).render() == content
+        assert len(serialized) == 2
+
+        slot.submission.title = "A changed title"
+        slot.submission.save()
+        content = FrabJsonExporter(event, schedule=slot.schedule).render()[2]
+
+    assert serialized[2:] == [slot.submission.code]
+    assert "A changed title" in content
+
+
+@pytest.mark.django_db
+@override_settings(CACHES=LOCMEM_CACHES)
+def test_ical_export_from_fragments_matches_full_calendar(event, slot, other_slot):
+    with scope(event=event):
+        ICalExporter(event, schedule=slot.schedule).render()
+        content = ICalExporter(event, schedule=slot.schedule).render()[2]
+
+        cal = vobject.iCalendar()
+        cal.add("prodid").value = f"-//pretalx//{urlparse(get_base_url(event)).netloc}//"
+        for talk in slot.schedule.talks.filter(is_visible=True).order_by("start"):
+            talk.build_ical(cal)
+
+    def without_dtstamp(ical):
+        return [line for line in ical.splitlines() if not line.startswith("DTSTAMP")]
+
+    assert without_dtstamp(content) == without_dtstamp(cal.serialize())
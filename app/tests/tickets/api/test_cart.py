@@ -7,11 +7,13 @@ import pytest
 from django.core.files.base import ContentFile
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
-import datetime
-UTC = datetime.timezone.utc
 
 from eventyay.base.models import Question, SeatingPlan
 from eventyay.base.models.orders import CartPosition
+from eventyay.base.services import quotacounters, quotas
+
+
+UTC = datetime.timezone.utc
 
 
 @pytest.fixture
@@ -667,6 +669,25 @@ def test_cartpos_create_quota_validation(token_client, organizer, event, item, q
     assert resp.data == ['There is not enough quota available on quota "Budget Quota" to perform the operation.']
 
 
+@pytest.mark.django_db
+def test_cartpos_create_updates_quota_counters(
+    token_client, organizer, event, item, quota, question, fake_redis, settings, django_capture_on_commit_callbacks
+):
+    settings.QUOTA_COUNTER_MODE = True
+    redis = fake_redis(quotacounters, quotas)
+    res = copy.deepcopy(CARTPOS_CREATE_PAYLOAD)
+    del res['item']
+    res['product'] = item.pk
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = token_client.post(
+            '/api/v1/organizers/{}/events/{}/cartpositions/'.format(organizer.slug, event.slug),
+            format='json',
+            data=res,
+        )
+    assert resp.status_code == 201
+    assert redis.zscore(f'quotas:{event.pk}:carts:{quota.pk}', resp.data['id']) is not None
+
+
 @pytest.fixture
 def seat(event, organizer, item):
     SeatingPlan.objects.create(name='Plan', organizer=organizer, layout='{}')
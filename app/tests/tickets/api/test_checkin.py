@@ -1,4 +1,5 @@
 import datetime
+import gzip
 import time
 from decimal import Decimal
 from unittest import mock
@@ -7,15 +8,19 @@ from unittest import mock
 # use urlib instead
 from urllib.parse import quote as urlquote
 
+import msgspec
 import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
 from django.core.files.base import ContentFile
 from django.utils.timezone import now
 from django_countries.fields import Country
 from django_scopes import scopes_disabled
 from i18nfield.strings import LazyI18nString
 import datetime
-UTC = datetime.timezone.utc
 
+from eventyay.api import consumers, routing
 from eventyay.api.serializers.product import QuestionSerializer
 from eventyay.base.models import (
     Checkin,
@@ -24,6 +29,10 @@ from eventyay.base.models import (
     Order,
     OrderPosition,
 )
+from eventyay.base.services import checkinstatus
+
+
+UTC = datetime.timezone.utc
 
 
 @pytest.fixture
@@ -657,6 +666,75 @@ def test_status(token_client, organizer, event, clist_all, item, other_item, ord
     ]
 
 
+@pytest.mark.django_db
+def test_status_not_modified(
+    token_client, organizer, event, clist_all, item, other_item, order, fake_redis, settings, monkeypatch,
+    django_capture_on_commit_callbacks
+):
+    settings.CHECKIN_STATUS_COUNTERS = True
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    monkeypatch.setattr(checkinstatus, 'request_reconcile', lambda event_id: None)
+    fake_redis(checkinstatus)
+    with scopes_disabled():
+        checkinstatus.reconcile(event)
+    url = f'/api/v1/organizers/{organizer.slug}/events/{event.slug}/checkinlists/{clist_all.pk}/status/'
+
+    resp = token_client.get(url)
+    assert resp.status_code == 200
+    assert resp.data['checkin_count'] == 0
+    etag = resp['ETag']
+
+    resp = token_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
+    assert resp['ETag'] == etag
+
+    with scopes_disabled(), django_capture_on_commit_callbacks(execute=True):
+        Checkin.objects.create(position=order.positions.first(), list=clist_all)
+    resp = token_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert resp.data['checkin_count'] == 1
+    assert resp['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_status_stream(
+    token_client, organizer, event, clist_all, order, fake_redis, settings, monkeypatch,
+    django_capture_on_commit_callbacks
+):
+    settings.CHECKIN_STATUS_COUNTERS = True
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    monkeypatch.setattr(checkinstatus, 'request_reconcile', lambda event_id: None)
+    monkeypatch.setattr(consumers, 'STATUS_PUSH_INTERVAL', 0)
+    fake_redis(checkinstatus)
+    with scopes_disabled():
+        checkinstatus.reconcile(event)
+    resp = token_client.get(
+        f'/api/v1/organizers/{organizer.slug}/events/{event.slug}/checkinlists/{clist_all.pk}/status/'
+    )
+    version = int(resp['ETag'].strip('"').split('-')[0])
+    stream = resp['X-Status-Stream']
+    assert stream.startswith('ws://testserver/ws/checkinstatus/')
+
+    async def listen():
+        app = URLRouter(routing.websocket_urlpatterns)
+        communicator = WebsocketCommunicator(app, stream.removeprefix('ws://testserver'))
+        assert (await communicator.connect())[0]
+        assert await communicator.receive_json_from() == {'list': clist_all.pk, 'version': version}
+
+        await sync_to_async(checkin)()
+        assert await communicator.receive_json_from() == {'list': clist_all.pk, 'version': version + 1}
+        await communicator.disconnect()
+
+        communicator = WebsocketCommunicator(app, f'/ws/checkinstatus/{clist_all.pk}/')
+        assert not (await communicator.connect())[0]
+
+    def checkin():
+        with scopes_disabled(), django_capture_on_commit_callbacks(execute=True):
+            Checkin.objects.create(position=order.positions.first(), list=clist_all)
+
+    async_to_sync(listen)()
+
+
 @pytest.mark.django_db
 def test_custom_datetime(token_client, organizer, clist, event, order):
     dt = now() - datetime.timedelta(days=1)
@@ -1257,3 +1335,135 @@ def test_question_upload(token_client, organizer, clist, event, order, question)
     with scopes_disabled():
         assert order.positions.first().answers.get(question=question[0]).answer.startswith('file://')
         assert order.positions.first().answers.get(question=question[0]).file
+
+
+def _sync(client, organizer, event, clist, cursor=None, **headers):
+    url = f'/api/v1/organizers/{organizer.slug}/events/{event.slug}/checkinlists/{clist.pk}/positions/sync/'
+    return client.get(url, {'cursor': cursor} if cursor else {}, **headers)
+
+
+@pytest.mark.django_db
+def test_sync_snapshot_and_delta(token_client, organizer, clist, event, order, item):
+    with scopes_disabled():
+        p1, p2 = order.positions.order_by('positionid')
+
+    resp = _sync(token_client, organizer, event, clist)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data['full']
+    assert [p['secret'] for p in data['positions']] == [p1.secret]
+    assert data['positions'][0]['attendee_name'] == 'Peter'
+    assert data['removed'] == []
+
+    data = _sync(token_client, organizer, event, clist, data['cursor']).json()
+    assert not data['full']
+    assert data['positions'] == []
+
+    with scopes_disabled():
+        Checkin.objects.create(position=p1, list=clist)
+        p2.product = item
+        p2.save()
+        event.revoked_secrets.create(secret='revoked')
+    data = _sync(token_client, organizer, event, clist, data['cursor']).json()
+    assert [p['id'] for p in data['positions']] == [p1.pk, p2.pk]
+    assert len(data['positions'][0]['checkins']) == 1
+    assert data['revoked_secrets'] == ['revoked']
+
+    with scopes_disabled():
+        order.status = Order.STATUS_CANCELED
+        order.save()
+    data = _sync(token_client, organizer, event, clist, data['cursor']).json()
+    assert data['positions'] == []
+    assert data['removed'] == [p1.pk, p2.pk]
+
+
+@pytest.mark.django_db
+def test_sync_invalid_cursor(token_client, organizer, clist, event, order):
+    resp = _sync(token_client, organizer, event, clist, 'foo')
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_sync_list_changed(token_client, organizer, clist, event, order, other_item):
+    cursor = _sync(token_client, organizer, event, clist).json()['cursor']
+    with scopes_disabled():
+        clist.limit_products.add(other_item)
+    data = _sync(token_client, organizer, event, clist, cursor).json()
+    assert data['full']
+    assert len(data['positions']) == 2
+
+
+@pytest.mark.django_db
+def test_sync_msgpack_gzip(token_client, organizer, clist, event, order):
+    resp = _sync(
+        token_client, organizer, event, clist, HTTP_ACCEPT='application/msgpack', HTTP_ACCEPT_ENCODING='gzip'
+    )
+    assert resp.status_code == 200
+    assert resp['Content-Type'] == 'application/msgpack'
+    assert resp['Content-Encoding'] == 'gzip'
+    data = msgspec.msgpack.decode(gzip.decompress(resp.content))
+    assert data['full']
+    assert len(data['positions']) == 1
+
+
+def _redeem_batch(client, organizer, scans, **kwargs):
+    return client.post(
+        f'/api/v1/organizers/{organizer.slug}/checkin/redeem-batch/',
+        {'scans': scans, **kwargs},
+        format='json',
+    )
+
+
+@pytest.mark.django_db
+def test_redeem_batch(token_client, organizer, clist, event, order):
+    with scopes_disabled():
+        p1, p2 = order.positions.order_by('positionid')
+    scans = [
+        {'secret': p1.secret, 'list': clist.pk, 'nonce': 'a', 'datetime': '2017-12-25T12:00:00Z'},
+        {'secret': p2.secret, 'list': clist.pk, 'nonce': 'b', 'datetime': '2017-12-25T12:00:01Z'},
+        {'secret': 'unknown', 'list': clist.pk, 'nonce': 'c', 'datetime': '2017-12-25T12:00:02Z'},
+    ]
+    resp = _redeem_batch(token_client, organizer, scans)
+    assert resp.status_code == 200
+    assert [(r['status'], r.get('reason')) for r in resp.data['results']] == [
+        ('ok', None),
+        ('error', 'product'),
+        ('error', 'invalid'),
+    ]
+    assert resp.data['results'][0]['position'] == p1.pk
+    with scopes_disabled():
+        assert p1.checkins.count() == 1
+        assert order.all_logentries().filter(action_type='eventyay.event.checkin.denied').exists()
+
+    # Uploading the same scans again does not create any more check-ins
+    resp = _redeem_batch(token_client, organizer, scans)
+    assert resp.data['results'][0]['status'] == 'ok'
+    with scopes_disabled():
+        assert p1.checkins.count() == 1
+
+
+@pytest.mark.django_db
+def test_redeem_batch_same_ticket(token_client, organizer, clist, event, order):
+    with scopes_disabled():
+        p1 = order.positions.get(positionid=1)
+    scans = [
+        {'secret': p1.secret, 'list': clist.pk, 'type': 'exit', 'datetime': '2017-12-25T13:00:00Z'},
+        {'secret': p1.secret, 'list': clist.pk, 'datetime': '2017-12-25T12:00:00Z'},
+        {'secret': p1.secret, 'list': clist.pk, 'datetime': '2017-12-25T14:00:00Z'},
+        {'secret': p1.secret, 'list': clist.pk, 'datetime': '2017-12-25T15:00:00Z'},
+    ]
+    resp = _redeem_batch(token_client, organizer, scans)
+    assert [(r['status'], r.get('reason')) for r in resp.data['results']] == [
+        ('ok', None),
+        ('ok', None),
+        ('ok', None),
+        ('error', 'checkout_required'),
+    ]
+    with scopes_disabled():
+        assert p1.checkins.count() == 3
+
+
+@pytest.mark.django_db
+def test_redeem_batch_unknown_list(token_client, organizer, clist, event, order):
+    resp = _redeem_batch(token_client, organizer, [{'secret': 'foo', 'list': clist.pk + 1000}])
+    assert resp.status_code == 400
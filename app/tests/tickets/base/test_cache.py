@@ -55,3 +55,23 @@ class CacheTest(TestCase):
         }
         self.cache.set_many(inp)
         self.assertEqual(inp, self.cache.get_many(inp.keys()))
+
+    def test_get_or_refresh(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(self.cache.get_or_refresh(self.testkey, compute), 1)
+        self.assertEqual(self.cache.get_or_refresh(self.testkey, compute), 1)
+        self.cache.clear()
+        self.assertEqual(self.cache.get_or_refresh(self.testkey, compute), 2)
+
+    def test_get_or_refresh_serves_stale_while_locked(self):
+        self.cache.get_or_refresh(self.testkey, lambda: 'old', timeout=0)
+        # Another request is computing the new value right now
+        django_cache.add(self.cache._prefix_key(self.testkey) + ':lock', 1)
+        self.assertEqual(self.cache.get_or_refresh(self.testkey, lambda: 'new'), 'old')
+        django_cache.delete(self.cache._prefix_key(self.testkey) + ':lock')
+        self.assertEqual(self.cache.get_or_refresh(self.testkey, lambda: 'new'), 'new')
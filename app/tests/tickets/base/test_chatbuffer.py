@@ -0,0 +1,125 @@
+import json
+from datetime import timedelta
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.utils.timezone import now
+
+from eventyay.base.models import Channel, ChatEvent, Event, Organizer, User
+from eventyay.base.models.chat import ChatEventNotification
+from eventyay.base.services import chatbuffer
+from eventyay.base.services.chat import ChatService
+
+
+@pytest.fixture
+def redis(fake_aredis, async_db, monkeypatch):
+    monkeypatch.setattr(chatbuffer, 'start_flusher', lambda: None)
+    return fake_aredis(chatbuffer)
+
+
+@pytest.fixture
+def channel():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+    return Channel.objects.create(event=event)
+
+
+def _event(channel, event_id, sender, timestamp):
+    return {
+        'event_id': event_id,
+        'channel': str(channel.pk),
+        'sender': str(sender.pk),
+        'type': 'chat.event',
+        'timestamp': timestamp.isoformat(),
+        'event_type': 'channel.message',
+        'content': {'type': 'text', 'body': f'Message {event_id}'},
+        'edited': None,
+        'replaces': None,
+        'reactions': {},
+    }
+
+
+@pytest.mark.django_db
+def test_flush_buffer(redis, channel):
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    timestamp = now() - timedelta(minutes=5)
+    async_to_sync(chatbuffer.append_event)(_event(channel, 1, user, timestamp))
+    async_to_sync(chatbuffer.append_event)(_event(channel, 2, user, timestamp))
+    async_to_sync(chatbuffer.append_notifications)(2, [str(user.pk)])
+
+    pending = async_to_sync(chatbuffer.pending_events)(channel.pk, 2)
+    assert [e['event_id'] for e in pending] == [1]
+
+    chatbuffer.flush_chat_buffer(sender=None)
+    assert list(ChatEvent.objects.values_list('id', flat=True).order_by('id')) == [1, 2]
+    assert ChatEvent.objects.get(id=1).timestamp == timestamp
+    assert ChatEventNotification.objects.get().chat_event_id == 2
+    assert async_to_sync(redis.xlen)(chatbuffer.KEY_STREAM) == 0
+
+
+@pytest.mark.django_db
+def test_flush_twice(redis, channel):
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    event = _event(channel, 1, user, now())
+    async_to_sync(chatbuffer.append_event)(event)
+    # A flusher died after writing the event, but before removing it from the stream
+    async_to_sync(chatbuffer._store)(async_to_sync(redis.xrange)(chatbuffer.KEY_STREAM))
+
+    chatbuffer.flush_chat_buffer(sender=None)
+    assert ChatEvent.objects.count() == 1
+    assert async_to_sync(redis.xlen)(chatbuffer.KEY_STREAM) == 0
+
+
+@pytest.mark.django_db
+def test_notifications_replayed(redis, channel):
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    async_to_sync(chatbuffer.append_event)(_event(channel, 1, user, now()))
+    async_to_sync(chatbuffer.append_notifications)(1, [str(user.pk)])
+    # A flusher died after writing the notification, but before removing it from the stream
+    async_to_sync(chatbuffer._store)(async_to_sync(redis.xrange)(chatbuffer.KEY_STREAM))
+
+    chatbuffer.flush_chat_buffer(sender=None)
+    assert ChatEventNotification.objects.filter(chat_event_id=1, recipient=user).count() == 1
+    assert async_to_sync(redis.xlen)(chatbuffer.KEY_STREAM) == 0
+
+
+@pytest.mark.django_db
+def test_pending_events_skip_membership(redis, channel):
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    join = _event(channel, 2, user, now())
+    join['event_type'] = 'channel.member'
+    join['content'] = {'membership': 'join', 'user': {'id': str(user.pk)}}
+    async_to_sync(chatbuffer.append_event)(_event(channel, 1, user, now()))
+    async_to_sync(chatbuffer.append_event)(join)
+    pending = async_to_sync(chatbuffer.pending_events)(channel.pk, None)
+
+    service = ChatService(channel.event)
+    events = async_to_sync(service._get_events)(channel, None, 50, buffered_events=pending)
+    assert [e['event_id'] for e in events] == [1, 2]
+    events = async_to_sync(service._get_events)(channel, None, 50, skip_membership=True, buffered_events=pending)
+    assert [e['event_id'] for e in events] == [1]
+
+
+@pytest.mark.django_db
+def test_unwritable_entries_are_dead_lettered(redis, channel):
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    broken = _event(channel, 2, user, now())
+    broken['sender'] = 'nobody'
+    async_to_sync(chatbuffer.append_event)(_event(channel, 1, user, now()))
+    async_to_sync(chatbuffer.append_event)(broken)
+    async_to_sync(redis.xadd)(chatbuffer.KEY_STREAM, {'event': '{"event_id": 3'})
+    async_to_sync(chatbuffer.append_notifications)(1, [str(user.pk)])
+
+    chatbuffer.flush_chat_buffer(sender=None)
+    assert list(ChatEvent.objects.values_list('id', flat=True)) == [1]
+    assert ChatEventNotification.objects.get().chat_event_id == 1
+    assert async_to_sync(redis.xlen)(chatbuffer.KEY_STREAM) == 0
+
+    dead = [fields for entry_id, fields in async_to_sync(redis.xrange)(chatbuffer.KEY_DEAD)]
+    assert [json.loads(fields[b'event'])['event_id'] for fields in dead[:1]] == [2]
+    assert dead[1][b'event'] == b'{"event_id": 3'
+    assert all(fields[b'error'] for fields in dead)
+
+    # Nothing is retried
+    chatbuffer.flush_chat_buffer(sender=None)
+    assert async_to_sync(redis.xlen)(chatbuffer.KEY_DEAD) == 2
@@ -0,0 +1,82 @@
+import asyncio
+from collections import defaultdict
+
+import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+
+from eventyay.base.services import chatbuffer, chatfanout
+from eventyay.features.live.channels import GROUP_USER
+
+
+@pytest.fixture
+def backends(fake_aredis, monkeypatch):
+    channel_layer = InMemoryChannelLayer()
+    buffered = []
+
+    async def append_notifications(event_id, user_ids):
+        buffered.append((event_id, user_ids))
+
+    monkeypatch.setattr(chatfanout, 'get_channel_layer', lambda: channel_layer)
+    monkeypatch.setattr(chatbuffer, 'append_notifications', append_notifications)
+    return fake_aredis(chatfanout), channel_layer, buffered
+
+
+async def _inbox(channel_layer, user_id):
+    channel = await channel_layer.new_channel()
+    await channel_layer.group_add(GROUP_USER.format(id=user_id), channel)
+    return channel
+
+
+async def _drain(channel_layer, channel):
+    messages = []
+    while True:
+        try:
+            messages.append(await asyncio.wait_for(channel_layer.receive(channel), 0.05))
+        except TimeoutError:
+            return messages
+
+
+def test_pointers_are_coalesced(backends):
+    redis, channel_layer, buffered = backends
+
+    async def run():
+        inboxes = {u: await _inbox(channel_layer, u) for u in ('a', 'b', 'c')}
+        await redis.sadd('chat:unread.notify:room1', 'a', 'b')
+        await redis.sadd('chat:unread.notify:room2', 'b')
+        await chatfanout.fan_out(
+            {'room1': (12, 'a'), 'room2': (11, 'c')},
+            {'c': {'dm': 10}},
+            [({'event_id': 12}, {'id': 'a'}, ['b'])],
+        )
+        return {user_id: await _drain(channel_layer, inbox) for user_id, inbox in inboxes.items()}
+
+    received = async_to_sync(run)()
+    assert received['a'] == []
+    assert [m['type'] for m in received['b']] == ['chat.notification', 'chat.unread_pointers']
+    assert received['b'][1]['data'] == {'room1': 12, 'room2': 11}
+    assert received['c'] == [{'type': 'chat.unread_pointers', 'data': {'dm': 10}}]
+    assert not async_to_sync(redis.exists)('chat:unread.notify:room1')
+
+
+def test_notifications_stored_before_queueing(backends, monkeypatch):
+    redis, channel_layer, buffered = backends
+    monkeypatch.setattr(chatfanout, '_start_worker', lambda: None)
+    monkeypatch.setattr(chatfanout, '_notifications', [])
+
+    async_to_sync(chatfanout.queue_notifications)({'event_id': 12}, {'id': 'a'}, {'b'})
+    assert buffered == [(12, ['b'])]
+    assert chatfanout._notifications == [({'event_id': 12}, {'id': 'a'}, ['b'])]
+
+
+def test_pointers_queued_per_tick(backends, monkeypatch):
+    monkeypatch.setattr(chatfanout, '_start_worker', lambda: None)
+    monkeypatch.setattr(chatfanout, '_pointers', {})
+    monkeypatch.setattr(chatfanout, '_dm_pointers', defaultdict(dict))
+
+    chatfanout.queue_unread_pointers('room1', 12, 'a')
+    chatfanout.queue_unread_pointers('room1', 11, 'b')
+    chatfanout.queue_unread_pointers('dm', 10, 'a', ['a', 'b'])
+    chatfanout.queue_unread_pointers('dm', 13, 'b', ['a', 'b'])
+    assert chatfanout._pointers == {'room1': (12, 'a')}
+    assert chatfanout._dm_pointers == {'a': {'dm': 13}, 'b': {'dm': 10}}
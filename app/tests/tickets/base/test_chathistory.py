@@ -0,0 +1,61 @@
+import pytest
+from asgiref.sync import async_to_sync
+
+from eventyay.base.services import chathistory
+
+CHANNEL = '1a2b3c4d-0000-4000-8000-000000000000'
+
+
+@pytest.fixture(autouse=True)
+def redis(fake_aredis, monkeypatch):
+    monkeypatch.setattr(chathistory, 'HISTORY_SIZE', 5)
+    return fake_aredis(chathistory)
+
+
+def _event(event_id, event_type='channel.message', body='Hello'):
+    return {
+        'event_id': event_id,
+        'channel': CHANNEL,
+        'sender': None,
+        'type': 'chat.event',
+        'timestamp': '2026-01-01T10:00:00+00:00',
+        'event_type': event_type,
+        'content': {'type': 'text', 'body': body},
+        'edited': None,
+        'replaces': None,
+        'reactions': {},
+    }
+
+
+def _ids(result):
+    events, loaded = result
+    return [e['event_id'] for e in events] if events is not None else None, loaded
+
+
+def test_load_and_read():
+    assert _ids(async_to_sync(chathistory.get_events)(CHANNEL, 100, 3)) == (None, False)
+    assert async_to_sync(chathistory.start_load)(CHANNEL)
+    assert not async_to_sync(chathistory.start_load)(CHANNEL)
+
+    # A message sent while loading is kept, even though the database did not return it
+    async_to_sync(chathistory.event_changed)(_event(4), new=True)
+    async_to_sync(chathistory.load)(CHANNEL, [_event(3), _event(2, 'channel.member'), _event(1)], complete=True)
+
+    assert _ids(async_to_sync(chathistory.get_events)(CHANNEL, 100, 3)) == ([2, 3, 4], True)
+    assert _ids(async_to_sync(chathistory.get_events)(CHANNEL, 4, 3, skip_membership=True)) == ([1, 3], True)
+
+
+def test_trim_and_update():
+    async_to_sync(chathistory.start_load)(CHANNEL)
+    async_to_sync(chathistory.load)(CHANNEL, [_event(i) for i in range(5, 0, -1)], complete=True)
+    for i in range(6, 9):
+        async_to_sync(chathistory.event_changed)(_event(i), new=True)
+
+    assert _ids(async_to_sync(chathistory.get_events)(CHANNEL, 100, 5)) == ([4, 5, 6, 7, 8], True)
+    # Older events are no longer complete and need to come from the database
+    assert _ids(async_to_sync(chathistory.get_events)(CHANNEL, 6, 3)) == (None, True)
+
+    async_to_sync(chathistory.event_changed)(_event(7, body='Edited'))
+    async_to_sync(chathistory.event_changed)(_event(2, body='Edited'))
+    events, loaded = async_to_sync(chathistory.get_events)(CHANNEL, 100, 5)
+    assert [e['content']['body'] for e in events] == ['Hello', 'Hello', 'Hello', 'Edited', 'Hello']
@@ -15,6 +15,7 @@ from eventyay.base.services.checkin import (
     SQLLogic,
     checkin_error_response_data,
     checkin_reason_explanation,
+    get_rules_query,
     perform_checkin,
     process_exit_all,
 )
@@ -390,6 +391,26 @@ def test_rules_simple(position, clist):
     perform_checkin(position, clist, {})
 
 
+@pytest.mark.django_db
+def test_rules_compiled_cache(event, position, clist):
+    clist.rules = {'isAfter': [{'var': 'now'}, {'buildTime': ['date_admission']}, None]}
+    clist.save()
+    event.date_admission = now() + timedelta(hours=1)
+    event.save()
+    with pytest.raises(CheckInError) as excinfo:
+        perform_checkin(position, clist, {})
+    assert excinfo.value.code == 'rules'
+
+    # The compiled rules notice that the event changed
+    event.date_admission = now() - timedelta(hours=1)
+    event.save()
+    perform_checkin(position, clist, {})
+
+    clist.rules = {'inList': [{'var': 'product'}, {'objectList': [{'lookup': ['product', '1', 'Ticket']}]}]}
+    clist.save()
+    assert get_rules_query(clist) is get_rules_query(clist)
+
+
 @pytest.mark.django_db
 def test_rules_product(event, position, clist):
     i2 = event.products.create(name='Ticket', default_price=3, admission=True)
@@ -0,0 +1,159 @@
+from datetime import timedelta
+
+import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.utils.timezone import now
+from django_scopes import scope
+
+from eventyay.base.models import (
+    Checkin,
+    Event,
+    Gate,
+    Order,
+    OrderPosition,
+    Organizer,
+    Product,
+)
+from eventyay.base.services import checkinstatus
+
+
+@pytest.fixture
+def redis(fake_redis, monkeypatch, settings):
+    settings.CHECKIN_STATUS_COUNTERS = True
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    monkeypatch.setattr(checkinstatus, 'request_reconcile', lambda event_id: None)
+    return fake_redis(checkinstatus)
+
+
+@pytest.fixture
+def event(redis):
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+    with scope(organizer=o):
+        yield event
+
+
+@pytest.fixture
+def product(event):
+    return Product.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+
+
+@pytest.fixture
+def clist(event):
+    return event.checkin_lists.create(name='Default', all_products=True)
+
+
+@pytest.fixture
+def gate(event):
+    return Gate.objects.create(organizer=event.organizer, name='North')
+
+
+@pytest.fixture
+def order(event, product):
+    order = Order.objects.create(event=event, status=Order.STATUS_PAID, expires=now() + timedelta(days=3), total=46)
+    for i in range(2):
+        OrderPosition.objects.create(order=order, product=product, price=23, positionid=i + 1)
+    return order
+
+
+def _summary(counts):
+    return (
+        counts.position_count,
+        counts.checkin_count,
+        counts.inside_count,
+        {k: v for k, v in counts.positions_by_product.items() if v},
+        {k: v for k, v in counts.checkins_by_product.items() if v},
+        counts.checkins_by_gate,
+    )
+
+
+@pytest.mark.django_db
+def test_counters_match_database(event, clist, gate, product, order, django_capture_on_commit_callbacks):
+    assert checkinstatus.read(clist) is None
+    assert checkinstatus.reconcile(event) == []
+    p1, p2 = order.positions.all()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Checkin.objects.create(position=p1, list=clist, gate=gate, datetime=now() - timedelta(minutes=5))
+        Checkin.objects.create(position=p1, list=clist, type=Checkin.TYPE_EXIT)
+        Checkin.objects.create(position=p2, list=clist)
+
+    counts = checkinstatus.get_counts(clist)
+    assert _summary(counts) == (2, 2, 1, {product.pk: 2}, {product.pk: 2}, {gate.pk: 1})
+    assert _summary(counts) == _summary(checkinstatus._count_in_database(clist))
+
+
+@pytest.mark.django_db
+def test_order_changes(event, clist, product, order, django_capture_on_commit_callbacks):
+    checkinstatus.reconcile(event)
+    with django_capture_on_commit_callbacks(execute=True):
+        Checkin.objects.create(position=order.positions.first(), list=clist)
+        order.status = Order.STATUS_CANCELED
+        order.save()
+    counts = checkinstatus.get_counts(clist)
+    assert (counts.position_count, counts.checkin_count, counts.inside_count) == (0, 0, 0)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        o2 = Order.objects.create(event=event, status=Order.STATUS_PAID, expires=now(), total=23)
+        OrderPosition.objects.create(order=o2, product=product, price=23, positionid=1)
+    assert checkinstatus.get_counts(clist).position_count == 1
+
+
+@pytest.mark.django_db
+def test_reconcile_replays_changes(event, clist, order, monkeypatch, django_capture_on_commit_callbacks):
+    checkinstatus.reconcile(event)
+    compute = checkinstatus._position_states
+
+    def _position_states(clist):
+        result = compute(clist)
+        # This check-in happens while we are reconciling and is not part of the result
+        with django_capture_on_commit_callbacks(execute=True):
+            Checkin.objects.create(position=order.positions.last(), list=clist)
+        return result
+
+    monkeypatch.setattr(checkinstatus, '_position_states', _position_states)
+    assert checkinstatus.reconcile_list(clist)
+    assert checkinstatus.get_counts(clist).checkin_count == 1
+
+
+@pytest.mark.django_db
+def test_invalidated_by_deletion(event, clist, order, django_capture_on_commit_callbacks):
+    checkinstatus.reconcile(event)
+    with django_capture_on_commit_callbacks(execute=True):
+        ci = Checkin.objects.create(position=order.positions.first(), list=clist)
+    version = checkinstatus.version(clist)
+    assert version
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ci.delete()
+    assert checkinstatus.read(clist) is None
+    assert checkinstatus.get_counts(clist).checkin_count == 0
+
+    checkinstatus.reconcile(event)
+    assert checkinstatus.read(clist)['checkins'] == 0
+    assert checkinstatus.version(clist) > version
+
+
+@pytest.mark.django_db
+def test_changes_are_pushed(event, clist, order, django_capture_on_commit_callbacks):
+    channel_layer = get_channel_layer()
+    channel = async_to_sync(channel_layer.new_channel)()
+    async_to_sync(channel_layer.group_add)(checkinstatus.GROUP_STATUS.format(list_id=clist.pk), channel)
+
+    def pushed():
+        message = async_to_sync(channel_layer.receive)(channel)
+        assert message['type'] == 'checkinstatus.changed'
+        assert message['list'] == clist.pk
+        return message['version']
+
+    checkinstatus.reconcile(event)
+    assert pushed() == checkinstatus.version(clist)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ci = Checkin.objects.create(position=order.positions.first(), list=clist)
+    assert pushed() == checkinstatus.version(clist)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ci.delete()
+    assert pushed() is None
@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from django.core.management import call_command
+
+from eventyay.base.services import connections
+from eventyay.base.services.roompresence import KEY_USERS as KEY_ROOM_USERS
+from eventyay.core.management.commands import connections as connections_command
+
+
+@pytest.fixture(autouse=True)
+def redis(fake_aredis, monkeypatch):
+    monkeypatch.setattr(connections, '_channels', {})
+    monkeypatch.setattr(connections, '_start_heartbeat', lambda: None)
+    return fake_aredis(connections)
+
+
+def test_register_and_report():
+    async_to_sync(connections.register_connection)('channel1', 'event1')
+    async_to_sync(connections.register_connection)('channel2', 'event1')
+    async_to_sync(connections.register_connection)('channel3', 'event2')
+    async_to_sync(connections.heartbeat)()
+    async_to_sync(connections.unregister_connection)('channel2', 'event1')
+    # Unregistering twice does not count
+    async_to_sync(connections.unregister_connection)('channel2', 'event1')
+
+    result = async_to_sync(connections.get_event_connections)('event1', [])
+    assert result == {'total': 1, 'nodes': {connections.NODE_ID: 1}, 'rooms': {}}
+    assert async_to_sync(connections.get_nodes)()[connections.NODE_ID]['connections'] == 2
+    assert sorted(async_to_sync(connections.get_node_channels)([connections.NODE_ID])) == ['channel1', 'channel3']
+
+
+def test_compaction(redis, monkeypatch):
+    async_to_sync(connections.register_connection)('channel1', 'event1')
+    async_to_sync(connections.heartbeat)()
+
+    later = connections.time.time() + connections.NODE_TTL + 1
+    monkeypatch.setattr(connections, 'time', SimpleNamespace(time=lambda: later))
+    assert async_to_sync(connections.compact)() == [connections.NODE_ID]
+    assert async_to_sync(connections.get_event_connections)('event1', [])['total'] == 0
+    assert not async_to_sync(redis.exists)(connections.KEY_NODE.format(node=connections.NODE_ID))
+
+    # A node that comes back writes its counts again
+    async_to_sync(connections.heartbeat)()
+    assert async_to_sync(connections.get_event_connections)('event1', [])['total'] == 1
+
+
+def test_room_counts(redis):
+    async_to_sync(connections.register_connection)('channel1', 'event1')
+    async_to_sync(connections.heartbeat)()
+    async_to_sync(redis.hset)(KEY_ROOM_USERS.format(room='room1'), mapping={'alice': 1, 'bob': 2})
+
+    result = async_to_sync(connections.get_event_connections)('event1', ['room1', 'room2'])
+    assert result == {'total': 1, 'nodes': {connections.NODE_ID: 1}, 'rooms': {'room1': 2, 'room2': 0}}
+
+
+@pytest.fixture
+def channel_layer(monkeypatch):
+    channel_layer = InMemoryChannelLayer()
+    monkeypatch.setattr(connections, 'get_channel_layer', lambda: channel_layer)
+    monkeypatch.setattr(connections_command, 'get_channel_layer', lambda: channel_layer)
+    return channel_layer
+
+
+async def _receive(channel_layer, channel):
+    try:
+        return await asyncio.wait_for(channel_layer.receive(channel), 0.05)
+    except TimeoutError:
+        return None
+
+
+def test_drain(channel_layer, monkeypatch):
+    drainers = []
+    monkeypatch.setattr(connections, '_start_drainer', drainers.append)
+
+    assert not async_to_sync(connections.drain_node)('unknown:1')
+    async_to_sync(connections.register_connection)('channel1', 'event1')
+    async_to_sync(connections.heartbeat)()
+    assert async_to_sync(connections.drain_node)(connections.NODE_ID, 30)
+    assert async_to_sync(connections.get_nodes)()[connections.NODE_ID]['draining']
+
+    # The node learns about it with its next heartbeat
+    async_to_sync(connections.heartbeat)()
+    assert drainers == [30.0]
+
+    async def run():
+        channel = await channel_layer.new_channel()
+        connections._channels[channel] = 'event1'
+        await connections._drain(0)
+        return await _receive(channel_layer, channel)
+
+    assert async_to_sync(run)() == {'type': 'connection.reload'}
+    assert not async_to_sync(connections.get_nodes)()[connections.NODE_ID]['draining']
+
+
+def test_force_reload_command(channel_layer, settings):
+    settings.REDIS_USE_PUBSUB = True
+    settings.EVENTYAY_COMMIT = 'ff350b4'
+    settings.EVENTYAY_ENVIRONMENT = 'production'
+
+    async def register():
+        channel = await channel_layer.new_channel()
+        await connections.register_connection(channel, 'event1')
+        await connections.heartbeat()
+        return channel
+
+    channel = async_to_sync(register)()
+    call_command(connections_command.Command(), 'force_reload', '*.staging')
+    assert async_to_sync(_receive)(channel_layer, channel) is None
+    call_command(connections_command.Command(), 'force_reload', 'ff350b4.*')
+    assert async_to_sync(_receive)(channel_layer, channel) == {'type': 'connection.reload'}
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from eventyay.base.models import Event, Organizer, Room, User
+from eventyay.base.models.auth import EventGrant, RoomGrant
+from eventyay.base.services import eventsnapshot
+
+
+@pytest.fixture
+def loads(fake_aredis, async_db, monkeypatch):
+    loads = []
+
+    def _load(self):
+        loads.append(self.event_id)
+        self.event = f'event {len(loads)}'
+
+    fake_aredis(eventsnapshot)
+    monkeypatch.setattr(eventsnapshot.EventSnapshot, '_load', _load)
+    monkeypatch.setattr(eventsnapshot, '_event_ids', {1: 1})
+    monkeypatch.setattr(eventsnapshot, '_snapshots', {})
+    return loads
+
+
+def test_consumers_share_one_load(loads):
+    async def run():
+        return await asyncio.gather(*(eventsnapshot.get_event(1) for _ in range(10)))
+
+    assert async_to_sync(run)() == ['event 1'] * 10
+    assert loads == [1]
+
+
+def test_version_bump(loads):
+    assert async_to_sync(eventsnapshot.get_event)(1) == 'event 1'
+    version = async_to_sync(eventsnapshot.increase_version)(1)
+
+    # Consumers told about the new version all get the same, reloaded event
+    assert async_to_sync(eventsnapshot.get_event)(1, version=version) == 'event 2'
+    assert async_to_sync(eventsnapshot.get_event)(1, version=version) == 'event 2'
+    assert loads == [1, 1]
+
+
+@pytest.mark.django_db
+def test_room_roles_do_not_leak(async_db):
+    with scopes_disabled():
+        o = Organizer.objects.create(name='Dummy', slug='dummy')
+        event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+        stage, lounge = Room.objects.create(event=event, name='Stage'), Room.objects.create(event=event, name='Lounge')
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    EventGrant.objects.create(event=event, user=user, role='attendee')
+    RoomGrant.objects.create(event=event, room=stage, user=user, role='speaker')
+
+    # The roles of a room used to be added to the cached roles of the event, which the snapshot now shares
+    assert user.get_role_grants(stage) == {'attendee', 'speaker'}
+    assert user.get_role_grants(lounge) == {'attendee'}
+    assert user.get_role_grants() == {'attendee'}
+    assert async_to_sync(user.get_role_grants_async)(stage) == {'attendee', 'speaker'}
+    assert async_to_sync(user.get_role_grants_async)(lounge) == {'attendee'}
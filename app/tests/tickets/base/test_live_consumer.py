@@ -0,0 +1,200 @@
+import zlib
+from types import SimpleNamespace
+
+import msgspec
+import pytest
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from eventyay.features.live import consumers, routing
+from eventyay.features.live.frames import COMPRESS_THRESHOLD, FRAME_KEY, broadcast_message
+from eventyay.features.live.modules import chat
+
+
+@pytest.fixture
+def event(settings, monkeypatch):
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    event = SimpleNamespace(pk=1, id=1, config={})
+
+    async def get_event(event_id):
+        return event
+
+    async def noop(*args):
+        pass
+
+    async def ping_connection(last_ping, user):
+        return last_ping
+
+    monkeypatch.setattr(consumers, 'get_event', get_event)
+    monkeypatch.setattr(consumers, 'register_connection', noop)
+    monkeypatch.setattr(consumers, 'unregister_connection', noop)
+    monkeypatch.setattr(consumers, 'ping_connection', ping_connection)
+    return event
+
+
+def _talk(*frames):
+    """
+    Sends the frames to a new connection and returns the frame received after each of them, text frames as JSON and
+    binary frames as they are.
+    """
+
+    async def talk():
+        communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns), '/ws/event/1/')
+        assert (await communicator.connect())[0]
+        received = []
+        for frame in frames:
+            if isinstance(frame, bytes):
+                await communicator.send_to(bytes_data=frame)
+            else:
+                await communicator.send_json_to(frame)
+            response = await communicator.receive_output()
+            received.append(response.get('bytes') or msgspec.json.decode(response['text']))
+        await communicator.disconnect()
+        return received
+
+    return async_to_sync(talk)()
+
+
+def _inflate(frame):
+    if frame[0] == 1:
+        return msgspec.msgpack.decode(zlib.decompress(frame[1:], -zlib.MAX_WBITS))
+    assert frame[0] == 0
+    return msgspec.msgpack.decode(frame[1:])
+
+
+def test_json_by_default(event):
+    assert _talk(['authenticate', {}], ['ping', 1]) == [
+        ['error', {'code': 'auth.missing_id_or_token'}],
+        ['pong', 1],
+    ]
+
+
+def test_authenticate_with_msgpack(event):
+    error, pong = _talk(['authenticate', {'protocol': 'msgpack'}], msgspec.msgpack.encode(['ping', 1]))
+    # The response to the authentication is already sent with the negotiated protocol
+    assert msgspec.msgpack.decode(error) == ['error', {'code': 'auth.missing_id_or_token'}]
+    assert msgspec.msgpack.decode(pong) == ['pong', 1]
+
+
+def test_authenticate_with_msgpack_deflate(event):
+    payload = 'x' * COMPRESS_THRESHOLD
+    error, pong, big_pong = _talk(
+        ['authenticate', {'protocol': 'msgpack+deflate'}],
+        msgspec.msgpack.encode(['ping', 1]),
+        msgspec.msgpack.encode(['ping', payload]),
+    )
+    # Small frames are not worth compressing
+    assert error[0] == 0
+    assert _inflate(error) == ['error', {'code': 'auth.missing_id_or_token'}]
+    assert pong[0] == 0
+    assert _inflate(pong) == ['pong', 1]
+    assert big_pong[0] == 1
+    assert len(big_pong) < COMPRESS_THRESHOLD
+    assert _inflate(big_pong) == ['pong', payload]
+
+
+def test_unsupported_protocol(event):
+    assert _talk(['authenticate', {'protocol': 'protobuf'}], ['ping', 1]) == [
+        ['error', {'code': 'protocol.unsupported'}],
+        ['pong', 1],
+    ]
+
+
+class Client:
+    """A consumer without a socket that records the frames it sends."""
+
+    def __init__(self, protocol='json'):
+        self.consumer = consumers.MainConsumer()
+        self.consumer.protocol = protocol
+        self.frames = []
+
+        async def send_frame(frame, close=False):
+            self.frames.append(frame)
+
+        self.consumer.send_frame = send_frame
+
+
+def test_broadcast_is_encoded_once_per_protocol(monkeypatch):
+    encoded = []
+    encode_frame = consumers.encode_frame
+
+    def counting_encode_frame(content, protocol='json'):
+        encoded.append(protocol)
+        return encode_frame(content, protocol)
+
+    monkeypatch.setattr(consumers, 'encode_frame', counting_encode_frame)
+    message = broadcast_message('poll.updated', ['poll.updated', {'poll': {'id': 1}}], poll={'id': 1})
+    clients = [Client(), Client(), Client('msgpack'), Client('msgpack')]
+    for client in clients:
+        async_to_sync(client.consumer.send_broadcast)(message)
+
+    # JSON clients get the frame of the sender, msgpack clients share a single re-encoded frame
+    assert clients[0].frames[0] is message[FRAME_KEY]
+    assert clients[1].frames[0] is message[FRAME_KEY]
+    assert encoded == ['msgpack']
+    assert clients[2].frames[0] is clients[3].frames[0]
+    assert msgspec.msgpack.decode(clients[2].frames[0]) == ['poll.updated', {'poll': {'id': 1}}]
+
+
+def test_broadcast_without_frame():
+    message = {'type': 'poll.updated', 'poll': {'id': 1}}
+    clients = [Client(), Client('msgpack')]
+    for client in clients:
+        async_to_sync(client.consumer.send_broadcast)(message, ['poll.updated', {'poll': {'id': 1}}])
+
+    assert msgspec.json.decode(clients[0].frames[0]) == ['poll.updated', {'poll': {'id': 1}}]
+    assert msgspec.msgpack.decode(clients[1].frames[0]) == ['poll.updated', {'poll': {'id': 1}}]
+
+
+@pytest.fixture
+def chat_client(monkeypatch):
+    looked_up = []
+
+    async def noop(*args, **kwargs):
+        pass
+
+    async def has_permission_async(**kwargs):
+        return True
+
+    async def get_public_users(event_id, ids, **kwargs):
+        looked_up.append(set(ids))
+        return [{'id': i, 'profile': {'display_name': i}} for i in ids]
+
+    monkeypatch.setattr(chat, 'refresh_channel_room', noop)
+    monkeypatch.setattr(chat, 'get_public_users', get_public_users)
+    client = Client()
+    client.consumer.event = SimpleNamespace(pk=1, id=1, config={}, has_permission_async=has_permission_async)
+    client.consumer.user = SimpleNamespace(refresh_from_db_if_outdated=noop)
+    client.consumer.channel_cache['c1'] = SimpleNamespace(room=None)
+    client.module = chat.ChatModule(client.consumer)
+    client.looked_up = looked_up
+    return client
+
+
+def test_chat_event_falls_back_to_user_profiles(chat_client):
+    message = chat._event_message(
+        {
+            'type': 'chat.event',
+            'channel': 'c1',
+            'event_id': 1,
+            'sender': 'alice',
+            'reactions': {'👏': ['bob']},
+            'content': {'type': 'text', 'body': 'Hi'},
+        }
+    )
+    async_to_sync(chat_client.module.publish_event)(message)
+    # The client does not know the users yet, so it gets its own frame that includes their profiles
+    event_type, data = msgspec.json.decode(chat_client.frames[0])
+    assert event_type == 'chat.event'
+    assert chat_client.looked_up == [{'alice', 'bob'}]
+    assert set(data['users']) == {'alice', 'bob'}
+    assert not [k for k in data if k.startswith('_')]
+
+    # From now on, the frame of the sender is good enough
+    async_to_sync(chat_client.module.publish_event)(message)
+    assert chat_client.frames[1] is message[FRAME_KEY]
+    assert chat_client.looked_up == [{'alice', 'bob'}]
+    event_type, data = msgspec.json.decode(chat_client.frames[1])
+    assert data['users'] == {}
+    assert not [k for k in data if k.startswith('_')]
@@ -49,3 +49,61 @@ def test_lock_timeout_steal(event):
     locking.lock_event(ev)
     with pytest.raises(LockReleaseException):
         locking.release_event(event)
+
+
+@pytest.fixture
+def fine_grained(settings, monkeypatch):
+    settings.FINE_GRAINED_LOCKING = True
+    monkeypatch.setattr(locking, 'DRAIN_TIMEOUT', 0.1)
+
+
+@pytest.mark.django_db
+def test_resource_locks_exclusive(event, fine_grained):
+    quota = event.quotas.create(name='Workshop', size=10)
+    with event.lock(quotas=[quota]):
+        with pytest.raises(LockTimeoutException):
+            with scopes_disabled():
+                ev = Event.objects.get(id=event.id)
+                with ev.lock(quotas=[quota]):
+                    pass
+
+
+@pytest.mark.django_db
+def test_resource_locks_different_quotas(event, fine_grained):
+    workshop = event.quotas.create(name='Workshop', size=10)
+    merch = event.quotas.create(name='Merch', size=10)
+    unlimited = event.quotas.create(name='Day pass', size=None)
+    with event.lock(quotas=[workshop, unlimited]):
+        with scopes_disabled():
+            ev = Event.objects.get(id=event.id)
+        with ev.lock(quotas=[merch, unlimited]):
+            pass
+
+
+@pytest.mark.django_db
+def test_resource_locks_exclude_event_lock(event, fine_grained):
+    quota = event.quotas.create(name='Workshop', size=10)
+    with scopes_disabled():
+        ev = Event.objects.get(id=event.id)
+
+    with event.lock(quotas=[quota]):
+        with pytest.raises(LockTimeoutException):
+            with ev.lock():
+                pass
+    with ev.lock():
+        with pytest.raises(LockTimeoutException):
+            with event.lock(quotas=[quota]):
+                pass
+    with event.lock(quotas=[quota]):
+        pass
+
+
+@pytest.mark.django_db
+def test_resource_locks_ignored_when_disabled(event):
+    quota = event.quotas.create(name='Workshop', size=10)
+    with event.lock(quotas=[quota]):
+        with pytest.raises(LockTimeoutException):
+            with scopes_disabled():
+                ev = Event.objects.get(id=event.id)
+                with ev.lock(quotas=[]):
+                    pass
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from eventyay.base.models import Event, Organizer, Room, User
+from eventyay.base.models.poll import Poll, PollVote
+from eventyay.base.services import poll as polls
+
+
+@pytest.fixture
+def redis(fake_aredis, async_db):
+    return fake_aredis(polls)
+
+
+@pytest.fixture
+def room():
+    with scopes_disabled():
+        o = Organizer.objects.create(name='Dummy', slug='dummy')
+        event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+        return Room.objects.create(event=event, name='Room')
+
+
+@pytest.fixture
+def poll(room):
+    poll = Poll.objects.create(room=room, content='Yes or no?', state=Poll.States.OPEN)
+    poll.options.create(content='Yes', order=1)
+    poll.options.create(content='No', order=2)
+    return poll
+
+
+@pytest.fixture
+def users():
+    return [User.objects.create_user(f'{name}@dummy.dummy', 'dummy') for name in ('alice', 'bob')]
+
+
+def _vote(poll, user, *options):
+    return async_to_sync(polls.vote_on_poll)(str(poll.pk), str(poll.room_id), user, [str(o.pk) for o in options])
+
+
+def _votes(poll):
+    return set(PollVote.objects.filter(option__poll=poll).values_list('sender_id', 'option__content'))
+
+
+@pytest.mark.django_db
+def test_vote_and_persist(redis, poll, users):
+    alice, bob = users
+    yes, no = poll.options.order_by('order')
+    assert _vote(poll, alice, yes)['results'] == {str(yes.pk): 1, str(no.pk): 0}
+    assert _vote(poll, bob, no)['results'] == {str(yes.pk): 1, str(no.pk): 1}
+    # Votes are replaced, not added
+    assert _vote(poll, alice, no)['results'] == {str(yes.pk): 0, str(no.pk): 2}
+    assert _votes(poll) == set()
+
+    assert async_to_sync(polls.persist_votes)(str(poll.pk)) == 2
+    assert _votes(poll) == {(alice.pk, 'No'), (bob.pk, 'No')}
+    assert async_to_sync(polls.persist_votes)(str(poll.pk)) == 0
+
+    # Withdrawing a vote removes it from the database as well
+    _vote(poll, bob)
+    assert async_to_sync(polls.persist_votes)(str(poll.pk)) == 1
+    assert _votes(poll) == {(alice.pk, 'No')}
+
+
+@pytest.mark.django_db
+def test_vote_on_closed_poll(redis, poll, users):
+    poll.state = Poll.States.CLOSED
+    poll.save()
+    with pytest.raises(Poll.DoesNotExist):
+        _vote(poll, users[0], poll.options.first())
+
+
+@pytest.mark.django_db
+def test_results_tick(redis, poll, users):
+    yes, no = poll.options.order_by('order')
+    _vote(poll, users[0], yes)
+
+    async def tick():
+        return await asyncio.gather(polls.poll_results_tick(str(poll.pk)), polls.poll_results_tick(str(poll.pk)))
+
+    # Only one of the voters of a tick broadcasts the results
+    assert sorted(async_to_sync(tick)(), key=bool) == [None, {str(yes.pk): 1, str(no.pk): 0}]
+
+
+@pytest.mark.django_db
+def test_left_behind_votes_are_persisted(redis, poll, users, monkeypatch):
+    yes = poll.options.get(content='Yes')
+    _vote(poll, users[0], yes)
+    store = polls._store_votes
+
+    async def _store_votes(pk, votes):
+        raise ValueError()
+
+    monkeypatch.setattr(polls, '_store_votes', _store_votes)
+    with pytest.raises(ValueError):
+        async_to_sync(polls.persist_votes)(str(poll.pk))
+    # The failure is logged, the votes stay around for the next try
+    polls.persist_poll_votes(sender=None)
+    assert async_to_sync(redis.smembers)(polls.KEY_DIRTY_POLLS) == {str(poll.pk).encode()}
+
+    monkeypatch.setattr(polls, '_store_votes', store)
+    polls.persist_poll_votes(sender=None)
+    assert _votes(poll) == {(users[0].pk, 'Yes')}
+    assert async_to_sync(redis.smembers)(polls.KEY_DIRTY_POLLS) == set()
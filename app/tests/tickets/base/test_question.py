@@ -0,0 +1,114 @@
+import importlib
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from eventyay.base.models import Event, Organizer, Room, User
+from eventyay.base.models.roomquestion import QuestionVote, RoomQuestion
+from eventyay.base.services import question as questions
+
+
+@pytest.fixture
+def redis(fake_aredis, async_db):
+    return fake_aredis(questions)
+
+
+@pytest.fixture
+def room():
+    with scopes_disabled():
+        o = Organizer.objects.create(name='Dummy', slug='dummy')
+        event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+        return Room.objects.create(event=event, name='Room')
+
+
+@pytest.fixture
+def users():
+    return [User.objects.create_user(f'{name}@dummy.dummy', 'dummy') for name in ('alice', 'bob')]
+
+
+@pytest.fixture
+def question(room, users):
+    return RoomQuestion.objects.create(room=room, sender=users[0], content='Why?', state=RoomQuestion.States.VISIBLE)
+
+
+def _vote(question, user, vote=True):
+    return async_to_sync(questions.vote_on_question)(str(question.pk), str(question.room_id), user, vote)
+
+
+def _list(room, user, moderator=False):
+    return [
+        (q['content'], q['score'], q['voted'])
+        for q in async_to_sync(questions.list_questions)(str(room.pk), user, moderator=moderator)
+    ]
+
+
+@pytest.mark.django_db
+def test_vote_and_persist(redis, room, question, users):
+    alice, bob = users
+    assert _vote(question, alice)['score'] == 1
+    # Voting twice does not count
+    assert _vote(question, alice)['score'] == 1
+    assert _vote(question, bob)['score'] == 2
+    assert _vote(question, bob, False)['score'] == 1
+    assert not QuestionVote.objects.exists()
+
+    assert async_to_sync(questions.persist_question_votes)(str(room.pk)) == 2
+    assert list(QuestionVote.objects.values_list('sender_id', flat=True)) == [alice.pk]
+    question.refresh_from_db()
+    assert question.cached_score == 1
+    assert async_to_sync(questions.persist_question_votes)(str(room.pk)) == 0
+
+
+@pytest.mark.django_db
+def test_vote_on_unknown_question(redis, room, question, users):
+    other = RoomQuestion(room=room, content='Who?')
+    with pytest.raises(RoomQuestion.DoesNotExist):
+        _vote(other, users[0])
+
+
+@pytest.mark.django_db
+def test_list_questions(redis, room, question, users):
+    alice, bob = users
+    RoomQuestion.objects.create(room=room, sender=bob, content='How?', state=RoomQuestion.States.MOD_QUEUE)
+    hidden = RoomQuestion.objects.create(room=room, sender=alice, content='What?')
+    _vote(hidden, bob)
+    _vote(hidden, alice)
+
+    # Questions waiting for moderation are only shown to moderators and the people who asked them
+    assert _list(room, alice) == [('What?', 2, True), ('Why?', 0, False)]
+    assert sorted(_list(room, bob)) == [('How?', 0, False), ('Why?', 0, False)]
+    assert sorted(_list(room, bob, moderator=True)) == [('How?', 0, False), ('What?', 2, True), ('Why?', 0, False)]
+
+
+@pytest.mark.django_db
+def test_left_behind_votes_are_persisted(redis, room, question, users, monkeypatch):
+    _vote(question, users[1])
+    store = questions._store_votes
+
+    async def _store_votes(room_id, votes, scores):
+        raise ValueError()
+
+    monkeypatch.setattr(questions, '_store_votes', _store_votes)
+    with pytest.raises(ValueError):
+        async_to_sync(questions.persist_question_votes)(str(room.pk))
+    # The failure is logged, the votes stay around for the next try
+    questions.flush_question_votes(sender=None)
+    assert async_to_sync(redis.smembers)(questions.KEY_DIRTY_ROOMS) == {str(room.pk).encode()}
+
+    monkeypatch.setattr(questions, '_store_votes', store)
+    questions.flush_question_votes(sender=None)
+    assert list(QuestionVote.objects.values_list('sender_id', flat=True)) == [users[1].pk]
+    assert async_to_sync(redis.smembers)(questions.KEY_DIRTY_ROOMS) == set()
+
+
+@pytest.mark.django_db
+def test_cached_score_backfill(question, users):
+    for user in users:
+        QuestionVote.objects.create(question=question, sender=user)
+    migration = importlib.import_module('eventyay.base.migrations.0061_roomquestion_cached_score')
+    migration.backfill_cached_score(apps, None)
+    question.refresh_from_db()
+    assert question.cached_score == 2
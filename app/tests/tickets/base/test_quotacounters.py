@@ -0,0 +1,161 @@
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from django_scopes import scope
+
+from eventyay.base.models import (
+    CartPosition,
+    Event,
+    Order,
+    OrderPosition,
+    Organizer,
+    Product,
+    Quota,
+    Voucher,
+)
+from eventyay.base.services import quotacounters, quotas
+from eventyay.base.services.quotas import QuotaAvailability
+
+
+@pytest.fixture
+def redis(fake_redis, settings):
+    settings.QUOTA_COUNTER_MODE = True
+    return fake_redis(quotacounters, quotas)
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+    with scope(organizer=o):
+        yield event
+
+
+@pytest.fixture
+def product(event):
+    return Product.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+
+
+@pytest.fixture
+def quota(event, product):
+    q = Quota.objects.create(event=event, name='Tickets', size=5)
+    q.products.add(product)
+    return q
+
+
+def _order(event, product, status=Order.STATUS_PAID, count=1):
+    order = Order.objects.create(event=event, status=status, expires=now() + timedelta(days=3), total=23 * count)
+    for i in range(count):
+        OrderPosition.objects.create(order=order, product=product, price=23, positionid=i + 1)
+    return order
+
+
+def _compute(quota):
+    qa = QuotaAvailability(full_results=True)
+    qa.queue(quota)
+    qa.compute()
+    return qa
+
+
+def _counted_in_db(queries):
+    return any('orderposition' in q['sql'] or 'cartposition' in q['sql'] for q in queries)
+
+
+@pytest.mark.django_db
+def test_counters_match_database(event, product, quota, redis, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        _order(event, product, Order.STATUS_PAID, 2)
+        _order(event, product, Order.STATUS_PENDING, 1)
+        CartPosition.objects.create(event=event, product=product, price=23, expires=now() + timedelta(minutes=10))
+    quotacounters.reconcile(event)
+
+    with CaptureQueriesContext(connection) as ctx:
+        qa = _compute(quota)
+    assert not _counted_in_db(ctx.captured_queries)
+    assert qa.results[quota] == (Quota.AVAILABILITY_OK, 1)
+    assert qa.count_paid_orders[quota] == 2
+    assert qa.count_pending_orders[quota] == 1
+    assert qa.count_cart[quota] == 1
+
+
+@pytest.mark.django_db
+def test_order_writes_update_counters(event, product, quota, redis, django_capture_on_commit_callbacks):
+    quotacounters.reconcile(event)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        order = _order(event, product, Order.STATUS_PENDING, 3)
+    assert _compute(quota).count_pending_orders[quota] == 3
+
+    with django_capture_on_commit_callbacks(execute=True):
+        order.status = Order.STATUS_PAID
+        order.save(update_fields=['status'])
+    qa = _compute(quota)
+    assert qa.count_pending_orders[quota] == 0
+    assert qa.count_paid_orders[quota] == 3
+
+    with django_capture_on_commit_callbacks(execute=True):
+        position = order.positions.first()
+        position.canceled = True
+        position.save(update_fields=['canceled'])
+    assert _compute(quota).count_paid_orders[quota] == 2
+
+    with django_capture_on_commit_callbacks(execute=True):
+        order.status = Order.STATUS_CANCELED
+        order.save()
+    with CaptureQueriesContext(connection) as ctx:
+        qa = _compute(quota)
+    assert not _counted_in_db(ctx.captured_queries)
+    assert qa.results[quota] == (Quota.AVAILABILITY_OK, 5)
+    assert quotacounters.reconcile(event) == {}
+
+
+@pytest.mark.django_db
+def test_expired_carts_are_not_counted(event, product, quota, redis, django_capture_on_commit_callbacks):
+    CartPosition.objects.create(event=event, product=product, price=23, expires=now() + timedelta(seconds=30))
+    quotacounters.reconcile(event)
+
+    assert _compute(quota).count_cart[quota] == 1
+    qa = QuotaAvailability(full_results=True)
+    qa.queue(quota)
+    qa.compute(now_dt=now() + timedelta(minutes=1))
+    assert qa.count_cart[quota] == 0
+
+
+@pytest.mark.django_db
+def test_fallback_without_counters(event, product, quota, redis, monkeypatch):
+    monkeypatch.setattr(quotacounters, 'request_reconcile', lambda event_id: None)
+    _order(event, product, Order.STATUS_PAID, 5)
+
+    with CaptureQueriesContext(connection) as ctx:
+        qa = _compute(quota)
+    assert _counted_in_db(ctx.captured_queries)
+    assert qa.results[quota] == (Quota.AVAILABILITY_GONE, 0)
+
+
+@pytest.mark.django_db
+def test_voucher_change_invalidates(event, product, quota, redis, monkeypatch, django_capture_on_commit_callbacks):
+    quotacounters.reconcile(event)
+    requested = []
+    monkeypatch.setattr(quotacounters, 'request_reconcile', requested.append)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Voucher.objects.create(event=event, product=product, block_quota=True, max_usages=2)
+    assert requested == [event.pk]
+
+    qa = _compute(quota)
+    assert qa.count_vouchers[quota] == 2
+    assert qa.results[quota] == (Quota.AVAILABILITY_OK, 3)
+
+
+@pytest.mark.django_db
+def test_reconcile_reports_drift(event, product, quota, redis):
+    _order(event, product, Order.STATUS_PAID, 2)
+    assert quotacounters.reconcile(event) == {}
+
+    redis.hincrby(f'quotas:{event.pk}:counters', f'{quota.pk}:paid', 3)
+    assert _compute(quota).count_paid_orders[quota] == 5
+    assert quotacounters.reconcile(event) == {quota.pk: {'paid': 3}}
+    assert _compute(quota).count_paid_orders[quota] == 2
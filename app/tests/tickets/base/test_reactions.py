@@ -0,0 +1,124 @@
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from asgiref.sync import async_to_sync
+from django_scopes import scopes_disabled
+from matplotlib.figure import Figure
+
+from eventyay.base.models import Event, Organizer, Room
+from eventyay.base.models.room import ReactionRollup
+from eventyay.base.services import reactions
+from eventyay.features.analytics.graphs.views import build_room_view_fig
+
+
+@pytest.fixture
+def written(fake_aredis, monkeypatch):
+    written = []
+
+    async def _write(minute, counts):
+        written.append((minute, {k.decode(): int(v) for k, v in counts.items()}))
+
+    fake_aredis(reactions)
+    monkeypatch.setattr(reactions, '_write', _write)
+    monkeypatch.setattr(reactions, '_start_writer', lambda: None)
+    monkeypatch.setattr(reactions, 'time', SimpleNamespace(time=lambda: 6000.5))
+    return written
+
+
+def test_ticks_are_rolled_up_per_minute(written):
+    async_to_sync(reactions.store_reactions)('room1', {'👏': 3, '❤️': 1})
+    async_to_sync(reactions.store_reactions)('room1', {'👏': 2})
+    async_to_sync(reactions.store_reactions)('room2', {'👍': 1})
+
+    # The minute is not over yet
+    assert async_to_sync(reactions.write_rollups)() == 0
+    assert async_to_sync(reactions.write_rollups)(until=6060 + reactions.WRITE_DELAY) == 1
+    assert written == [(6000, {'room1:👏': 5, 'room1:❤️': 1, 'room2:👍': 1})]
+
+    # Nothing changed, nothing to write
+    assert async_to_sync(reactions.write_rollups)(until=6100) == 0
+
+
+def test_late_tick_rewrites_whole_minute(written):
+    async_to_sync(reactions.store_reactions)('room1', {'👏': 3})
+    async_to_sync(reactions.write_rollups)(until=6100)
+    async_to_sync(reactions.store_reactions)('room1', {'👏': 1})
+    async_to_sync(reactions.write_rollups)(until=6100)
+
+    assert written == [(6000, {'room1:👏': 3}), (6000, {'room1:👏': 4})]
+
+
+def test_failed_write_is_retried(written, monkeypatch):
+    write = reactions._write
+    failures = [ValueError()]
+
+    async def _write(minute, counts):
+        if failures:
+            raise failures.pop()
+        await write(minute, counts)
+
+    monkeypatch.setattr(reactions, '_write', _write)
+    async_to_sync(reactions.store_reactions)('room1', {'👏': 3})
+    with pytest.raises(ValueError):
+        async_to_sync(reactions.write_rollups)(until=6100)
+
+    assert async_to_sync(reactions.write_rollups)(until=6100) == 1
+    assert written == [(6000, {'room1:👏': 3})]
+
+
+@pytest.fixture
+def room():
+    with scopes_disabled():
+        o = Organizer.objects.create(name='Dummy', slug='dummy')
+        event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=datetime.now(UTC))
+        return Room.objects.create(event=event, name='Room')
+
+
+@pytest.mark.django_db
+def test_write_upserts_rollups(room, async_db):
+    async_to_sync(reactions._write)(6000, {f'{room.pk}:👏'.encode(): b'3', f'{room.pk}:❤️'.encode(): b'1'})
+    # The whole minute is written again, e.g. after a late tick
+    async_to_sync(reactions._write)(6000, {f'{room.pk}:👏'.encode(): b'4', b'999999:\xf0\x9f\x91\x8f': b'2'})
+
+    minute = datetime.fromtimestamp(6000, tz=UTC)
+    assert set(ReactionRollup.objects.values_list('room', 'minute', 'reaction', 'amount')) == {
+        (room.pk, minute, '👏', 4),
+        (room.pk, minute, '❤️', 1),
+    }
+
+
+@pytest.mark.django_db
+def test_reaction_counts(room):
+    begin = datetime(2024, 5, 1, 10, 0, tzinfo=UTC)
+    for minute, reaction, amount in ((1, '👏', 3), (9, '👏', 2), (10, '👏', 1), (12, '❤️', 4), (75, '👏', 1)):
+        ReactionRollup.objects.create(
+            room=room, minute=begin + timedelta(minutes=minute), reaction=reaction, amount=amount
+        )
+
+    assert reactions.get_reaction_counts(room, begin, begin + timedelta(hours=1)) == {
+        (begin + timedelta(minutes=1), '👏'): 3,
+        (begin + timedelta(minutes=9), '👏'): 2,
+        (begin + timedelta(minutes=10), '👏'): 1,
+        (begin + timedelta(minutes=12), '❤️'): 4,
+    }
+    assert reactions.get_reaction_counts(room, begin, begin + timedelta(hours=1), bucket_minutes=10) == {
+        (begin, '👏'): 5,
+        (begin + timedelta(minutes=10), '👏'): 1,
+        (begin + timedelta(minutes=10), '❤️'): 4,
+    }
+
+
+@pytest.mark.django_db
+def test_room_view_graph_shows_reactions(room):
+    begin = datetime(2024, 5, 1, 10, 0, tzinfo=UTC)
+    ReactionRollup.objects.create(room=room, minute=begin + timedelta(minutes=1), reaction='👏', amount=3)
+    ReactionRollup.objects.create(room=room, minute=begin + timedelta(minutes=12), reaction='❤️', amount=4)
+
+    fig = Figure()
+    build_room_view_fig(fig, room, begin, begin + timedelta(hours=1), UTC)
+
+    # The viewer axes, the reaction axes and one image per bucket and reaction
+    assert len(fig.axes) == 4
+    assert fig.axes[1].get_ylabel() == 'Emoji reactions'
+    assert fig.axes[1].get_ylim() == pytest.approx((0, 4 * 1.4))
@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+import pytest
+from django.utils.timezone import now
+from django_scopes import scope
+
+from eventyay.base.models import (
+    CartPosition,
+    Event,
+    Order,
+    OrderPosition,
+    Organizer,
+    Product,
+    Quota,
+)
+from eventyay.base.services import reservationtokens
+from eventyay.base.services.cart import CartError, CartManager
+
+
+@pytest.fixture
+def redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(reservationtokens, 'request_refill', lambda event_id: None)
+    return fake_redis(reservationtokens)
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(
+        organizer=o, name='Dummy', slug='dummy', date_from=now() + timedelta(days=7), live=True
+    )
+    event.settings.high_demand_mode = True
+    with scope(organizer=o):
+        yield event
+
+
+@pytest.fixture
+def product(event):
+    return Product.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+
+
+@pytest.fixture
+def quota(event, product):
+    q = Quota.objects.create(event=event, name='Tickets', size=3)
+    q.products.add(product)
+    return q
+
+
+def _pool(redis, event, quota):
+    return int(redis.hget(f'quotas:{event.pk}:tokens', quota.pk))
+
+
+def _add(event, product, count, cart_id='aaa'):
+    cm = CartManager(event=event, cart_id=cart_id)
+    cm.add_new_products([{'product': product.pk, 'variation': None, 'count': count}])
+    cm.commit()
+
+
+@pytest.mark.django_db
+def test_refill_from_availability(event, product, quota, redis):
+    order = Order.objects.create(event=event, status=Order.STATUS_PAID, expires=now(), total=23)
+    OrderPosition.objects.create(order=order, product=product, price=23, positionid=1)
+    CartPosition.objects.create(event=event, product=product, price=23, expires=now() + timedelta(minutes=10))
+    CartPosition.objects.create(event=event, product=product, price=23, expires=now() - timedelta(minutes=10))
+
+    assert reservationtokens.refill(event) == {quota.pk: 1}
+    assert _pool(redis, event, quota) == 1
+
+
+@pytest.mark.django_db
+def test_take_all_or_nothing(event, product, quota, redis):
+    other = Quota.objects.create(event=event, name='Other', size=1)
+    reservationtokens.refill(event)
+
+    assert reservationtokens.take(event, {quota: 2, other: 2}) is False
+    assert _pool(redis, event, quota) == 3
+    assert reservationtokens.take(event, {quota: 2, other: 1}) is True
+    assert _pool(redis, event, quota) == 1
+    assert _pool(redis, event, other) == 0
+
+    reservationtokens.give_back(event, {quota: 2})
+    assert _pool(redis, event, quota) == 3
+
+
+@pytest.mark.django_db
+def test_take_without_pool(event, quota, redis):
+    assert reservationtokens.take(event, {quota: 1}) is None
+
+
+@pytest.mark.django_db
+def test_cart_takes_and_returns_tokens(event, product, quota, redis):
+    reservationtokens.refill(event)
+
+    _add(event, product, 2)
+    assert _pool(redis, event, quota) == 1
+
+    cm = CartManager(event=event, cart_id='aaa')
+    cm.remove_product(CartPosition.objects.filter(cart_id='aaa').first().pk)
+    cm.commit()
+    assert _pool(redis, event, quota) == 2
+
+
+@pytest.mark.django_db
+def test_cart_fails_fast_when_sold_out(event, product, quota, redis):
+    reservationtokens.refill(event)
+    _add(event, product, 3)
+    assert _pool(redis, event, quota) == 0
+
+    with pytest.raises(CartError):
+        _add(event, product, 1, cart_id='bbb')
+    assert not CartPosition.objects.filter(cart_id='bbb').exists()
+    assert _pool(redis, event, quota) == 0
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from eventyay.base.models import Event, Organizer, Room, User
+from eventyay.base.models.room import RoomView
+from eventyay.base.services import roompresence
+
+
+@pytest.fixture(autouse=True)
+def redis(fake_aredis):
+    return fake_aredis(roompresence)
+
+
+def test_enter_and_leave():
+    assert async_to_sync(roompresence.enter)('room', 'alice', 'socket1') == (1, [])
+    assert async_to_sync(roompresence.enter)('room', 'alice', 'socket2') == (1, [])
+    assert async_to_sync(roompresence.enter)('room', 'bob', 'socket3') == (2, [])
+    assert sorted(async_to_sync(roompresence.get_viewer_ids)('room')) == ['alice', 'bob']
+
+    assert async_to_sync(roompresence.leave)('room', 'alice', 'socket1') == (2, False, [])
+    assert async_to_sync(roompresence.leave)('room', 'alice', 'socket2') == (1, True, [])
+    # Leaving twice does not count
+    assert async_to_sync(roompresence.leave)('room', 'alice', 'socket2') == (1, False, [])
+
+
+def test_expiry(monkeypatch):
+    async_to_sync(roompresence.enter)('room', 'alice', 'socket1')
+    async_to_sync(roompresence.enter)('room', 'bob', 'socket2')
+
+    monkeypatch.setattr(roompresence, 'SESSION_TTL', 600)
+    async_to_sync(roompresence.refresh)(['room'], 'bob', 'socket2')
+    # Only the views expire, redis itself keeps the keys
+    later = roompresence.time.time() + 300
+    monkeypatch.setattr(roompresence, 'time', SimpleNamespace(time=lambda: later))
+
+    assert async_to_sync(roompresence.enter)('room', 'carol', 'socket3') == (2, ['alice'])
+    assert sorted(async_to_sync(roompresence.get_viewer_ids)('room')) == ['bob', 'carol']
+
+
+def test_leave_after_expiry(monkeypatch):
+    async_to_sync(roompresence.enter)('room', 'alice', 'socket1')
+    later = roompresence.time.time() + roompresence.SESSION_TTL + 1
+    monkeypatch.setattr(roompresence, 'time', SimpleNamespace(time=lambda: later))
+
+    # The view expired, so leaving neither counts twice nor makes the count negative
+    assert async_to_sync(roompresence.leave)('room', 'alice', 'socket1') == (0, False, ['alice'])
+    assert async_to_sync(roompresence.get_viewer_ids)('room') == []
+
+
+@pytest.fixture
+def room():
+    with scopes_disabled():
+        o = Organizer.objects.create(name='Dummy', slug='dummy')
+        event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+        return Room.objects.create(event=event, name='Room')
+
+
+@pytest.mark.django_db
+def test_write_views(room, async_db):
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    abandoned = RoomView.objects.create(room=room, user=user)
+
+    view = RoomView(room=room, user=user)
+    async_to_sync(roompresence.write_views)([(view, False)], [])
+    abandoned.refresh_from_db()
+    assert abandoned.end is not None
+    assert RoomView.objects.get(pk=view.pk).end is None
+
+    # Views that start and end in the same batch are ended or never written at all
+    short, deleted = RoomView(room=room, user=user), RoomView(room=room, user=user)
+    async_to_sync(roompresence.write_views)([(short, False), (deleted, True)], [(short, False), (deleted, True)])
+    assert RoomView.objects.get(pk=short.pk).end is not None
+    assert deleted.pk is None
+    assert RoomView.objects.get(pk=view.pk).end is not None
+    assert RoomView.objects.count() == 3
@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+import pytest
+from django.utils.timezone import now
+from django_scopes import scope
+
+from eventyay.base.models import (
+    Event,
+    Order,
+    OrderPosition,
+    Organizer,
+    Product,
+    RevokedTicketSecret,
+)
+from eventyay.base.services import secretindex
+
+
+@pytest.fixture
+def redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(secretindex, 'request_build', lambda event_id: None)
+    return fake_redis(secretindex)
+
+
+@pytest.fixture
+def event(redis):
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(
+        organizer=o, name='Dummy', slug='dummy', date_from=now() + timedelta(days=7), live=True
+    )
+    event.settings.checkin_secret_index = True
+    with scope(organizer=o):
+        yield event
+
+
+@pytest.fixture
+def position(event):
+    product = Product.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    order = Order.objects.create(event=event, status=Order.STATUS_PAID, expires=now(), total=23)
+    return OrderPosition.objects.create(order=order, product=product, price=23, positionid=1, secret='abc')
+
+
+@pytest.mark.django_db
+def test_not_used_before_build(event, position):
+    assert secretindex.lookup([event], 'abc') is None
+
+
+@pytest.mark.django_db
+def test_lookup(event, position):
+    RevokedTicketSecret.objects.create(event=event, position=position, secret='old')
+    assert secretindex.build(event) == 2
+
+    assert secretindex.lookup([event], 'abc') == [position.pk]
+    assert secretindex.lookup([event], 'unknown') == []
+    # Revoked secrets are left to the database
+    assert secretindex.lookup([event], 'old') is None
+
+
+@pytest.mark.django_db
+def test_disabled(event, position):
+    secretindex.build(event)
+    event.settings.checkin_secret_index = False
+    assert secretindex.lookup([event], 'unknown') is None
+
+
+@pytest.mark.django_db
+def test_drop(event, position, redis):
+    secretindex.build(event)
+    secretindex.drop(event)
+    assert secretindex.lookup([event], 'abc') is None
+    assert not redis.exists(f'checkin:{event.pk}:secrets')
+
+
+@pytest.mark.django_db
+def test_updated_on_save(event, position, django_capture_on_commit_callbacks):
+    secretindex.build(event)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        position.secret = 'def'
+        position.save()
+        RevokedTicketSecret.objects.create(event=event, position=position, secret='abc')
+    assert secretindex.lookup([event], 'def') == [position.pk]
+    assert secretindex.lookup([event], 'abc') is None
+
+    with django_capture_on_commit_callbacks(execute=True):
+        position.secret = 'ghi'
+        position.save(update_fields=['secret'])
+    assert secretindex.lookup([event], 'ghi') == [position.pk]
+    assert secretindex.lookup([event], 'def') == []
+
+
+@pytest.mark.django_db
+def test_shared_secret(event, position, django_capture_on_commit_callbacks):
+    secretindex.build(event)
+
+    addon = OrderPosition.objects.create(
+        order=position.order, product=position.product, price=0, positionid=2, addon_to=position
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        # New positions always get a secret of their own, but existing ones may be given a shared one
+        addon.secret = 'abc'
+        addon.save()
+    assert sorted(secretindex.lookup([event], 'abc')) == [position.pk, addon.pk]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        position.save()
+    assert sorted(secretindex.lookup([event], 'abc')) == [position.pk, addon.pk]
+    assert secretindex.build(event) == 1
+    assert sorted(secretindex.lookup([event], 'abc')) == [position.pk, addon.pk]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        addon.secret = 'def'
+        addon.save()
+    assert secretindex.lookup([event], 'abc') == [position.pk]
+    assert secretindex.lookup([event], 'def') == [addon.pk]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        addon.delete()
+    assert secretindex.lookup([event], 'def') == []
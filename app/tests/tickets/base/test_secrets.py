@@ -4,10 +4,11 @@ import pytest
 from django.utils.timezone import now
 from django_scopes import scope
 
-from eventyay.base.models import Event, Organizer
+from eventyay.base.models import Event, Order, OrderPosition, Organizer
 from eventyay.base.secrets import (
     RandomTicketSecretGenerator,
     Sig1TicketSecretGenerator,
+    assign_ticket_secrets,
 )
 
 schemes = (
@@ -147,3 +148,40 @@ def test_lsp_signature_compatibility(event, scheme):
     assert secret2
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize('scheme', schemes)
+def test_generate_secrets(event, scheme):
+    item = event.products.create(name='Foo', default_price=0)
+    item2 = event.products.create(name='Bar', default_price=0)
+    generator, input_dependent = scheme
+    g = generator(event)
+
+    first = g.generate_secret(item, None, None, current_secret=None, force_invalidate=False)
+    positions = [
+        OrderPosition(product=item, secret=first),
+        OrderPosition(product=item2, secret=first),
+        OrderPosition(product=item, secret=None),
+    ]
+    kept, changed, new = g.generate_secrets(positions)
+    assert kept == first
+    assert (changed != first) == input_dependent
+    assert new and new != first
+
+    assert first not in g.generate_secrets(positions, force_invalidate=True)
+
+
+@pytest.mark.django_db
+def test_assign_ticket_secrets(event):
+    event.settings.ticket_secret_generator = 'pretix_sig1'
+    item = event.products.create(name='Foo', default_price=0)
+    order = Order.objects.create(event=event, status=Order.STATUS_PAID, expires=now(), total=0)
+    p1 = OrderPosition.objects.create(order=order, product=item, price=0, positionid=1)
+    p2 = OrderPosition.objects.create(order=order, product=item, price=0, positionid=2)
+    old_secrets = {p1.secret, p2.secret}
+
+    assert assign_ticket_secrets(event, [p1, p2]) == []
+    assert assign_ticket_secrets(event, [p1, p2], force_invalidate_if_revokation_list_used=True) == [p1, p2]
+    p1.refresh_from_db()
+    p2.refresh_from_db()
+    assert not old_secrets & {p1.secret, p2.secret}
+    assert set(event.revoked_secrets.values_list('secret', flat=True)) == old_secrets
@@ -23,12 +23,30 @@ def test_shared_tests(logic, data, expected):
     assert Logic().apply(logic, data) == expected
 
 
+@pytest.mark.parametrize('logic,data,expected', params)
+def test_shared_tests_compiled(logic, data, expected):
+    assert Logic().compile(logic)(data) == expected
+
+
 def test_unknown_operator():
     with pytest.raises(ValueError):
         assert Logic().apply({'unknownOp': []}, {})
+    with pytest.raises(ValueError):
+        Logic().compile({'unknownOp': []})
 
 
 def test_custom_operation():
     logic = Logic()
     logic.add_operation('double', lambda a: a * 2)
     assert logic.apply({'double': [{'var': 'value'}]}, {'value': 3}) == 6
+
+
+def test_compiled_short_circuit():
+    calls = []
+    logic = Logic()
+    logic.add_operation('track', lambda a: calls.append(a) or a)
+    func = logic.compile({'and': [{'track': [{'var': 'a'}]}, {'track': [{'var': 'b'}]}, {'track': [True]}]})
+    # Constant parts are evaluated right away
+    assert calls == [True]
+    assert func({'a': False, 'b': True}) is False
+    assert calls == [True, False]
@@ -7,7 +7,7 @@ from unittest.mock import patch
 from django.conf import settings
 from django.core import mail
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 from zoneinfo import ZoneInfo
@@ -28,6 +28,7 @@ from eventyay.base.models.product import SubEventProduct as SubEventItem, SubEve
 from tests.tickets.base import SoupTest
 from tests.tickets.testdummy.signals import FoobarSalesChannel
 from eventyay.presale.views.contact import ContactOrganizerView
+from eventyay.presale.views.event import get_cached_grouped_products
 
 
 class EventTestMixin:
@@ -711,6 +712,52 @@ class ItemDisplayTest(EventTestMixin, SoupTest):
         self.assertIn('plus taxes', doc.select('section:nth-of-type(1) div.price')[0].text)
 
 
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'cached-product-list',
+        }
+    }
+)
+class CachedItemDisplayTest(EventTestMixin, SoupTest):
+    @scopes_disabled()
+    def setUp(self):
+        super().setUp()
+        q = Quota.objects.create(event=self.event, name='Quota', size=2)
+        self.item = Item.objects.create(event=self.event, name='Early-bird ticket', default_price=12)
+        q.items.add(self.item)
+        q2 = Quota.objects.create(event=self.event, name='Sold out', size=0)
+        self.item2 = Item.objects.create(event=self.event, name='Late-bird ticket', default_price=23)
+        q2.items.add(self.item2)
+
+    def _rows(self):
+        doc = self.get_doc(f'/{self.orga.slug}/{self.event.slug}/')
+        return [' '.join(row.text.split()) for row in doc.select('section .product-row')]
+
+    def test_second_request_from_cache(self):
+        rows = self._rows()
+        assert any('Early-bird' in r and '12.00' in r for r in rows)
+        assert any('Late-bird' in r and '23.00' in r and 'SOLD OUT' in r for r in rows)
+
+        with patch('eventyay.presale.views.event.get_grouped_products') as get_grouped_products:
+            assert self._rows() == rows
+        assert not get_grouped_products.called
+
+    def test_cached_products_use_event_of_request(self):
+        with scopes_disabled():
+            first, _ = get_cached_grouped_products(Event.objects.get(pk=self.event.pk))
+            event = Event.objects.get(pk=self.event.pk)
+            with patch('eventyay.presale.views.event.get_grouped_products') as get_grouped_products:
+                products, _ = get_cached_grouped_products(event)
+            assert not get_grouped_products.called
+
+            assert [p.pk for p in products] == [p.pk for p in first]
+            assert all(p.event is event for p in products)
+            assert [p.display_price.gross for p in products] == [p.display_price.gross for p in first]
+            assert [p.cached_availability for p in products] == [p.cached_availability for p in first]
+
+
 class VoucherRedeemItemDisplayTest(EventTestMixin, SoupTest):
     @scopes_disabled()
     def setUp(self):
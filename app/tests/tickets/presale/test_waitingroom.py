@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils.timezone import now
+from django_scopes import scope
+
+from eventyay.base.models import Event, Organizer
+from eventyay.presale import waitingroom
+
+
+@pytest.fixture
+def redis(fake_redis, settings):
+    settings.WAITING_ROOM = True
+    return fake_redis(waitingroom)
+
+
+@pytest.fixture
+def event(redis):
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now(), live=True)
+    event.settings.waiting_room_enabled = True
+    event.settings.waiting_room_rate = 2
+    with scope(organizer=o):
+        waitingroom.configure(o, event)
+        yield event
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(waitingroom, 'time', SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def _visit(cookies=None, url_name='event.checkout.start'):
+    request = RequestFactory().get('/dummy/dummy/checkout/start')
+    request.COOKIES.update(cookies or {})
+    url = SimpleNamespace(url_name=url_name, kwargs={'organizer': 'dummy', 'event': 'dummy'})
+    response = waitingroom.check(request, url)
+    admitted = response is None
+    if admitted:
+        response = waitingroom.add_admission_cookie(request, HttpResponse())
+    return admitted, response, {k: c.value for k, c in response.cookies.items()}
+
+
+@pytest.mark.django_db
+def test_admits_rate_per_second(event, clock):
+    visits = [_visit() for i in range(5)]
+    assert [admitted for admitted, response, cookies in visits] == [True, True, False, False, False]
+
+    admitted, response, cookies = _visit(visits[2][2])
+    assert not admitted
+    assert b'There is 1 person ahead of you' in response.content
+    assert response['Refresh']
+
+    clock.now += 0.5
+    admitted, response, cookies = _visit(visits[2][2])
+    assert admitted
+    assert not _visit(visits[3][2])[0]
+
+    # The admission cookie lets the visitor through without queueing again
+    assert _visit(cookies)[0]
+
+
+@pytest.mark.django_db
+def test_not_gated(event):
+    for i in range(5):
+        assert _visit(url_name='event.order')[0]
+
+
+@pytest.mark.django_db
+def test_disabled(event, redis):
+    event.settings.waiting_room_enabled = False
+    waitingroom.configure(event.organizer, event)
+    for i in range(5):
+        assert _visit()[0]
+    assert not redis.exists('waitingroom:dummy/dummy')
+
+
+@pytest.mark.django_db
+def test_reenabled_starts_new_queue(event, clock):
+    for i in range(5):
+        admitted, response, cookies = _visit()
+    assert not admitted
+
+    event.settings.waiting_room_enabled = False
+    waitingroom.configure(event.organizer, event)
+    event.settings.waiting_room_enabled = True
+    waitingroom.configure(event.organizer, event)
+
+    # The position from the old queue is worthless, the visitor is queued again at the front
+    assert _visit(cookies)[0]
+
+
+@pytest.mark.django_db
+def test_not_configured(event, redis, settings, monkeypatch):
+    settings.WAITING_ROOM = False
+    monkeypatch.setattr(redis, 'eval', None)
+    for i in range(5):
+        assert _visit()[0]
@@ -9,7 +9,7 @@ from django.utils.timezone import now
 from django_scopes import scopes_disabled
 from freezegun import freeze_time
 
-from eventyay.base.models import Order, OrderPosition
+from eventyay.base.models import CartPosition, Order, OrderPosition
 from eventyay.presale.style import regenerate_css, regenerate_organizer_css
 
 from .test_cart import CartTestMixin
@@ -264,6 +264,41 @@ class WidgetCartTest(CartTestMixin, TestCase):
             'voucher_explanation_text': '',
         }
 
+    def test_product_list_view_snapshot(self):
+        url = f'/{self.orga.slug}/{self.event.slug}/widget/product_list'
+        response = self.client.get(url)
+        etag = response['ETag']
+        assert etag
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response['Access-Control-Allow-Origin'] == '*'
+
+        with scopes_disabled():
+            self.ticket.default_price = Decimal('42.00')
+            self.ticket.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+        data = json.loads(response.content.decode())
+        assert data['items_by_category'][0]['items'][0]['price']['gross'] == '42.00'
+
+    def test_product_list_view_snapshot_with_cart(self):
+        url = f'/{self.orga.slug}/{self.event.slug}/widget/product_list'
+        self.client.get(url)
+        with scopes_disabled():
+            CartPosition.objects.create(
+                event=self.event,
+                cart_id='aaa',
+                product=self.ticket,
+                price=23,
+                expires=now() + datetime.timedelta(minutes=10),
+            )
+        data = json.loads(self.client.get(url + '?cart_id=aaa').content.decode())
+        assert data['cart_exists'] is True
+        data = json.loads(self.client.get(url + '?cart_id=bbb').content.decode())
+        assert data['cart_exists'] is False
+
     def test_product_list_view_filter(self):
         response = self.client.get(
             '/%s/%s/widget/product_list?items=%s' % (self.orga.slug, self.event.slug, self.ticket.pk)
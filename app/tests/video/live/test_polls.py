@@ -194,36 +194,20 @@ async def test_poll_lifecycle(questions_room, world):
                 await c_mod.receive_json_from()
             )  # TODO validate answered and results state
             assert response[0] == "success", response
-            response = await c_mod.receive_json_from()  # Change broadcast for mods
-            assert response[0] == "poll.created_or_updated", response
-            assert response[1] == {
-                "poll": {
-                    "content": "What is your favourite colour?",
+            response = await c_mod.receive_json_from()  # Results broadcast for mods
+            assert response == [
+                "poll.results",
+                {
+                    "room": str(room.id),
                     "id": poll["id"],
-                    "room_id": str(room.id),
-                    "state": "open",
-                    "timestamp": poll["timestamp"],
-                    "is_pinned": False,
-                    "options": [
-                        {
-                            "content": "blue",
-                            "order": 1,
-                            "id": poll["options"][0]["id"],
-                        },
-                        {
-                            "content": "red",
-                            "order": 2,
-                            "id": poll["options"][1]["id"],
-                        },
-                    ],
                     "results": {
                         poll["options"][0]["id"]: 0,
                         poll["options"][1]["id"]: 1,
                     },
-                }
-            }
-            response = await c_mod.receive_json_from()  # Change broadcast for voters
-            assert response[0] == "poll.created_or_updated", response
+                },
+            ]
+            response = await c_mod.receive_json_from()  # Results broadcast for voters
+            assert response[0] == "poll.results", response
 
             await c.send_json_to(
                 [
@@ -272,45 +256,28 @@ async def test_poll_lifecycle(questions_room, world):
                     },
                 ]
             )
-            response = (
-                await c_mod.receive_json_from()
-            )  # Change broadcast for privileged users
-            assert response[0] == "poll.created_or_updated", response
-            response = await c_mod.receive_json_from()  # Change broadcast for voters
-            assert response[0] == "poll.created_or_updated", response
-
             response = await c.receive_json_from()  # Success message
             assert response[0] == "success"
-            response = (
-                await c.receive_json_from()
-            )  # Change broadcast for voters, TODO: show content with votes and answers
-            assert response[0] == "poll.created_or_updated", response
-            assert response[1] == {
-                "poll": {
-                    "content": "What is your favourite colour?",
+            assert response[2]["poll"]["results"] == {
+                poll["options"][0]["id"]: 1,
+                poll["options"][1]["id"]: 1,
+            }
+            response = await c.receive_json_from()  # Results broadcast for voters
+            assert response == [
+                "poll.results",
+                {
+                    "room": str(room.id),
                     "id": poll["id"],
-                    "room_id": str(room.id),
-                    "state": "open",
-                    "timestamp": poll["timestamp"],
-                    "is_pinned": False,
-                    "options": [
-                        {
-                            "content": "blue",
-                            "order": 1,
-                            "id": poll["options"][0]["id"],
-                        },
-                        {
-                            "content": "red",
-                            "order": 2,
-                            "id": poll["options"][1]["id"],
-                        },
-                    ],
                     "results": {
                         poll["options"][0]["id"]: 1,
                         poll["options"][1]["id"]: 1,
                     },
-                }
-            }
+                },
+            ]
+            response = await c_mod.receive_json_from()  # Results broadcast for privileged users
+            assert response[0] == "poll.results", response
+            response = await c_mod.receive_json_from()  # Results broadcast for voters
+            assert response[0] == "poll.results", response
 
             # after voting, unprivileged users see results and their answers on list
             await c.send_json_to(